@@ -0,0 +1,274 @@
+"""命运轮盘专家AI决策表编译器
+
+专家AI（及地狱AI、搜索AI推演中的专家AI）每次决策都要对手牌逐个走一遍打分的判断链。
+打分的输入都很小而且离散：自己和对手的生命、手牌数、对手可偷的灵物数、是否签了契约、
+是否已知牌堆顶、当前倾向、上回合用过的灵物。build 子命令枚举这些输入的所有组合，
+把 ExpertAIPlayer._score_spirit / _score_forced_spirit 的结果和偷取优先级写成决策表，
+各命令行入口用 --ai-tables 以内存映射方式加载（见 main.DecisionTables），之后每个灵物的得分只是一次查表。
+
+伤害牌概率是连续的，只影响少数灵物（红药水、镜子）且只在达到威胁门槛时起作用：
+编译时找出这些灵物，运行时达到门槛才对它们在线打分，其余情况与在线计算逐位相同。
+同样，编译时也记下得分与牌堆顶是否已知有关的灵物（放大镜），手里没有时运行时不必查看信念。
+决策表绑定编译时的权重（及其版本号）和规则，权重文件或打分方法改变后，不匹配的AI类自动回到在线计算。
+编译和检查时用 --ai-weights 指定权重文件，与对局时加载的权重一致。
+
+check 子命令把决策表与在线打分做三层比较：逐项重新计算全部表项、随机局面下的决策、
+以及若干整局对局的完整日志（开、关决策表各下一遍）。
+
+用法示例:
+    python ai_tables.py build                          # 按当前权重编译到 fate_ai_tables.bin
+    python ai_tables.py build --player HellAIPlayer --out hell_tables.bin
+    python ai_tables.py check --games 500 --samples 200000
+"""
+import argparse
+import array
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+import main
+
+FILLER = "AMULET" # 编译时填充手牌用的灵物：打分只看张数和是否为手套
+
+
+class _ProbePlayer(main.ExpertAIPlayer):
+    """编译时代入打分方法的假局面，只设置打分会读到的属性"""
+    known_next_fate_card = None # 覆盖父类的属性，直接赋值
+
+
+def _probe(weights, config):
+    player = _ProbePlayer()
+    player.weights, player.config, player.max_hp = weights, config, config.max_hp
+    return player
+
+
+def compile_tables(cls=main.ExpertAIPlayer, config=main.DEFAULT_CONFIG, progress=False):
+    """按 cls 的权重和偷取优先级编译决策表，返回 (元数据, 数组字典)"""
+    weights = dict(cls.weights)
+    meta = {"weights": weights, "config": config.to_dict(only_changed=True), "steal_priority": list(cls.steal_priority),
+            "threat_spirits": [], "top_spirits": [], "player": cls.__name__, "weights_version": main.AI_WEIGHTS_VERSION}
+    layout = main.DecisionTables(meta, dict.fromkeys(name for name, _ in main.DecisionTables.ARRAYS))
+    me, opponent = _probe(weights, config), _probe(weights, config)
+    calm = 0.0 # 表中的得分按伤害牌概率为0计算；门槛不大于0时威胁加分总是成立，也就一并计入了表中
+    palette, codes = {}, {}
+    action = array.array("H", bytes(2 * layout.action_size()))
+    threat, top = set(), set()
+    hp_range, hand_range = range(config.max_hp + 1), range(config.max_spirits + 1)
+    for hp in hp_range:
+        if progress: sys.stderr.write(f"\r编译行动得分 {hp + 1}/{len(hp_range)} "); sys.stderr.flush()
+        me.hp = hp
+        for hand in hand_range:
+            me.spirits = [FILLER] * hand
+            for has_contract in (0, 1):
+                me.status.has_contract = bool(has_contract)
+                for top_unknown in (0, 1):
+                    me.known_next_fate_card = None if top_unknown else main.FATE_CARD_KEYS[0]
+                    for opponent_hp in hp_range:
+                        opponent.hp = opponent_hp
+                        for opponent_hand in hand_range:
+                            for stealable in range(opponent_hand + 1):
+                                opponent.spirits = [FILLER] * stealable + ["GLOVES"] * (opponent_hand - stealable)
+                                for t, tendency in enumerate(main.DecisionTables.TENDENCIES):
+                                    row = layout.action_index(hp, hand, has_contract, top_unknown, opponent_hp, opponent_hand, stealable, t)
+                                    known_row = layout.action_index(hp, hand, has_contract, 0, opponent_hp, opponent_hand, stealable, t)
+                                    for repeated in (0, 1):
+                                        for k, spirit in enumerate(main.SPIRIT_KEYS):
+                                            last_used = spirit if repeated else None
+                                            score = me._score_spirit(spirit, opponent, tendency, calm, last_used)
+                                            code = codes.get(score)
+                                            if code is None:
+                                                code = codes[score] = len(palette)
+                                                palette[code] = score
+                                            action[row + repeated * main.SPIRIT_COUNT + k] = code
+                                            if top_unknown and action[known_row + repeated * main.SPIRIT_COUNT + k] != code:
+                                                top.add(spirit)
+                                            if spirit not in threat and \
+                                                    me._score_spirit(spirit, opponent, tendency, 1.0, last_used) != score:
+                                                threat.add(spirit)
+    if progress: sys.stderr.write("\n")
+    if len(palette) > 65535: raise ValueError(f"行动得分有 {len(palette)} 种取值，超出 uint16 编号范围")
+    force = array.array("d", bytes(8 * layout.force_size()))
+    for opponent_hp in hp_range:
+        opponent.hp = opponent_hp
+        for opponent_hand in hand_range:
+            opponent.spirits = [FILLER] * opponent_hand
+            for own in hand_range:
+                me.spirits = [FILLER] * own
+                start = layout.force_index(opponent_hp, opponent_hand, own)
+                for k, spirit in enumerate(main.SPIRIT_KEYS): force[start + k] = me._score_forced_spirit(spirit, opponent)
+    steal = array.array("B", [255] * main.SPIRIT_COUNT)
+    for rank, spirit in enumerate(cls.steal_priority): steal[main.SPIRIT_INDEX[spirit]] = rank
+    meta["threat_spirits"] = [s for s in main.SPIRIT_KEYS if s in threat]
+    meta["top_spirits"] = [s for s in main.SPIRIT_KEYS if s in top]
+    return meta, {"palette": array.array("d", (palette[i] for i in range(len(palette)))),
+                  "action": action, "force": force, "steal": steal}
+
+
+def build(args):
+    cls = _player_class(args.player)
+    config = main.GameConfig.from_dict(_load_json(args.config)) if args.config else main.DEFAULT_CONFIG
+    started = time.perf_counter()
+    meta, arrays = compile_tables(cls, config, progress=not args.quiet)
+    data = main.DecisionTables.encode(meta, arrays)
+    with open(args.out, "wb") as f: f.write(data)
+    print(f"已写出 {args.out}（{len(data) / 1024:,.0f} KB，{len(arrays['palette'])} 种行动得分，"
+          f"在线计算的灵物: {', '.join(meta['threat_spirits']) or '无'}），用时 {time.perf_counter() - started:.1f} 秒")
+
+
+# --- 一致性检查 ---
+
+def check_entries(table, cls):
+    """重新编译并与文件逐项比较，返回不一致的描述列表"""
+    meta, arrays = compile_tables(cls, table.config)
+    problems = [f"元数据 {key} 不同" for key in ("weights", "steal_priority", "threat_spirits", "top_spirits") if meta[key] != table.meta[key]]
+    if table.meta.get("byteorder") != sys.byteorder: problems.append("字节序不同")
+    loaded = {name: getattr(table, name) for name, _ in main.DecisionTables.ARRAYS}
+    fresh_palette, old_palette = arrays["palette"], loaded["palette"]
+    for name in ("action", "force", "steal"):
+        fresh, old = arrays[name], loaded[name]
+        if len(fresh) != len(old):
+            problems.append(f"{name} 长度 {len(old)}，应为 {len(fresh)}")
+            continue
+        if name == "action": differing = sum(1 for a, b in zip(fresh, old) if fresh_palette[a] != old_palette[b])
+        else: differing = sum(1 for a, b in zip(fresh, old) if a != b)
+        if differing: problems.append(f"{name} 有 {differing} 项与在线打分不同")
+    return problems
+
+
+def _random_state(rng, game):
+    """把对局改成一个随机局面：生命、手牌、契约、上回合用过的灵物、牌堆信念"""
+    config = game.config
+    for player in game.players:
+        player.hp = rng.randint(1, config.max_hp)
+        player.spirits[:] = rng.choices(main.SPIRIT_KEYS, k=rng.randint(0, config.max_spirits))
+        player.status.has_contract = rng.random() < 0.2
+        size = rng.randint(1, config.max_fate_cards)
+        if rng.random() < 0.5: player.belief.reset(size, prior=config.fate_prior)
+        else: player.belief.reset(size, Counter(config.random_fate_cards(rng, size)), config.fate_prior)
+        if rng.random() < 0.3: player.belief.revealed(0, rng.choice(main.FATE_CARD_KEYS))
+    game.last_spirit_used_by_player = [rng.choice(main.SPIRIT_KEYS + (None,)) for _ in game.players]
+
+
+def _both_ways(player, decide):
+    """同一决策分别查表和在线计算（AI自己的随机源从相同状态开始）"""
+    state = player.rng.getstate()
+    tabled = decide()
+    player.rng.setstate(state)
+    player.decision_table = None # 实例属性遮住类属性，只对这一次生效
+    try: live = decide()
+    finally: del player.decision_table
+    return tabled, live
+
+
+def check_decisions(cls, samples, seed):
+    """随机局面下的行动、强制使用和偷取决策，返回 (比较次数, 不一致的例子)"""
+    rng = random.Random(seed)
+    game = main.Game(headless=True, seed=seed)
+    game.players = [cls(), cls()]
+    game._setup()
+    compared, mismatches = 0, []
+    for _ in range(samples):
+        _random_state(rng, game)
+        me, opponent = game.players
+        if me._decision_table() is None: raise RuntimeError(f"{cls.__name__} 没有使用决策表（权重或打分方法与编译时不同）")
+        tendency = me._determine_strategic_tendency(opponent)
+        stealable = [s for s in opponent.spirits if s != "GLOVES"] or ["TELEPHONE"]
+        for name, decide in (("行动", lambda: me._evaluate_spirit_use(opponent, game, tendency)),
+                             ("强制使用", lambda: me.ai_choose_spirit_to_force_use(opponent.spirits, opponent)),
+                             ("偷取", lambda: me.ai_choose_spirit_to_steal(stealable))):
+            tabled, live = _both_ways(me, decide)
+            compared += 1
+            if tabled != live and len(mismatches) < 10:
+                mismatches.append(f"{name}: 查表 {tabled!r}，在线 {live!r}（自己 {me.hp} 血 {me.spirits}，"
+                                  f"对手 {opponent.hp} 血 {opponent.spirits}，倾向 {tendency}）")
+    return compared, mismatches
+
+
+def check_games(table, pairs, games, seed):
+    """每对AI下若干局，比较开、关决策表时的完整对局日志，返回 (局数, 不一致的例子)"""
+    played, mismatches = 0, []
+    for first_cls, second_cls in pairs:
+        for index in range(games):
+            game_seed = seed + index
+            logs = []
+            for active in (table, None):
+                main.use_decision_tables(active)
+                result = main.simulate_game(first_cls, second_cls, seed=game_seed, first_player=index & 1, record=True)
+                logs.append(result.log.to_bytes())
+            played += 1
+            if logs[0] != logs[1] and len(mismatches) < 10:
+                mismatches.append(f"{first_cls.__name__} 对 {second_cls.__name__}，种子 {game_seed}")
+    main.use_decision_tables(table)
+    return played, mismatches
+
+
+def check(args):
+    cls = _player_class(args.player)
+    table = main.DecisionTables.open(args.table)
+    main.SearchAIPlayer.node_budget = args.search_nodes
+    main.use_decision_tables(table)
+    if not table.matches(cls):
+        print(f"{args.table} 与 {cls.__name__} 当前的权重或打分方法不符，决策表不会被使用，请重新编译。")
+        return 1
+    failed = False
+    started = time.perf_counter()
+    problems = check_entries(table, cls)
+    print(f"表项: {'一致' if not problems else '；'.join(problems)}（{time.perf_counter() - started:.1f} 秒）")
+    failed |= bool(problems)
+    started = time.perf_counter()
+    compared, mismatches = check_decisions(cls, args.samples, args.seed)
+    print(f"随机局面: {compared:,} 次决策，{len(mismatches) and '有不一致' or '一致'}（{time.perf_counter() - started:.1f} 秒）")
+    for line in mismatches: print("  " + line)
+    failed |= bool(mismatches)
+    started = time.perf_counter()
+    hell, expert = main.HellAIPlayer, main.ExpertAIPlayer
+    pairs = [(expert, expert), (hell, expert), (hell, hell), (main.HardAIPlayer, hell)]
+    if args.search_games: pairs.append((main.SearchAIPlayer, hell))
+    played, mismatches = check_games(table, pairs, args.games, args.seed)
+    print(f"整局对局: {played:,} 局，对局日志{len(mismatches) and '有不一致' or '完全相同'}（{time.perf_counter() - started:.1f} 秒）")
+    for line in mismatches: print("  " + line)
+    failed |= bool(mismatches)
+    print("决策表与在线计算一致。" if not failed else "决策表与在线计算不一致！")
+    return 1 if failed else 0
+
+
+def _player_class(name):
+    cls = getattr(main, name, None)
+    if not (isinstance(cls, type) and issubclass(cls, main.ExpertAIPlayer)): raise SystemExit(f"{name} 不是专家AI类")
+    return cls
+
+
+def _load_json(path):
+    with open(path, "r", encoding="utf-8") as f: return json.load(f)
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="专家AI决策表编译与一致性检查")
+    sub = parser.add_subparsers(dest="command", required=True)
+    default_path = os.environ.get("FATE_AI_TABLES", main.AI_TABLES_FILE)
+    p = sub.add_parser("build", help="编译决策表")
+    p.add_argument("--player", default="ExpertAIPlayer", help="按哪个AI类的权重编译")
+    p.add_argument("--config", help="规则变体的 JSON 文件（只写出与标准规则不同的字段），默认为标准规则")
+    p.add_argument("--out", default=default_path, help="输出文件")
+    p.add_argument("--quiet", action="store_true", help="不显示进度")
+    p = sub.add_parser("check", help="检查决策表与在线打分是否一致")
+    p.add_argument("table", nargs="?", default=default_path, help="决策表文件")
+    p.add_argument("--player", default="ExpertAIPlayer", help="决策表对应的AI类")
+    p.add_argument("--samples", type=int, default=100000, help="随机局面数")
+    p.add_argument("--games", type=int, default=200, help="每对AI比较的局数")
+    p.add_argument("--search-games", action="store_true", help="同时比较搜索AI的对局（较慢）")
+    p.add_argument("--search-nodes", type=int, default=30, help="搜索AI每次决策的推演局数")
+    p.add_argument("--seed", type=int, default=0)
+    for p in sub.choices.values():
+        p.add_argument("--ai-weights", default=os.environ.get("FATE_AI_WEIGHTS"), help="按此权重文件（tune.py 写出）编译或检查，默认取 $FATE_AI_WEIGHTS")
+    args = parser.parse_args(argv)
+    if args.ai_weights: main.load_ai_weights(args.ai_weights)
+    if args.command == "build": build(args)
+    else: sys.exit(check(args))
+
+
+if __name__ == "__main__":
+    main_cli()
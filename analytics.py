@@ -0,0 +1,428 @@
+"""命运轮盘模拟数据分析
+
+simulate 子命令在进程池中下无头AI对局，通过事件总线把每一次行动（使用灵物、使用命运卡牌、
+遥控器迫使的抽牌）记成一行：行动方、灵物、命运卡牌、目标、双方生命值变化、镜子是否反弹、
+护身符是否吸收或破碎。每个工作进程攒够 --batch 行后（只在对局边界）写出一个压缩的
+NumPy .npz 列式分块，内存占用与总局数无关。
+
+report 子命令逐个分块流式聚合：各灵物使用与否的胜率差、各命运卡牌的伤害分布、
+先手与座位优势。
+
+用法示例:
+    python analytics.py simulate --players ExpertAIPlayer ExpertAIPlayer --games 200000 --jobs 8 --out sim_events
+    python analytics.py report sim_events --json summary.json
+"""
+import argparse
+import glob
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+import main
+from tournament import discover_ai_classes, game_seed
+
+SCHEMA_VERSION = 1
+MANIFEST = "manifest.json"
+Z95 = 1.959964
+
+# 行动的种类和来源
+KIND_SPIRIT, KIND_FATE = 0, 1
+VIA_SELF, VIA_RADIO, VIA_REMOTE = 0, 1, 2 # 自己使用 / 被无线电强制使用 / 被遥控器强制抽牌
+AMULET_NONE, AMULET_ABSORBED, AMULET_SHATTERED = 0, 1, 2
+
+# 每行一次行动；spirit、card、target 不适用时为 -1，生命值变化是行动结束时减去行动开始时
+EVENT_COLUMNS = (
+    ("game", np.int64), ("turn", np.int16), ("actor", np.int8), ("kind", np.int8), ("via", np.int8),
+    ("spirit", np.int8), ("card", np.int8), ("target", np.int8),
+    ("hp_actor", np.int8), ("hp_opponent", np.int8), ("mirror", np.bool_), ("amulet", np.int8),
+)
+# 每局一行；winner 为 -1 表示平局
+GAME_COLUMNS = (("game", np.int64), ("seed", np.uint64), ("first_player", np.int8), ("winner", np.int8), ("turns", np.int16))
+
+DAMAGE_BINS = 6 # 伤害分布的桶：0..4 各一个，最后一个是 5 点及以上
+
+
+# ==============================================================================
+# --- 事件采集 ---
+# ==============================================================================
+
+class ActionRecorder:
+    """订阅对局事件总线，把每次行动整理成 EVENT_COLUMNS 顺序的元组。
+
+    一次行动从 SpiritUsed / SpiritForced / FateCardPrepared / RemoteControlTriggered 开始，
+    到下一次行动开始或回合结束为止；无线电强制使用的灵物单独成行，无线电本身那一行没有生命值变化。
+    """
+    wants_events = True
+
+    def __init__(self, game, game_id):
+        self.game = game
+        self.game_id = game_id
+        self.rows = []
+        self.current = None # 进行中的行动（列表，按 EVENT_COLUMNS 排列）
+        self.start_hp = None
+        self.damaged_hp = [None, None] # 本次行动中各座位最近一次受伤后的生命值
+
+    def _seat(self, player): return self.game.players.index(player)
+
+    def _open(self, actor, kind, via, spirit=-1, card=-1, target=-1):
+        self._close()
+        players = self.game.players
+        self.start_hp = (players[actor].hp, players[1 - actor].hp)
+        self.damaged_hp = [None, None]
+        self.current = [self.game_id, self.game.turn_count, actor, kind, via, spirit, card, target, 0, 0, False, AMULET_NONE]
+
+    def _close(self, contract_seat=None):
+        row = self.current
+        if row is None: return
+        hp = [player.hp for player in self.game.players]
+        # 契约书把生命值重置为1之前的真实结果
+        if contract_seat is not None and self.damaged_hp[contract_seat] is not None: hp[contract_seat] = self.damaged_hp[contract_seat]
+        actor = row[2]
+        row[8] = hp[actor] - self.start_hp[0]
+        row[9] = hp[1 - actor] - self.start_hp[1]
+        self.rows.append(tuple(row))
+        self.current = None
+
+    def handle(self, event):
+        kind = type(event)
+        if kind is main.SpiritUsed:
+            self._open(self._seat(event.player), KIND_SPIRIT, VIA_SELF, main.SPIRIT_INDEX[event.spirit])
+        elif kind is main.SpiritForced:
+            self._open(self._seat(event.victim), KIND_SPIRIT, VIA_RADIO, main.SPIRIT_INDEX[event.spirit])
+        elif kind is main.FateCardPrepared:
+            self._open(self._seat(event.player), KIND_FATE, VIA_SELF)
+        elif kind is main.RemoteControlTriggered:
+            seat = self._seat(event.player)
+            self._open(seat, KIND_FATE, VIA_REMOTE, target=seat)
+        elif self.current is None:
+            return
+        elif kind is main.TargetChosen:
+            self.current[7] = self._seat(event.target)
+        elif kind is main.FateCardDrawn or kind is main.RemoteControlDrawn:
+            self.current[6] = main.FATE_CARD_INDEX[event.card]
+        elif kind is main.MirrorReflected:
+            self.current[10] = True
+        elif kind is main.AmuletAbsorbed:
+            self.current[11] = max(self.current[11], AMULET_ABSORBED)
+        elif kind is main.AmuletShattered:
+            self.current[11] = AMULET_SHATTERED
+        elif kind is main.DamageTaken:
+            self.damaged_hp[self._seat(event.player)] = event.hp
+        elif kind is main.TurnEnded:
+            self._close()
+        elif kind is main.ContractTriggered:
+            # 遥控器抽牌之后的判定发生在回合之外，行动这时还没有结束
+            self._close(self._seat(event.player))
+
+    def flush(self): pass
+
+    def finish(self):
+        """对局结束（包括遥控器抽牌后直接分出胜负的情况）时收尾，返回全部行"""
+        self._close()
+        return self.rows
+
+
+class ChunkWriter:
+    """按列缓存行，攒够 batch 行就写出一个 .npz 分块"""
+
+    def __init__(self, out_dir, prefix, batch):
+        self.out_dir = out_dir
+        self.prefix = prefix
+        self.batch = batch
+        self.events = []
+        self.games = []
+        self.files = []
+
+    def add_game(self, game_row, event_rows):
+        self.games.append(game_row)
+        self.events.extend(event_rows)
+        if len(self.events) >= self.batch: self.write()
+
+    def write(self):
+        if not self.games: return
+        path = os.path.join(self.out_dir, f"{self.prefix}-{len(self.files):04d}.npz")
+        arrays = {}
+        events = np.array(self.events, dtype=np.int64).reshape(-1, len(EVENT_COLUMNS))
+        for index, (name, dtype) in enumerate(EVENT_COLUMNS): arrays[name] = events[:, index].astype(dtype)
+        for index, (name, dtype) in enumerate(GAME_COLUMNS):
+            arrays["game_" + name] = np.array([row[index] for row in self.games], dtype=dtype)
+        np.savez_compressed(path, **arrays)
+        self.files.append(os.path.basename(path))
+        self.events.clear()
+        self.games.clear()
+
+
+def _simulate_chunk(task):
+    """工作进程：下一批种子（每个种子交换先后手各一局），把行动写成分块文件"""
+    task_index, first_cls, second_cls, start, count, base_seed, max_turns, config, out_dir, batch = task
+    writer = ChunkWriter(out_dir, f"events-{task_index:05d}", batch)
+    rows = 0
+    for game_index in range(start, start + count):
+        seed = game_seed(base_seed, 0, game_index)
+        for first_player in (0, 1):
+            game_id = game_index * 2 + first_player
+            game = main.Game(headless=True, seed=seed, record=False, config=config)
+            game.players = [first_cls(), second_cls()]
+            recorder = game.bus.subscribe(ActionRecorder(game, game_id))
+            result = game.run_headless(first_player, max_turns)
+            events = recorder.finish()
+            rows += len(events)
+            writer.add_game((game_id, seed, result.first_player, -1 if result.winner is None else result.winner, result.turns), events)
+    writer.write()
+    return count * 2, rows, writer.files
+
+
+def simulate(first_cls, second_cls, games, out_dir, jobs, batch=100_000, chunk_size=1000, base_seed=0,
+             max_turns=main.HEADLESS_MAX_TURNS, config=None, progress=True):
+    """下 games 局并把行动写入 out_dir，最后写出 manifest.json；返回清单"""
+    os.makedirs(out_dir, exist_ok=True)
+    for stale in glob.glob(os.path.join(out_dir, "events-*.npz")): os.remove(stale)
+    config = config if config is not None else main.DEFAULT_CONFIG
+    seeds = max(1, games // 2)
+    tasks = [(index, first_cls, second_cls, start, min(chunk_size, seeds - start), base_seed, max_turns, config, out_dir, batch)
+             for index, start in enumerate(range(0, seeds, chunk_size))]
+    total_games = seeds * 2
+    done = rows = 0
+    files = []
+    started = last_report = time.perf_counter()
+    with multiprocessing.Pool(processes=jobs) as pool:
+        for played, written, names in pool.imap_unordered(_simulate_chunk, tasks):
+            done += played
+            rows += written
+            files.extend(names)
+            now = time.perf_counter()
+            if progress and (now - last_report > 0.2 or done == total_games):
+                last_report = now
+                rate = done / (now - started) if now > started else 0
+                sys.stderr.write(f"\r进度 {done}/{total_games} 局 ({done / total_games:6.1%})  {rate:,.0f} 局/秒  {rows:,} 行 ")
+                sys.stderr.flush()
+    if progress: sys.stderr.write("\n")
+    manifest = {
+        "schema_version": SCHEMA_VERSION,
+        "players": [first_cls.__name__, second_cls.__name__],
+        "games": total_games,
+        "rows": rows,
+        "seed": base_seed,
+        "config": config.to_dict(only_changed=True),
+        "seconds": time.perf_counter() - started,
+        "spirits": list(main.SPIRIT_KEYS),
+        "fate_cards": list(main.FATE_CARD_KEYS),
+        "event_columns": [name for name, _ in EVENT_COLUMNS],
+        "game_columns": [name for name, _ in GAME_COLUMNS],
+        "files": sorted(files),
+    }
+    with open(os.path.join(out_dir, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=4, ensure_ascii=False)
+    return manifest
+
+
+# ==============================================================================
+# --- 流式聚合 ---
+# ==============================================================================
+
+def iter_chunks(out_dir):
+    """按清单顺序逐个读入分块（每次只有一个分块在内存中）"""
+    with open(os.path.join(out_dir, MANIFEST), "r", encoding="utf-8") as f: manifest = json.load(f)
+    if manifest.get("schema_version") != SCHEMA_VERSION:
+        raise ValueError(f"不支持的数据版本: {manifest.get('schema_version')}")
+    for name in manifest["files"]:
+        with np.load(os.path.join(out_dir, name)) as data: yield {key: data[key] for key in data.files}
+
+
+class Aggregator:
+    """可合并的计数器：每个分块只包含完整的对局，逐块累加后由 summary() 得出指标"""
+
+    def __init__(self):
+        spirits, cards = len(main.SPIRIT_KEYS), len(main.FATE_CARD_KEYS)
+        self.games = 0
+        self.draws = 0
+        self.turns = 0
+        self.seat_wins = np.zeros(2, dtype=np.int64)
+        self.first_wins = 0
+        # (灵物, 是否使用过, 是否获胜) 的 (对局, 座位) 计数
+        self.spirit_outcomes = np.zeros((spirits, 2, 2), dtype=np.int64)
+        self.spirit_uses = np.zeros(spirits, dtype=np.int64)
+        self.forced_uses = np.zeros(spirits, dtype=np.int64)
+        # (命运卡牌, 目标是否自己, 行动方掉血桶, 对手掉血桶)
+        self.card_damage = np.zeros((cards, 2, DAMAGE_BINS, DAMAGE_BINS), dtype=np.int64)
+        self.mirror_reflections = np.zeros(cards, dtype=np.int64)
+        self.amulet = np.zeros(3, dtype=np.int64)
+
+    def add(self, chunk):
+        winners = chunk["game_winner"]
+        decided = winners >= 0
+        self.games += len(winners)
+        self.draws += int((~decided).sum())
+        self.turns += int(chunk["game_turns"].sum(dtype=np.int64))
+        self.seat_wins += np.bincount(winners[decided], minlength=2)
+        self.first_wins += int((winners == chunk["game_first_player"]).sum())
+
+        # 把行的对局编号映射到本分块中的对局下标
+        order = np.argsort(chunk["game_game"])
+        position = order[np.searchsorted(chunk["game_game"], chunk["game"], sorter=order)]
+        spirit_rows = chunk["kind"] == KIND_SPIRIT
+        used = np.zeros((len(winners), 2, len(main.SPIRIT_KEYS)), dtype=bool)
+        used[position[spirit_rows], chunk["actor"][spirit_rows], chunk["spirit"][spirit_rows]] = True
+        won = np.stack([winners == 0, winners == 1], axis=1)
+        used_total = used.sum(axis=(0, 1))
+        used_won = (used & won[:, :, None]).sum(axis=(0, 1))
+        unused_won = int(won.sum()) - used_won
+        self.spirit_outcomes[:, 1, 1] += used_won
+        self.spirit_outcomes[:, 1, 0] += used_total - used_won
+        self.spirit_outcomes[:, 0, 1] += unused_won
+        self.spirit_outcomes[:, 0, 0] += 2 * len(winners) - used_total - unused_won
+        np.add.at(self.spirit_uses, chunk["spirit"][spirit_rows], 1)
+        forced = spirit_rows & (chunk["via"] == VIA_RADIO)
+        np.add.at(self.forced_uses, chunk["spirit"][forced], 1)
+
+        fate_rows = (chunk["kind"] == KIND_FATE) & (chunk["card"] >= 0)
+        card = chunk["card"][fate_rows]
+        on_self = (chunk["target"][fate_rows] == chunk["actor"][fate_rows]).astype(np.int64)
+        lost_actor = np.clip(-chunk["hp_actor"][fate_rows].astype(np.int64), 0, DAMAGE_BINS - 1)
+        lost_opponent = np.clip(-chunk["hp_opponent"][fate_rows].astype(np.int64), 0, DAMAGE_BINS - 1)
+        np.add.at(self.card_damage, (card, on_self, lost_actor, lost_opponent), 1)
+        np.add.at(self.mirror_reflections, card[chunk["mirror"][fate_rows]], 1)
+        self.amulet += np.bincount(chunk["amulet"].astype(np.int64), minlength=3)
+
+    def summary(self, manifest):
+        games = self.games
+        decided = games - self.draws
+        spirits = {}
+        for index, name in enumerate(main.SPIRIT_KEYS):
+            (lost_unused, won_unused), (lost_used, won_used) = self.spirit_outcomes[index]
+            n_used, n_unused = int(lost_used + won_used), int(lost_unused + won_unused)
+            rate_used = won_used / n_used if n_used else None
+            rate_unused = won_unused / n_unused if n_unused else None
+            impact = ci = None
+            if n_used and n_unused:
+                impact = rate_used - rate_unused
+                ci = Z95 * math.sqrt(rate_used * (1 - rate_used) / n_used + rate_unused * (1 - rate_unused) / n_unused)
+            spirits[name] = {
+                "uses": int(self.spirit_uses[index]),
+                "forced_uses": int(self.forced_uses[index]),
+                "seat_games_used": n_used,
+                "win_rate_used": rate_used,
+                "win_rate_unused": rate_unused,
+                "win_rate_impact": impact, # 使用过与没使用过的 (对局, 座位) 的胜率差，是相关而非因果
+                "win_rate_impact_ci95": ci,
+            }
+        cards = {}
+        bins = np.arange(DAMAGE_BINS)
+        for index, name in enumerate(main.FATE_CARD_KEYS):
+            entry = {"mirror_reflections": int(self.mirror_reflections[index])}
+            for on_self, label in ((0, "on_opponent"), (1, "on_self")):
+                table = self.card_damage[index, on_self]
+                n = int(table.sum())
+                to_actor, to_opponent = table.sum(axis=1), table.sum(axis=0)
+                entry[label] = {
+                    "uses": n,
+                    "mean_damage_to_actor": float(to_actor @ bins / n) if n else None,
+                    "mean_damage_to_opponent": float(to_opponent @ bins / n) if n else None,
+                    "damage_to_actor": (to_actor / n).tolist() if n else None, # 0..4 点各一桶，最后一桶为 5 点及以上
+                    "damage_to_opponent": (to_opponent / n).tolist() if n else None,
+                }
+            cards[name] = entry
+        first_rate = self.first_wins / decided if decided else None
+        seat0_rate = self.seat_wins[0] / decided if decided else None
+        return {
+            "players": manifest["players"],
+            "config": manifest["config"],
+            "games": games,
+            "draws": self.draws,
+            "average_turns": self.turns / games if games else None,
+            "seat0_win_rate": seat0_rate,
+            "seat0_win_rate_ci95": Z95 * math.sqrt(seat0_rate * (1 - seat0_rate) / decided) if decided else None,
+            "first_player_win_rate": first_rate,
+            "first_player_win_rate_ci95": Z95 * math.sqrt(first_rate * (1 - first_rate) / decided) if decided else None,
+            "amulet": {"absorbed": int(self.amulet[AMULET_ABSORBED]), "shattered": int(self.amulet[AMULET_SHATTERED])},
+            "spirits": spirits,
+            "fate_cards": cards,
+        }
+
+
+def aggregate(out_dir):
+    with open(os.path.join(out_dir, MANIFEST), "r", encoding="utf-8") as f: manifest = json.load(f)
+    aggregator = Aggregator()
+    for chunk in iter_chunks(out_dir): aggregator.add(chunk)
+    return aggregator.summary(manifest)
+
+
+def _percent(value, ci=None):
+    if value is None: return "-"
+    return f"{value:+.1%} ± {ci:.1%}" if ci is not None else f"{value:.1%}"
+
+
+def print_summary(summary):
+    first, second = summary["players"]
+    print(f"\n{first} 对 {second}，共 {summary['games']:,} 局（平局 {summary['draws']}），平均 {summary['average_turns']:.2f} 回合")
+    if summary["config"]: print("规则变体: " + json.dumps(summary["config"], ensure_ascii=False))
+    print(f"座位0胜率 {_percent(summary['seat0_win_rate'])} ± {summary['seat0_win_rate_ci95']:.1%}，"
+          f"先手胜率 {_percent(summary['first_player_win_rate'])} ± {summary['first_player_win_rate_ci95']:.1%}")
+    print(f"护身符吸收 {summary['amulet']['absorbed']:,} 次，破碎 {summary['amulet']['shattered']:,} 次")
+
+    print("\n--- 灵物：使用过 vs 没使用过的胜率差（相关，非因果） ---")
+    ordered = sorted(summary["spirits"].items(), key=lambda item: -(item[1]["win_rate_impact"] or 0))
+    for name, entry in ordered:
+        print(f"{main.SPIRIT_NAMES[name]:<6}\t使用 {entry['uses']:>8,} 次（被强制 {entry['forced_uses']:>6,}）\t"
+              f"胜率 {_percent(entry['win_rate_used'])} / {_percent(entry['win_rate_unused'])}\t"
+              f"差 {_percent(entry['win_rate_impact'], entry['win_rate_impact_ci95'])}")
+
+    print("\n--- 命运卡牌：每次结算的平均掉血（行动方 / 对手） ---")
+    for name, entry in summary["fate_cards"].items():
+        cells = []
+        for label, text in (("on_opponent", "对对手"), ("on_self", "对自己")):
+            part = entry[label]
+            if not part["uses"]: cells.append(f"{text} -")
+            else: cells.append(f"{text} {part['uses']:>8,} 次 {part['mean_damage_to_actor']:.2f} / {part['mean_damage_to_opponent']:.2f}")
+        print(f"{main.FATE_CARD_NAMES[name]:<4}\t" + "\t".join(cells) + f"\t镜子反弹 {entry['mirror_reflections']:,} 次")
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="命运轮盘模拟数据分析")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("simulate", help="下无头对局并把每次行动写成列式分块")
+    p.add_argument("--players", nargs=2, default=["ExpertAIPlayer", "ExpertAIPlayer"], help="对局双方的 AI 类")
+    p.add_argument("--games", type=int, default=20000, help="总局数（先后手各一半）")
+    p.add_argument("--out", default="sim_events", help="分块输出目录（其中旧的分块会被删除）")
+    p.add_argument("--batch", type=int, default=100_000, help="每个分块大约包含的行数")
+    p.add_argument("--chunk", type=int, default=1000, help="每个任务包含的种子数")
+    p.add_argument("--jobs", type=int, default=multiprocessing.cpu_count(), help="工作进程数")
+    p.add_argument("--seed", type=int, default=0, help="基础随机种子")
+    p.add_argument("--max-turns", type=int, default=main.HEADLESS_MAX_TURNS, help="单局回合上限")
+    p.add_argument("--config", help="规则变体的 JSON 文件（只写与标准规则不同的字段）")
+    p.add_argument("--quiet", action="store_true", help="不显示实时进度")
+    p = sub.add_parser("report", help="流式聚合分块并输出指标")
+    p.add_argument("out", nargs="?", default="sim_events", help="分块目录")
+    p.add_argument("--json", help="将汇总写入 JSON 文件")
+    args = parser.parse_args(argv)
+
+    if args.command == "simulate":
+        by_name = {cls.__name__: cls for cls in discover_ai_classes()}
+        unknown = [name for name in args.players if name not in by_name]
+        if unknown: parser.error(f"未知的 AI 类: {', '.join(unknown)}")
+        config = None
+        if args.config:
+            try:
+                with open(args.config, "r", encoding="utf-8") as f: config = main.GameConfig.from_dict(json.load(f))
+            except (ValueError, OSError) as e: parser.error(str(e))
+        manifest = simulate(by_name[args.players[0]], by_name[args.players[1]], args.games, args.out, args.jobs,
+                            args.batch, args.chunk, args.seed, args.max_turns, config, progress=not args.quiet)
+        print(f"{manifest['games']:,} 局、{manifest['rows']:,} 行写入 {args.out}（{len(manifest['files'])} 个分块），"
+              f"用时 {manifest['seconds']:.1f} 秒")
+        return 0
+
+    summary = aggregate(args.out)
+    print_summary(summary)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=4, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
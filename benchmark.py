@@ -0,0 +1,321 @@
+"""命运轮盘性能基准
+
+固定种子、固定局面集，多次重复取中位数，结果写入机器可读的基线文件；
+compare 模式重新测量（或读取另一份结果）并与基线逐项比较，超出阈值的退化会被标出并以非零状态退出。
+
+用法示例:
+    python benchmark.py run --out bench_baseline.json          # 测量并保存基线
+    python benchmark.py compare bench_baseline.json            # 修改后重新测量，与基线比较
+    python benchmark.py compare bench_baseline.json --results after.json --threshold 0.05
+    python benchmark.py list                                   # 列出所有基准项
+"""
+import argparse
+import gc
+import itertools
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+import main
+from tournament import discover_ai_classes
+
+CORPUS_SIZE = 400        # 微基准使用的局面数
+CORPUS_SEED = 20240601   # 局面集的基础种子
+MEMORY_GAMES = 200       # 测量内存时同时保留的对局数
+
+BENCHMARKS = [] # (名称, 类型, 构造函数)；类型为 "time" 或 "memory"
+
+
+def benchmark(name, kind="time"):
+    """注册一个基准项。time 类型的构造函数返回 run(n)，执行 n 次被测操作；memory 类型返回每局的 (保留字节数, 峰值字节数)"""
+    def register(factory):
+        BENCHMARKS.append((name, kind, factory))
+        return factory
+    return register
+
+
+def _new_game(seed, classes=(main.HellAIPlayer, main.ExpertAIPlayer)):
+    game = main.Game(headless=True, seed=seed)
+    game.players = [cls() for cls in classes]
+    return game
+
+
+def build_positions(count=CORPUS_SIZE, seed=CORPUS_SEED):
+    """地狱AI对专家AI的若干局中，每个回合开始时的局面键"""
+    positions = []
+    for game_seed in itertools.count(seed):
+        game = _new_game(game_seed)
+        game._setup()
+        while not game.game_over and game.turn_count < main.HEADLESS_MAX_TURNS:
+            positions.append(game.state_key())
+            game._turn()
+            game._check_game_over()
+            if not game.game_over: game._switch_player()
+        if len(positions) >= count: return positions[:count]
+
+
+def materialize(positions):
+    """把每个局面恢复成一局独立的对局，AI 的牌堆信念按恢复后的牌堆重置；返回 (对局, 行动方, 对手)"""
+    games = []
+    for key in positions:
+        game = _new_game(0)
+        game.restore_state(key)
+        for player in game.players:
+            player.bus = game.bus
+            player.deck_refilled(game.fate_deck)
+        player = game.players[game.current_player_index]
+        games.append((game, player, game.players[1 - game.current_player_index]))
+    return games
+
+
+_corpus = None
+
+def corpus():
+    global _corpus
+    if _corpus is None: _corpus = materialize(build_positions())
+    return _corpus
+
+
+# --- 整局吞吐 ---
+
+def _register_throughput():
+    classes = discover_ai_classes()
+    for first_cls, second_cls in itertools.combinations(classes, 2):
+        def factory(first_cls=first_cls, second_cls=second_cls):
+            def run(n):
+                # 每次重复都下同样的 n 局（先后手交替）
+                for seed in range(CORPUS_SEED, CORPUS_SEED + n):
+                    main.simulate_game(first_cls, second_cls, seed=seed, first_player=seed & 1)
+            return run
+        benchmark(f"throughput[{first_cls.__name__} vs {second_cls.__name__}]")(factory)
+
+_register_throughput()
+
+
+# --- AI 决策延迟 ---
+
+@benchmark("latency[ExpertAIPlayer._evaluate_spirit_use]")
+def _evaluate_spirit_use():
+    cases = [(player, opponent, game, player._determine_strategic_tendency(opponent)) for game, player, opponent in corpus()]
+    def run(n):
+        for player, opponent, game, tendency in itertools.islice(itertools.cycle(cases), n):
+            player._evaluate_spirit_use(opponent, game, tendency)
+    return run
+
+@benchmark("latency[ExpertAIPlayer.ai_choose_spirit_to_force_use]")
+def _force_use():
+    # 无线电发动时的调用方式：行动方替对手挑选灵物
+    cases = [(main.ExpertAIPlayer.ai_choose_spirit_to_force_use, player, opponent) for _, player, opponent in corpus()]
+    def run(n):
+        for choose, player, opponent in itertools.islice(itertools.cycle(cases), n):
+            choose(player, opponent.spirits, opponent)
+    return run
+
+@benchmark("latency[HellAIPlayer._determine_strategic_tendency]")
+def _strategic_tendency():
+    cases = [(game.players[0], game.players[1]) for game, _, _ in corpus()] # 0号座位是地狱AI
+    def run(n):
+        for player, opponent in itertools.islice(itertools.cycle(cases), n):
+            player._determine_strategic_tendency(opponent)
+    return run
+
+
+# --- 规则热点 ---
+
+@benchmark("latency[Game._draw_fate_card]")
+def _draw_fate_card():
+    # 包含观察者（两名AI的牌堆信念）的更新以及牌堆抽空后的重新生成
+    game = _new_game(CORPUS_SEED)
+    game._setup()
+    players = game.players
+    def run(n):
+        for i in range(n): game._draw_fate_card(players[i & 1])
+    return run
+
+@benchmark("latency[Game._use_spirit dispatch]")
+def _use_spirit_dispatch():
+    # 护符的效果只是设置一个状态，测得的主要是出牌、统计、事件和策略分派本身的开销
+    game = _new_game(CORPUS_SEED)
+    game._setup()
+    user, opponent = game.players
+    def run(n):
+        spirits = user.spirits
+        for _ in range(n):
+            spirits.append("AMULET")
+            game._use_spirit(len(spirits) - 1, user, opponent)
+    return run
+
+
+# --- 内存 ---
+
+def _retained_bytes(build):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        games = [build(seed) for seed in range(CORPUS_SEED, CORPUS_SEED + MEMORY_GAMES)]
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del games
+    return current / MEMORY_GAMES, peak / MEMORY_GAMES
+
+@benchmark("memory[Game after setup]", kind="memory")
+def _memory_setup():
+    def build(seed):
+        game = _new_game(seed)
+        game._setup()
+        return game
+    return _retained_bytes(build)
+
+@benchmark("memory[Game after full game]", kind="memory")
+def _memory_full_game():
+    def build(seed):
+        game = _new_game(seed)
+        game.run_headless(seed & 1)
+        return game
+    return _retained_bytes(build)
+
+
+# --- 测量与比较 ---
+
+def _calibrate(run, min_time):
+    """与 timeit.autorange 相同：把单次重复的操作数加倍，直到耗时不少于 min_time"""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        run(number)
+        if time.perf_counter() - started >= min_time: return number
+        number *= 2
+
+
+def measure(name, kind, factory, repeat, min_time):
+    if kind == "memory":
+        retained, peak = factory()
+        return {"kind": kind, "unit": "bytes", "value": retained, "peak": peak}
+    run = factory()
+    number = _calibrate(run, min_time) # 同时也是预热
+    samples = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable() # 与 timeit 一致，避免垃圾回收时机带来的抖动
+    try:
+        for _ in range(repeat):
+            gc.collect()
+            started = time.perf_counter()
+            run(number)
+            samples.append((time.perf_counter() - started) / number)
+    finally:
+        if gc_was_enabled: gc.enable()
+    median = statistics.median(samples)
+    quartiles = statistics.quantiles(samples, n=4) if len(samples) > 1 else [median, median, median]
+    return {"kind": kind, "unit": "seconds", "value": median, "min": min(samples),
+            "iqr": quartiles[2] - quartiles[0], "number": number, "samples": samples,
+            "ops_per_second": 1 / median if median else 0.0}
+
+
+def selected(pattern):
+    return [b for b in BENCHMARKS if not pattern or pattern in b[0]]
+
+
+def run_suite(pattern=None, repeat=7, min_time=0.2, search_nodes=20, progress=True):
+    # 搜索AI按固定推演局数决策，保证每次测量的工作量相同（与循环赛一致）
+    main.SearchAIPlayer.node_budget = search_nodes
+    results = {}
+    for name, kind, factory in selected(pattern):
+        if progress: sys.stderr.write(f"  {name} ...\n")
+        results[name] = measure(name, kind, factory, repeat, min_time)
+    return {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "settings": {"repeat": repeat, "min_time": min_time, "search_nodes": search_nodes,
+                     "corpus_size": CORPUS_SIZE, "corpus_seed": CORPUS_SEED, "memory_games": MEMORY_GAMES},
+        "results": results,
+    }
+
+
+def format_value(entry):
+    if entry["unit"] == "bytes": return f"{entry['value'] / 1024:10.1f} KiB"
+    value = entry["value"]
+    if value >= 1e-3: text = f"{value * 1e3:10.3f} ms"
+    else: text = f"{value * 1e6:10.3f} µs"
+    spread = entry["iqr"] / value if value else 0.0
+    return f"{text}  ±{spread:5.1%}  ({entry['ops_per_second']:,.0f}/s)"
+
+
+def print_results(report):
+    width = max(len(name) for name in report["results"]) if report["results"] else 0
+    for name, entry in report["results"].items():
+        print(f"{name:<{width}}  {format_value(entry)}")
+
+
+def compare(baseline, current, threshold):
+    """逐项比较（都是越小越好），返回退化项列表。计时项的变化若没有超过两边四分位距之和，视为噪声"""
+    width = max((len(name) for name in current["results"]), default=0)
+    regressions = []
+    for name, entry in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            print(f"{name:<{width}}  {format_value(entry)}   （基线中没有）")
+            continue
+        ratio = entry["value"] / base["value"] if base["value"] else float("inf")
+        noise = (entry.get("iqr", 0.0) + base.get("iqr", 0.0)) / base["value"] if base["value"] else 0.0
+        change = ratio - 1
+        if change > threshold and change > noise:
+            mark = "退化"
+            regressions.append((name, change))
+        elif -change > threshold and -change > noise: mark = "改进"
+        else: mark = ""
+        print(f"{name:<{width}}  {format_value(entry)}   {change:+7.1%}  {mark}")
+    for name in baseline["results"]:
+        if name not in current["results"]: print(f"{name:<{width}}  （本次未测量）")
+    return regressions
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="命运轮盘性能基准")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="列出所有基准项")
+    for command, help_text in (("run", "测量并保存结果"), ("compare", "测量并与基线比较")):
+        p = sub.add_parser(command, help=help_text)
+        if command == "compare":
+            p.add_argument("baseline", help="基线文件")
+            p.add_argument("--results", help="直接使用已有的结果文件，不重新测量")
+            p.add_argument("--threshold", type=float, default=0.10, help="判定退化的相对阈值（默认 0.10 即 10%%）")
+        p.add_argument("--out", default="bench_baseline.json" if command == "run" else None, help="结果写入的文件")
+        p.add_argument("--filter", help="只运行名称包含该字符串的基准项")
+        p.add_argument("--repeat", type=int, default=7, help="每项的重复次数（取中位数）")
+        p.add_argument("--min-time", type=float, default=0.2, help="单次重复的最短耗时（秒）")
+        p.add_argument("--search-nodes", type=int, default=20, help="搜索AI每次决策的推演局数")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        for name, kind, _ in BENCHMARKS: print(f"{kind:<7} {name}")
+        return
+
+    if args.command == "compare" and args.results:
+        with open(args.results, encoding="utf-8") as f: report = json.load(f)
+    else:
+        report = run_suite(args.filter, args.repeat, args.min_time, args.search_nodes)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f: json.dump(report, f, indent=4, ensure_ascii=False)
+
+    if args.command == "run":
+        print_results(report)
+        if args.out: print(f"\n结果已写入 {args.out}")
+        return
+    with open(args.baseline, encoding="utf-8") as f: baseline = json.load(f)
+    if baseline.get("settings") != report.get("settings"):
+        print(f"注意：测量参数与基线不同（基线 {baseline.get('settings')}）")
+    regressions = compare(baseline, report, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} 项超过 {args.threshold:.0%} 的退化阈值。")
+        sys.exit(1)
+    print(f"\n没有超过 {args.threshold:.0%} 的退化。")
+
+
+if __name__ == "__main__":
+    main_cli()
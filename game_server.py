@@ -0,0 +1,409 @@
+"""命运轮盘多会话服务器
+
+一个 asyncio 事件循环同时承载大量对局（人机、双人）。每局是一个 main.GameSession：
+等待玩家期间只保存种子和已做出的决策，不保留 Game 对象，也不占用线程。
+会话的推进（从种子重新运行到下一个决策）交给重放进程池，AI 的决策由 AIScheduler 交给AI进程池计算，
+超时兜底也在重放进程池中计算，事件循环本身从不运行对局代码。
+
+协议为按行分隔的 JSON（UTF-8）。客户端发送:
+    {"op": "new", "vs": "ai", "difficulty": 3, "name": "玩家"}     # 人机对战，难度见 main.DIFFICULTY_LEVELS
+    {"op": "new", "vs": "human", "name": "玩家1"}                  # 创建双人对局，等待对手加入
+    {"op": "join", "session": "3f2a9c1e", "name": "玩家2"}         # 加入双人对局
+    {"op": "answer", "choice": 0}                                  # 回答待决的决策（选项序号）
+服务器发送:
+    {"type": "session", "session": ..., "seat": 0}                 # 对局已创建 / 已加入
+    {"type": "event", "event": "DamageTaken", "text": ...}         # 对局事件（私密事件只发给所属玩家）
+    {"type": "decision", "kind": "action", "prompt": ..., "options": [...], "timeout": 120}
+    {"type": "end", "winner": 1, "reason": "finished"}            # winner 为座位号，null 为平局
+    {"type": "error", "message": ...}
+
+用法示例:
+    python game_server.py --port 7788 --max-sessions 5000 --history fate_history.db
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import secrets
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import main
+
+LINE_LIMIT = 64 * 1024 # 单条消息的长度上限（字节）
+ANSWER_QUEUE_SIZE = 4  # 每个连接未处理答复的上限，超过视为刷屏
+AI_DEADLINE = 2.0      # AI 单次决策的截止时间（秒），超时改用兜底AI
+FALLBACK_AI = main.ExpertAIPlayer # 兜底用的廉价启发式AI
+
+
+class _Disconnected:
+    """连接断开时放进答复队列的标记"""
+
+
+class Client:
+    """一个客户端连接。写出时等待缓冲区排空（背压），读入的答复放进有界队列"""
+    __slots__ = ("reader", "writer", "name", "match", "seat", "answers", "send_timeout", "closed")
+
+    def __init__(self, reader, writer, send_timeout):
+        self.reader = reader
+        self.writer = writer
+        self.name = "玩家"
+        self.match = None
+        self.seat = None
+        self.answers = asyncio.Queue(ANSWER_QUEUE_SIZE)
+        self.send_timeout = send_timeout
+        self.closed = False
+
+    async def send(self, message):
+        if self.closed: return
+        self.writer.write(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+        try:
+            # 对方不读数据时只会卡住这一局，超时后断开这个慢连接
+            await asyncio.wait_for(self.writer.drain(), self.send_timeout)
+        except (asyncio.TimeoutError, ConnectionError):
+            self.close()
+
+    def close(self):
+        if self.closed: return
+        self.closed = True
+        self.writer.close()
+        try: self.answers.put_nowait(_Disconnected)
+        except asyncio.QueueFull: pass
+
+
+def _compute_pending(session, player_class=None):
+    """工作进程：计算会话中待决的AI决策"""
+    return session.compute_pending(player_class)
+
+
+def _advance(session):
+    """工作进程：把会话推进到下一个待决的决策，返回推进后的会话和新事件的消息。
+    事件对象引用了会话内部的玩家，不能跨进程传递，这里先转换成消息和可以看到它的座位"""
+    messages = []
+    for event in session.advance():
+        message = {"type": "event", "event": type(event).__name__, "text": event.text()}
+        messages.append((message, [seat for seat in range(len(session.seats)) if session.visible_to(event, seat)]))
+    return session, messages
+
+
+class _AIJob:
+    __slots__ = ("session", "future", "expired")
+
+    def __init__(self, session, future):
+        self.session = session
+        self.future = future
+        self.expired = False # 已超时改用兜底，工作池之后返回的结果丢弃
+
+
+class AIScheduler:
+    """把AI决策交给工作池计算，事件循环本身不做任何AI思考。
+
+    排队的请求按会话轮流派发，同时在算的请求不超过工作池大小，一个慢会话不会占满工作池。
+    过了截止时间还没有结果时改用廉价的启发式AI兜底，工作池之后返回的结果直接丢弃。兜底同样要从种子重新运行，
+    所以交给 fallback_executor（None 为事件循环默认的线程池）计算，不在事件循环中进行：
+    超时往往发生在服务器已经过载的时候。
+    """
+    def __init__(self, executor, workers, deadline=AI_DEADLINE, fallback=FALLBACK_AI, fallback_executor=None):
+        self.executor = executor
+        self.fallback_executor = fallback_executor
+        self.workers = workers
+        self.deadline = deadline
+        self.fallback = fallback
+        self.waiting = OrderedDict() # 会话键 -> 排队的请求
+        self.in_flight = 0
+        self.stats = Counter() # computed / fallback / failed
+
+    async def decide(self, key, session):
+        """返回 session 待决AI决策的编码"""
+        loop = asyncio.get_running_loop()
+        # 派发的是副本：超时兜底后会话会继续推进，不能影响还在排队或计算中的请求
+        job = _AIJob(session.clone(), loop.create_future())
+        self.waiting.setdefault(key, deque()).append(job)
+        timer = loop.call_later(self.deadline, self._expire, key, job)
+        self._dispatch(loop)
+        try:
+            return await job.future
+        finally:
+            timer.cancel()
+
+    def _dispatch(self, loop):
+        while self.in_flight < self.workers and self.waiting:
+            key, jobs = self.waiting.popitem(last=False)
+            job = jobs.popleft()
+            if jobs: self.waiting[key] = jobs # 这个会话还有请求就排到队尾，轮到下一个会话
+            self.in_flight += 1
+            work = loop.run_in_executor(self.executor, _compute_pending, job.session)
+            work.add_done_callback(lambda work, job=job: self._finished(loop, job, work))
+
+    def _finished(self, loop, job, work):
+        self.in_flight -= 1
+        if not job.expired and not job.future.done():
+            if work.cancelled() or work.exception() is not None:
+                self.stats["failed"] += 1
+                self._fall_back(loop, job)
+            else:
+                self.stats["computed"] += 1
+                job.future.set_result(work.result())
+        self._dispatch(loop)
+
+    def _expire(self, key, job):
+        if job.expired or job.future.done(): return
+        jobs = self.waiting.get(key)
+        if jobs and job in jobs:
+            jobs.remove(job)
+            if not jobs: del self.waiting[key]
+        self.stats["fallback"] += 1
+        self._fall_back(asyncio.get_running_loop(), job)
+
+    def _fall_back(self, loop, job):
+        """在兜底工作池中用兜底AI计算 job 的决策，算完后交给等待的协程"""
+        job.expired = True
+        work = loop.run_in_executor(self.fallback_executor, _compute_pending, job.session, self.fallback)
+        def resolve(work):
+            if job.future.done(): return
+            if work.cancelled(): job.future.cancel()
+            elif work.exception() is not None: job.future.set_exception(work.exception())
+            else: job.future.set_result(work.result())
+        work.add_done_callback(resolve)
+
+
+def think_delay(ai_class, request):
+    """AI 的模拟思考时间：在服务器上用计时器等待，不阻塞事件循环"""
+    if request.decision_type == main.DECISION_ACTION: return ai_class.action_think_delay
+    if request.decision_type == main.DECISION_TARGET: return ai_class.target_think_delay
+    return 0
+
+
+class Match:
+    """服务器上的一局对局：座位上的客户端（AI座位为 None）加上一个 GameSession"""
+    __slots__ = ("server", "id", "session", "clients", "task", "joined")
+
+    def __init__(self, server, session, clients):
+        self.server = server
+        self.id = secrets.token_hex(4)
+        self.session = session
+        self.clients = clients
+        self.task = None
+        self.joined = asyncio.Event()
+
+    async def broadcast(self, message):
+        for client in self.clients:
+            if client is not None: await client.send(message)
+
+    async def play(self):
+        session = self.session
+        reason = "finished"
+        winner = None
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                # 在重放进程池中推进，换回推进后的会话（会话只在这个协程中修改）
+                session, messages = await loop.run_in_executor(self.server.replay_executor, _advance, session)
+                self.session = session
+                for message, seats in messages:
+                    for seat in seats:
+                        client = self.clients[seat]
+                        if client is not None: await client.send(message)
+                if session.finished:
+                    winner = session.result.winner
+                    break
+                request = session.pending
+                ai_class = session.seats[request.seat]
+                if ai_class is not None:
+                    await self._ai_turn(ai_class, request)
+                    continue
+                client = self.clients[request.seat]
+                choice = await self._ask(client, request)
+                if choice is _Disconnected or choice is None:
+                    # 超时或断线按认输处理
+                    reason = "disconnected" if choice is _Disconnected else "timeout"
+                    winner = 1 - request.seat
+                    break
+                session.answer(choice)
+        finally:
+            self.server.finish(self)
+        await self.broadcast({"type": "end", "winner": winner, "reason": reason})
+        if reason == "finished" and self.server.stats is not None:
+            self.server.stats.record_game(session.result, self.server.difficulty_of(session), session.names)
+
+    async def _ai_turn(self, ai_class, request):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        code = await self.server.scheduler.decide(self.id, self.session)
+        # 计算本身已经花掉的时间从模拟思考时间里扣除
+        delay = think_delay(ai_class, request) * self.server.think_scale - (loop.time() - started)
+        if delay > 0: await asyncio.sleep(delay)
+        self.session.answer_code(code)
+
+    async def _ask(self, client, request):
+        """向玩家发出决策请求，直到收到合法的选项；超时返回 None，断线返回 _Disconnected"""
+        message = {"type": "decision", **request.to_dict(), "timeout": self.server.decision_timeout}
+        await client.send(message)
+        while True:
+            try:
+                choice = await asyncio.wait_for(client.answers.get(), self.server.decision_timeout)
+            except asyncio.TimeoutError:
+                return None
+            if choice is _Disconnected: return choice
+            try:
+                request.resolve(choice)
+                return choice
+            except ValueError as e:
+                await client.send({"type": "error", "message": str(e)})
+                await client.send(message)
+
+
+class GameServer:
+    def __init__(self, scheduler, max_sessions=5000, decision_timeout=120, join_timeout=300, idle_timeout=600, send_timeout=30,
+                 history_path=None, think_scale=1.0, replay_executor=None):
+        self.scheduler = scheduler
+        self.replay_executor = replay_executor # 推进会话用的工作池，None 为事件循环默认的线程池
+        self.think_scale = think_scale
+        self.max_sessions = max_sessions
+        self.decision_timeout = decision_timeout
+        self.join_timeout = join_timeout
+        self.idle_timeout = idle_timeout
+        self.send_timeout = send_timeout
+        self.matches = {}
+        self.stats = main.GameStats(history_path, legacy_filename=None) if history_path else None
+
+    def difficulty_of(self, session):
+        for level, (_, ai_class) in main.DIFFICULTY_LEVELS.items():
+            if ai_class in session.seats: return level
+        return 0
+
+    def finish(self, match):
+        self.matches.pop(match.id, None)
+        for client in match.clients:
+            if client is not None: client.match = None
+
+    async def handle(self, reader, writer):
+        client = Client(reader, writer, self.send_timeout)
+        try:
+            while not client.closed:
+                # 对局进行中由决策超时负责，只有空闲连接才按 idle_timeout 断开
+                timeout = None if client.match is not None else self.idle_timeout
+                try:
+                    line = await asyncio.wait_for(reader.readline(), timeout)
+                except (asyncio.TimeoutError, asyncio.LimitOverrunError, ValueError, ConnectionError):
+                    break
+                if not line: break
+                try:
+                    message = json.loads(line)
+                    if not isinstance(message, dict): raise ValueError("消息必须是 JSON 对象")
+                except ValueError as e:
+                    await client.send({"type": "error", "message": f"无法解析的消息: {e}"})
+                    continue
+                await self.dispatch(client, message)
+        finally:
+            client.close()
+            match = client.match
+            # 还在等待对手加入的双人对局随创建者一起取消；进行中的对局由 Match.play 按断线认输处理
+            if match is not None and not match.joined.is_set():
+                match.task.cancel()
+                self.finish(match)
+
+    async def dispatch(self, client, message):
+        op = message.get("op")
+        if op == "answer":
+            if client.match is None:
+                await client.send({"type": "error", "message": "当前不在对局中"})
+                return
+            try: client.answers.put_nowait(message.get("choice"))
+            except asyncio.QueueFull: await client.send({"type": "error", "message": "未处理的答复过多"})
+            return
+        if client.match is not None:
+            await client.send({"type": "error", "message": "已经在对局中"})
+            return
+        client.name = str(message.get("name") or client.name)[:32]
+        if op == "new": await self.new_match(client, message)
+        elif op == "join": await self.join_match(client, message)
+        else: await client.send({"type": "error", "message": f"未知的操作: {op!r}"})
+
+    async def new_match(self, client, message):
+        if len(self.matches) >= self.max_sessions:
+            await client.send({"type": "error", "message": "服务器已满，请稍后再试"})
+            return
+        if message.get("vs") == "human":
+            session = main.GameSession([None, None], [client.name, "玩家2"])
+            match = Match(self, session, [client, None])
+            self._seat(client, match, 0)
+            await client.send({"type": "session", "session": match.id, "seat": 0})
+            match.task = asyncio.create_task(self._wait_for_opponent(match))
+            return
+        level = message.get("difficulty", 1)
+        if level not in main.DIFFICULTY_LEVELS:
+            await client.send({"type": "error", "message": f"无效的难度: {level!r}"})
+            return
+        name, ai_class = main.DIFFICULTY_LEVELS[level]
+        session = main.GameSession([None, ai_class], [client.name, f"AI ({name})"], inline_ai=False)
+        match = Match(self, session, [client, None])
+        match.joined.set()
+        self._seat(client, match, 0)
+        await client.send({"type": "session", "session": match.id, "seat": 0})
+        match.task = asyncio.create_task(match.play())
+
+    async def join_match(self, client, message):
+        match = self.matches.get(message.get("session"))
+        if match is None or match.joined.is_set():
+            await client.send({"type": "error", "message": "对局不存在或已开始"})
+            return
+        match.clients[1] = client
+        match.session.names[1] = client.name
+        self._seat(client, match, 1)
+        await client.send({"type": "session", "session": match.id, "seat": 1})
+        match.joined.set()
+
+    async def _wait_for_opponent(self, match):
+        try:
+            await asyncio.wait_for(match.joined.wait(), self.join_timeout)
+        except asyncio.TimeoutError:
+            self.finish(match)
+            await match.broadcast({"type": "end", "winner": None, "reason": "no_opponent"})
+            return
+        await match.play()
+
+    def _seat(self, client, match, seat):
+        while not client.answers.empty(): client.answers.get_nowait() # 丢弃上一局遗留的答复
+        client.match = match
+        client.seat = seat
+        self.matches[match.id] = match
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port, limit=LINE_LIMIT)
+        addresses = ", ".join(str(sock.getsockname()) for sock in server.sockets)
+        print(f"命运轮盘服务器已启动: {addresses}")
+        async with server:
+            await server.serve_forever()
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="命运轮盘多会话服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7788)
+    parser.add_argument("--max-sessions", type=int, default=5000, help="同时进行的对局上限")
+    parser.add_argument("--decision-timeout", type=float, default=120, help="玩家每次决策的时限（秒），超时判负")
+    parser.add_argument("--join-timeout", type=float, default=300, help="双人对局等待对手加入的时限（秒）")
+    parser.add_argument("--idle-timeout", type=float, default=600, help="不在对局中的连接的空闲时限（秒）")
+    parser.add_argument("--send-timeout", type=float, default=30, help="客户端不读取数据时的等待时限（秒），超时断开")
+    parser.add_argument("--history", help="把完成的对局写入 SQLite 对局历史库")
+    parser.add_argument("--ai-workers", type=int, default=multiprocessing.cpu_count(), help="计算AI决策的工作进程数")
+    parser.add_argument("--replay-workers", type=int, default=max(1, multiprocessing.cpu_count() // 2),
+                        help="推进会话（从种子重新运行）和超时兜底的工作进程数")
+    parser.add_argument("--ai-deadline", type=float, default=AI_DEADLINE, help="AI 单次决策的截止时间（秒），超时用启发式AI兜底")
+    parser.add_argument("--think-scale", type=float, default=1.0, help="AI 模拟思考时间的倍数（0 为不停顿）")
+    main.add_ai_file_arguments(parser)
+    args = parser.parse_args(argv)
+    main.load_ai_files(args)
+    with ProcessPoolExecutor(args.ai_workers) as executor, ProcessPoolExecutor(args.replay_workers) as replay_executor:
+        scheduler = AIScheduler(executor, args.ai_workers, args.ai_deadline, fallback_executor=replay_executor)
+        server = GameServer(scheduler, args.max_sessions, args.decision_timeout, args.join_timeout, args.idle_timeout,
+                            args.send_timeout, args.history, args.think_scale, replay_executor)
+        try:
+            asyncio.run(server.serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main_cli()
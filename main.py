@@ -1,10 +1,27 @@
+import array
+import bisect
+import functools
 import random
 import time
 import os
 import json
-from collections import Counter
-import msvcrt # 用于非阻塞输入检测
+import math
+import mmap
+import sqlite3
+import threading
+import multiprocessing
+from collections import Counter, OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import select
+import shutil
 import sys
+import unicodedata
+if os.name == 'nt':
+    import msvcrt # 用于非阻塞输入检测
+else:
+    import termios # 逐字打印时检测按键（cbreak 模式 + select）
+    import tty
 
 # --- 游戏常量定义 ---
 
@@ -47,6 +64,13 @@ FATE_CARD_NAMES = {
     "BACKLASH": "反噬",
 }
 
+# 紧凑状态编码使用的固定编号（按上面字典的定义顺序）
+SPIRIT_KEYS = tuple(SPIRIT_NAMES)
+SPIRIT_INDEX = {name: i for i, name in enumerate(SPIRIT_KEYS)}
+SPIRIT_COUNT = len(SPIRIT_KEYS)
+FATE_CARD_KEYS = tuple(FATE_CARD_NAMES)
+FATE_CARD_INDEX = {name: i for i, name in enumerate(FATE_CARD_KEYS)}
+
 # --- 规则和说明常量 ---
 
 GAME_RULES = """
@@ -90,130 +114,1177 @@ FATE_CARD_DESCRIPTIONS = {
 }
 
 
-# 游戏设置
-INITIAL_HP = 4
-MAX_HP = 5
-MAX_SPIRITS = 5
-INITIAL_SPIRITS = 2
-HP_LOSS_SPIRIT_GAIN = 2
-MIN_FATE_CARDS = 5
-MAX_FATE_CARDS = 10
+# 游戏设置：一套规则参数。不可变、可哈希、可以传给工作进程，同一进程中不同的规则变体互不影响
+_GAME_CONFIG_DEFAULTS = {
+    "initial_hp": 4,
+    "max_hp": 5,
+    "max_spirits": 5,
+    "initial_spirits": 2,
+    "hp_loss_spirit_gain": 2, # 每失去1点生命获得的灵物数
+    "min_fate_cards": 5,
+    "max_fate_cards": 10,
+    "spirit_copies": 2, # 灵物牌堆中每种灵物的张数
+    "fate_weights": None, # 各命运牌（按 FATE_CARD_KEYS 排列）的相对生成权重，None 为均匀
+}
+
+# 手牌计数向量打包时每种灵物占用的位数（见 pack_hand）
+HAND_COUNT_BITS = 4
+HAND_COUNT_MASK = (1 << HAND_COUNT_BITS) - 1
+# 规则参数在编码上的上限（不是规则本身），取决于局面和对局日志的编码
+ENCODING_MAX_FATE_CARDS = 254 # 对局日志中命运牌堆的张数占1字节
+ENCODING_MAX_HP = 255
+
+class GameConfig(namedtuple("GameConfig", _GAME_CONFIG_DEFAULTS, defaults=_GAME_CONFIG_DEFAULTS.values())):
+    """对局规则参数。用 GameConfig(max_hp=6) 或 config._replace(...) 得到变体，两种方式都会检查取值（见 validated）"""
+    __slots__ = ()
+
+    def __new__(cls, *args, **kwargs):
+        return super().__new__(cls, *args, **kwargs).validated()
+
+    @classmethod
+    def _make(cls, iterable):
+        # _replace 经由 _make 构造，不经过 __new__
+        return super()._make(iterable).validated()
+
+    @classmethod
+    def from_dict(cls, values):
+        """从 JSON 字典构造（只需给出与默认不同的字段），字段名或取值不合法时抛出 ValueError"""
+        unknown = set(values) - set(cls._fields)
+        if unknown: raise ValueError(f"未知的规则参数: {', '.join(sorted(unknown))}")
+        values = dict(values)
+        if values.get("fate_weights") is not None: values["fate_weights"] = tuple(values["fate_weights"])
+        return cls(**values)
+
+    def to_dict(self, only_changed=False):
+        values = self._asdict()
+        if values["fate_weights"] is not None: values["fate_weights"] = list(values["fate_weights"])
+        if only_changed: values = {k: v for k, v in values.items() if getattr(self, k) != _GAME_CONFIG_DEFAULTS[k]}
+        return values
+
+    def validated(self):
+        """检查取值范围，返回自身"""
+        for name in self._fields:
+            value = getattr(self, name)
+            if name != "fate_weights" and (not isinstance(value, int) or value < 0):
+                raise ValueError(f"规则参数 {name} 必须是非负整数: {value!r}")
+        if not 1 <= self.initial_hp <= self.max_hp: raise ValueError("需要 1 <= initial_hp <= max_hp")
+        if self.initial_spirits > self.max_spirits: raise ValueError("initial_spirits 不能超过 max_spirits")
+        if not 1 <= self.min_fate_cards <= self.max_fate_cards: raise ValueError("需要 1 <= min_fate_cards <= max_fate_cards")
+        if self.spirit_copies < 1: raise ValueError("spirit_copies 至少为 1")
+        # 手牌按每种灵物4位计数打包（state_key、搜索的置换表、胜率浮层都依赖它），对局日志的负载每项1字节
+        if self.max_spirits > HAND_COUNT_MASK or self.spirit_copies > HAND_COUNT_MASK:
+            raise ValueError(f"max_spirits 和 spirit_copies 不能超过 {HAND_COUNT_MASK}")
+        if self.max_fate_cards > ENCODING_MAX_FATE_CARDS: raise ValueError(f"max_fate_cards 不能超过 {ENCODING_MAX_FATE_CARDS}")
+        if self.max_hp > ENCODING_MAX_HP: raise ValueError(f"max_hp 不能超过 {ENCODING_MAX_HP}")
+        weights = self.fate_weights
+        if weights is not None and (len(weights) != len(FATE_CARD_KEYS) or min(weights) < 0 or not sum(weights) > 0):
+            raise ValueError(f"fate_weights 需要 {len(FATE_CARD_KEYS)} 个非负且和为正的权重")
+        return self
+
+    @property
+    def spirit_deck_template(self):
+        return _spirit_deck_template(self.spirit_copies)
+
+    @property
+    def fate_prior(self):
+        """新生成的一张命运牌是各种牌的概率（按 FATE_CARD_KEYS 排列）"""
+        return _fate_prior(self.fate_weights)
+
+    def random_fate_cards(self, rng, k):
+        # 均匀时保持原来的调用方式，默认规则下的随机序列（以及旧的对局日志）不变
+        if self.fate_weights is None: return rng.choices(FATE_CARD_KEYS, k=k)
+        return rng.choices(FATE_CARD_KEYS, weights=self.fate_weights, k=k)
+
+    def random_fate_card(self, rng):
+        if self.fate_weights is None: return rng.choice(FATE_CARD_KEYS)
+        return rng.choices(FATE_CARD_KEYS, weights=self.fate_weights)[0]
+
+@functools.lru_cache(maxsize=None)
+def _spirit_deck_template(copies):
+    return tuple(name for name in SPIRIT_NAMES for _ in range(copies))
+
+@functools.lru_cache(maxsize=None)
+def _fate_prior(weights):
+    if weights is None: return tuple(1 / len(FATE_CARD_KEYS) for _ in FATE_CARD_KEYS)
+    total = sum(weights)
+    return tuple(w / total for w in weights)
+
+DEFAULT_CONFIG = GameConfig()
+# 无头模拟时单局的回合上限，防止极端情况下对局无法结束
+HEADLESS_MAX_TURNS = 1000
 
 # --- 辅助函数 ---
 def clear_screen():
-    os.system('cls' if os.name == 'nt' else 'clear')
+    SCREEN.clear()
+
+@contextmanager
+def _keypress_watch():
+    """逐字打印期间检测按键：产出 wait(delay)，等待 delay 秒，期间有按键时丢弃按键并返回 True。
+    Windows 用 msvcrt；其他系统在标准输入是终端时切到 cbreak 模式（不回显、不等回车），用 select 等待"""
+    if os.name == 'nt':
+        def wait(delay):
+            if msvcrt.kbhit():
+                msvcrt.getch()
+                return True
+            time.sleep(delay)
+            return False
+        yield wait
+        return
+    try:
+        fd = sys.stdin.fileno()
+        saved = termios.tcgetattr(fd) if sys.stdin.isatty() else None
+    except (AttributeError, ValueError, OSError, termios.error):
+        saved = None
+    if saved is None:
+        yield lambda delay: time.sleep(delay)
+        return
+    def wait(delay):
+        if not select.select([fd], [], [], delay)[0]: return False
+        os.read(fd, 1024)
+        return True
+    tty.setcbreak(fd)
+    try: yield wait
+    finally: termios.tcsetattr(fd, termios.TCSADRAIN, saved)
 
 def print_slow(text, delay=0.03):
-    for i, char in enumerate(text):
-        print(char, end='', flush=True)
-        if os.name == 'nt' and msvcrt.kbhit():
-            msvcrt.getch()
-            print(text[i+1:], end='')
-            break
-        time.sleep(delay)
+    with _keypress_watch() as wait:
+        for i, char in enumerate(text):
+            print(char, end='', flush=True)
+            if wait(delay):
+                print(text[i+1:], end='')
+                break
     print()
 
-def print_to_player(player, message):
-    """只对人类玩家显示信息"""
-    if not isinstance(player, BaseAIPlayer):
-        print_slow(message)
+def display_width(text):
+    """文字在终端中占的列数：全角字符和表情占两列"""
+    return sum(2 if unicodedata.east_asian_width(c) in "WF" else 0 if unicodedata.combining(c) else 1
+               for c in text)
+
+def pad_display(text, width, right=False):
+    """按终端显示宽度补空格到 width 列（str.ljust/rjust 把全角字符算作一列，中英文混排时会错位）"""
+    padding = " " * max(width - display_width(text), 0)
+    return padding + text if right else text + padding
+
+class TerminalScreen:
+    """回合界面的差量刷新：记住上一帧，只用 ANSI 光标控制重写变化的行，每帧只写出一次。
+
+    帧固定在屏幕顶部，帧下方设为滚动区域：事件文字和输入提示在滚动区域里滚动，不会把帧推走，
+    所以下一帧仍可按行号定位。帧的行数或终端大小改变时整帧重画；输出不是终端、在 Windows 上、
+    或帧放不进终端（行数过多、有行会折行）时，退回清屏后整帧打印。
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream # None 表示使用当时的 sys.stdout
+        self.frame = None    # 屏幕顶部现有的帧，None 表示屏幕内容未知
+        self.size = None
+        self.scrolling = False # 是否设置了滚动区域
+
+    def _out(self):
+        return self.stream or sys.stdout
+
+    def clear(self):
+        """清屏并忘记上一帧（同时取消滚动区域）"""
+        self.frame = None
+        if os.name == 'nt':
+            os.system('cls')
+            return
+        out = self._out()
+        out.write("\033[r\033[H\033[2J" if self.scrolling else "\033[H\033[2J")
+        out.flush()
+        self.scrolling = False
+
+    def release(self):
+        """取消滚动区域，把终端恢复原状（程序退出前调用）"""
+        if not self.scrolling: return
+        out = self._out()
+        out.write(f"\033[r\033[{len(self.frame or ()) + 1};1H")
+        out.flush()
+        self.scrolling = False
+        self.frame = None
+
+    def draw(self, lines):
+        """显示一帧并清空帧下方的区域，光标停在帧的下一行"""
+        out = self._out()
+        size = shutil.get_terminal_size()
+        if (os.name == 'nt' or not out.isatty() or len(lines) + 2 > size.lines
+                or any(display_width(line) >= size.columns for line in lines)):
+            self.clear()
+            out.write("\n".join(lines) + "\n")
+            out.flush()
+            return
+        parts = []
+        previous = self.frame
+        if previous is None or len(previous) != len(lines) or size != self.size:
+            # 设置滚动区域会把光标移回左上角，之后所有的行都按行号重写
+            parts.append(f"\033[r\033[H\033[2J\033[{len(lines) + 1};{size.lines}r")
+            previous = [None] * len(lines)
+        for row, (line, old) in enumerate(zip(lines, previous), 1):
+            if line != old: parts.append(f"\033[{row};1H{line}\033[K")
+        parts.append(f"\033[{len(lines) + 1};1H\033[J")
+        out.write("".join(parts))
+        out.flush()
+        self.frame = list(lines)
+        self.size = size
+        self.scrolling = True
+
+SCREEN = TerminalScreen()
 
-# --- 数据统计类 ---
-class GameStats:
-    def __init__(self, filename="fate_game_stats.json"):
-        self.filename = filename
-        self.stats = {
-            "wins": 0,
-            "losses": 0,
-            "total_damage_dealt": 0,
-            "total_damage_taken": 0,
-            "spirits_used": Counter(),
-            "fate_cards_drawn": Counter(),
-        }
-        self.load()
+# ==============================================================================
+# --- 游戏事件与渲染 ---
+# ==============================================================================
+# 规则代码只发出携带原始数据的事件对象；文字在渲染器需要时才生成。
+# 没有订阅者时 emit 直接返回，连事件对象都不会创建（无头模拟、搜索推演）。
+
+def spirit_label(spirit):
+    """灵物的公开显示名：隐藏灵物统一显示为神秘护符"""
+    return f"【{MYSTERIOUS_CHARM_NAME}】" if spirit in HIDDEN_SPIRITS else f"【{SPIRIT_NAMES.get(spirit, spirit)}】"
+
+class GameEvent:
+    """事件基类。子类用 __slots__ 声明字段（按 emit 的参数顺序），用 template 描述文字"""
+    __slots__ = ()
+    template = ""
+    private = False # 私密事件只展示给 player 字段对应的人类玩家
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values): setattr(self, name, value)
+
+    def text(self):
+        values = {name: getattr(self, name) for name in self.__slots__}
+        if "card" in values: values["card_name"] = FATE_CARD_NAMES.get(values["card"], values["card"])
+        if "spirit" in values: values["spirit_label"] = spirit_label(values["spirit"])
+        return self.template.format(**values)
+
+    def to_dict(self):
+        data = {"event": type(self).__name__}
+        if self.private: data["private"] = True
+        for name in self.__slots__:
+            value = getattr(self, name)
+            data[name] = value.name if isinstance(value, Player) else value
+        return data
+
+# 玩家
+class AmuletShattered(GameEvent):
+    __slots__ = ("player",)
+    template = f"💥 {{player.name}} 的【{MYSTERIOUS_CHARM_NAME}】({SPIRIT_NAMES['AMULET']})因巨大伤害而破碎，受到双倍伤害！"
+
+class AmuletAbsorbed(GameEvent):
+    __slots__ = ("player",)
+    template = f"🛡️ {{player.name}} 的【{MYSTERIOUS_CHARM_NAME}】({SPIRIT_NAMES['AMULET']})吸收了1点伤害。"
+
+class MirrorDamageBonus(GameEvent):
+    __slots__ = ("player",)
+    template = f"🪞 {SPIRIT_NAMES['MIRROR']}反弹的伤害+1！"
+
+class DamageTaken(GameEvent):
+    __slots__ = ("player", "amount", "hp")
+    template = "💔 {player.name} 失去了 {amount} 点生命值，当前生命值: {hp}"
+
+class DamageNegated(GameEvent):
+    __slots__ = ("player",)
+    template = "{player.name} 没有受到伤害。"
+
+class Healed(GameEvent):
+    __slots__ = ("player", "amount", "hp")
+    template = "💚 {player.name} 恢复了 {amount} 点生命值，当前生命值: {hp}"
+
+class SpiritGained(GameEvent):
+    __slots__ = ("player", "spirit")
+    template = "✨ {player.name} 获得了灵物: {spirit_label}"
+
+class SpiritHandFull(GameEvent):
+    __slots__ = ("player",)
+    template = "⚠️ {player.name} 的灵物已满（{player.config.max_spirits}个），无法获得新的灵物。"
+
+# 灵物效果（使用护符和镜子时不揭示身份）
+class AmuletActivated(GameEvent):
+    __slots__ = ("player",)
+    template = "🛡️ 一道神秘的屏障笼罩了 {player.name}。"
+
+class MirrorActivated(GameEvent):
+    __slots__ = ("player",)
+    template = "✨ {player.name} 周身的空间开始微微扭曲..."
+
+class RemoteControlArmed(GameEvent):
+    __slots__ = ("player",)
+    template = "遥控器已设置，将在你的回合结束后对你的对手生效。"
+
+class NothingToErase(GameEvent):
+    __slots__ = ("player",)
+    template = "但 {player.name} 没有任何灵物可以移除。"
+
+class SpiritsErased(GameEvent):
+    __slots__ = ("player", "spirits")
+
+    def text(self):
+        # 移除时，即使是隐藏灵物，也会揭示其真实身份
+        lines = [f"橡皮擦抹去了 {self.player.name} 的 {len(self.spirits)} 个随机灵物！"]
+        lines.extend(f" - 【{SPIRIT_NAMES.get(s, s)}】 已被移除。" for s in self.spirits)
+        return "\n".join(lines)
+
+class NothingToSteal(GameEvent):
+    __slots__ = ("player",)
+    template = "但 {player.name} 没有任何可以偷取的灵物。"
+
+class StealBlocked(GameEvent):
+    __slots__ = ("player",)
+    template = "但 {player.name} 的灵物已满，无法偷取！"
+
+class SpiritStolen(GameEvent):
+    __slots__ = ("player", "victim", "spirit")
+
+    def text(self):
+        stolen = f"一个【{MYSTERIOUS_CHARM_NAME}】" if self.spirit in HIDDEN_SPIRITS else spirit_label(self.spirit)
+        return f"{self.player.name} 决定从 {self.victim.name} 处偷取{stolen}!"
+
+class MushroomHint(GameEvent):
+    __slots__ = ("player",)
+    template = "你的下一张抽取的牌将被替换成随机的另一张牌。"
+    private = True
+
+class MushroomArmed(GameEvent):
+    __slots__ = ("player",)
+    template = "{player.name} 的周围出现了奇妙的孢子..."
+
+class WhitePotionResult(GameEvent):
+    __slots__ = ("player", "outcome")
+    TEXTS = {'heal1': "白药水发出了温和的光芒...", 'dmg1': "白药水变得浑浊并发出嘶嘶声...",
+             'heal2': "奇迹发生了！白药水散发出耀眼的光芒！", 'dmg2': "灾难降临！白药水剧烈爆炸！"}
+
+    def text(self): return self.TEXTS[self.outcome]
+
+class ShufflerHint(GameEvent):
+    __slots__ = ("player",)
+    template = "你的下一张抽取的牌将与牌堆中随机一张牌交换位置。"
+    private = True
+
+class ShufflerArmed(GameEvent):
+    __slots__ = ("player",)
+    template = "{player.name} 面前的牌堆发生了小小的骚动..."
+
+class MagnifierUsed(GameEvent):
+    __slots__ = ("player",)
+    template = "👁️ {player.name} 拿出了放大镜，仔细观察着牌堆..."
+
+class DeckEmptyHint(GameEvent):
+    __slots__ = ("player",)
+    template = "牌堆是空的！"
+    private = True
+
+class CardPeeked(GameEvent):
+    __slots__ = ("player", "card")
+    template = "你看清了下一张牌是: 【{card_name}】"
+    private = True
+
+class RedPotionUsed(GameEvent):
+    __slots__ = ("player",)
+    template = "{player.name} 的身上泛起了不祥的红光..."
+
+class RedPotionHint(GameEvent):
+    __slots__ = ("player",)
+    template = "你的下一张伤害牌效果+1。"
+    private = True
+
+class HandcuffsBlocked(GameEvent):
+    __slots__ = ("player",)
+    template = "但 {player.name} 受到了【枕头】的保护，手铐无效！"
+
+class Handcuffed(GameEvent):
+    __slots__ = ("player",)
+    template = "{player.name} 在下个回合将无法使用灵物，但他获得了一个灵物作为补偿。"
+
+class TelephoneDead(GameEvent):
+    __slots__ = ("player",)
+    template = "电话线是断的... 牌堆是空的！"
+    private = True
+
+class TelephoneUsed(GameEvent):
+    __slots__ = ("player",)
+    template = "📞 {player.name} 拿起了电话，似乎在窃听着什么..."
+
+class TelephoneHeard(GameEvent):
+    __slots__ = ("player", "position", "card")
+    template = "你通过电话得知，牌堆的第 {position} 张牌是【{card_name}】。"
+    private = True
+
+class PillowUsed(GameEvent):
+    __slots__ = ("player",)
+    template = "{player.name} 获得了3个灵物，但会跳过下个回合，并在2回合内免疫【手铐】。"
+
+class ContractSigned(GameEvent):
+    __slots__ = ("player",)
+    template = "{player.name} 划破手指，与命运签订了契约！立即扣除2点生命值。"
+
+class ContractArmed(GameEvent):
+    __slots__ = ("player",)
+    template = "下次生命值归零时将获得最后的机会！"
+
+class NothingToControl(GameEvent):
+    __slots__ = ("player",)
+    template = "但 {player.name} 没有任何灵物可以被操控。"
+
+class ControlDeclined(GameEvent):
+    __slots__ = ("player",)
+    template = "{player.name} 决定暂时不进行操控。"
+
+class SpiritForced(GameEvent):
+    __slots__ = ("player", "victim", "spirit")
+
+    def text(self):
+        locked = f"一个【{MYSTERIOUS_CHARM_NAME}】" if self.spirit in HIDDEN_SPIRITS else spirit_label(self.spirit)
+        return (f"📡 {self.player.name} 使用无线电，锁定了 {self.victim.name} 的{locked}！\n"
+                f"{self.victim.name} 不由自主地拿出了它...")
+
+class StrategyMissing(GameEvent):
+    __slots__ = ("spirit",)
+    template = "警告：未找到灵物【{spirit}】的对应策略实现！"
+
+# 对局流程
+class GamePreparing(GameEvent):
+    __slots__ = ()
+    template = "--- 游戏准备中 ---"
+
+class FirstPlayerChosen(GameEvent):
+    __slots__ = ("player", "second")
+    template = "{player.name} 成为先手玩家。\n{second.name} 作为后手，额外获得一个灵物。"
+
+class FateDeckCreated(GameEvent):
+    __slots__ = ("size",)
+    template = "命运牌堆已重新生成，包含 {size} 张卡牌。"
+
+class SpiritDeckRefilled(GameEvent):
+    __slots__ = ()
+    template = "警告：灵物牌堆已空！正在重新生成..."
+
+class FateDeckExhausted(GameEvent):
+    __slots__ = ()
+    template = "命运牌堆已空，正在重新洗牌..."
+
+class ShufflerTriggered(GameEvent):
+    __slots__ = ("player",)
+    template = "⚙️【洗牌器】效果发动，牌堆发生了变化！"
+
+class MushroomTriggered(GameEvent):
+    __slots__ = ("player", "card")
+    template = "🍄【蘑菇】效果发动，将【{card_name}】变成了..."
+
+class TurnStarted(GameEvent):
+    __slots__ = ("player",)
+    template = "\n轮到 {player.name} 的回合了。"
+
+class TurnSkipped(GameEvent):
+    __slots__ = ("player",)
+    template = "由于【枕头】的效果，{player.name} 跳过本回合。"
 
-    def load(self):
-        try:
-            with open(self.filename, 'r', encoding='utf-8') as f:
-                loaded_stats = json.load(f)
-                self.stats["wins"] = loaded_stats.get("wins", 0)
-                self.stats["losses"] = loaded_stats.get("losses", 0)
-                self.stats["total_damage_dealt"] = loaded_stats.get("total_damage_dealt", 0)
-                self.stats["total_damage_taken"] = loaded_stats.get("total_damage_taken", 0)
-                self.stats["spirits_used"] = Counter(loaded_stats.get("spirits_used", {}))
-                self.stats["fate_cards_drawn"] = Counter(loaded_stats.get("fate_cards_drawn", {}))
-        except (FileNotFoundError, json.JSONDecodeError):
-            print_slow("未找到统计文件或文件损坏，将创建新的统计数据。")
+class ActionFailed(GameEvent):
+    __slots__ = ("player",)
+    template = "内部错误：处理灵物选择时出现问题。"
+
+class TurnEnded(GameEvent):
+    __slots__ = ("player",)
+    template = "{player.name} 的回合结束。"
+
+class AmuletExpired(GameEvent):
+    __slots__ = ("player",)
+    template = f"{{player.name}} 的【{MYSTERIOUS_CHARM_NAME}】({SPIRIT_NAMES['AMULET']})效果已结束。"
+
+class PillowImmunityExpired(GameEvent):
+    __slots__ = ("player",)
+    template = "{player.name} 的【枕头】手铐免疫效果已结束。"
+
+class MirrorExpired(GameEvent):
+    __slots__ = ("player",)
+    template = f"{{player.name}} 周身的【{MYSTERIOUS_CHARM_NAME}】({SPIRIT_NAMES['MIRROR']})效果消失了。"
+
+class FateCardPrepared(GameEvent):
+    __slots__ = ("player",)
+    template = "{player.name} 准备抽取命运卡牌..."
+
+class TargetChosen(GameEvent):
+    __slots__ = ("player", "target")
+    template = "{player.name} 决定将卡牌对 {target.name} 使用。"
+
+class FateCardDrawn(GameEvent):
+    __slots__ = ("player", "card")
+    template = "抽出的卡牌是... 【{card_name}】!"
+
+class FateCardResolved(GameEvent):
+    __slots__ = ("card", "target")
+    template = "【{card_name}】的效果对 {target.name} 生效了。"
+
+class MirrorReflected(GameEvent):
+    __slots__ = ("player", "target")
+    template = f"🪞 {{player.name}} 的【{MYSTERIOUS_CHARM_NAME}】({SPIRIT_NAMES['MIRROR']})生效了！效果被反弹！\n效果反弹给了 {{target.name}}！"
+
+class BacklashExtraTurn(GameEvent):
+    __slots__ = ("player",)
+    template = "【反噬】效果触发！失去生命值的 {player.name} 获得一个额外回合！"
+
+class VoidResolved(GameEvent):
+    __slots__ = ("player", "extra_turn")
+
+    def text(self):
+        if not self.extra_turn: return "虚无... 本回合无事发生。"
+        return f"虚无... 本回合无事发生。\n由于对己使用，{self.player.name} 获得一个额外回合！"
+
+class ReincarnationTriggered(GameEvent):
+    __slots__ = ("player",)
+    template = "【轮回】之力发动！{player.name} 将对自己使用下一张命运卡牌！"
+
+class ReincarnationDrawn(GameEvent):
+    __slots__ = ("player", "card")
+    template = "下一张牌是... 【{card_name}】!"
+
+class SpiritUsed(GameEvent):
+    __slots__ = ("player", "spirit")
+
+    def text(self):
+        # 对隐藏物品，使用时显示统一的模糊信息
+        if self.spirit in HIDDEN_SPIRITS: return f"{self.player.name} 使用了【{MYSTERIOUS_CHARM_NAME}】..."
+        return f"{self.player.name} 使用了灵物: {spirit_label(self.spirit)}"
+
+class HpLossCompensated(GameEvent):
+    __slots__ = ("player", "count")
+    template = "作为失去生命的代价，{player.name} 获得了 {count} 个灵物。"
+
+class ContractTriggered(GameEvent):
+    __slots__ = ("player",)
+    template = "✝️ {player.name} 的生命值归零，但【契约书】发动了！\n{player.name} 获得一个最终回合，并抽取3个灵物！"
+
+class LastStandFailed(GameEvent):
+    __slots__ = ("player",)
+    template = "⏰ {player.name} 的最终回合结束，但未能击败对手。契约失败！"
+
+class RemoteControlTriggered(GameEvent):
+    __slots__ = ("player",)
+    template = "\n📡【遥控器】效果发动！{player.name} 将对自己使用牌堆顶的牌！"
+
+class RemoteControlDrawn(GameEvent):
+    __slots__ = ("player", "card")
+    template = "{player.name} 抽到了... 【{card_name}】!"
+
+class EventBus:
+    """每局一个的事件总线。渲染器通过 subscribe 注册，需要实现 handle(event) 和 flush()"""
+    __slots__ = ("renderers", "_active")
+
+    def __init__(self):
+        self.renderers = []
+        self._active = []
+
+    def subscribe(self, renderer):
+        self.renderers.append(renderer)
+        if renderer.wants_events: self._active.append(renderer)
+        return renderer
+
+    def unsubscribe(self, renderer):
+        self.renderers.remove(renderer)
+        if renderer in self._active: self._active.remove(renderer)
+
+    def emit(self, event_type, *values):
+        if not self._active: return
+        event = event_type(*values)
+        for renderer in self._active: renderer.handle(event)
+
+    def flush(self):
+        """一帧结束（等待输入或停顿之前），让缓冲型渲染器输出"""
+        for renderer in self._active: renderer.flush()
+
+# 玩家未加入对局时使用的空总线（永远没有订阅者）
+_DETACHED_BUS = EventBus()
+
+class TypewriterRenderer:
+    """原有的逐字打印效果，私密事件只给人类玩家看"""
+    wants_events = True
+
+    def __init__(self, delay=0.03):
+        self.delay = delay
+
+    def handle(self, event):
+        if event.private and isinstance(event.player, BaseAIPlayer): return
+        print_slow(event.text(), self.delay)
+
+    def flush(self): pass
+
+class BufferedRenderer:
+    """快速终端输出：事件文字先缓存，每帧一次性写出"""
+    wants_events = True
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.lines = []
+
+    def handle(self, event):
+        if event.private and isinstance(event.player, BaseAIPlayer): return
+        self.lines.append(event.text())
+
+    def flush(self):
+        if not self.lines: return
+        self.lines.append("")
+        self.stream.write("\n".join(self.lines))
+        self.stream.flush()
+        self.lines.clear()
+
+class JsonLinesRenderer:
+    """每个事件写成一行 JSON（包括私密事件，由读取方自行过滤），供外部工具或客户端消费"""
+    wants_events = True
 
-    def save(self):
-        with open(self.filename, 'w', encoding='utf-8') as f:
-            json.dump(self.stats, f, indent=4, ensure_ascii=False)
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
 
-    def record_win(self):
-        self.stats["wins"] += 1
+    def handle(self, event):
+        self.stream.write(json.dumps(event.to_dict(), ensure_ascii=False) + "\n")
 
-    def record_loss(self):
-        self.stats["losses"] += 1
+    def flush(self): self.stream.flush()
 
-    def record_damage_dealt(self, amount):
-        self.stats["total_damage_dealt"] += amount
+class NullRenderer:
+    """丢弃一切输出。总线不会为它创建事件对象，因此没有任何开销"""
+    wants_events = False
+    def handle(self, event): pass
+    def flush(self): pass
 
-    def record_damage_taken(self, amount):
-        self.stats["total_damage_taken"] += amount
+class HistoryRecorder:
+    """把一局的事件收集成 (回合, 座位, 事件名, JSON数据) 行，对局结束后由 GameStats 写入历史库"""
+    wants_events = True
 
-    def record_spirit_used(self, spirit_name):
-        self.stats["spirits_used"][spirit_name] += 1
+    def __init__(self, game):
+        self.game = game
+        self.rows = []
 
-    def record_fate_card_drawn(self, card_name):
-        self.stats["fate_cards_drawn"][card_name] += 1
+    def handle(self, event):
+        data = event.to_dict()
+        name = data.pop("event")
+        player = getattr(event, "player", None)
+        seat = self.game.players.index(player) if player is not None else None
+        data.pop("player", None)
+        self.rows.append((self.game.turn_count, seat, name, json.dumps(data, ensure_ascii=False) if data else None))
+
+    def flush(self): pass
+
+RENDERERS = {"typewriter": TypewriterRenderer, "buffered": BufferedRenderer, "jsonl": JsonLinesRenderer, "null": NullRenderer}
+
+# --- 数据统计类 ---
+class GameStats:
+    """本地对局历史（SQLite，WAL 模式）。
+
+    每局一行，另有双方数据、灵物使用次数、命运卡牌抽取次数和逐回合事件。每次写入都是
+    一个短事务，多个对局进程和模拟进程可以同时写入同一个数据库；战绩界面直接读取 SQL 聚合。
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS games (
+            id INTEGER PRIMARY KEY,
+            played_at REAL NOT NULL,      -- unix 时间戳
+            seed INTEGER NOT NULL,
+            difficulty INTEGER,           -- 0 = 双人对战，1.. = AI 难度，NULL = 模拟对局
+            first_player INTEGER NOT NULL,
+            winner INTEGER,               -- 胜者座位，NULL = 平局
+            turns INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS games_difficulty ON games (difficulty);
+        CREATE INDEX IF NOT EXISTS games_winner ON games (winner);
+        CREATE INDEX IF NOT EXISTS games_played_at ON games (played_at);
+        CREATE TABLE IF NOT EXISTS game_players (
+            game_id INTEGER NOT NULL REFERENCES games (id),
+            seat INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            player_type TEXT NOT NULL,
+            is_human INTEGER NOT NULL,
+            damage_taken INTEGER NOT NULL,
+            damage_dealt INTEGER NOT NULL,
+            PRIMARY KEY (game_id, seat)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS game_players_type ON game_players (player_type);
+        CREATE TABLE IF NOT EXISTS game_spirits (
+            game_id INTEGER NOT NULL REFERENCES games (id),
+            seat INTEGER NOT NULL,
+            spirit TEXT NOT NULL,
+            uses INTEGER NOT NULL,
+            PRIMARY KEY (game_id, seat, spirit)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS game_spirits_spirit ON game_spirits (spirit);
+        CREATE TABLE IF NOT EXISTS game_cards (
+            game_id INTEGER NOT NULL REFERENCES games (id),
+            seat INTEGER NOT NULL,
+            card TEXT NOT NULL,
+            draws INTEGER NOT NULL,
+            PRIMARY KEY (game_id, seat, card)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS game_events (
+            game_id INTEGER NOT NULL REFERENCES games (id),
+            seq INTEGER NOT NULL,
+            turn INTEGER NOT NULL,
+            seat INTEGER,
+            event TEXT NOT NULL,
+            data TEXT,                    -- 事件字段的 JSON
+            PRIMARY KEY (game_id, seq)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS legacy_counters (  -- 旧版 JSON 统计文件导入的累计数据
+            category TEXT NOT NULL,
+            name TEXT NOT NULL,
+            value INTEGER NOT NULL,
+            PRIMARY KEY (category, name)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+    """
+
+    def __init__(self, filename="fate_history.db", legacy_filename="fate_game_stats.json"):
+        self.filename = filename
+        # isolation_level=None：事务由 _transaction 显式控制；timeout 让并发写入排队而不是报错
+        self.conn = sqlite3.connect(filename, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        if legacy_filename and os.path.exists(legacy_filename): self._import_legacy(legacy_filename)
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE 在事务开始时就拿写锁，避免两个进程同时从读锁升级而死锁
+        cursor = self.conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            yield cursor
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            raise
+        cursor.execute("COMMIT")
+
+    def _import_legacy(self, legacy_filename):
+        """把旧版 fate_game_stats.json 的累计数据导入一次"""
+        try:
+            with open(legacy_filename, 'r', encoding='utf-8') as f: legacy = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+        with self._transaction() as cursor:
+            if cursor.execute("SELECT 1 FROM meta WHERE key = 'legacy_imported'").fetchone(): return
+            rows = [("total", key, legacy.get(key, 0)) for key in ("wins", "losses", "total_damage_dealt", "total_damage_taken")]
+            rows += [("spirit", name, count) for name, count in legacy.get("spirits_used", {}).items()]
+            rows += [("card", name, count) for name, count in legacy.get("fate_cards_drawn", {}).items()]
+            cursor.executemany("INSERT OR REPLACE INTO legacy_counters VALUES (?, ?, ?)", rows)
+            cursor.execute("INSERT INTO meta VALUES ('legacy_imported', ?)", (legacy_filename,))
+
+    def record_game(self, result, difficulty=None, player_names=None, events=()):
+        return self.record_games([(result, difficulty, player_names, events)])[0]
+
+    def record_games(self, entries):
+        """在一个事务中批量写入 (GameResult, 难度, 玩家名称, 事件行) 列表，返回各局的 id。
+
+        事件行为 (回合, 座位, 事件名, JSON数据)，通常来自 HistoryRecorder；模拟对局可以为空。
+        """
+        played_at = time.time()
+        ids = []
+        players, spirits, cards, events_rows = [], [], [], []
+        with self._transaction() as cursor:
+            for result, difficulty, player_names, events in entries:
+                cursor.execute("INSERT INTO games (played_at, seed, difficulty, first_player, winner, turns) VALUES (?, ?, ?, ?, ?, ?)",
+                               (played_at, result.seed, difficulty, result.first_player, result.winner, result.turns))
+                game_id = cursor.lastrowid
+                ids.append(game_id)
+                names = player_names or result.player_types
+                for seat, player_type in enumerate(result.player_types):
+                    players.append((game_id, seat, names[seat], player_type, int(player_type == Player.__name__),
+                                    result.damage_taken[seat], result.damage_dealt[seat]))
+                    spirits.extend((game_id, seat, spirit, uses) for spirit, uses in result.spirits_used[seat].items())
+                    cards.extend((game_id, seat, card, draws) for card, draws in result.fate_cards_drawn[seat].items())
+                events_rows.extend((game_id, seq, *row) for seq, row in enumerate(events))
+            cursor.executemany("INSERT INTO game_players VALUES (?, ?, ?, ?, ?, ?, ?)", players)
+            cursor.executemany("INSERT INTO game_spirits VALUES (?, ?, ?, ?)", spirits)
+            cursor.executemany("INSERT INTO game_cards VALUES (?, ?, ?, ?)", cards)
+            cursor.executemany("INSERT INTO game_events VALUES (?, ?, ?, ?, ?, ?)", events_rows)
+        return ids
+
+    def summary(self):
+        """人类玩家的累计战绩（包括旧版统计文件导入的数据）"""
+        query = self.conn.execute
+        legacy = {(category, name): value for category, name, value in query("SELECT category, name, value FROM legacy_counters")}
+        # 胜负只统计 AI 对战（与旧版一致），按难度分组
+        by_difficulty = {}
+        for difficulty, won, games in query("""
+                SELECT g.difficulty, SUM(p.seat = g.winner), COUNT(*) FROM games g
+                JOIN game_players p ON p.game_id = g.id AND p.is_human = 1
+                WHERE g.difficulty > 0 AND g.winner IS NOT NULL GROUP BY g.difficulty"""):
+            by_difficulty[difficulty] = (won, games - won)
+        damage_taken, damage_dealt = query("SELECT COALESCE(SUM(damage_taken), 0), COALESCE(SUM(damage_dealt), 0) FROM game_players WHERE is_human = 1").fetchone()
+        spirits = Counter({name: value for (category, name), value in legacy.items() if category == "spirit"})
+        for spirit, uses in query("""
+                SELECT s.spirit, SUM(s.uses) FROM game_spirits s
+                JOIN game_players p ON p.game_id = s.game_id AND p.seat = s.seat AND p.is_human = 1 GROUP BY s.spirit"""):
+            spirits[spirit] += uses
+        cards = Counter({name: value for (category, name), value in legacy.items() if category == "card"})
+        for card, draws in query("""
+                SELECT c.card, SUM(c.draws) FROM game_cards c
+                JOIN game_players p ON p.game_id = c.game_id AND p.seat = c.seat AND p.is_human = 1 GROUP BY c.card"""):
+            cards[card] += draws
+        return {
+            "wins": sum(w for w, _ in by_difficulty.values()) + legacy.get(("total", "wins"), 0),
+            "losses": sum(l for _, l in by_difficulty.values()) + legacy.get(("total", "losses"), 0),
+            "by_difficulty": by_difficulty,
+            "total_damage_dealt": damage_dealt + legacy.get(("total", "total_damage_dealt"), 0),
+            "total_damage_taken": damage_taken + legacy.get(("total", "total_damage_taken"), 0),
+            "spirits_used": spirits,
+            "fate_cards_drawn": cards,
+        }
 
     def display(self):
+        stats = self.summary()
         clear_screen()
         print("--- 玩家战绩统计 ---")
-        total_games = self.stats['wins'] + self.stats['losses']
-        win_rate = (self.stats['wins'] / total_games * 100) if total_games > 0 else 0
-        print(f"胜场: {self.stats['wins']} | 败场: {self.stats['losses']} | 胜率: {win_rate:.1f}%")
-        print(f"累计造成伤害: {self.stats['total_damage_dealt']}")
-        print(f"累计承受伤害: {self.stats['total_damage_taken']}")
+        total_games = stats['wins'] + stats['losses']
+        win_rate = (stats['wins'] / total_games * 100) if total_games > 0 else 0
+        print(f"胜场: {stats['wins']} | 败场: {stats['losses']} | 胜率: {win_rate:.1f}%")
+        for level, (name, _) in DIFFICULTY_LEVELS.items():
+            if level in stats['by_difficulty']:
+                wins, losses = stats['by_difficulty'][level]
+                print(f"  【{name}】 {wins} 胜 {losses} 负")
+        print(f"累计造成伤害: {stats['total_damage_dealt']}")
+        print(f"累计承受伤害: {stats['total_damage_taken']}")
         
         print("\n--- 灵物使用统计 ---")
-        if self.stats['spirits_used']:
-            for spirit, count in self.stats['spirits_used'].most_common():
+        if stats['spirits_used']:
+            for spirit, count in stats['spirits_used'].most_common():
                 print(f"【{SPIRIT_NAMES.get(spirit, spirit)}】: {count} 次")
         else:
             print("暂无记录。")
 
         print("\n--- 命运卡牌抽取统计 ---")
-        if self.stats['fate_cards_drawn']:
-            for card, count in self.stats['fate_cards_drawn'].most_common():
+        if stats['fate_cards_drawn']:
+            for card, count in stats['fate_cards_drawn'].most_common():
                 print(f"【{FATE_CARD_NAMES.get(card, card)}】: {count} 次")
         else:
             print("暂无记录。")
             
         input("\n--- 按回车键返回 ---")
 
+    def close(self):
+        self.conn.close()
+
 
 # --- 核心类定义 ---
 
+def hand_counts(spirits):
+    """把灵物列表转换为按 SPIRIT_KEYS 排列的定长计数向量"""
+    counts = [0] * len(SPIRIT_KEYS)
+    for s in spirits: counts[SPIRIT_INDEX[s]] += 1
+    return tuple(counts)
+
+def pack_hand(spirits):
+    """把灵物列表打包成一个整数（每种灵物一个计数字段），与顺序无关"""
+    bits = 0
+    for s in spirits: bits += 1 << (SPIRIT_INDEX[s] * HAND_COUNT_BITS)
+    return bits
+
+def unpack_hand(bits):
+    """pack_hand 的逆操作，返回按 SPIRIT_KEYS 顺序排列的灵物列表"""
+    spirits = []
+    index = 0
+    while bits:
+        count = bits & HAND_COUNT_MASK
+        if count: spirits.extend([SPIRIT_KEYS[index]] * count)
+        bits >>= HAND_COUNT_BITS
+        index += 1
+    return spirits
+
+def pack_sequence(items, index, base):
+    """把有序的牌堆编码成一个整数（base 进制，牌堆顶在最低位）"""
+    bits = 0
+    for item in reversed(items): bits = bits * base + index[item]
+    return bits
+
+def unpack_sequence(bits, length, keys):
+    items = []
+    base = len(keys)
+    for _ in range(length):
+        bits, digit = divmod(bits, base)
+        items.append(keys[digit])
+    return items
+
+class Deck:
+    """牌堆。对外的位置一律从牌堆顶数起（0 = 牌堆顶），迭代也从牌堆顶开始。
+
+    内部列表 cards 以牌堆底在前、牌堆顶在末尾存放，所以抽牌、放回牌堆顶、替换牌堆顶、
+    查看和交换任意位置都是 O(1)；counts 实时记录每种牌的张数。
+    观察者需要实现 deck_refilled(deck)、card_drawn(deck, card)、card_discarded(deck, card)、
+    card_pushed(deck, card) 和 cards_swapped(deck, i, j)。
+    """
+    __slots__ = ("cards", "counts", "observers")
+
+    def __init__(self, kinds, cards=()):
+        self.cards = []
+        self.counts = dict.fromkeys(kinds, 0)
+        self.observers = []
+        self.load(cards)
+
+    def __len__(self): return len(self.cards)
+    def __iter__(self): return reversed(self.cards)
+    def __reversed__(self): return iter(self.cards)
+
+    def _recount(self):
+        counts = self.counts
+        for kind in counts: counts[kind] = 0
+        for card in self.cards: counts[card] += 1
+
+    def load(self, cards):
+        """直接替换全部内容（从牌堆顶开始排列），不通知观察者；用于恢复局面"""
+        self.cards[:] = cards
+        self.cards.reverse()
+        self._recount()
+
+    def load_bottom_up(self, cards):
+        """同 load，但 cards 从牌堆底开始排列"""
+        self.cards[:] = cards
+        self._recount()
+
+    def refill(self, cards):
+        """换成一副新牌（从牌堆顶开始排列）并通知观察者"""
+        self.load(cards)
+        for observer in self.observers: observer.deck_refilled(self)
+
+    def refill_shuffled(self, template, rng):
+        """按模板原地重建并洗牌，不分配新列表"""
+        self.cards[:] = template
+        rng.shuffle(self.cards)
+        self._recount()
+        for observer in self.observers: observer.deck_refilled(self)
+
+    def draw(self):
+        card = self.cards.pop()
+        self.counts[card] -= 1
+        for observer in self.observers: observer.card_drawn(self, card)
+        return card
+
+    def discard(self):
+        """移除牌堆顶的牌但不算作抽牌"""
+        card = self.cards.pop()
+        self.counts[card] -= 1
+        for observer in self.observers: observer.card_discarded(self, card)
+        return card
+
+    def push(self, card):
+        self.cards.append(card)
+        self.counts[card] += 1
+        for observer in self.observers: observer.card_pushed(self, card)
+
+    def replace_top(self, card):
+        old = self.cards[-1]
+        self.cards[-1] = card
+        self.counts[old] -= 1
+        self.counts[card] += 1
+        for observer in self.observers:
+            observer.card_discarded(self, old)
+            observer.card_pushed(self, card)
+        return old
+
+    def peek(self, position=0):
+        return self.cards[-1 - position]
+
+    def swap(self, i, j):
+        cards = self.cards
+        cards[-1 - i], cards[-1 - j] = cards[-1 - j], cards[-1 - i]
+        for observer in self.observers: observer.cards_swapped(self, i, j)
+
+    def composition(self):
+        """当前每种牌的张数（只包含张数不为0的牌）"""
+        return Counter({kind: n for kind, n in self.counts.items() if n})
+
+# 信念查询常用的牌组（按 FATE_CARD_KEYS 的下标）
+DAMAGE_CARD_INDICES = (FATE_CARD_INDEX["DIVINE_PUNISHMENT"], FATE_CARD_INDEX["BACKLASH"])
+SELF_CARD_INDICES = (FATE_CARD_INDEX["THE_VOID"], FATE_CARD_INDEX["DIVINE_BOON"]) # 对自己使用有利的牌
+_UNIFORM_ROW = DEFAULT_CONFIG.fate_prior
+
+class DeckBelief:
+    """某个玩家对命运牌堆的信念：每个位置上是哪张牌的概率分布（按 FATE_CARD_KEYS 排列）。
+
+    rows 与 Deck.cards 一样以牌堆底在前、牌堆顶在末尾存放。命运牌是按规则的先验 prior 独立生成的，
+    所以不知道牌堆构成时未揭示的位置都是先验分布，抽牌只需 O(1)；知道构成时（remaining
+    记录剩余各牌的期望张数），每次更新后把各位置的分布按剩余构成做比例拟合，O(张数)；
+    没有任何位置被单独揭示或打乱过时，各位置可交换，直接用剩余构成/张数即可。
+    对牌堆顶的查询是 O(1)。
+    """
+    __slots__ = ("rows", "remaining", "exchangeable", "prior")
+    FIT_PASSES = 5
+
+    def __init__(self):
+        self.rows = []
+        self.remaining = None
+        self.exchangeable = True
+        self.prior = _UNIFORM_ROW
+
+    def reset(self, size, counts=None, prior=None):
+        """新牌堆：counts 为各牌张数（按牌名的字典），不知道构成时为 None；prior 为一张新牌的分布，默认均匀"""
+        self.exchangeable = True
+        self.prior = prior or _UNIFORM_ROW
+        if counts is None or not size:
+            self.remaining = None
+            self.rows = [self.prior] * size
+            return
+        self.remaining = [counts.get(card, 0) for card in FATE_CARD_KEYS]
+        self.rows = [tuple(n / size for n in self.remaining)] * size
+
+    def copy_from(self, other, with_counts=True):
+        self.rows = list(other.rows)
+        self.remaining = list(other.remaining) if with_counts and other.remaining is not None else None
+        self.exchangeable = other.exchangeable
+        self.prior = other.prior
+
+    def _fit(self):
+        """让各位置的分布与剩余构成一致：交替按列缩放、逐行归一化（比例拟合）。
+
+        已经确定的位置不参与拟合，其余位置拟合到扣除这些牌之后的构成——否则某种牌的剩余张数
+        全部落在已确定的位置上时，比例拟合只能很慢地把其余位置上它的概率压到0。
+        """
+        rows = self.rows
+        if self.remaining is None or not rows: return
+        if self.exchangeable:
+            total = sum(self.remaining)
+            if total > 0:
+                self.rows = [tuple(n / total for n in self.remaining)] * len(rows)
+            return
+        targets = list(self.remaining)
+        free = []
+        for i, row in enumerate(rows):
+            if max(row) > 0.999999:
+                for index, p in enumerate(row): targets[index] -= p
+            else: free.append(i)
+        targets = [max(0.0, n) for n in targets]
+        fitting = [rows[i] for i in free]
+        for _ in range(self.FIT_PASSES):
+            scale = []
+            error = 0.0
+            for index, target in enumerate(targets):
+                column = 0.0
+                for row in fitting: column += row[index]
+                error = max(error, abs(column - target))
+                scale.append(target / column if column > 1e-12 else 0.0)
+            if error < 1e-3: break
+            fitted = []
+            for row in fitting:
+                weights = [p * s for p, s in zip(row, scale)]
+                total = sum(weights)
+                fitted.append(tuple(w / total for w in weights) if total > 1e-12 else row)
+            fitting = fitted
+        rows = list(rows)
+        for i, row in zip(free, fitting): rows[i] = row
+        self.rows = rows
+
+    def _remove(self, card):
+        if self.remaining is not None:
+            index = FATE_CARD_INDEX[card]
+            self.remaining[index] = max(0.0, self.remaining[index] - 1)
+            self._fit()
+
+    def drawn(self, card):
+        """牌堆顶被抽走并公开"""
+        if self.rows: self.rows.pop()
+        self._remove(card)
+
+    def revealed(self, position, card):
+        """得知从牌堆顶数第 position 张（0 起）是 card"""
+        if position >= len(self.rows): return
+        row = [0.0] * len(FATE_CARD_KEYS)
+        row[FATE_CARD_INDEX[card]] = 1.0
+        self.rows[-1 - position] = tuple(row)
+        self.exchangeable = False
+        self._fit()
+
+    def pushed_unknown(self):
+        """一张按先验随机生成的新牌被放到牌堆顶（蘑菇）"""
+        self.rows.append(self.prior)
+        self.exchangeable = False
+        if self.remaining is not None: self.remaining = [n + p for n, p in zip(self.remaining, self.prior)]
+
+    def swapped_with_random(self, position):
+        """position 处的牌与其余某个看不到的随机位置交换（洗牌器）"""
+        rows = self.rows
+        n = len(rows)
+        if position >= n or n < 2: return
+        target = n - 1 - position
+        moved = rows[target]
+        others = [row for i, row in enumerate(rows) if i != target]
+        share = 1 / (n - 1)
+        mean = tuple(sum(column) * share for column in zip(*others))
+        mixed = [tuple(p * (1 - share) + q * share for p, q in zip(row, moved)) if i != target else mean
+                 for i, row in enumerate(rows)]
+        self.rows = mixed
+        self.exchangeable = False
+
+    def swapped(self, i, j):
+        rows = self.rows
+        rows[-1 - i], rows[-1 - j] = rows[-1 - j], rows[-1 - i]
+        self.exchangeable = False
+
+    def probability(self, position, indices):
+        """从牌堆顶数第 position 张属于 indices 中任一种牌的概率；位置不存在时返回先验"""
+        row = self.rows[-1 - position] if position < len(self.rows) else self.prior
+        p = 0.0
+        for i in indices: p += row[i]
+        return p
+
+    def certain(self, position=0):
+        """该位置的牌已经确定时返回牌名，否则返回 None"""
+        if position >= len(self.rows): return None
+        row = self.rows[-1 - position]
+        for index, p in enumerate(row):
+            if p > 0.999999: return FATE_CARD_KEYS[index]
+        return None
+
+    def sample(self, rng):
+        """按各位置的分布独立抽样出一副牌（从牌堆顶开始排列），用于搜索的随机化"""
+        return [rng.choices(FATE_CARD_KEYS, weights=row)[0] for row in reversed(self.rows)]
+
+class PlayerStatus:
+    """玩家的状态效果。字段直接作为属性访问，pack() 把全部字段压缩成一个16位整数"""
+    __slots__ = ("amulet_turns", "is_mirrored", "is_handcuffed", "pillow_immunity", "skip_next_turn", "has_contract",
+                 "last_stand", "red_potion_bonus", "remote_control_active", "mushroom_effect", "shuffler_effect")
+    # 位布局：amulet_turns 2位 | pillow_immunity 2位 | red_potion_bonus 4位 | 8个布尔标志各1位
+    FLAG_FIELDS = ("is_mirrored", "is_handcuffed", "skip_next_turn", "has_contract",
+                   "last_stand", "remote_control_active", "mushroom_effect", "shuffler_effect")
+
+    def __init__(self):
+        self.amulet_turns = 0
+        self.is_mirrored = False
+        self.is_handcuffed = False
+        self.pillow_immunity = 0
+        self.skip_next_turn = False
+        self.has_contract = False
+        self.last_stand = False
+        self.red_potion_bonus = 0
+        self.remote_control_active = False
+        self.mushroom_effect = False
+        self.shuffler_effect = False
+
+    def pack(self):
+        return (self.amulet_turns | (self.pillow_immunity << 2) | (min(self.red_potion_bonus, 15) << 4)
+                | (self.is_mirrored << 8) | (self.is_handcuffed << 9) | (self.skip_next_turn << 10)
+                | (self.has_contract << 11) | (self.last_stand << 12) | (self.remote_control_active << 13)
+                | (self.mushroom_effect << 14) | (self.shuffler_effect << 15))
+
+    def unpack(self, bits):
+        self.amulet_turns = bits & 0b11
+        self.pillow_immunity = (bits >> 2) & 0b11
+        self.red_potion_bonus = (bits >> 4) & 0b1111
+        bit = 1 << 8
+        for field in self.FLAG_FIELDS:
+            setattr(self, field, bool(bits & bit))
+            bit <<= 1
+        return self
+
 class Player:
+    __slots__ = ("name", "hp", "max_hp", "spirits", "status", "bus", "config")
+
     def __init__(self, name):
         self.name = name
-        self.hp = INITIAL_HP
-        self.max_hp = MAX_HP
+        self.config = DEFAULT_CONFIG # 加入对局时由 Game 换成该局的规则
+        self.hp = self.config.initial_hp
+        self.max_hp = self.config.max_hp
         self.spirits = []
-        self.status = {
-            "amulet_turns": 0,
-            "is_mirrored": False,
-            "is_handcuffed": False,
-            "pillow_immunity": 0,
-            "skip_next_turn": False,
-            "has_contract": False,
-            "last_stand": False,
-            "red_potion_bonus": 0,
-            "remote_control_active": False,
-            "mushroom_effect": False,
-            "shuffler_effect": False,
-        }
+        self.status = PlayerStatus()
+        self.bus = _DETACHED_BUS # 加入对局时由 Game 换成该局的事件总线
+
+    def state_key(self):
+        """(生命值, 状态位, 手牌计数) 三元组，可哈希"""
+        return (self.hp, self.status.pack(), pack_hand(self.spirits))
+
+    def load_state_key(self, key):
+        self.hp, status_bits, hand_bits = key
+        self.status.unpack(status_bits)
+        self.spirits = unpack_hand(hand_bits)
 
     def take_damage(self, amount, source_is_mirror=False):
         if amount <= 0:
@@ -221,44 +1292,42 @@ class Player:
         
         final_damage = amount
         
-        if self.status["amulet_turns"] > 0:
+        if self.status.amulet_turns > 0:
             # 触发时揭示身份
             if amount > 1:
                 final_damage = amount * 2
-                print_slow(f"💥 {self.name} 的【{MYSTERIOUS_CHARM_NAME}】({SPIRIT_NAMES['AMULET']})因巨大伤害而破碎，受到双倍伤害！")
-                self.status["amulet_turns"] = 0
+                self.bus.emit(AmuletShattered, self)
+                self.status.amulet_turns = 0
             else:
                 final_damage = 0
-                print_slow(f"🛡️ {self.name} 的【{MYSTERIOUS_CHARM_NAME}】({SPIRIT_NAMES['AMULET']})吸收了1点伤害。")
+                self.bus.emit(AmuletAbsorbed, self)
         
         if source_is_mirror:
             final_damage += 1
-            print_slow(f"🪞 {SPIRIT_NAMES['MIRROR']}反弹的伤害+1！")
+            self.bus.emit(MirrorDamageBonus, self)
             
         if final_damage > 0:
             self.hp -= final_damage
-            print_slow(f"💔 {self.name} 失去了 {final_damage} 点生命值，当前生命值: {self.hp}")
+            self.bus.emit(DamageTaken, self, final_damage, self.hp)
             return final_damage
         else:
-            print_slow(f"{self.name} 没有受到伤害。")
+            self.bus.emit(DamageNegated, self)
             return 0
 
     def heal(self, amount):
         self.hp = min(self.max_hp, self.hp + amount)
-        print_slow(f"💚 {self.name} 恢复了 {amount} 点生命值，当前生命值: {self.hp}")
+        self.bus.emit(Healed, self, amount, self.hp)
 
     def add_spirit(self, spirit_name):
-        if len(self.spirits) < MAX_SPIRITS:
+        if len(self.spirits) < self.config.max_spirits:
             self.spirits.append(spirit_name)
-            # CHANGED: 获得隐藏灵物时，不显示其真实名称
-            display_name = f"【{MYSTERIOUS_CHARM_NAME}】" if spirit_name in HIDDEN_SPIRITS else f"【{SPIRIT_NAMES.get(spirit_name, spirit_name)}】"
-            print_slow(f"✨ {self.name} 获得了灵物: {display_name}")
+            self.bus.emit(SpiritGained, self, spirit_name) # 隐藏灵物在显示时不暴露真实名称
         else:
-            print_slow(f"⚠️ {self.name} 的灵物已满（{MAX_SPIRITS}个），无法获得新的灵物。")
+            self.bus.emit(SpiritHandFull, self)
 
-    def display_status(self, for_opponent=False): # for_opponent 参数现在只用于历史兼容，新逻辑不再需要
-        print(f"--- {self.name} 的状态 ---")
-        print(f"❤️  生命值: {self.hp}/{self.max_hp}")
+    def status_lines(self):
+        """状态面板的各行（不含换行），回合界面按行比较后只重画变化的部分"""
+        lines = [f"--- {self.name} 的状态 ---", f"❤️  生命值: {self.hp}/{self.max_hp}"]
         
         spirit_display = []
         if self.spirits:
@@ -271,53 +1340,116 @@ class Player:
         else:
             spirit_display.append("无")
             
-        print(f"👻 灵物 ({len(self.spirits)}/{MAX_SPIRITS}): {' '.join(spirit_display)}")
+        lines.append(f"👻 灵物 ({len(self.spirits)}/{self.config.max_spirits}): {' '.join(spirit_display)}")
         
         active_statuses = []
         # 状态效果的显示也使用模糊名称
-        if self.status['amulet_turns'] > 0: active_statuses.append(f"屏障守护({self.status['amulet_turns']}回合)")
-        if self.status['is_mirrored']: active_statuses.append("空间折射")
-        if self.status['is_handcuffed']: active_statuses.append("被手铐")
-        if self.status['pillow_immunity'] > 0: active_statuses.append(f"枕头免疫({self.status['pillow_immunity']}回合)")
-        if self.status['has_contract']: active_statuses.append("契约书")
-        if self.status['last_stand']: active_statuses.append("最终回合")
+        if self.status.amulet_turns > 0: active_statuses.append(f"屏障守护({self.status.amulet_turns}回合)")
+        if self.status.is_mirrored: active_statuses.append("空间折射")
+        if self.status.is_handcuffed: active_statuses.append("被手铐")
+        if self.status.pillow_immunity > 0: active_statuses.append(f"枕头免疫({self.status.pillow_immunity}回合)")
+        if self.status.has_contract: active_statuses.append("契约书")
+        if self.status.last_stand: active_statuses.append("最终回合")
         if active_statuses:
-            print(f"🌟 状态: {', '.join(active_statuses)}")
-        print("-" * (len(self.name) + 12))
+            lines.append(f"🌟 状态: {', '.join(active_statuses)}")
+        lines.append("-" * (len(self.name) + 12))
+        return lines
+
+    def display_status(self, for_opponent=False): # for_opponent 参数现在只用于历史兼容，新逻辑不再需要
+        for line in self.status_lines(): print(line)
 
 class BaseAIPlayer(Player):
+    # 模拟思考的停顿（秒），由 Game 统一处理，无头模式下不生效
+    action_think_delay = AI_THINK_DELAY
+    target_think_delay = AI_THINK_DELAY / 2
+
     def __init__(self, name="AI"):
         super().__init__(name)
+        self.rng = random.Random() # AI自己的随机源，与对局规则的随机源分开，开局时由 Game 设定种子
     def ai_choose_action(self, opponent, game): raise NotImplementedError
     def ai_choose_target(self, opponent): raise NotImplementedError
     def ai_choose_spirit_to_steal(self, stealable_spirits): raise NotImplementedError
     def ai_choose_spirit_to_force_use(self, opponent_spirits, opponent_player_object): raise NotImplementedError
+    def ai_choose_telephone_position(self, deck_size): return self.rng.randint(1, deck_size)
+    # 对手行动时的后台预演（见 SearchAIPlayer），默认不做任何事
+    def ponder(self, game): pass
+    def stop_pondering(self): pass
 
 class HardAIPlayer(BaseAIPlayer):
+    action_think_delay = AI_THINK_DELAY / 2
+    target_think_delay = AI_THINK_DELAY / 4
+
     def __init__(self, name="AI (困难)"):
         super().__init__(name)
 
     def ai_choose_action(self, opponent, game):
-        time.sleep(AI_THINK_DELAY / 2)
-        if self.spirits and not self.status["is_handcuffed"] and random.random() < 0.4:
-            return f"spirit_index_{random.randint(0, len(self.spirits)-1)}"
+        if self.spirits and not self.status.is_handcuffed and self.rng.random() < 0.4:
+            return f"spirit_index_{self.rng.randint(0, len(self.spirits)-1)}"
         return "fate_card"
 
     def ai_choose_target(self, opponent):
-        time.sleep(AI_THINK_DELAY / 4)
-        return 'opponent' if random.random() < 0.9 else 'self'
+        return 'opponent' if self.rng.random() < 0.9 else 'self'
 
     def ai_choose_spirit_to_steal(self, stealable_spirits):
-        return random.choice(stealable_spirits)
+        return self.rng.choice(stealable_spirits)
 
     def ai_choose_spirit_to_force_use(self, opponent_spirits, opponent_player_object):
-        return random.choice(opponent_spirits)
+        return self.rng.choice(opponent_spirits)
+
+# 专家AI的评分权重。默认值即原来写死的数值；tune.py 通过自我对弈调优后写出权重文件，命令行入口用 --ai-weights 加载（load_ai_weights）
+EXPERT_WEIGHTS = {
+    # _evaluate_spirit_use：各灵物的基础分
+    "green_potion_per_missing_hp": 40, "eraser_per_enemy_spirit": 25, "gloves_base": 35, "gloves_per_stealable": 5,
+    "creation_per_free_slot": 15, "magnifier_unknown_top": 80, "contract_hp_le_2": 150, "contract_hp_3": 50,
+    "white_potion": 15, "white_potion_last_hp": -200, "pillow_base": 80, "pillow_per_enemy_hp": 5, "radio": 50,
+    "hidden_defensive": 90, "hidden_other": 40, "default_spirit": 30,
+    # 下一张是伤害牌的概率达到门槛时（默认为1：确知下一张是伤害牌，与按已知牌堆顶判断的规则相同）
+    "threat_probability": 1.0, "red_potion_threat": 120, "mirror_threat": 60,
+    # 倾向的倍率与行动门槛
+    "aggressive_multiplier": 1.5, "defensive_multiplier": 1.8, "action_threshold": 35,
+    # ai_choose_target：对自己使用命运卡牌所需的把握
+    "self_target_confidence": 0.8,
+    # 地狱AI的 ai_choose_target：知道牌堆构成时按期望结算比较两个目标（每点生命差、每个灵物差、自己得到额外回合、
+    # 用掉自己的镜子——镜子本可以在对手回合里保护自己）
+    "target_hp_swing": 1.0, "target_spirit": 0.05, "target_extra_turn": 0.3, "target_own_mirror": 1.0, "target_lethal": 5.0,
+    # ai_choose_spirit_to_force_use
+    "force_contract": 200, "force_pillow": 150, "force_white_potion_low_hp": 120, "force_white_potion": 30,
+    "force_green_potion_full_hp": 80, "force_creation_full_hand": 70, "force_gloves_empty_hand": 60, "force_hidden": -50,
+    "force_harmful": -200, "force_gloves_per_spirit": -100, "force_default": 10, "force_threshold": 20,
+}
+AI_WEIGHTS_FILE = "fate_ai_weights.json"
 
 class ExpertAIPlayer(BaseAIPlayer):
+    weights = EXPERT_WEIGHTS # 可以按类（由权重文件）或按实例（调优时）替换
+    # 偷取时按此顺序取第一种，都没有时随机
+    steal_priority = ("CONTRACT", "RED_POTION", "PILLOW", "ERASER", "REMOTE_CONTROL", "RADIO", "MIRROR", "AMULET",
+                      "GREEN_POTION", "MAGNIFYING_GLASS", "HANDCUFFS", "CREATION", "SHUFFLER", "WHITE_POTION", "MUSHROOM")
+    # ai_tables.py 编译的决策表及其对应的权重（由 use_decision_tables 设置），见 _decision_table
+    decision_table = None
+    decision_weights = None
+    # opening_book.py 推演的开局库及其对应的权重（由 use_opening_book 设置）
+    opening_book = None
+    book_weights = None
+
     def __init__(self, name="AI (专家)"):
         super().__init__(name)
-        self.known_next_fate_card = None
+        self.belief = DeckBelief() # 对命运牌堆每个位置的概率信念
         self.intended_fate_card_target = 'opponent'
+        self.book_target = None # 开局库给出的命运卡牌目标，在 ai_choose_target 中使用
+
+    @property
+    def known_next_fate_card(self):
+        """已经确定的牌堆顶（如用放大镜看过），不确定时为 None"""
+        return self.belief.certain(0)
+
+    # 作为命运牌堆的观察者，把牌堆的每次变化汇入信念。专家不知道牌堆构成，只知道张数和生成规则
+    def deck_refilled(self, deck): self.belief.reset(len(deck), prior=self.config.fate_prior)
+    def card_drawn(self, deck, card): self.belief.drawn(card)
+    def card_discarded(self, deck, card): self.belief.drawn(card) # 蘑菇变掉的牌是公开的
+    def card_pushed(self, deck, card): self.belief.pushed_unknown()
+    # 洗牌器交换的另一个位置是随机的，玩家看不到，这里不使用 j
+    def cards_swapped(self, deck, i, j): self.belief.swapped_with_random(i)
+    def see_fate_card(self, position, card): self.belief.revealed(position, card)
 
     def _determine_strategic_tendency(self, opponent):
         if self.hp <= 2: return "Defensive"
@@ -325,327 +1457,1716 @@ class ExpertAIPlayer(BaseAIPlayer):
         if self.hp > opponent.hp: return "Stable"
         return "Stable"
 
+    def _score_spirit(self, spirit, opponent, tendency, p_damage, last_used):
+        """使用某个灵物的得分；last_used 为自己上回合用过的灵物"""
+        w = self.weights
+        score = 0
+        if spirit == "GREEN_POTION": score += (self.max_hp - self.hp) * w["green_potion_per_missing_hp"]
+        elif spirit == "ERASER": score += len(opponent.spirits) * w["eraser_per_enemy_spirit"]
+        elif spirit == "GLOVES":
+            stealable_count = len([s for s in opponent.spirits if s != "GLOVES"])
+            if stealable_count > 0 and len(self.spirits) < self.config.max_spirits: score += w["gloves_base"] + stealable_count * w["gloves_per_stealable"]
+        elif spirit == "CREATION": score += (self.config.max_spirits - len(self.spirits)) * w["creation_per_free_slot"]
+        elif spirit == "MAGNIFYING_GLASS" and self.known_next_fate_card is None: score += w["magnifier_unknown_top"]
+        elif spirit == "CONTRACT" and not self.status.has_contract:
+            if self.hp <= 2: score += w["contract_hp_le_2"]
+            elif self.hp == 3: score += w["contract_hp_3"]
+        elif spirit == "WHITE_POTION": score += w["white_potion"] if self.hp > 1 else w["white_potion_last_hp"]
+        elif spirit == "PILLOW" and len(self.spirits) <= 2: score += w["pillow_base"] - opponent.hp * w["pillow_per_enemy_hp"]
+        elif spirit == "RADIO" and opponent.spirits: score += w["radio"]
+        # NEW: AI now evaluates hidden spirits based on tendency
+        elif spirit in HIDDEN_SPIRITS:
+            if tendency == "Defensive": score += w["hidden_defensive"] # 赌它是防御性物品
+            else: score += w["hidden_other"]
+        else: score += w["default_spirit"]
+        if p_damage >= w["threat_probability"]:
+            if spirit == "RED_POTION": score += w["red_potion_threat"]
+            if spirit == "MIRROR": score += w["mirror_threat"] # AI knows it has a mirror
+        if tendency == "Aggressive":
+            if spirit in ["RED_POTION", "ERASER", "HANDCUFFS", "REMOTE_CONTROL", "RADIO"]: score *= w["aggressive_multiplier"]
+        if tendency == "Defensive":
+            if spirit in ["AMULET", "MIRROR", "GREEN_POTION"]: score *= w["defensive_multiplier"]
+        if spirit in ["HANDCUFFS", "REMOTE_CONTROL"] and last_used == spirit:
+            score = -1000
+        return score
+
+    def _decision_table(self):
+        """加载的决策表适用于当前的权重和规则时返回它，否则返回 None（按实例调优的权重、规则变体等）"""
+        table = self.decision_table
+        if table is not None and self.weights is self.decision_weights and self.config is table.config: return table
+        return None
+
     def _evaluate_spirit_use(self, opponent, game, tendency):
+        p_damage = self.belief.probability(0, DAMAGE_CARD_INDICES)
+        last_used = game.last_spirit_used_by_player[game.players.index(self)]
+        table = self._decision_table()
+        if table is not None:
+            result = table.best_spirit_use(self, opponent, tendency, p_damage, last_used)
+            if result is not None: return result
         best_spirit_index = -1
         highest_score = 0
         for i, spirit in enumerate(self.spirits):
-            score = 0
-            if spirit == "GREEN_POTION": score += (self.max_hp - self.hp) * 40
-            elif spirit == "ERASER": score += len(opponent.spirits) * 25
-            elif spirit == "GLOVES":
-                stealable_count = len([s for s in opponent.spirits if s != "GLOVES"])
-                if stealable_count > 0 and len(self.spirits) < MAX_SPIRITS: score += 35 + stealable_count * 5
-            elif spirit == "CREATION": score += (MAX_SPIRITS - len(self.spirits)) * 15
-            elif spirit == "MAGNIFYING_GLASS" and self.known_next_fate_card is None: score += 80
-            elif spirit == "CONTRACT" and not self.status["has_contract"]:
-                if self.hp <= 2: score += 150
-                elif self.hp == 3: score += 50
-            elif spirit == "WHITE_POTION": score += 15 if self.hp > 1 else -200
-            elif spirit == "PILLOW" and len(self.spirits) <= 2: score += 80 - opponent.hp * 5
-            elif spirit == "RADIO" and opponent.spirits: score += 50
-            # NEW: AI now evaluates hidden spirits based on tendency
-            elif spirit in HIDDEN_SPIRITS:
-                if tendency == "Defensive": score += 90 # 赌它是防御性物品
-                else: score += 40
-            else: score += 30
-            if self.known_next_fate_card in ["DIVINE_PUNISHMENT", "BACKLASH"]:
-                if spirit == "RED_POTION": score += 120
-                if spirit == "MIRROR": score += 60 # AI knows it has a mirror
-            if tendency == "Aggressive":
-                if spirit in ["RED_POTION", "ERASER", "HANDCUFFS", "REMOTE_CONTROL", "RADIO"]: score *= 1.5
-            if tendency == "Defensive":
-                if spirit in ["AMULET", "MIRROR", "GREEN_POTION"]: score *= 1.8
-            if spirit in ["HANDCUFFS", "REMOTE_CONTROL"] and game.last_spirit_used_by_player[game.players.index(self)] == spirit:
-                score = -1000
+            score = self._score_spirit(spirit, opponent, tendency, p_damage, last_used)
             if score > highest_score:
                 highest_score = score
                 best_spirit_index = i
         return best_spirit_index, highest_score
 
     def ai_choose_action(self, opponent, game):
-        time.sleep(AI_THINK_DELAY)
+        book = self.opening_book
+        if book is not None and game.turn_count <= 2 and self.weights is self.book_weights and self.config is book.config:
+            action = book.lookup(game, self)
+            if action is not None:
+                kind, value = action
+                if kind == "fate":
+                    self.book_target = value
+                    return "fate_card"
+                return f"spirit_index_{self.spirits.index(value)}"
         tendency = self._determine_strategic_tendency(opponent)
-        if not self.status["is_handcuffed"]:
+        if not self.status.is_handcuffed:
             best_index, score = self._evaluate_spirit_use(opponent, game, tendency)
-            if score > 35:
+            if score > self.weights["action_threshold"]:
                 return f"spirit_index_{best_index}"
         return "fate_card"
 
     def ai_choose_target(self, opponent):
-        time.sleep(AI_THINK_DELAY / 2)
-        if self.known_next_fate_card in ["THE_VOID", "DIVINE_BOON"]:
+        if self.book_target is not None:
+            self.intended_fate_card_target, self.book_target = self.book_target, None
+            return self.intended_fate_card_target
+        # 有足够把握下一张对自己有利（虚无/恩赐）时才对自己使用，否则对对手使用
+        if self.belief.probability(0, SELF_CARD_INDICES) >= self.weights["self_target_confidence"]:
             self.intended_fate_card_target = 'self'
             return 'self'
         self.intended_fate_card_target = 'opponent'
         return 'opponent'
 
     def ai_choose_spirit_to_steal(self, stealable_spirits):
-        priority = ["CONTRACT", "RED_POTION", "PILLOW", "ERASER", "REMOTE_CONTROL", "RADIO", "MIRROR", "AMULET", "GREEN_POTION", "MAGNIFYING_GLASS", "HANDCUFFS", "CREATION", "SHUFFLER", "WHITE_POTION", "MUSHROOM"]
-        for p_spirit in priority:
-            if p_spirit in stealable_spirits: return p_spirit
-        return random.choice(stealable_spirits)
+        table = self._decision_table()
+        if table is not None: choice = table.steal_choice(stealable_spirits)
+        else: choice = next((p_spirit for p_spirit in self.steal_priority if p_spirit in stealable_spirits), None)
+        return choice if choice is not None else self.rng.choice(stealable_spirits)
+
+    def _score_forced_spirit(self, spirit, opponent_player_object):
+        """无线电：强制对手使用某个灵物的得分"""
+        w = self.weights
+        if spirit == "CONTRACT": return w["force_contract"]
+        if spirit == "PILLOW": return w["force_pillow"]
+        if spirit == "WHITE_POTION": return w["force_white_potion_low_hp"] if opponent_player_object.hp <= 2 else w["force_white_potion"]
+        if spirit == "GREEN_POTION" and opponent_player_object.hp >= opponent_player_object.max_hp: return w["force_green_potion_full_hp"]
+        if spirit == "CREATION" and len(opponent_player_object.spirits) >= self.config.max_spirits: return w["force_creation_full_hand"]
+        if spirit == "GLOVES" and not any(s != "GLOVES" for s in self.spirits): return w["force_gloves_empty_hand"]
+        if spirit in HIDDEN_SPIRITS: return w["force_hidden"] # 赌一手这个隐藏物品对自己没好处
+        if spirit in ["ERASER", "HANDCUFFS", "REMOTE_CONTROL", "RADIO"]: return w["force_harmful"]
+        if spirit == "GLOVES": return w["force_gloves_per_spirit"] * len([s for s in self.spirits if s != "GLOVES"])
+        return w["force_default"]
 
     def ai_choose_spirit_to_force_use(self, opponent_spirits, opponent_player_object):
-        scores = {}
-        for spirit in opponent_spirits:
-            score = 0
-            if spirit == "CONTRACT": score = 200
-            elif spirit == "PILLOW": score = 150
-            elif spirit == "WHITE_POTION": score = 120 if opponent_player_object.hp <= 2 else 30
-            elif spirit == "GREEN_POTION" and opponent_player_object.hp >= opponent_player_object.max_hp: score = 80
-            elif spirit == "CREATION" and len(opponent_player_object.spirits) >= MAX_SPIRITS: score = 70
-            elif spirit == "GLOVES" and not any(s != "GLOVES" for s in self.spirits): score = 60
-            elif spirit in HIDDEN_SPIRITS: score = -50 # 赌一手这个隐藏物品对自己没好处
-            elif spirit in ["ERASER", "HANDCUFFS", "REMOTE_CONTROL", "RADIO"]: score = -200
-            elif spirit == "GLOVES": score = -100 * len([s for s in self.spirits if s != "GLOVES"])
-            else: score = 10
-            scores[spirit] = score
-        if not scores or max(scores.values()) < 20: return None
+        table = self._decision_table()
+        scores = table.force_scores(self, opponent_player_object, opponent_spirits) if table is not None else None
+        if scores is None: scores = {spirit: self._score_forced_spirit(spirit, opponent_player_object) for spirit in opponent_spirits}
+        if not scores or max(scores.values()) < self.weights["force_threshold"]: return None
         return max(scores, key=scores.get)
 
+# --- 命运卡牌的期望结算 ---
+# 已知命运牌堆构成时，精确计算抽一张命运卡牌对某个目标使用的期望结果：双方失去的生命、获得的灵物、
+# 谁得到额外回合、谁的镜子被用掉、谁因此输掉。牌堆顺序在构成之内均匀随机（已知的牌堆顶除外），按剩余构成做动态规划，
+# 轮回的连锁、镜子反弹（+1伤害）、护身符、红药水加成、抽牌时的洗牌器/蘑菇、牌堆抽空后按先验重新生成都按规则结算。
+# 结果按 (构成, 牌堆顶, 抽牌者, 目标, 双方修正) 缓存在有上限的 LRU 缓存里；除轮回外的单张牌结算与牌堆无关，另外缓存，
+# 所以一次未命中只需沿轮回的连锁向下递归。
+FATE_SOLVER_CACHE_SIZE = 100000
+# 双方修正的字段：是否有镜子、护身符是否生效、红药水加成、洗牌器/蘑菇是否在下次抽牌时触发、手牌空位、
+# 致命的伤害（失去这么多生命就会输掉；契约书还能救一次时为0，表示不会因此输掉）
+SIDE_MIRRORED, SIDE_AMULET, SIDE_BONUS, SIDE_SHUFFLER, SIDE_MUSHROOM, SIDE_FREE, SIDE_LETHAL = range(7)
+_PUNISHMENT, _BOON, _VOID, _REINCARNATION, _BACKLASH = (FATE_CARD_INDEX[c] for c in
+    ("DIVINE_PUNISHMENT", "DIVINE_BOON", "THE_VOID", "REINCARNATION", "BACKLASH"))
+
+def fate_side(player, config):
+    """玩家的修正字段（见 SIDE_*），作为 fate_expectation 的输入"""
+    status = player.status
+    lethal = 0 if status.has_contract and not status.last_stand else max(player.hp, 1)
+    return (int(status.is_mirrored), int(status.amulet_turns > 0), status.red_potion_bonus, int(status.shuffler_effect),
+            int(status.mushroom_effect), max(0, config.max_spirits - len(player.spirits)), lethal)
+
+@functools.lru_cache(maxsize=FATE_SOLVER_CACHE_SIZE)
+def _fate_draws(counts, top, shuffler, mushroom, prior):
+    """下一次抽牌：(各牌被抽到的概率, ((概率, 抽到轮回之后的剩余构成), ...))，只有轮回需要知道之后的牌堆；
+    counts 为 None 表示牌堆是按先验新生成的（每张牌独立服从先验）"""
+    if counts is None or not any(counts): # 抽空后重新生成，此后的每张牌都独立服从先验
+        return prior, ((prior[_REINCARNATION], None),) if prior[_REINCARNATION] else ()
+    n = sum(counts)
+    if top >= 0 and not (shuffler and n > 1): tops = ((1.0, top),)
+    elif top >= 0: # 看过的牌堆顶被洗牌器换到看不到的位置，新的牌堆顶来自其余的牌
+        tops = [((k - (c == top)) / (n - 1), c) for c, k in enumerate(counts)]
+    else: tops = [(k / n, c) for c, k in enumerate(counts)]
+    rest = lambda c: counts[:c] + (counts[c] - 1,) + counts[c + 1:]
+    if mushroom: # 蘑菇把牌堆顶弃掉，换成一张按先验新生成的牌
+        q = prior[_REINCARNATION]
+        return prior, tuple((p * q, rest(c)) for p, c in tops if p and q)
+    probs = [0.0] * len(counts)
+    for p, c in tops: probs[c] += p
+    q = probs[_REINCARNATION]
+    return tuple(probs), ((q, rest(_REINCARNATION)),) if q else ()
+
+@functools.lru_cache(maxsize=FATE_SOLVER_CACHE_SIZE)
+def fate_expectation(counts, top, drawer, target, sides, prior, gain):
+    """drawer 抽一张命运卡牌对 target 使用（0、1 为 sides 中的两方），结算完成后的期望：
+    (0 失去的生命, 1 失去的生命, 0 获得的灵物, 1 获得的灵物, 0 得到额外回合的概率, 1 得到额外回合的概率,
+     0 的镜子被用掉的概率, 1 的镜子被用掉的概率, 0 因此输掉的概率, 1 因此输掉的概率)。
+
+    counts 为剩余各牌张数（按 FATE_CARD_KEYS）或 None（按先验新生成的牌堆），top 为已知牌堆顶的编号（-1 为未知），
+    prior 为一张新牌的分布，gain 为每失去1点生命获得的灵物数。
+    """
+    side = sides[drawer]
+    shuffler, mushroom = side[SIDE_SHUFFLER], side[SIDE_MUSHROOM]
+    if shuffler or mushroom: # 抽牌时触发一次
+        side = side[:SIDE_SHUFFLER] + (0, 0) + side[SIDE_FREE:]
+        sides = (side, sides[1]) if drawer == 0 else (sides[0], side)
+    probs, reincarnations = _fate_draws(counts, top, shuffler, mushroom, prior)
+    total = (0.0,) * 10
+    for card, p in enumerate(probs):
+        if p and card != _REINCARNATION:
+            total = tuple([t + p * v for t, v in zip(total, _fate_card_outcome(card, drawer, target, sides, gain))])
+    repeat = 0.0 # 新生成的牌堆上对自己连续轮回：回到同一个状态，按几何级数求和
+    for p, rest in reincarnations:
+        if rest is None and counts is None and top == -1 and drawer == target and not sides[target][SIDE_MIRRORED]:
+            repeat += p
+            continue
+        total = tuple([t + p * v for t, v in zip(total, _reincarnation_outcome(rest, drawer, target, sides, prior, gain))])
+    if repeat: total = tuple([v / (1 - repeat) for v in total])
+    return total
+
+def _reflect(user, target, sides):
+    """目标有镜子时把牌反弹到另一方并用掉镜子：返回 (新目标, 新的 sides)；没有镜子时原样返回"""
+    side = sides[target]
+    if not side[SIDE_MIRRORED]: return target, sides
+    cleared = (0,) + side[1:]
+    sides = (cleared, sides[1]) if target == 0 else (sides[0], cleared)
+    return (user if target != user else 1 - user), sides
+
+def _reincarnation_outcome(rest, user, target, sides, prior, gain):
+    """user 对 target 结算轮回：目标（被反弹后的一方）立刻对自己使用下一张牌"""
+    reflected, sides = _reflect(user, target, sides)
+    result = fate_expectation(rest, -1, reflected, reflected, sides, prior, gain)
+    if reflected == target: return result
+    return result[:6 + target] + (1.0,) + result[7 + target:]
+
+@functools.lru_cache(maxsize=FATE_SOLVER_CACHE_SIZE)
+def _fate_card_outcome(card, user, target, sides, gain):
+    """user 对 target 结算已经抽到的非轮回牌，结果与牌堆无关，单独缓存；格式与 fate_expectation 相同"""
+    result = [0.0] * 10
+    reflected, sides = _reflect(user, target, sides)
+    mirrored = reflected != target
+    if mirrored: result[6 + target] = 1.0
+    target, side = reflected, sides[reflected]
+    if card == _PUNISHMENT or card == _BACKLASH:
+        damage = 1 + sides[user][SIDE_BONUS]
+        if side[SIDE_AMULET]: # 护身符：1点伤害被抵消，更高的伤害翻倍并使护身符失效
+            damage = damage * 2 if damage > 1 else 0
+        if mirrored: damage += 1
+        result[target] = damage
+        result[2 + target] = min(gain * damage, side[SIDE_FREE])
+        if side[SIDE_LETHAL] and damage >= side[SIDE_LETHAL]: result[8 + target] = 1.0
+        if card == _BACKLASH and damage: result[4 + target] = 1.0
+    elif card == _BOON: result[2 + target] = 1 if side[SIDE_FREE] else 0
+    elif card == _VOID and target == user: result[4 + user] = 1.0
+    return tuple(result)
+
 class HellAIPlayer(ExpertAIPlayer):
     def __init__(self, name="AI (地狱)"):
         super().__init__(name)
-        self.known_fate_deck_composition = Counter()
-    def update_deck_knowledge(self, deck): self.known_fate_deck_composition = Counter(deck)
-    def see_card_draw(self, card):
-        if card in self.known_fate_deck_composition:
-            self.known_fate_deck_composition[card] -= 1
-            if self.known_fate_deck_composition[card] == 0: del self.known_fate_deck_composition[card]
+    # 地狱AI在牌堆生成时就知道它的构成，信念会随之按剩余构成拟合
+    def deck_refilled(self, deck): self.belief.reset(len(deck), deck.counts, self.config.fate_prior)
+
+    def _fate_target_values(self, opponent):
+        """(对自己, 对对手) 使用命运卡牌的期望价值，由 fate_expectation 按剩余构成精确计算；
+        构成不确定（蘑菇换上了未知的牌）或牌堆被打乱过而牌堆顶未知时返回 None"""
+        belief, config = self.belief, self.config
+        top = self.known_next_fate_card
+        if belief.remaining is None or not (belief.exchangeable or top is not None): return None
+        counts = tuple(round(n) for n in belief.remaining)
+        if any(abs(n - k) > 1e-9 for n, k in zip(belief.remaining, counts)) or sum(counts) != len(belief.rows): return None
+        sides = (fate_side(self, config), fate_side(opponent, config))
+        top = -1 if top is None else FATE_CARD_INDEX[top]
+        w = self.weights
+        values = []
+        for target in (0, 1):
+            lost, dealt, gained, given, extra, _, mirror_used, _, dead, kill = fate_expectation(
+                counts, top, 0, target, sides, config.fate_prior, config.hp_loss_spirit_gain)
+            values.append((dealt - lost) * w["target_hp_swing"] + (gained - given) * w["target_spirit"] + extra * w["target_extra_turn"]
+                          - mirror_used * w["target_own_mirror"] + (kill - dead) * w["target_lethal"])
+        return values
+
+    def ai_choose_target(self, opponent):
+        values = self._fate_target_values(opponent) if self.book_target is None else None
+        if values is None: return super().ai_choose_target(opponent)
+        self.intended_fate_card_target = 'self' if values[0] > values[1] + 1e-9 else 'opponent' # 相等时对对手使用
+        return self.intended_fate_card_target
+
     def _determine_strategic_tendency(self, opponent):
         tendency = super()._determine_strategic_tendency(opponent)
-        if not self.known_fate_deck_composition: return tendency
-        total_cards = sum(self.known_fate_deck_composition.values())
-        if total_cards == 0: return tendency
-        damage_cards = self.known_fate_deck_composition.get("DIVINE_PUNISHMENT", 0) + self.known_fate_deck_composition.get("BACKLASH", 0)
-        threat_ratio = damage_cards / total_cards
+        threat_ratio = self.belief.probability(0, DAMAGE_CARD_INDICES) # 下一张是伤害牌的概率
         if threat_ratio > 0.6 and tendency not in ["Desperate", "Aggressive"]: return "Defensive"
         if threat_ratio < 0.2 and tendency == "Stable": return "Aggressive"
         return tendency
 
-# ==============================================================================
-# --- 策略模式实现 (灵物) ---
-# ==============================================================================
-class SpiritStrategy:
-    def apply(self, user: Player, opponent: Player, game: 'Game'): raise NotImplementedError
-
-class AmuletStrategy(SpiritStrategy):
-    def apply(self, user, opponent, game):
-        user.status["amulet_turns"] = 2
-        # 使用时不揭示身份，只显示模糊信息
-        print_slow(f"🛡️ 一道神秘的屏障笼罩了 {user.name}。")
-
-class MirrorStrategy(SpiritStrategy):
-    def apply(self, user, opponent, game):
-        user.status["is_mirrored"] = True
-        # 使用时不揭示身份，只显示模糊信息
-        print_slow(f"✨ {user.name} 周身的空间开始微微扭曲...")
-
-class RemoteControlStrategy(SpiritStrategy):
-    def apply(self, user, opponent, game):
-        user.status["remote_control_active"] = True
-        print_slow("遥控器已设置，将在你的回合结束后对你的对手生效。")
-
-class EraserStrategy(SpiritStrategy):
-    def apply(self, user, opponent, game):
-        if not opponent.spirits:
-            print_slow(f"但 {opponent.name} 没有任何灵物可以移除。")
-            return
-        num_to_remove = min(2, len(opponent.spirits))
-        removed_spirits = random.sample(opponent.spirits, k=num_to_remove)
-        print_slow(f"橡皮擦抹去了 {opponent.name} 的 {num_to_remove} 个随机灵物！")
-        for s in removed_spirits:
-            opponent.spirits.remove(s)
-            # CHANGED: 移除时，即使是隐藏灵物，也会揭示其真实身份
-            display_name = f"【{SPIRIT_NAMES.get(s, s)}】"
-            print_slow(f" - {display_name} 已被移除。")
-
-class GlovesStrategy(SpiritStrategy):
-    def apply(self, user, opponent, game):
-        stealable = [s for s in opponent.spirits if s != "GLOVES"]
-        if not stealable:
-            print_slow(f"但 {opponent.name} 没有任何可以偷取的灵物。")
-            return
-        if len(user.spirits) >= MAX_SPIRITS:
-            print_slow(f"但 {user.name} 的灵物已满，无法偷取！")
-            return
-        decision_maker = game.force_use_decision_maker if game.is_force_use_active else user
-        stolen_spirit = game._get_opponent_spirit_choice(decision_maker, opponent, stealable)
-        opponent.spirits.remove(stolen_spirit)
-        
-        # CHANGED: 偷取和获得时的描述保持一致性
-        display_name_stolen = f"一个【{MYSTERIOUS_CHARM_NAME}】" if stolen_spirit in HIDDEN_SPIRITS else f"【{SPIRIT_NAMES.get(stolen_spirit, stolen_spirit)}】"
-        print_slow(f"{decision_maker.name} 决定从 {opponent.name} 处偷取{display_name_stolen}!")
-        
-        user.add_spirit(stolen_spirit) # add_spirit内部会处理正确的打印信息
-
-class GreenPotionStrategy(SpiritStrategy):
-    def apply(self, user, opponent, game): user.heal(1)
-
-class CreationStrategy(SpiritStrategy):
-    def apply(self, user, opponent, game): game._draw_spirit_for_player(user, 2)
-
-class MushroomStrategy(SpiritStrategy):
-    def apply(self, user, opponent, game):
-        user.status["mushroom_effect"] = True
-        print_to_player(user, "你的下一张抽取的牌将被替换成随机的另一张牌。")
-        print_slow(f"{user.name} 的周围出现了奇妙的孢子...")
-
-class WhitePotionStrategy(SpiritStrategy):
-    def apply(self, user, opponent, game):
-        result = random.choices(['heal1', 'dmg1', 'heal2', 'dmg2'], weights=[49, 49, 1, 1], k=1)[0]
-        if result == 'heal1':
-            print_slow("白药水发出了温和的光芒...")
-            user.heal(1)
-        elif result == 'dmg1':
-            print_slow("白药水变得浑浊并发出嘶嘶声...")
-            dmg_done = user.take_damage(1)
-            if dmg_done > 0: game._handle_hp_loss(user, dmg_done, attacker=user)
-        elif result == 'heal2':
-            print_slow("奇迹发生了！白药水散发出耀眼的光芒！")
-            user.heal(2)
-        elif result == 'dmg2':
-            print_slow("灾难降临！白药水剧烈爆炸！")
-            dmg_done = user.take_damage(2)
-            if dmg_done > 0: game._handle_hp_loss(user, dmg_done, attacker=user)
-
-class ShufflerStrategy(SpiritStrategy):
-    def apply(self, user, opponent, game):
-        user.status["shuffler_effect"] = True
-        print_to_player(user, "你的下一张抽取的牌将与牌堆中随机一张牌交换位置。")
-        print_slow(f"{user.name} 面前的牌堆发生了小小的骚动...")
-
-class MagnifyingGlassStrategy(SpiritStrategy):
-    def apply(self, user, opponent, game):
-        print_slow(f"👁️ {user.name} 拿出了放大镜，仔细观察着牌堆...")
-        # CHANGED: 牌堆为空的检查现在由 _draw_fate_card 统一处理，但这里只是查看，所以需要单独检查
-        if not game.fate_deck:
-            print_to_player(user, "牌堆是空的！")
-            return
+# --- 搜索型AI ---
+
+# 搜索AI单次决策的默认预算
+SEARCH_TIME_BUDGET = 0.3    # 秒
+SEARCH_ROLLOUT_MAX_TURNS = 200
+SEARCH_EXPLORATION = 0.7    # UCB1 探索系数（收益范围为0~1）
+SEARCH_TABLE_LIMIT = 500000 # 置换表条目上限，超过后清空重建
+SEARCH_PONDER_READY = 200   # 根节点已有这么多次推演（多半来自对手回合时的预演）时只做补充搜索，
+                            # 不足时按已有次数的比例缩短本次的时间预算
+SEARCH_REFINE_BUDGET = 0.05 # 秒，补充搜索的最短预算
+SEARCH_PONDER_LIMIT = 50000 # 一次预演最多推演的局数
+
+def observation_key(game, seat, known_next_fate_card=None):
+    """seat 号玩家视角下的局面键：对手的隐藏灵物统一记为同一种，牌堆只保留张数和已知的牌堆顶"""
+    me = game.players[seat]
+    opponent = game.players[1 - seat]
+    opponent_hand = 0
+    for s in opponent.spirits:
+        opponent_hand += 1 << (SPIRIT_INDEX["AMULET" if s in HIDDEN_SPIRITS else s] * HAND_COUNT_BITS)
+    last = game.last_spirit_used_by_player[seat]
+    return (me.hp, me.status.pack(), pack_hand(me.spirits),
+            opponent.hp, opponent.status.pack(), opponent_hand,
+            len(game.fate_deck), -1 if known_next_fate_card is None else FATE_CARD_INDEX[known_next_fate_card],
+            -1 if last is None else SPIRIT_INDEX[last])
+
+def legal_search_actions(game, player):
+    """搜索时的候选行动：命运卡牌对对手/自己，以及每种可用的灵物（同种灵物只算一次）"""
+    actions = [("fate", "opponent"), ("fate", "self")]
+    if not player.status.is_handcuffed:
+        last = game.last_spirit_used_by_player[game.players.index(player)]
+        for spirit in dict.fromkeys(player.spirits):
+            if spirit in ["HANDCUFFS", "REMOTE_CONTROL"] and last == spirit: continue
+            actions.append(("spirit", spirit))
+    return actions
+
+class _SearchNode:
+    __slots__ = ("actions", "visits", "action_visits", "action_values")
+
+    def __init__(self, actions):
+        self.actions = actions
+        self.visits = 0
+        self.action_visits = [0] * len(actions)
+        self.action_values = [0.0] * len(actions)
+
+    def merge(self, other):
+        """把另一棵树中同一局面的统计累加进来（候选行动不同时保留自己的）"""
+        if other.actions != self.actions: return
+        self.visits += other.visits
+        for i, (n, value) in enumerate(zip(other.action_visits, other.action_values)):
+            self.action_visits[i] += n
+            self.action_values[i] += value
+
+    def select(self, exploration, rng):
+        untried = [i for i, n in enumerate(self.action_visits) if n == 0]
+        if untried: return rng.choice(untried)
+        log_total = math.log(self.visits)
+        return max(range(len(self.actions)),
+                   key=lambda i: self.action_values[i] / self.action_visits[i] + exploration * math.sqrt(log_total / self.action_visits[i]))
+
+class _SearchRolloutPlayer(ExpertAIPlayer):
+    """搜索推演中代表搜索方的玩家：在搜索树内按 UCB 选择，离开搜索树后使用专家启发式"""
+    def __init__(self, tree):
+        super().__init__("search")
+        self.tree = tree
+        self.pending_target = None
 
-        next_card = game.fate_deck[0]
-        # 信息只给使用者看
-        print_to_player(user, f"你看清了下一张牌是: 【{FATE_CARD_NAMES.get(next_card, '未知')}】")
-        if isinstance(user, ExpertAIPlayer):
-            user.known_next_fate_card = next_card
+    def ai_choose_action(self, opponent, game):
+        choice = self.tree.choose(game, self)
+        if choice is None: return super().ai_choose_action(opponent, game)
+        kind, value = choice
+        if kind == "fate":
+            self.pending_target = value
+            return "fate_card"
+        return f"spirit_index_{self.spirits.index(value)}"
 
+    def ai_choose_target(self, opponent):
+        if self.pending_target is not None:
+            target, self.pending_target = self.pending_target, None
+            return target
+        return super().ai_choose_target(opponent)
+
+class SearchAIPlayer(HellAIPlayer):
+    """蒙特卡洛树搜索AI。
+
+    每次决策在预算内反复进行：按自己掌握的信息对未知部分随机取样（对手的神秘护符、
+    命运牌堆顺序、灵物牌堆），然后用无头引擎把对局推演到结束。搜索树以自己视角的局面键
+    存放在置换表中，并在多次决策之间保留。
+    """
+    action_think_delay = 0 # 搜索本身就需要时间，不再额外停顿
+    target_think_delay = 0
+    # 默认预算；设置 node_budget 后改为按推演局数限制（结果可复现）
+    time_budget = SEARCH_TIME_BUDGET
+    node_budget = None
+
+    def __init__(self, name="AI (深渊)", time_budget=None, node_budget=None):
+        super().__init__(name)
+        if time_budget is not None: self.time_budget = time_budget
+        if node_budget is not None: self.node_budget = node_budget
+        self.table = {}
+        self.stats = {"searches": 0, "iterations": 0, "seconds": 0.0, "table_hits": 0, "table_misses": 0,
+                      "ponder_iterations": 0, "ponder_seconds": 0.0, "ponder_hits": 0}
+        self._planned_target = None
+        self._tree = _SearchTree(self, self.rng, self.table, self.stats)
+        self._table_lock = threading.Lock() # 预演线程停止时把它的搜索树并入置换表
+        self._ponder_thread = None
+        self._ponder_stop = None
+        self._ponder_root = None
+
+    # 每个决策入口都先停止预演：决策会用到随机源和信念，预演的树也要先并入置换表
+    def ai_choose_action(self, opponent, game):
+        kind, value = self._search(game)
+        if kind == "fate":
+            self._planned_target = value
+            return "fate_card"
+        self._planned_target = None
+        return f"spirit_index_{self.spirits.index(value)}"
 
-class RedPotionStrategy(SpiritStrategy):
-    def apply(self, user, opponent, game):
-        user.status["red_potion_bonus"] += 1
-        print_slow(f"{user.name} 的身上泛起了不祥的红光...")
-        print_to_player(user, "你的下一张伤害牌效果+1。")
+    def ai_choose_target(self, opponent):
+        self.stop_pondering()
+        if self._planned_target is not None:
+            target, self._planned_target = self._planned_target, None
+            return target
+        return super().ai_choose_target(opponent)
+
+    def ai_choose_spirit_to_steal(self, stealable_spirits):
+        self.stop_pondering()
+        return super().ai_choose_spirit_to_steal(stealable_spirits)
 
-class HandcuffsStrategy(SpiritStrategy):
-    def apply(self, user, opponent, game):
-        if opponent.status["pillow_immunity"] > 0:
-            print_slow(f"但 {opponent.name} 受到了【枕头】的保护，手铐无效！")
+    def ai_choose_spirit_to_force_use(self, opponent_spirits, opponent_player_object):
+        self.stop_pondering()
+        return super().ai_choose_spirit_to_force_use(opponent_spirits, opponent_player_object)
+
+    def ai_choose_telephone_position(self, deck_size):
+        self.stop_pondering()
+        return super().ai_choose_telephone_position(deck_size)
+
+    def search_report(self):
+        """累计的搜索统计：每秒推演局数、置换表命中率等，用于调参"""
+        with self._table_lock: stats, table_size = dict(self.stats), len(self.table)
+        lookups = stats["table_hits"] + stats["table_misses"]
+        stats["nodes_per_second"] = stats["iterations"] / stats["seconds"] if stats["seconds"] else 0.0
+        stats["table_hit_rate"] = stats["table_hits"] / lookups if lookups else 0.0
+        stats["ponder_hit_rate"] = stats["ponder_hits"] / stats["searches"] if stats["searches"] else 0.0
+        stats["table_size"] = table_size
+        return stats
+
+    def _search(self, game):
+        self.stop_pondering()
+        seat = game.players.index(self)
+        root_state = game.state_key()
+        root_key = observation_key(game, seat, self.known_next_fate_card)
+        tree = self._tree
+        scratch = tree.scratch_game(seat)
+        with self._table_lock:
+            if len(self.table) > SEARCH_TABLE_LIMIT: self.table.clear()
+            time_budget = self.time_budget
+            root = self.table.get(root_key)
+            if root is not None and root.visits:
+                # 预演（或之前的搜索）已经算过这个局面，在此基础上补充即可
+                self.stats["ponder_hits"] += 1
+                time_budget = max(min(time_budget, SEARCH_REFINE_BUDGET), time_budget * (1 - root.visits / SEARCH_PONDER_READY))
+            iterations = 0
+            started = time.perf_counter()
+            deadline = started + time_budget
+            while True:
+                tree.iterate(scratch, seat, root_state, self.belief)
+                iterations += 1
+                if self.node_budget is not None and iterations >= self.node_budget: break
+                if self.node_budget is None and time.perf_counter() >= deadline: break
+            self.stats["searches"] += 1
+            self.stats["iterations"] += iterations
+            self.stats["seconds"] += time.perf_counter() - started
+            root = self.table[root_key]
+            return root.actions[max(range(len(root.actions)), key=root.action_visits.__getitem__)]
+
+    def ponder(self, game):
+        """对手行动期间，在后台线程里从当前局面推演下去，预先算好自己接下来可能面对的局面。
+
+        由 Game 在人类玩家每次选择行动前调用；局面与正在预演的起点不同（对手用了灵物等）时取消旧的预演重新开始。
+        预演线程有自己的随机源、推演对局和搜索树，停止时再在锁内并入置换表，不与前台的决策共享可变状态。
+        """
+        root_state = game.state_key()
+        if self._ponder_thread is not None and self._ponder_root == root_state: return
+        self.stop_pondering()
+        belief = DeckBelief()
+        belief.copy_from(self.belief) # 预演用信念的快照，真实对局可以继续更新 self.belief
+        tree = _SearchTree(self, random.Random(self.rng.getrandbits(64)), {}, dict.fromkeys(("table_hits", "table_misses"), 0))
+        self._ponder_root = root_state
+        self._ponder_stop = threading.Event()
+        self._ponder_thread = threading.Thread(target=self._ponder_loop, args=(tree, game.players.index(self), root_state, belief, self._ponder_stop),
+                                               name="search-ponder", daemon=True)
+        self._ponder_thread.start()
+
+    def stop_pondering(self):
+        if self._ponder_thread is None: return
+        self._ponder_stop.set()
+        self._ponder_thread.join()
+        self._ponder_thread = None
+        self._ponder_root = None
+
+    def _ponder_loop(self, tree, seat, root_state, belief, stop):
+        scratch = tree.scratch_game(seat)
+        started = time.perf_counter()
+        iterations = 0
+        while not stop.is_set() and iterations < SEARCH_PONDER_LIMIT and len(tree.table) <= SEARCH_TABLE_LIMIT:
+            tree.iterate(scratch, seat, root_state, belief)
+            iterations += 1
+        with self._table_lock:
+            table = self.table
+            for key, node in tree.table.items():
+                mine = table.get(key)
+                if mine is None: table[key] = node
+                else: mine.merge(node)
+            for key, value in tree.stats.items(): self.stats[key] += value
+            self.stats["ponder_iterations"] += iterations
+            self.stats["ponder_seconds"] += time.perf_counter() - started
+
+class _SearchTree:
+    """搜索树及推演它所用的状态：随机源、推演用的无头对局和当前推演的路径。
+
+    前台搜索用搜索AI自己的随机源和置换表；后台预演另建一个，互不干扰。
+    """
+    def __init__(self, owner, rng, table, stats):
+        self.owner = owner
+        self.rng = rng
+        self.table = table
+        self.stats = stats
+        self._scratch = None
+        self._rollout = None
+        self._path = None
+        self._expanded = False
+
+    def scratch_game(self, seat):
+        """推演用的无头对局，自己的座位由 _SearchRolloutPlayer 代替，对手由专家AI模拟"""
+        config = self.owner.config
+        if self._scratch is None or self._scratch.players[seat] is not self._rollout or self._scratch.config != config:
+            self._rollout = _SearchRolloutPlayer(self)
+            self._scratch = Game(headless=True, seed=self.rng.getrandbits(64), config=config)
+            self._scratch.players = [ExpertAIPlayer("model"), ExpertAIPlayer("model")]
+            self._scratch.players[seat] = self._rollout
+            for p in self._scratch.players:
+                p.rng.seed(self.rng.getrandbits(64))
+                p.config = config
+            self._scratch.fate_deck.observers = list(self._scratch.players)
+        return self._scratch
+
+    def _determinize(self, scratch, seat, belief):
+        """把 scratch 中自己看不到的部分换成一个符合已知信息的随机样本"""
+        opponent = scratch.players[1 - seat]
+        rng = self.rng
+        opponent.spirits = [rng.choice(["AMULET", "MIRROR"]) if s in HIDDEN_SPIRITS else s for s in opponent.spirits]
+        rng.shuffle(scratch.spirit_deck.cards)
+        size = len(scratch.fate_deck)
+        # 命运牌堆按自己的信念逐位置取样；信念与实际张数对不上时退回规则的先验
+        if len(belief.rows) == size: scratch.fate_deck.load(belief.sample(rng))
+        else: scratch.fate_deck.load(scratch.config.random_fate_cards(rng, size))
+
+    def iterate(self, scratch, seat, root_state, belief):
+        """一次推演：从 root_state 出发，按 belief 对看不到的部分取样，把胜负回传给搜索树路径上的节点"""
+        rollout = self._rollout
+        scratch.restore_state(root_state)
+        self._determinize(scratch, seat, belief)
+        scratch.turn_count = 0
+        for p in scratch.players: p.belief.reset(len(scratch.fate_deck))
+        rollout.belief.copy_from(belief, with_counts=False) # 推演中不做构成拟合，保持推演速度
+        rollout.pending_target = None
+        self._path = []
+        self._expanded = False
+        winner = scratch.play_out(SEARCH_ROLLOUT_MAX_TURNS)
+        reward = 0.5 if winner is None else (1.0 if winner is rollout else 0.0)
+        for node, index in self._path:
+            node.visits += 1
+            node.action_visits[index] += 1
+            node.action_values[index] += reward
+        self._path = None
+
+    def choose(self, game, player):
+        """推演中轮到搜索方决策时调用；返回 None 表示交给默认策略"""
+        if self._path is None or self._expanded: return None
+        key = observation_key(game, game.players.index(player), player.known_next_fate_card)
+        node = self.table.get(key)
+        if node is None:
+            node = _SearchNode(legal_search_actions(game, player))
+            self.table[key] = node
+            self._expanded = True
+            self.stats["table_misses"] += 1
+        else:
+            self.stats["table_hits"] += 1
+        index = node.select(SEARCH_EXPLORATION, self.rng)
+        self._path.append((node, index))
+        return node.actions[index]
+
+# --- 胜率估计浮层 ---
+
+OVERLAY_BATCH_GAMES = 8192   # 每个推演任务的局数
+OVERLAY_MAX_GAMES = 262144   # 同一局面累计推演到这么多局后不再细化
+OVERLAY_CACHE_SIZE = 256     # 按局面缓存的估计数，超过后丢弃最久未用的
+HIDDEN_OPTION = "HIDDEN"     # 候选行动“使用一个神秘护符”：连自己也不知道它是护身符还是镜子
+
+# 某个玩家视角下的局面，自己在前、对手在后；神秘护符只记张数，命运牌堆只有该玩家的信念（从牌堆底开始）
+ObservedPosition = namedtuple("ObservedPosition", "hp status hands hidden last_used extra fate_rows spirit_deck_size")
+
+def observe_position(game, seat, belief):
+    """seat 号玩家掌握的局面信息：双方的生命值、状态和手牌（神秘护符不分身份），以及按 belief 的命运牌堆"""
+    me, opponent = game.players[seat], game.players[1 - seat]
+    hands, hidden = [], []
+    for player in (me, opponent):
+        counts = [0] * len(SPIRIT_KEYS)
+        for s in player.spirits:
+            if s not in HIDDEN_SPIRITS: counts[SPIRIT_INDEX[s]] += 1
+        hands.append(tuple(counts))
+        hidden.append(len(player.spirits) - sum(counts))
+    rows = belief.rows if len(belief.rows) == len(game.fate_deck) else [game.config.fate_prior] * len(game.fate_deck)
+    last = game.last_spirit_used_by_player
+    extra = game.extra_turn_player
+    return ObservedPosition(
+        hp=(me.hp, opponent.hp), status=(me.status.pack(), opponent.status.pack()), hands=tuple(hands), hidden=tuple(hidden),
+        last_used=tuple(-1 if last[i] is None else SPIRIT_INDEX[last[i]] for i in (seat, 1 - seat)),
+        extra=-1 if extra is None else int(extra is opponent), fate_rows=tuple(rows), spirit_deck_size=len(game.spirit_deck))
+
+def overlay_options(game, player):
+    """估计的候选：None（按默认策略行动，即局面本身的胜率）以及每种现在可以使用的灵物（神秘护符算一种）"""
+    options = [None]
+    if not player.status.is_handcuffed:
+        last = game.last_spirit_used_by_player[game.players.index(player)]
+        for spirit in dict.fromkeys(HIDDEN_OPTION if s in HIDDEN_SPIRITS else s for s in player.spirits):
+            if spirit in ["HANDCUFFS", "REMOTE_CONTROL"] and last == spirit: continue
+            options.append(spirit)
+    return tuple(options)
+
+_overlay_generation = None # 工作进程中：当前有效任务的代号（共享整数），与任务的代号不同时放弃推演
+
+def _init_overlay_worker(generation):
+    global _overlay_generation
+    _overlay_generation = generation
+
+def _overlay_rollouts(position, options, games, seed, generation):
+    """工作进程：从 position 出发向量化推演 games 局，任务已经过期时返回 None"""
+    import vector_sim # 需要 NumPy，只在工作进程里导入
+    return vector_sim.rollout_position(position, options, games, seed=seed, stop=lambda: _overlay_generation.value != generation)
+
+class WinRateOverlay:
+    """胜率估计浮层：在人类玩家的回合界面下方显示双方的估计胜率，以及现在使用手中每种灵物后的胜率。
+
+    估计来自后台进程池里的向量化推演（vector_sim，需要 NumPy），双方都按专家AI的策略推演。以玩家视角的
+    局面为键，同一局面的推演分批累积，界面每次重绘时显示已有的结果，从不等待推演；局面一变，
+    旧局面排队中的任务被取消，正在进行的推演在下一步放弃。推演只用该玩家掌握的信息：神秘护符（包括自己的）
+    按牌库比例取样，命运牌堆按该玩家自己的信念（只含自己看到的牌）取样，灵物牌堆视为重新洗过。
+
+    同时是事件总线的订阅者（接收放大镜和电话的私密结果）和命运牌堆的观察者（维护双方各自的信念）。
+    """
+    wants_events = True
+
+    def __init__(self, workers=None):
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.game = None
+        self.beliefs = (DeckBelief(), DeckBelief())
+        self.cache = OrderedDict() # (局面, 候选) -> [各候选的得分和, 各候选的局数, 进行中的任务数]
+        self.lock = threading.Lock()
+        self.rng = random.Random()
+        self.current = None
+        self.error = None
+        self._executor = None
+        self._generation = None
+        self._pending = []
+
+    def attach(self, game):
+        """开局时由 Game 调用：成为命运牌堆的观察者"""
+        self.game = game
+        game.fate_deck.observers.append(self)
+
+    # 命运牌堆的观察者接口，与专家AI的信念更新相同
+    def deck_refilled(self, deck):
+        for belief in self.beliefs: belief.reset(len(deck), prior=self.game.config.fate_prior)
+    def card_drawn(self, deck, card):
+        for belief in self.beliefs: belief.drawn(card)
+    card_discarded = card_drawn # 蘑菇变掉的牌是公开的
+    def card_pushed(self, deck, card):
+        for belief in self.beliefs: belief.pushed_unknown()
+    def cards_swapped(self, deck, i, j):
+        for belief in self.beliefs: belief.swapped_with_random(i)
+
+    # 渲染器接口：只关心各自看到的牌
+    def handle(self, event):
+        if type(event) is CardPeeked: self._seen(event.player, 0, event.card)
+        elif type(event) is TelephoneHeard: self._seen(event.player, event.position - 1, event.card)
+
+    def flush(self): pass
+
+    def _seen(self, player, position, card):
+        if self.game is not None and player in self.game.players:
+            self.beliefs[self.game.players.index(player)].revealed(position, card)
+
+    def show(self, game, player):
+        """打印 player 视角的估计（只给人类玩家），并让后台开始细化这个局面"""
+        if isinstance(player, BaseAIPlayer) or game is not self.game: return
+        if game.config != DEFAULT_CONFIG:
+            print("\n📊 胜率估计只支持标准规则。")
             return
-        opponent.status["is_handcuffed"] = True
-        game._draw_spirit_for_player(opponent, 1)
-        print_slow(f"{opponent.name} 在下个回合将无法使用灵物，但他获得了一个灵物作为补偿。")
-
-class TelephoneStrategy(SpiritStrategy):
-    def apply(self, user, opponent, game):
-        if not game.fate_deck:
-            print_to_player(user, "电话线是断的... 牌堆是空的！")
+        seat = game.players.index(player)
+        key = (observe_position(game, seat, self.beliefs[seat]), overlay_options(game, player))
+        self._request(key)
+        if self.error is not None:
+            print(f"\n📊 胜率估计不可用：{self.error}")
             return
-        decision_maker = game.force_use_decision_maker if game.is_force_use_active else user
-        print_slow(f"📞 {decision_maker.name} 拿起了电话，似乎在窃听着什么...")
-        if isinstance(decision_maker, BaseAIPlayer):
-            n = random.randint(1, len(game.fate_deck))
-        else:
-            while True:
-                game._display_turn_interface(game.players[game.current_player_index], game.players[1 - game.current_player_index])
-                try:
-                    n_str = input(f"({decision_maker.name}) 你想看牌堆顶下方的第几张牌？(1-{len(game.fate_deck)}) -> ")
-                    if not n_str: continue
-                    n = int(n_str)
-                    if 1 <= n <= len(game.fate_deck): break
-                    else: print_slow("无效的数字。")
-                except ValueError: print_slow("请输入一个数字。")
-        # 信息只给使用者看
-        print_to_player(decision_maker, f"你通过电话得知，牌堆的第 {n} 张牌是【{FATE_CARD_NAMES.get(game.fate_deck[n-1], '未知')}】。")
-
-class PillowStrategy(SpiritStrategy):
-    def apply(self, user, opponent, game):
-        game._draw_spirit_for_player(user, 3)
-        user.status["skip_next_turn"] = True
-        user.status["pillow_immunity"] = 3
-        print_slow(f"{user.name} 获得了3个灵物，但会跳过下个回合，并在2回合内免疫【手铐】。")
-
-class ContractStrategy(SpiritStrategy):
-    def apply(self, user, opponent, game):
-        print_slow(f"{user.name} 划破手指，与命运签订了契约！立即扣除2点生命值。")
-        dmg_done = user.take_damage(2)
-        if dmg_done > 0: game._handle_hp_loss(user, dmg_done, attacker=user)
-        if not game.game_over:
-            user.status["has_contract"] = True
-            print_slow("下次生命值归零时将获得最后的机会！")
-
-class RadioStrategy(SpiritStrategy):
-    def apply(self, user, opponent, game):
-        if not opponent.spirits:
-            print_slow(f"但 {opponent.name} 没有任何灵物可以被操控。")
+        with self.lock: entry = self.cache.get(key)
+        if entry is None or not entry[1][0]:
+            print("\n📊 胜率估计：推演中...")
             return
-        if isinstance(user, BaseAIPlayer):
-            spirit_to_force = user.ai_choose_spirit_to_force_use(opponent.spirits, opponent)
-        else:
-            spirit_to_force = game._get_spirit_choice_from_opponent(user, opponent)
-        if spirit_to_force is None:
-            print_slow(f"{user.name} 决定暂时不进行操控。")
+        scores, games, _ = entry
+        total = sum(games)
+        p = scores[0] / games[0]
+        margin = 1.96 * math.sqrt(p * (1 - p) / games[0])
+        print(f"\n📊 胜率估计（{total:,} 局推演）: 你 {p:.1%} ± {margin:.1%}  ·  对手 {1 - p:.1%}")
+        used = []
+        for spirit, score, n in zip(key[1][1:], scores[1:], games[1:]):
+            if not n: continue
+            name = MYSTERIOUS_CHARM_NAME if spirit == HIDDEN_OPTION else SPIRIT_NAMES.get(spirit, spirit)
+            used.append(f"【{name}】{score / n:.0%}({(score / n - p) * 100:+.1f})")
+        if used: print("   现在使用灵物后的胜率: " + "  ".join(used))
+
+    def close(self):
+        """取消所有推演并关闭进程池"""
+        if self._executor is None: return
+        self._generation.value += 1
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+    def _request(self, key):
+        """key 成为当前局面：取消旧局面的任务，为新局面保持每个工作进程一个任务"""
+        if key == self.current or self.error is not None: return
+        if self._executor is None:
+            self._generation = multiprocessing.Value("q", 0)
+            self._executor = ProcessPoolExecutor(self.workers, initializer=_init_overlay_worker, initargs=(self._generation,))
+        with self.lock:
+            self.current = key
+            self._generation.value += 1
+            stale, self._pending = self._pending, []
+            entry = self.cache.get(key)
+            if entry is None:
+                entry = self.cache[key] = [[0.0] * len(key[1]), [0] * len(key[1]), 0]
+                if len(self.cache) > OVERLAY_CACHE_SIZE: self.cache.popitem(last=False)
+            self.cache.move_to_end(key)
+            for _ in range(self.workers): self._submit(key, entry)
+        for future in stale: future.cancel() # 回调会在这里同步执行，不能持有锁
+
+    def _submit(self, key, entry):
+        """在持有 self.lock 时调用；累计局数（含进行中的任务）达到上限后不再提交"""
+        if sum(entry[1]) + entry[2] * OVERLAY_BATCH_GAMES >= OVERLAY_MAX_GAMES: return
+        generation = self._generation.value
+        future = self._executor.submit(_overlay_rollouts, key[0], key[1], OVERLAY_BATCH_GAMES, self.rng.getrandbits(63), generation)
+        entry[2] += 1
+        self._pending.append(future)
+        future.add_done_callback(lambda f: self._finished(key, generation, f))
+
+    def _finished(self, key, generation, future):
+        """进程池的回调线程：累加结果（过期局面的完整结果同样有效），局面仍是当前局面时接着提交下一批"""
+        error = None if future.cancelled() else future.exception()
+        with self.lock:
+            if future in self._pending: self._pending.remove(future)
+            entry = self.cache.get(key)
+            if entry is not None: entry[2] = max(entry[2] - 1, 0)
+            if error is not None:
+                self.error = "需要 NumPy" if isinstance(error, ImportError) else f"{type(error).__name__}: {error}"
+                return
+            result = None if future.cancelled() else future.result()
+            if entry is None or result is None: return
+            for i, (score, games) in enumerate(zip(*result)):
+                entry[0][i] += score
+                entry[1][i] += games
+            if generation == self._generation.value and self._executor is not None: self._submit(key, entry)
+
+# 菜单中的难度阶梯：等级 -> (名称, AI类)，需依次战胜解锁
+DIFFICULTY_LEVELS = {
+    1: ("困难", HardAIPlayer),
+    2: ("专家", ExpertAIPlayer),
+    3: ("地狱", HellAIPlayer),
+    4: ("深渊", SearchAIPlayer),
+}
+
+AI_WEIGHTS_VERSION = None # 已加载的权重文件的版本号（由 load_ai_weights 设置），没有加载时为 None
+
+def load_ai_weights(path):
+    """读取 tune.py 写出的权重文件，覆盖其中列出的AI类的权重（没有列出的键保持默认，子类随父类一起变化）。
+
+    只由命令行入口显式调用（--ai-weights，见 add_ai_file_arguments），导入 main 不会读取任何文件。
+    文件不存在或格式不对时给出警告、所有类保持默认权重（EXPERT_WEIGHTS）。返回文件中的版本号，没有加载时返回 None。
+    """
+    global AI_WEIGHTS_VERSION
+    try:
+        with open(path, encoding="utf-8") as f: data = json.load(f)
+        updates = []
+        for class_name, weights in data["classes"].items():
+            cls = globals().get(class_name)
+            if not (isinstance(cls, type) and issubclass(cls, ExpertAIPlayer)):
+                raise ValueError(f"{class_name} 不是专家AI类")
+            unknown = set(weights) - set(EXPERT_WEIGHTS)
+            if unknown: raise ValueError(f"未知的权重: {', '.join(sorted(unknown))}")
+            updates.append((cls, {**EXPERT_WEIGHTS, **weights}))
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        print(f"警告: 无法加载权重文件 {path}（{e}），使用默认权重", file=sys.stderr)
+        return None
+    # 整个文件检查通过后才替换，不会只加载一半
+    for cls, weights in updates: cls.weights = weights
+    AI_WEIGHTS_VERSION = data.get("version")
+    return AI_WEIGHTS_VERSION
+
+# --- 专家AI决策表 ---
+AI_TABLES_FILE = "fate_ai_tables.bin"
+
+class MappedTables:
+    """离线编译、以内存映射方式只读打开的数据文件（决策表、开局库）。
+
+    文件头是魔数、版本、4字节长度 + 元数据 JSON（编译时的参数和各数组的位置），之后是按 ARRAYS
+    的顺序、按8字节对齐的数组。子类给出 MAGIC、VERSION、KIND 和 ARRAYS，并以 (meta, arrays, source) 构造。
+    """
+    MAGIC = b""
+    VERSION = 1
+    KIND = "数据文件"
+    ARRAYS = ()
+
+    @classmethod
+    def encode(cls, meta, arrays):
+        """meta 为元数据字典（不含数组位置），arrays 为 {名称: 数值序列}，返回文件内容"""
+        blobs, offset = [], 0
+        meta = dict(meta, byteorder=sys.byteorder, arrays={})
+        for name, typecode in cls.ARRAYS:
+            blob = memoryview(array.array(typecode, arrays[name])).cast("B").tobytes()
+            meta["arrays"][name] = [offset, len(blob)]
+            blobs.append(blob + bytes(-len(blob) % 8))
+            offset += len(blob) + (-len(blob) % 8)
+        encoded = json.dumps(meta, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        header = cls.MAGIC + bytes((cls.VERSION,)) + len(encoded).to_bytes(4, "little") + encoded
+        return header + bytes(-len(header) % 8) + b"".join(blobs)
+
+    @classmethod
+    def open(cls, path):
+        with open(path, "rb") as f:
+            source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if source[:3] != cls.MAGIC: raise ValueError(f"{path} 不是{cls.KIND}")
+        if source[3] != cls.VERSION: raise ValueError(f"不支持的{cls.KIND}版本: {source[3]}")
+        length = int.from_bytes(source[4:8], "little")
+        meta = json.loads(source[8:8 + length].decode("utf-8"))
+        if meta["byteorder"] != sys.byteorder: raise ValueError(f"{cls.KIND} {path} 是在字节序不同的机器上编译的")
+        base = 8 + length + (-(8 + length) % 8)
+        view = memoryview(source)
+        arrays = {name: view[base + offset:base + offset + size].cast(typecode)
+                  for (name, typecode), (offset, size) in ((item, meta["arrays"][item[0]]) for item in cls.ARRAYS)}
+        return cls(meta, arrays, source)
+
+class DecisionTables(MappedTables):
+    """ai_tables.py 离线编译的专家AI决策表。
+
+    元数据是编译时的权重、规则参数和偷取优先级，数组为：
+      palette   float64  行动得分的取值表
+      action    uint16   行动得分在 palette 中的编号，按 action_index 给出的局面加上灵物编号排列
+      force     float64  强制使用的得分，按 force_index 给出的局面加上灵物编号排列
+      steal     uint8    偷取优先级（255 = 不在优先级列表中）
+    伤害牌概率达到威胁门槛时，得分因此改变的灵物（threat_spirits）不查表，仍在线计算；
+    手里没有得分与牌堆顶是否已知有关的灵物（top_spirits）时，不必查看信念。
+    """
+    MAGIC = b"FAT"
+    VERSION = 1
+    KIND = "专家AI决策表"
+    TENDENCIES = ("Stable", "Aggressive", "Defensive")
+    ARRAYS = (("palette", "d"), ("action", "H"), ("force", "d"), ("steal", "B"))
+
+    def __init__(self, meta, arrays, source=None):
+        self.meta = meta
+        self.weights = meta["weights"]
+        config = GameConfig.from_dict(meta["config"])
+        self.config = DEFAULT_CONFIG if config == DEFAULT_CONFIG else config
+        self.steal_priority = tuple(meta["steal_priority"])
+        self.threat_spirits = frozenset(SPIRIT_INDEX[s] for s in meta["threat_spirits"])
+        self.top_spirits = frozenset(meta["top_spirits"])
+        self.max_hp, self.max_spirits = self.config.max_hp, self.config.max_spirits
+        self.threat_threshold = self.weights["threat_probability"]
+        self.tendency_index = {name: i for i, name in enumerate(self.TENDENCIES)}
+        # action_index 对各输入是线性的（对手的手牌数和可偷数合成一个三角形编号），查表时直接乘步长
+        self.action_strides = (self.action_index(1, 0, 0, 0, 0, 0, 0, 0), self.action_index(0, 1, 0, 0, 0, 0, 0, 0),
+                               self.action_index(0, 0, 1, 0, 0, 0, 0, 0), self.action_index(0, 0, 0, 1, 0, 0, 0, 0),
+                               self.action_index(0, 0, 0, 0, 1, 0, 0, 0), self.action_index(0, 0, 0, 0, 0, 1, 0, 0),
+                               self.action_index(0, 0, 0, 0, 0, 0, 0, 1))
+        # 大表 action 直接用内存映射的视图，小数组转成元组，按下标取值更快
+        self.action = arrays["action"]
+        self.palette, self.force, self.steal = (None if arrays[name] is None else tuple(arrays[name])
+                                                for name in ("palette", "force", "steal"))
+        self._source = source # 内存映射，需要与数组视图一起保持打开
+
+    # 局面编号。自己的生命、对手的生命为 0..max_hp，手牌数为 0..max_spirits，对手的（手牌数, 可偷数）按三角形排列
+    def action_index(self, hp, hand, has_contract, top_unknown, opponent_hp, opponent_hand, stealable, tendency):
+        """行动得分的起始位置：之后是 2 组（刚用过该灵物：否/是）各 SPIRIT_COUNT 个得分"""
+        h, s = self.max_hp + 1, self.max_spirits + 1
+        pair = opponent_hand * (opponent_hand + 1) // 2 + stealable
+        context = ((((hp * s + hand) * 2 + has_contract) * 2 + top_unknown) * h + opponent_hp) * (s * (s + 1) // 2) + pair
+        return (context * 3 + tendency) * 2 * SPIRIT_COUNT
+
+    def action_size(self):
+        h, s = self.max_hp + 1, self.max_spirits + 1
+        return h * s * 2 * 2 * h * (s * (s + 1) // 2) * 3 * 2 * SPIRIT_COUNT
+
+    def force_index(self, opponent_hp, opponent_hand, own_stealable):
+        s = self.max_spirits + 1
+        return ((opponent_hp * s + opponent_hand) * s + own_stealable) * SPIRIT_COUNT
+
+    def force_size(self):
+        return (self.max_hp + 1) * (self.max_spirits + 1) ** 2 * SPIRIT_COUNT
+
+    def matches(self, cls):
+        """cls 的权重、打分方法和偷取优先级是否与编译时相同"""
+        return (cls.weights == self.weights and tuple(cls.steal_priority) == self.steal_priority
+                and cls._score_spirit is ExpertAIPlayer._score_spirit
+                and cls._score_forced_spirit is ExpertAIPlayer._score_forced_spirit)
+
+    def best_spirit_use(self, player, opponent, tendency, p_damage, last_used):
+        """与 ExpertAIPlayer._evaluate_spirit_use 的结果相同；局面超出表的范围时返回 None"""
+        spirits = player.spirits
+        if not spirits: return -1, 0
+        # 手牌数不会超过 max_spirits、max_hp 就是规则中的值（调用方已确认规则与表相同）；生命值在回合中可能降到0以下
+        hp, opponent_hp, t = player.hp, opponent.hp, self.tendency_index.get(tendency)
+        if t is None or not 0 <= hp <= self.max_hp >= opponent_hp >= 0: return None
+        opponent_spirits = opponent.spirits
+        opponent_hand = len(opponent_spirits)
+        s_hp, s_hand, s_contract, s_top, s_opponent_hp, s_pair, s_tendency = self.action_strides
+        row = (hp * s_hp + len(spirits) * s_hand + opponent_hp * s_opponent_hp + t * s_tendency
+               + (opponent_hand * (opponent_hand + 1) // 2 + opponent_hand - opponent_spirits.count("GLOVES")) * s_pair)
+        if player.status.has_contract: row += s_contract
+        # 牌堆顶是否已知只影响少数灵物（放大镜），手里没有时不必查看信念
+        if not self.top_spirits.isdisjoint(spirits) and player.known_next_fate_card is None: row += s_top
+        palette, action = self.palette, self.action
+        best_spirit_index, highest_score = -1, 0
+        if p_damage < self.threat_threshold and last_used not in spirits:
+            # 最常见的情况：每个灵物的得分都只是一次查表
+            for i, spirit in enumerate(spirits):
+                score = palette[action[row + SPIRIT_INDEX[spirit]]]
+                if score > highest_score:
+                    highest_score = score
+                    best_spirit_index = i
+            return best_spirit_index, highest_score
+        live = self.threat_spirits if p_damage >= self.threat_threshold else ()
+        repeated = SPIRIT_INDEX.get(last_used)
+        for i, spirit in enumerate(spirits):
+            k = SPIRIT_INDEX[spirit]
+            if k in live: score = player._score_spirit(spirit, opponent, tendency, p_damage, last_used)
+            elif k == repeated: score = palette[action[row + SPIRIT_COUNT + k]]
+            else: score = palette[action[row + k]]
+            if score > highest_score:
+                highest_score = score
+                best_spirit_index = i
+        return best_spirit_index, highest_score
+
+    def force_scores(self, player, opponent, opponent_spirits):
+        """{灵物: 强制使用的得分}（与 ExpertAIPlayer._score_forced_spirit 相同）；局面超出表的范围时返回 None"""
+        hp, hand = opponent.hp, len(opponent.spirits)
+        own = len(player.spirits) - player.spirits.count("GLOVES")
+        if not 0 <= hp <= self.max_hp or hand > self.max_spirits or own > self.max_spirits or opponent.max_hp != self.max_hp:
+            return None
+        start, force = self.force_index(hp, hand, own), self.force
+        return {spirit: force[start + SPIRIT_INDEX[spirit]] for spirit in opponent_spirits}
+
+    def steal_choice(self, stealable_spirits):
+        """优先级最高的可偷灵物，都不在优先级列表中时返回 None"""
+        steal, choice, best = self.steal, None, 255
+        for spirit in stealable_spirits:
+            rank = steal[SPIRIT_INDEX[spirit]]
+            if rank < best: choice, best = spirit, rank
+        return choice
+
+def use_decision_tables(table):
+    """把决策表交给权重和打分方法与编译时相同的专家AI类（及其已定义的子类），其余的类在线计算；table 为 None 时全部在线计算。
+
+    返回使用决策表的类。
+    """
+    pending, users = [ExpertAIPlayer], []
+    while pending:
+        cls = pending.pop()
+        pending.extend(cls.__subclasses__())
+        usable = table is not None and table.matches(cls)
+        cls.decision_table = table if usable else None
+        cls.decision_weights = cls.weights if usable else None
+        if usable: users.append(cls)
+    return users
+
+DECISION_TABLES = None # 已加载的决策表（由 load_decision_tables 设置）
+
+def load_decision_tables(path):
+    """显式加载决策表（--ai-tables），应在权重加载之后调用。
+
+    文件不存在或格式不对时给出警告并返回 None；与当前权重不符的类不会使用它（见 use_decision_tables），
+    没有一个类能使用时也给出警告——多半是权重文件换过之后没有重新编译。
+    """
+    global DECISION_TABLES
+    try: table = DecisionTables.open(path)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"警告: 无法加载决策表 {path}（{e}），专家AI在线计算", file=sys.stderr)
+        return None
+    if not use_decision_tables(table):
+        print(f"警告: 决策表 {path} 与当前权重不符（编译时权重版本 {table.meta.get('weights_version')}，"
+              f"当前 {AI_WEIGHTS_VERSION}），请用 ai_tables.py build 重新编译；专家AI在线计算", file=sys.stderr)
+    DECISION_TABLES = table
+    return table
+
+# --- 开局库 ---
+OPENING_BOOK_FILE = "fate_opening_book.bin"
+
+def opening_key(game, player):
+    """player 的开局局面键：轮到它的第一个回合、双方生命都是初始值且没有任何状态时，
+    由（是否后手、手牌的多重集、命运牌堆张数、已知的牌堆顶）组成的整数；不是开局时返回 None"""
+    config = game.config
+    seat = game.players.index(player)
+    opponent = game.players[1 - seat]
+    deck_size = len(game.fate_deck)
+    if (game.turn_count > 2 or game.fate_cards_drawn[seat] or player.hp != config.initial_hp or opponent.hp != config.initial_hp
+            or player.status.pack() or opponent.status.pack() or deck_size > config.max_fate_cards
+            or len(player.spirits) > config.max_spirits):
+        return None
+    hand = 0
+    for k in sorted(SPIRIT_INDEX[s] for s in player.spirits): hand = hand * (SPIRIT_COUNT + 1) + k + 1
+    top = player.known_next_fate_card
+    top = 0 if top is None else FATE_CARD_INDEX[top] + 1
+    return ((hand * (config.max_fate_cards + 1) + deck_size) * (len(FATE_CARD_KEYS) + 1) + top) * 2 + (seat != game.first_player_index)
+
+class OpeningBook(MappedTables):
+    """opening_book.py 离线推演得到的开局库：开局局面键 -> 推演中胜率最高的第一步。
+
+    元数据是编译时的规则参数、AI类的权重和推演参数，数组为：
+      keys     uint64   opening_key 给出的局面键，升序
+      actions  uint8    该局面的行动编号：0 = 命运卡牌对对手，1 = 命运卡牌对自己，2+k = 使用第 k 种灵物
+      values   float32  推演中这一步的胜率（只用于报告）
+    只收录推演中明显好于专家启发式的局面，其余局面查不到，照常使用启发式。
+    """
+    MAGIC = b"FOB"
+    VERSION = 1
+    KIND = "开局库"
+    ARRAYS = (("keys", "Q"), ("actions", "B"), ("values", "f"))
+
+    def __init__(self, meta, arrays, source=None):
+        self.meta = meta
+        self.weights = meta["weights"]
+        config = GameConfig.from_dict(meta["config"])
+        self.config = DEFAULT_CONFIG if config == DEFAULT_CONFIG else config
+        self.keys, self.actions, self.values = arrays["keys"], arrays["actions"], arrays["values"]
+        self._source = source # 内存映射，需要与数组视图一起保持打开
+
+    def __len__(self): return len(self.keys)
+
+    @staticmethod
+    def action_code(action):
+        kind, value = action
+        if kind == "fate": return 0 if value == "opponent" else 1
+        return 2 + SPIRIT_INDEX[value]
+
+    @staticmethod
+    def decode_action(code):
+        if code < 2: return ("fate", "opponent" if code == 0 else "self")
+        return ("spirit", SPIRIT_KEYS[code - 2])
+
+    def matches(self, cls):
+        """cls 的权重与编译时相同，并且按专家启发式行动（搜索AI、推演用的玩家等有自己的决策方式）"""
+        return cls.weights == self.weights and cls.ai_choose_action is ExpertAIPlayer.ai_choose_action
+
+    def lookup(self, game, player):
+        """player 在当前局面下开局库给出的行动（legal_search_actions 的格式）；不是开局、没有收录或不合法时返回 None"""
+        key = opening_key(game, player)
+        if key is None: return None
+        keys = self.keys
+        i = bisect.bisect_left(keys, key)
+        if i == len(keys) or keys[i] != key: return None
+        kind, value = action = self.decode_action(self.actions[i])
+        if kind == "spirit":
+            if player.status.is_handcuffed or value not in player.spirits: return None
+            if value in ["HANDCUFFS", "REMOTE_CONTROL"] and game.last_spirit_used_by_player[game.players.index(player)] == value: return None
+        return action
+
+def use_opening_book(book):
+    """把开局库交给权重与编译时相同、按专家启发式行动的AI类（及其已定义的子类）；book 为 None 时都不使用。返回使用开局库的类"""
+    pending, users = [ExpertAIPlayer], []
+    while pending:
+        cls = pending.pop()
+        pending.extend(cls.__subclasses__())
+        usable = book is not None and book.matches(cls)
+        cls.opening_book = book if usable else None
+        cls.book_weights = cls.weights if usable else None
+        if usable: users.append(cls)
+    return users
+
+OPENING_BOOK = None # 已加载的开局库（由 load_opening_book 设置）
+
+def load_opening_book(path):
+    """显式加载开局库（--opening-book），应在权重加载之后调用。文件不存在或格式不对、或与当前权重不符时给出警告"""
+    global OPENING_BOOK
+    try: book = OpeningBook.open(path)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"警告: 无法加载开局库 {path}（{e}），专家AI按启发式开局", file=sys.stderr)
+        return None
+    if not use_opening_book(book):
+        print(f"警告: 开局库 {path} 与当前权重不符，请用 opening_book.py build 重新生成；专家AI按启发式开局", file=sys.stderr)
+    OPENING_BOOK = book
+    return book
+
+def add_ai_file_arguments(parser):
+    """命令行入口共用的选项：显式指定要加载的AI数据文件（默认取环境变量，都没有时不加载）"""
+    parser.add_argument("--ai-weights", nargs="?", const=AI_WEIGHTS_FILE, default=os.environ.get("FATE_AI_WEIGHTS"),
+                        help=f"加载 tune.py 调优的权重文件（不写路径时为 {AI_WEIGHTS_FILE}，默认取 $FATE_AI_WEIGHTS）")
+    parser.add_argument("--ai-tables", nargs="?", const=AI_TABLES_FILE, default=os.environ.get("FATE_AI_TABLES"),
+                        help=f"加载 ai_tables.py 编译的决策表（不写路径时为 {AI_TABLES_FILE}，默认取 $FATE_AI_TABLES）")
+    parser.add_argument("--opening-book", nargs="?", const=OPENING_BOOK_FILE, default=os.environ.get("FATE_OPENING_BOOK"),
+                        help=f"加载 opening_book.py 生成的开局库（不写路径时为 {OPENING_BOOK_FILE}，默认取 $FATE_OPENING_BOOK）")
+
+def load_ai_files(args):
+    """按 add_ai_file_arguments 的选项加载AI数据文件（先权重，再按权重检查决策表和开局库）；工作进程在加载之后创建，随 fork 继承"""
+    if args.ai_weights: load_ai_weights(args.ai_weights)
+    if args.ai_tables: load_decision_tables(args.ai_tables)
+    if args.opening_book: load_opening_book(args.opening_book)
+
+# --- 日志事件类型 ---
+# 日志事件类型：随机结果
+EVENT_FIRST_PLAYER = 1
+EVENT_FATE_DECK = 2
+EVENT_SPIRIT_DECK = 3
+EVENT_FATE_DRAW = 4
+EVENT_ERASE = 5
+EVENT_WHITE_POTION = 6
+EVENT_SHUFFLER_SWAP = 7
+EVENT_MUSHROOM = 8
+# 日志事件类型：玩家决策
+DECISION_ACTION = 16      # 0 = 使用命运卡牌，i+1 = 使用第 i 个灵物
+DECISION_TARGET = 17      # 0 = 自己，1 = 对手
+DECISION_STEAL = 18       # 灵物编号
+DECISION_FORCE_USE = 19   # 0 = 放弃，i+1 = 灵物编号 i
+DECISION_TELEPHONE = 20   # 查看的位置
+EVENT_GAME_END = 31       # 胜者座位(255 = 平局)，回合数低位，回合数高位
+# 变长事件的第一个字节是后续字节数，其余事件的负载长度固定
+_EVENT_PAYLOAD_SIZES = {EVENT_FATE_DECK: None, EVENT_SPIRIT_DECK: None, EVENT_ERASE: None, EVENT_GAME_END: 3}
+
+# ==============================================================================
+# --- 效果指令表 (灵物与命运卡牌) ---
+# ==============================================================================
+# 每个灵物和每张命运卡牌的效果只描述一次：一小段由基本指令组成的序列。模块加载时每条指令按操作码
+# 查表编译成一个闭包，运行时解释器只是依次调用这些闭包，不再有按名字的分支判断。正常游戏、无头模拟、
+# 服务器会话和搜索AI的推演都经过同一个解释器。
+#
+# 指令在一个帧（列表）上执行，帧的各槽位如下；指令参数中的“槽位”指这些下标。
+FRAME_USER = 0     # 效果的使用者（命运卡牌为抽牌的人）
+FRAME_OTHER = 1    # 灵物为对手，命运卡牌为目标（镜子反弹后会被改写）
+FRAME_DECIDER = 2  # 需要做选择时由谁决定：平时是使用者，被无线电强制使用时是无线电的使用者
+FRAME_CARD = 3     # 正在结算的命运卡牌
+FRAME_VALUE = 4    # 上一条指令的结果（实际伤害、看到的牌、选中的灵物等）
+FRAME_AUX = 5      # 第二个结果（电话选择的位置、随机分支的编号）
+FRAME_MIRROR = 6   # 伤害来自镜子反弹（+1）
+FRAME_NEXT = 7     # 轮回抽到的下一张牌，由 _apply_fate_card_effect 接着结算
+FRAME_SIZE = 8
+
+# 操作码
+OP_EMIT = 0         # (事件类, 槽位...)：发出事件，字段依次取自各槽位
+OP_SET_STATUS = 1   # (槽位, 状态字段, 值)
+OP_ADD_STATUS = 2   # (槽位, 状态字段, 增量)
+OP_DAMAGE = 3       # (目标槽位, 伤害, 攻击者槽位, 是否加上使用者的红药水加成)：实际伤害写入 VALUE
+OP_HEAL = 4         # (槽位, 数值)
+OP_DRAW_SPIRIT = 5  # (槽位, 张数)
+OP_GIVE_SPIRIT = 6  # (槽位)：把 VALUE 中的灵物交给该玩家
+OP_ERASE = 7        # (槽位, 张数)：随机移除该玩家的灵物，移除的列表写入 VALUE
+OP_STEAL = 8        # (槽位)：决策者从该玩家处选一个可偷的灵物并拿走，写入 VALUE
+OP_PEEK = 9         # (观看者槽位, 位置)：位置从牌堆顶数起、从1开始，None 表示取 AUX；牌写入 VALUE
+OP_CHOOSE_DEPTH = 10 # (槽位)：该玩家选择电话查看的位置，写入 AUX
+OP_SWAP_TOP = 11    # ()：牌堆顶与其下方随机一张交换（洗牌器）
+OP_REPLACE_TOP = 12 # (槽位)：牌堆顶被弃掉并换成一张新的随机牌（蘑菇）
+OP_EXTRA_TURN = 13  # (槽位)
+OP_REFLECT = 14     # (是否为伤害牌)：目标身上有镜子时改写目标
+OP_RANDOM = 15      # (结果列表, 权重, 日志类型)：随机结果写入 VALUE，编号写入 AUX
+OP_SWITCH = 16      # (分支...)：按 AUX 执行对应的分支
+OP_REQUIRE = 17     # (条件, 槽位, 失败事件类或 None)：条件不成立时发出失败事件（字段为该槽位）并结束
+OP_WHEN = 18        # (条件, 槽位, 分支)：条件成立时执行分支
+OP_TEST = 19        # (条件, 槽位)：条件的结果写入 VALUE
+OP_CHOOSE_FORCED = 20 # (槽位)：使用者选择要强制该玩家使用的灵物（可以放弃），写入 VALUE
+OP_FORCE = 21       # (槽位)：该玩家交出 VALUE 中的灵物并对使用者生效，决策者改为使用者
+OP_CHAIN = 22       # (槽位)：该玩家抽下一张牌，交给 _apply_fate_card_effect 对他自己结算
+OP_PAUSE = 23       # (秒数)
+
+# 条件
+COND_HAS_SPIRITS = 0
+COND_HAS_STEALABLE = 1 # 有手套以外的灵物
+COND_HAND_NOT_FULL = 2
+COND_DECK_NOT_EMPTY = 3
+COND_NOT_PILLOW_IMMUNE = 4
+COND_NOT_GAME_OVER = 5
+COND_HAS_VALUE = 6     # VALUE 为真（造成了伤害、做出了选择等）
+COND_IS_USER = 7       # 该槽位的玩家就是使用者
+
+def _condition(cond, slot):
+    if cond == COND_HAS_SPIRITS: return lambda game, frame: bool(frame[slot].spirits)
+    if cond == COND_HAS_STEALABLE: return lambda game, frame: any(s != "GLOVES" for s in frame[slot].spirits)
+    if cond == COND_HAND_NOT_FULL: return lambda game, frame: len(frame[slot].spirits) < game.config.max_spirits
+    if cond == COND_DECK_NOT_EMPTY: return lambda game, frame: bool(game.fate_deck)
+    if cond == COND_NOT_PILLOW_IMMUNE: return lambda game, frame: frame[slot].status.pillow_immunity <= 0
+    if cond == COND_NOT_GAME_OVER: return lambda game, frame: not game.game_over
+    if cond == COND_HAS_VALUE: return lambda game, frame: bool(frame[FRAME_VALUE])
+    if cond == COND_IS_USER: return lambda game, frame: frame[slot] is frame[FRAME_USER]
+    raise ValueError(f"未知的条件: {cond}")
+
+def _run_effect(game, program, frame):
+    """解释器：依次执行编译好的指令，某条指令返回 False 时提前结束"""
+    for step in program:
+        if step(game, frame) is False: return False
+    return True
+
+def _op_emit(event_type, *slots):
+    # 事件最多三个字段，按字段数各给一个闭包，避免运行时拼参数列表
+    if len(slots) == 1:
+        a, = slots
+        return lambda game, frame: game.bus.emit(event_type, frame[a])
+    if len(slots) == 2:
+        a, b = slots
+        return lambda game, frame: game.bus.emit(event_type, frame[a], frame[b])
+    a, b, c = slots
+    return lambda game, frame: game.bus.emit(event_type, frame[a], frame[b], frame[c])
+
+def _op_set_status(slot, field, value):
+    def step(game, frame): setattr(frame[slot].status, field, value)
+    return step
+
+def _op_add_status(slot, field, delta):
+    def step(game, frame):
+        status = frame[slot].status
+        setattr(status, field, getattr(status, field) + delta)
+    return step
+
+def _op_damage(slot, amount, attacker_slot, boosted):
+    def step(game, frame):
+        target = frame[slot]
+        damage = amount + frame[FRAME_USER].status.red_potion_bonus if boosted else amount
+        dealt = target.take_damage(damage, source_is_mirror=frame[FRAME_MIRROR])
+        if dealt > 0: game._handle_hp_loss(target, dealt, attacker=frame[attacker_slot])
+        frame[FRAME_VALUE] = dealt
+    return step
+
+def _op_heal(slot, amount):
+    return lambda game, frame: frame[slot].heal(amount)
+
+def _op_draw_spirit(slot, count):
+    return lambda game, frame: game._draw_spirit_for_player(frame[slot], count)
+
+def _op_give_spirit(slot):
+    return lambda game, frame: frame[slot].add_spirit(frame[FRAME_VALUE])
+
+def _op_erase(slot, count):
+    def step(game, frame):
+        spirits = frame[slot].spirits
+        removed = game.rng.sample(spirits, k=min(count, len(spirits)))
+        game._log_event(EVENT_ERASE, [len(removed)] + [SPIRIT_INDEX[s] for s in removed])
+        for s in removed: spirits.remove(s)
+        frame[FRAME_VALUE] = removed
+    return step
+
+def _op_steal(slot):
+    def step(game, frame):
+        victim = frame[slot]
+        stealable = [s for s in victim.spirits if s != "GLOVES"]
+        stolen = game._get_opponent_spirit_choice(frame[FRAME_DECIDER], victim, stealable)
+        game._log_event(DECISION_STEAL, (SPIRIT_INDEX[stolen],))
+        victim.spirits.remove(stolen)
+        frame[FRAME_VALUE] = stolen
+    return step
+
+def _op_peek(viewer_slot, depth):
+    def step(game, frame):
+        position = (frame[FRAME_AUX] if depth is None else depth) - 1
+        card = frame[FRAME_VALUE] = game.fate_deck.peek(position)
+        viewer = frame[viewer_slot]
+        if isinstance(viewer, ExpertAIPlayer): viewer.see_fate_card(position, card)
+    return step
+
+def _op_choose_depth(slot):
+    def step(game, frame):
+        frame[FRAME_AUX] = n = game._get_telephone_position(frame[slot])
+        game._log_event(DECISION_TELEPHONE, (n,))
+    return step
+
+def _op_swap_top():
+    def step(game, frame):
+        deck = game.fate_deck
+        if len(deck) > 1:
+            swap_index = game.rng.randint(1, len(deck) - 1)
+            game._log_event(EVENT_SHUFFLER_SWAP, (swap_index,))
+            deck.swap(0, swap_index)
+            game.bus.emit(ShufflerTriggered, frame[FRAME_USER])
+    return step
+
+def _op_replace_top(slot):
+    def step(game, frame):
+        original_card = game.fate_deck.discard()
+        game.bus.emit(MushroomTriggered, frame[slot], original_card)
+        # 蘑菇效果后如果牌堆空了，也需要刷新
+        if not game.fate_deck: game._create_fate_deck()
+        new_card = game.config.random_fate_card(game.rng)
+        game._log_event(EVENT_MUSHROOM, (FATE_CARD_INDEX[new_card],))
+        game.fate_deck.push(new_card)
+    return step
+
+def _op_extra_turn(slot):
+    def step(game, frame): game.extra_turn_player = frame[slot]
+    return step
+
+def _op_reflect(damaging):
+    def step(game, frame):
+        target = frame[FRAME_OTHER]
+        if not target.status.is_mirrored: return
+        # 触发时揭示身份
+        target.status.is_mirrored = False
+        user = frame[FRAME_USER]
+        new_target = user if target is not user else game.players[1 - game.players.index(user)]
+        game.bus.emit(MirrorReflected, target, new_target)
+        frame[FRAME_OTHER] = new_target
+        if damaging: frame[FRAME_MIRROR] = True
+    return step
+
+def _op_random(outcomes, weights, log_type):
+    outcomes, weights = list(outcomes), list(weights)
+    def step(game, frame):
+        result = game.rng.choices(outcomes, weights=weights, k=1)[0]
+        frame[FRAME_AUX] = index = outcomes.index(result)
+        frame[FRAME_VALUE] = result
+        game._log_event(log_type, (index,))
+    return step
+
+def _compile_branch(ops):
+    """分支编译成单个闭包：只有一条指令时直接用它，省掉一层解释器调用"""
+    program = compile_effect(ops)
+    if len(program) == 1: return program[0]
+    return lambda game, frame: _run_effect(game, program, frame)
+
+def _op_switch(*branches):
+    branches = tuple(_compile_branch(branch) for branch in branches)
+    return lambda game, frame: branches[frame[FRAME_AUX]](game, frame)
+
+def _op_require(cond, slot, fail_event):
+    test = _condition(cond, slot)
+    def step(game, frame):
+        if test(game, frame): return True
+        if fail_event is not None: game.bus.emit(fail_event, frame[slot])
+        return False
+    return step
+
+def _op_when(cond, slot, branch):
+    test, branch = _condition(cond, slot), _compile_branch(branch)
+    def step(game, frame):
+        if test(game, frame): branch(game, frame)
+    return step
+
+def _op_test(cond, slot):
+    if cond == COND_IS_USER: # 虚空每次都要用，单独写一个闭包
+        def step(game, frame): frame[FRAME_VALUE] = frame[slot] is frame[FRAME_USER]
+        return step
+    test = _condition(cond, slot)
+    def step(game, frame): frame[FRAME_VALUE] = test(game, frame)
+    return step
+
+def _op_choose_forced(slot):
+    def step(game, frame):
+        choice = frame[FRAME_VALUE] = game._get_forced_spirit_choice(frame[FRAME_USER], frame[slot])
+        game._log_event(DECISION_FORCE_USE, (0 if choice is None else SPIRIT_INDEX[choice] + 1,))
+    return step
+
+def _op_force(slot):
+    def step(game, frame):
+        # 被强制使用的灵物，其使用者是所有者，但后续决策（如偷窃目标）由无线电的使用者决定
+        # 强制使用时不再发出 SpiritUsed 事件，SpiritForced 已经说明了
+        owner, spirit, controller = frame[slot], frame[FRAME_VALUE], frame[FRAME_USER]
+        owner.spirits.remove(spirit)
+        program = SPIRIT_EFFECTS.get(spirit)
+        if program is None:
+            game.bus.emit(StrategyMissing, spirit)
             return
-        
-        # CHANGED: 描述保持一致性
-        display_name = f"一个【{MYSTERIOUS_CHARM_NAME}】" if spirit_to_force in HIDDEN_SPIRITS else f"【{SPIRIT_NAMES.get(spirit_to_force, spirit_to_force)}】"
-        print_slow(f"📡 {user.name} 使用无线电，锁定了 {opponent.name} 的{display_name}！")
-        print_slow(f"{opponent.name} 不由自主地拿出了它...")
-        time.sleep(AI_THINK_DELAY)
-        
-        # 使用被强制的灵物时，其所有者是opponent，但决策者是user
-        # _use_spirit 方法现在不处理打印，所以我们在这里处理
-        # 强制使用时，我们不打印 "xxx使用了灵物"，因为上面的文本已经很清楚了
-        opponent.spirits.remove(spirit_to_force)
-        forced_strategy = SPIRIT_STRATEGIES.get(spirit_to_force)
-        if forced_strategy:
-            game.is_force_use_active = True
-            game.force_use_decision_maker = user
-            # 注意这里的参数：灵物的“使用者”仍然是opponent，但后续决策（如偷窃目标）由user决定
-            forced_strategy.apply(user=opponent, opponent=user, game=game)
-            game.is_force_use_active = False
-            game.force_use_decision_maker = None
-        else:
-            print_slow(f"警告：未找到灵物【{spirit_to_force}】的对应策略实现！")
-
-# --- 策略注册表 ---
-SPIRIT_STRATEGIES = {
-    "AMULET": AmuletStrategy(), "MIRROR": MirrorStrategy(), "REMOTE_CONTROL": RemoteControlStrategy(),
-    "ERASER": EraserStrategy(), "GLOVES": GlovesStrategy(), "GREEN_POTION": GreenPotionStrategy(),
-    "CREATION": CreationStrategy(), "MUSHROOM": MushroomStrategy(), "WHITE_POTION": WhitePotionStrategy(),
-    "SHUFFLER": ShufflerStrategy(), "MAGNIFYING_GLASS": MagnifyingGlassStrategy(), "RED_POTION": RedPotionStrategy(),
-    "HANDCUFFS": HandcuffsStrategy(), "TELEPHONE": TelephoneStrategy(), "PILLOW": PillowStrategy(),
-    "CONTRACT": ContractStrategy(), "RADIO": RadioStrategy(),
+        program(game, owner, controller, controller)
+    return step
+
+def _op_chain(slot):
+    def step(game, frame):
+        target = frame[slot]
+        next_card = frame[FRAME_NEXT] = game._draw_fate_card(target)
+        game.bus.emit(ReincarnationDrawn, target, next_card)
+    return step
+
+def _op_pause(seconds):
+    return lambda game, frame: game._pause(seconds)
+
+_OP_COMPILERS = (_op_emit, _op_set_status, _op_add_status, _op_damage, _op_heal, _op_draw_spirit, _op_give_spirit,
+                 _op_erase, _op_steal, _op_peek, _op_choose_depth, _op_swap_top, _op_replace_top, _op_extra_turn,
+                 _op_reflect, _op_random, _op_switch, _op_require, _op_when, _op_test, _op_choose_forced, _op_force,
+                 _op_chain, _op_pause)
+
+def compile_effect(ops):
+    """把指令序列（(操作码, 参数...) 元组）编译成可以直接交给解释器的闭包元组"""
+    return tuple(_OP_COMPILERS[op[0]](*op[1:]) for op in ops)
+
+def make_effect(name, ops):
+    """编译一个效果，返回 effect(game, user, other, decider=None, card=None)：在新的帧上运行并返回帧。
+
+    返回的是普通函数而不是带 __call__ 的对象，调用开销更小；原始指令保存在 effect.ops 中。
+    """
+    program = compile_effect(ops)
+    if any(op[0] == OP_REQUIRE for op in ops):
+        def effect(game, user, other, decider=None, card=None):
+            frame = [user, other, decider or user, card, None, None, False, None]
+            for step in program: # 即 _run_effect，在最常走的路径上省掉一层调用
+                if step(game, frame) is False: break
+            return frame
+    else: # 没有可能提前结束的指令，不必检查返回值
+        def effect(game, user, other, decider=None, card=None):
+            frame = [user, other, decider or user, card, None, None, False, None]
+            for step in program: step(game, frame)
+            return frame
+    effect.__name__ = effect.__qualname__ = name
+    effect.ops = tuple(ops)
+    return effect
+
+U, O, D, V, A = FRAME_USER, FRAME_OTHER, FRAME_DECIDER, FRAME_VALUE, FRAME_AUX
+
+# --- 灵物效果 ---
+SPIRIT_EFFECT_OPS = {
+    # 护身符和镜子使用时不揭示身份，只显示模糊信息
+    "AMULET": ((OP_SET_STATUS, U, "amulet_turns", 2), (OP_EMIT, AmuletActivated, U)),
+    "MIRROR": ((OP_SET_STATUS, U, "is_mirrored", True), (OP_EMIT, MirrorActivated, U)),
+    "REMOTE_CONTROL": ((OP_SET_STATUS, U, "remote_control_active", True), (OP_EMIT, RemoteControlArmed, U)),
+    "ERASER": ((OP_REQUIRE, COND_HAS_SPIRITS, O, NothingToErase), (OP_ERASE, O, 2), (OP_EMIT, SpiritsErased, O, V)),
+    "GLOVES": ((OP_REQUIRE, COND_HAS_STEALABLE, O, NothingToSteal), (OP_REQUIRE, COND_HAND_NOT_FULL, U, StealBlocked),
+               (OP_STEAL, O), (OP_EMIT, SpiritStolen, D, O, V), (OP_GIVE_SPIRIT, U)),
+    "GREEN_POTION": ((OP_HEAL, U, 1),),
+    "CREATION": ((OP_DRAW_SPIRIT, U, 2),),
+    "MUSHROOM": ((OP_SET_STATUS, U, "mushroom_effect", True), (OP_EMIT, MushroomHint, U), (OP_EMIT, MushroomArmed, U)),
+    "WHITE_POTION": ((OP_RANDOM, ("heal1", "dmg1", "heal2", "dmg2"), (49, 49, 1, 1), EVENT_WHITE_POTION),
+                     (OP_EMIT, WhitePotionResult, U, V),
+                     (OP_SWITCH, ((OP_HEAL, U, 1),), ((OP_DAMAGE, U, 1, U, False),),
+                                 ((OP_HEAL, U, 2),), ((OP_DAMAGE, U, 2, U, False),))),
+    "SHUFFLER": ((OP_SET_STATUS, U, "shuffler_effect", True), (OP_EMIT, ShufflerHint, U), (OP_EMIT, ShufflerArmed, U)),
+    # 牌堆为空时只能看到空牌堆（不触发刷新）；看到的牌只给使用者
+    "MAGNIFYING_GLASS": ((OP_EMIT, MagnifierUsed, U), (OP_REQUIRE, COND_DECK_NOT_EMPTY, U, DeckEmptyHint),
+                         (OP_PEEK, U, 1), (OP_EMIT, CardPeeked, U, V)),
+    "RED_POTION": ((OP_ADD_STATUS, U, "red_potion_bonus", 1), (OP_EMIT, RedPotionUsed, U), (OP_EMIT, RedPotionHint, U)),
+    "HANDCUFFS": ((OP_REQUIRE, COND_NOT_PILLOW_IMMUNE, O, HandcuffsBlocked), (OP_SET_STATUS, O, "is_handcuffed", True),
+                  (OP_DRAW_SPIRIT, O, 1), (OP_EMIT, Handcuffed, O)),
+    "TELEPHONE": ((OP_REQUIRE, COND_DECK_NOT_EMPTY, U, TelephoneDead), (OP_EMIT, TelephoneUsed, D), (OP_CHOOSE_DEPTH, D),
+                  (OP_PEEK, D, None), (OP_EMIT, TelephoneHeard, D, A, V)),
+    "PILLOW": ((OP_DRAW_SPIRIT, U, 3), (OP_SET_STATUS, U, "skip_next_turn", True), (OP_SET_STATUS, U, "pillow_immunity", 3),
+               (OP_EMIT, PillowUsed, U)),
+    "CONTRACT": ((OP_EMIT, ContractSigned, U), (OP_DAMAGE, U, 2, U, False), (OP_REQUIRE, COND_NOT_GAME_OVER, U, None),
+                 (OP_SET_STATUS, U, "has_contract", True), (OP_EMIT, ContractArmed, U)),
+    # 被强制使用的无线电由它的所有者（此时的使用者）选择
+    "RADIO": ((OP_REQUIRE, COND_HAS_SPIRITS, O, NothingToControl), (OP_CHOOSE_FORCED, O),
+              (OP_REQUIRE, COND_HAS_VALUE, U, ControlDeclined), (OP_EMIT, SpiritForced, U, O, V),
+              (OP_PAUSE, AI_THINK_DELAY), (OP_FORCE, O)),
+}
+
+# --- 命运卡牌效果（user 为抽牌的人，other 为目标） ---
+FATE_EFFECT_OPS = {
+    "DIVINE_PUNISHMENT": ((OP_REFLECT, True), (OP_DAMAGE, O, 1, U, True), (OP_SET_STATUS, U, "red_potion_bonus", 0)),
+    "DIVINE_BOON": ((OP_REFLECT, False), (OP_DRAW_SPIRIT, O, 1)),
+    "THE_VOID": ((OP_REFLECT, False), (OP_TEST, COND_IS_USER, O), (OP_EMIT, VoidResolved, U, V),
+                 (OP_WHEN, COND_HAS_VALUE, U, ((OP_EXTRA_TURN, U),))),
+    "REINCARNATION": ((OP_REFLECT, False), (OP_EMIT, ReincarnationTriggered, O), (OP_CHAIN, O)),
+    "BACKLASH": ((OP_REFLECT, True), (OP_DAMAGE, O, 1, U, True),
+                 (OP_WHEN, COND_HAS_VALUE, U, ((OP_EMIT, BacklashExtraTurn, O), (OP_EXTRA_TURN, O))),
+                 (OP_SET_STATUS, U, "red_potion_bonus", 0)),
 }
 
+# --- 抽命运牌时由状态触发的效果（user 为抽牌的人） ---
+SHUFFLER_TRIGGER_OPS = ((OP_SET_STATUS, U, "shuffler_effect", False), (OP_SWAP_TOP,))
+MUSHROOM_TRIGGER_OPS = ((OP_SET_STATUS, U, "mushroom_effect", False), (OP_REPLACE_TOP, U))
+
+del U, O, D, V, A
+
+SPIRIT_EFFECTS = {name: make_effect(name, ops) for name, ops in SPIRIT_EFFECT_OPS.items()}
+FATE_EFFECTS = {name: make_effect(name, ops) for name, ops in FATE_EFFECT_OPS.items()}
+SHUFFLER_TRIGGER = make_effect("SHUFFLER_TRIGGER", SHUFFLER_TRIGGER_OPS)
+MUSHROOM_TRIGGER = make_effect("MUSHROOM_TRIGGER", MUSHROOM_TRIGGER_OPS)
+
+# ==============================================================================
+# --- 对局日志与回放 ---
+# ==============================================================================
+class ReplayMismatch(Exception):
+    """回放结果与原始日志不一致（规则被修改，或日志已损坏）"""
+
+class GameLog:
+    """对局的紧凑二进制日志。
+
+    文件头是魔数、版本、种子和玩家名称（版本2之后还有2字节长度 + 与标准规则不同的规则参数 JSON），
+    之后按发生顺序记录每个决策和随机结果：1字节类型 + 负载 + 2字节局面校验值（事件发生后 state_key 的哈希低16位）。
+    标准规则的对局仍按版本1写出。
+    """
+    MAGIC = b"FRL"
+    VERSION = 1
+    CONFIG_VERSION = 2
+
+    def __init__(self, seed, player_names=None, config=None):
+        self.seed = seed
+        self.player_names = list(player_names or ["玩家1", "玩家2"])
+        self.config = config if config is not None else DEFAULT_CONFIG
+        self.events = bytearray()
+        self.expected = None # 回放校验时的原始事件流
+
+    def append(self, event_type, payload, check):
+        record = bytes((event_type, *payload)) + check.to_bytes(2, "little")
+        if self.expected is not None:
+            start = len(self.events)
+            if self.expected[start:start + len(record)] != record:
+                raise ReplayMismatch(f"第 {self.count() + 1} 个事件不一致：期望 {self._describe(self.expected, start)}，"
+                                     f"实际 {self._describe(record, 0)}")
+        self.events += record
+
+    def expect(self, original):
+        """进入校验模式：之后追加的每条记录都必须与 original 中同一位置的记录完全相同"""
+        self.expected = bytes(original.events)
+
+    def next_decision(self, decision_type):
+        """校验模式下读取即将发生的决策的负载"""
+        start = len(self.events)
+        if start >= len(self.expected) or self.expected[start] != decision_type:
+            raise ReplayMismatch(f"第 {self.count() + 1} 个事件应为决策 {decision_type}，日志中为 "
+                                 f"{self._describe(self.expected, start) if start < len(self.expected) else '结尾'}")
+        return self._parse(self.expected, start)[1]
+
+    def count(self):
+        return sum(1 for _ in self.records())
+
+    def records(self, data=None):
+        """逐条解析日志，产出 (类型, 负载元组, 校验值)"""
+        data = self.events if data is None else data
+        pos = 0
+        while pos < len(data):
+            event_type, payload, pos = self._parse(data, pos)
+            yield event_type, payload, int.from_bytes(data[pos - 2:pos], "little")
+
+    def game_end(self):
+        """返回 (胜者座位或None, 回合数)；日志没有结束记录时返回 None"""
+        for event_type, payload, _ in self.records():
+            if event_type == EVENT_GAME_END:
+                return (None if payload[0] == 255 else payload[0]), payload[1] | (payload[2] << 8)
+        return None
+
+    def first_player(self):
+        for event_type, payload, _ in self.records():
+            if event_type == EVENT_FIRST_PLAYER: return payload[0]
+        return None
+
+    def to_bytes(self):
+        changed = self.config.to_dict(only_changed=True)
+        header = bytearray(self.MAGIC)
+        header.append(self.CONFIG_VERSION if changed else self.VERSION)
+        header += self.seed.to_bytes(8, "little")
+        for name in self.player_names:
+            encoded = name.encode("utf-8")[:255]
+            header.append(len(encoded))
+            header += encoded
+        if changed:
+            encoded = json.dumps(changed, separators=(",", ":")).encode("utf-8")
+            header += len(encoded).to_bytes(2, "little") + encoded
+        return bytes(header) + bytes(self.events)
+
+    @classmethod
+    def from_bytes(cls, data):
+        if data[:3] != cls.MAGIC: raise ValueError("不是命运轮盘的对局日志")
+        if data[3] not in (cls.VERSION, cls.CONFIG_VERSION): raise ValueError(f"不支持的日志版本: {data[3]}")
+        seed = int.from_bytes(data[4:12], "little")
+        pos = 12
+        names = []
+        for _ in range(2):
+            length = data[pos]
+            names.append(bytes(data[pos + 1:pos + 1 + length]).decode("utf-8"))
+            pos += 1 + length
+        config = None
+        if data[3] == cls.CONFIG_VERSION:
+            length = int.from_bytes(data[pos:pos + 2], "little")
+            config = GameConfig.from_dict(json.loads(bytes(data[pos + 2:pos + 2 + length]).decode("utf-8")))
+            pos += 2 + length
+        log = cls(seed, names, config)
+        log.events = bytearray(data[pos:])
+        return log
+
+    @staticmethod
+    def _parse(data, pos):
+        event_type = data[pos]
+        size = _EVENT_PAYLOAD_SIZES.get(event_type, 1)
+        if size is None: size = data[pos + 1] + 1
+        payload = tuple(data[pos + 1:pos + 1 + size])
+        return event_type, payload, pos + 1 + size + 2
+
+    @classmethod
+    def _describe(cls, data, pos):
+        event_type, payload, end = cls._parse(data, pos)
+        return f"(类型 {event_type}, 负载 {list(payload)}, 校验 {int.from_bytes(data[end - 2:end], 'little')})"
+
+def write_game_logs(path, logs):
+    """把多局日志写入一个文件：每局前面是4字节长度"""
+    with open(path, "wb") as f:
+        for log in logs:
+            data = log.to_bytes()
+            f.write(len(data).to_bytes(4, "little"))
+            f.write(data)
+
+def read_game_logs(path):
+    with open(path, "rb") as f: data = f.read()
+    pos = 0
+    while pos < len(data):
+        size = int.from_bytes(data[pos:pos + 4], "little")
+        yield GameLog.from_bytes(data[pos + 4:pos + 4 + size])
+        pos += 4 + size
+
+class _ReplayPlayer(BaseAIPlayer):
+    """回放时代替原玩家的傀儡：所有决策都从原始日志中读取"""
+    action_think_delay = 0
+    target_think_delay = 0
+
+    def __init__(self, name, log):
+        super().__init__(name)
+        self.log = log
+
+    def ai_choose_action(self, opponent, game):
+        code = self.log.next_decision(DECISION_ACTION)[0]
+        return "fate_card" if code == 0 else f"spirit_index_{code - 1}"
+
+    def ai_choose_target(self, opponent):
+        return 'self' if self.log.next_decision(DECISION_TARGET)[0] == 0 else 'opponent'
+
+    def ai_choose_spirit_to_steal(self, stealable_spirits):
+        return SPIRIT_KEYS[self.log.next_decision(DECISION_STEAL)[0]]
+
+    def ai_choose_spirit_to_force_use(self, opponent_spirits, opponent_player_object):
+        code = self.log.next_decision(DECISION_FORCE_USE)[0]
+        return None if code == 0 else SPIRIT_KEYS[code - 1]
+
+    def ai_choose_telephone_position(self, deck_size):
+        return self.log.next_decision(DECISION_TELEPHONE)[0]
+
+def replay_game(original):
+    """按日志重新运行一局（无界面、无停顿），每个事件后都校验局面；不一致时抛出 ReplayMismatch"""
+    if not isinstance(original, GameLog): original = GameLog.from_bytes(original)
+    ending = original.game_end()
+    if ending is None: raise ReplayMismatch("日志没有结束记录，无法完整回放")
+    game = Game(headless=True, seed=original.seed, record=True, config=original.config)
+    game.log.expect(original)
+    game.players = [_ReplayPlayer(name, game.log) for name in original.player_names]
+    result = game.run_headless(first_player=original.first_player(), max_turns=ending[1])
+    if len(game.log.events) != len(original.events):
+        raise ReplayMismatch(f"回放在第 {game.log.count()} 个事件处提前结束")
+    return result
+
 # ==============================================================================
 # --- 游戏主控制器 ---
 # ==============================================================================
+class GameResult:
+    """无头模拟的结构化对局结果，玩家均以座位索引(0/1)表示"""
+    __slots__ = ("seed", "player_types", "first_player", "winner", "turns", "damage_taken", "damage_dealt", "spirits_used",
+                 "fate_cards_drawn", "log")
+
+    def __init__(self, game):
+        self.seed = game.seed
+        self.player_types = [type(p).__name__ for p in game.players]
+        self.first_player = game.first_player_index
+        self.winner = game.players.index(game.winner) if game.winner else None # None 表示达到回合上限的平局
+        self.turns = game.turn_count
+        self.damage_taken = list(game.damage_taken)
+        self.damage_dealt = list(game.damage_dealt)
+        self.spirits_used = [dict(c) for c in game.spirits_used]
+        self.fate_cards_drawn = [dict(c) for c in game.fate_cards_drawn]
+        self.log = game.log # 仅在记录日志时存在
+
+    @classmethod
+    def from_values(cls, **values):
+        """不经过 Game 直接构造（如向量化模拟器的结果），values 按 __slots__ 给出，log 可省略"""
+        result = cls.__new__(cls)
+        values.setdefault("log", None)
+        for name in cls.__slots__: setattr(result, name, values[name])
+        return result
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__ if name != "log"}
+
+
 class Game:
-    def __init__(self):
+    def __init__(self, headless=False, seed=None, record=None, renderer=None, config=None, overlay=None):
+        self.headless = headless # 无头模式：无输出、无输入、无停顿，仅用于AI对战模拟
+        self.config = config if config is not None else DEFAULT_CONFIG # 本局的规则，开局时传给每个玩家
+        # 对局事件总线：无头模式下没有订阅者，规则代码发出的事件不产生任何开销
+        self.bus = EventBus()
+        if not headless: self.bus.subscribe(renderer if renderer is not None else TypewriterRenderer())
+        # 可选的胜率估计浮层（WinRateOverlay），在人类玩家的回合界面下方显示
+        self.overlay = overlay if not headless else None
+        if self.overlay is not None: self.bus.subscribe(self.overlay)
+        # 每局独立的随机源：同一种子加上同样的决策序列，对局可以被完全复现
+        self.seed = seed if seed is not None else random.getrandbits(63)
+        self.rng = random.Random(self.seed)
+        # 对局日志：正常游戏默认记录（结束后保存以便复现），无头模拟默认不记录以保证速度
+        self.log = GameLog(self.seed, config=self.config) if (record if record is not None else not headless) else None
         self.players = []
-        self.spirit_deck = []
-        self.fate_deck = []
+        self.spirit_deck = Deck(SPIRIT_KEYS)
+        self.fate_deck = Deck(FATE_CARD_KEYS)
         self.current_player_index = 0
         self.game_over = False
         self.winner = None
         self.extra_turn_player = None
         self.last_spirit_used_by_player = [None, None]
-        self.is_force_use_active = False
-        self.force_use_decision_maker = None
         self.difficulty_level = 0
         self.unlocked_level = 1
         self.PROGRESS_FILE = "fate_game_progress.dat"
-        self.stats = GameStats() # 初始化统计系统
+        self.REPLAY_FILE = "fate_last_game.frl"
+        self.stats = None if headless else GameStats() # 对局历史库
+        self.first_player_index = 0
+        self.turn_count = 0
+        self.damage_taken = [0, 0]
+        self.damage_dealt = [0, 0]
+        self.spirits_used = [Counter(), Counter()]
+        self.fate_cards_drawn = [Counter(), Counter()]
+
+    def state_key(self):
+        """整局规则状态的不可变可哈希键：一个由16个整数组成的元组。
+
+        手牌按计数向量编码（与顺序无关），两个牌堆保留顺序。不包含AI的私有记忆
+        （如放大镜看到的牌）以及只在灵物结算过程中存在的临时标志。
+        """
+        p0, p1 = self.players
+        extra = -1 if self.extra_turn_player is None else self.players.index(self.extra_turn_player)
+        winner = -1 if self.winner is None else self.players.index(self.winner)
+        last0, last1 = (-1 if s is None else SPIRIT_INDEX[s] for s in self.last_spirit_used_by_player)
+        return (p0.hp, p0.status.pack(), pack_hand(p0.spirits),
+                p1.hp, p1.status.pack(), pack_hand(p1.spirits),
+                self.current_player_index, extra, last0, last1, int(self.game_over), winner,
+                len(self.fate_deck), pack_sequence(self.fate_deck, FATE_CARD_INDEX, len(FATE_CARD_KEYS)),
+                len(self.spirit_deck), pack_sequence(self.spirit_deck.cards, SPIRIT_INDEX, len(SPIRIT_KEYS)))
+
+    def restore_state(self, key):
+        """从 state_key() 的结果恢复局面，玩家对象保持不变（手牌恢复为按编号排列的顺序）"""
+        (hp0, status0, hand0, hp1, status1, hand1, current, extra, last0, last1, game_over, winner,
+         fate_len, fate_bits, spirit_len, spirit_bits) = key
+        p0, p1 = self.players
+        p0.load_state_key((hp0, status0, hand0))
+        p1.load_state_key((hp1, status1, hand1))
+        self.current_player_index = current
+        self.extra_turn_player = None if extra < 0 else self.players[extra]
+        self.last_spirit_used_by_player = [None if s < 0 else SPIRIT_KEYS[s] for s in (last0, last1)]
+        self.game_over = bool(game_over)
+        self.winner = None if winner < 0 else self.players[winner]
+        self.fate_deck.load(unpack_sequence(fate_bits, fate_len, FATE_CARD_KEYS))
+        self.spirit_deck.load_bottom_up(unpack_sequence(spirit_bits, spirit_len, SPIRIT_KEYS))
+
+    def _log_event(self, event_type, payload=()):
+        """记录一条决策或随机结果，连同此刻的局面校验值"""
+        if self.log is not None: self.log.append(event_type, payload, hash(self.state_key()) & 0xFFFF)
+
+    def _pause(self, seconds):
+        """给玩家留出阅读时间的停顿，无头模式下直接跳过"""
+        if self.headless: return
+        self.bus.flush()
+        if seconds > 0: time.sleep(seconds)
+
+    def _prompt(self, text):
+        """对局中等待玩家输入：先把本帧的事件输出完"""
+        self.bus.flush()
+        return input(text)
 
     def _show_rules(self):
         clear_screen()
@@ -660,95 +3181,90 @@ class Game:
         for card_key, description in FATE_CARD_DESCRIPTIONS.items(): print(f"{description}\n")
         input("--- 说明结束，按回车键返回 ---")
 
-    def _setup(self):
-        print_slow("--- 游戏准备中 ---")
-        for name in SPIRIT_NAMES.keys(): self.spirit_deck.extend([name] * 2)
-        random.shuffle(self.spirit_deck)
-        self._create_fate_deck()
+    def _setup(self, first_player=None):
+        self.bus.emit(GamePreparing)
+        config = self.config
         for player in self.players:
-            player.hp = INITIAL_HP
+            player.bus = self.bus
+            player.config = config
+        self.fate_deck.observers = [p for p in self.players if isinstance(p, ExpertAIPlayer)]
+        if self.overlay is not None: self.overlay.attach(self)
+        self.spirit_deck.refill_shuffled(config.spirit_deck_template, self.rng)
+        self._create_fate_deck()
+        for index, player in enumerate(self.players):
+            if isinstance(player, BaseAIPlayer): player.rng.seed(hash((self.seed, index)))
+            player.hp = config.initial_hp
+            player.max_hp = config.max_hp
             player.spirits.clear() # 清空上一局的灵物
-            for _ in range(INITIAL_SPIRITS): self._draw_spirit_for_player(player)
-        self.current_player_index = random.randint(0, 1)
+            for _ in range(config.initial_spirits): self._draw_spirit_for_player(player)
+        self.current_player_index = self.rng.randint(0, 1)
+        if first_player is not None: self.current_player_index = first_player
+        if self.log is not None:
+            self.log.player_names = [p.name for p in self.players]
+            self._log_event(EVENT_SPIRIT_DECK, [len(self.spirit_deck)] + [SPIRIT_INDEX[s] for s in self.spirit_deck.cards])
+            self._log_event(EVENT_FIRST_PLAYER, (self.current_player_index,))
+        self.first_player_index = self.current_player_index
         second_player_index = 1 - self.current_player_index
-        print_slow(f"{self.players[self.current_player_index].name} 成为先手玩家。")
-        print_slow(f"{self.players[second_player_index].name} 作为后手，额外获得一个灵物。")
+        self.bus.emit(FirstPlayerChosen, self.players[self.current_player_index], self.players[second_player_index])
         self._draw_spirit_for_player(self.players[second_player_index])
-        input("\n按回车键开始游戏...")
+        if not self.headless: self._prompt("\n按回车键开始游戏...")
 
     def _create_fate_deck(self):
-        self.fate_deck.clear()
-        deck_size = random.randint(MIN_FATE_CARDS, MAX_FATE_CARDS)
-        self.fate_deck = random.choices(list(FATE_CARD_NAMES.keys()), k=deck_size)
-        print_slow(f"命运牌堆已重新生成，包含 {len(self.fate_deck)} 张卡牌。")
-        for p in self.players:
-            if isinstance(p, HellAIPlayer): p.update_deck_knowledge(self.fate_deck)
+        deck_size = self.rng.randint(self.config.min_fate_cards, self.config.max_fate_cards)
+        cards = self.config.random_fate_cards(self.rng, deck_size)
+        self.fate_deck.refill(cards)
+        self._log_event(EVENT_FATE_DECK, [deck_size] + [FATE_CARD_INDEX[c] for c in cards])
+        self.bus.emit(FateDeckCreated, deck_size)
 
     def _draw_spirit_for_player(self, player, count=1):
         for _ in range(count):
             if not self.spirit_deck:
-                print_slow("警告：灵物牌堆已空！正在重新生成...")
-                for name in SPIRIT_NAMES.keys(): self.spirit_deck.extend([name] * 2)
-                random.shuffle(self.spirit_deck)
-            player.add_spirit(self.spirit_deck.pop())
+                self.bus.emit(SpiritDeckRefilled)
+                self.spirit_deck.refill_shuffled(self.config.spirit_deck_template, self.rng)
+                self._log_event(EVENT_SPIRIT_DECK, [len(self.spirit_deck)] + [SPIRIT_INDEX[s] for s in self.spirit_deck.cards])
+            player.add_spirit(self.spirit_deck.draw())
 
     def _draw_fate_card(self, drawing_player):
         # CHANGED: 牌堆刷新逻辑被集中到这里，这是唯一的抽牌入口
         if not self.fate_deck:
-            print_slow("命运牌堆已空，正在重新洗牌...")
+            self.bus.emit(FateDeckExhausted)
             self._create_fate_deck()
-            time.sleep(AI_THINK_DELAY) # 给玩家一个反应时间
-
-        if drawing_player.status["shuffler_effect"]:
-            drawing_player.status["shuffler_effect"] = False
-            if len(self.fate_deck) > 1:
-                swap_index = random.randint(1, len(self.fate_deck) - 1)
-                self.fate_deck[0], self.fate_deck[swap_index] = self.fate_deck[swap_index], self.fate_deck[0]
-                print_slow("⚙️【洗牌器】效果发动，牌堆发生了变化！")
-
-        if drawing_player.status["mushroom_effect"]:
-            drawing_player.status["mushroom_effect"] = False
-            original_card = self.fate_deck.pop(0)
-            print_slow(f"🍄【蘑菇】效果发动，将【{FATE_CARD_NAMES.get(original_card, original_card)}】变成了...")
-            # 蘑菇效果后如果牌堆空了，也需要刷新
-            if not self.fate_deck:
-                self._create_fate_deck()
-            new_card = random.choice(list(FATE_CARD_NAMES.keys()))
-            self.fate_deck.insert(0, new_card)
-
-        card = self.fate_deck.pop(0)
-        if not isinstance(drawing_player, BaseAIPlayer): self.stats.record_fate_card_drawn(card)
-        for p in self.players:
-            if isinstance(p, HellAIPlayer): p.see_card_draw(card)
-        if isinstance(drawing_player, ExpertAIPlayer): drawing_player.known_next_fate_card = None
+            self._pause(AI_THINK_DELAY) # 给玩家一个反应时间
+
+        status = drawing_player.status
+        if status.shuffler_effect: SHUFFLER_TRIGGER(self, drawing_player, drawing_player)
+        if status.mushroom_effect: MUSHROOM_TRIGGER(self, drawing_player, drawing_player)
+
+        card = self.fate_deck.draw() # 观察者（AI的牌堆信念）在这里得知抽出的牌
+        self._log_event(EVENT_FATE_DRAW, (FATE_CARD_INDEX[card],))
+        self.fate_cards_drawn[self.players.index(drawing_player)][card] += 1
         return card
 
     def load_progress(self):
         try:
-            with open(self.PROGRESS_FILE, 'r') as f: self.unlocked_level = max(1, min(int(f.read()), 4))
+            with open(self.PROGRESS_FILE, 'r') as f: self.unlocked_level = max(1, min(int(f.read()), len(DIFFICULTY_LEVELS) + 1))
         except (FileNotFoundError, ValueError): self.unlocked_level = 1
 
     def save_progress(self):
         with open(self.PROGRESS_FILE, 'w') as f: f.write(str(self.unlocked_level))
 
     def select_difficulty(self):
-        DIFFICULTY_NAMES = {1: "困难", 2: "专家", 3: "地狱"}
         while True:
             clear_screen()
             print("--- 选择AI难度 ---")
-            for i in range(1, 4):
-                print(f"{i}. 【{DIFFICULTY_NAMES[i]}】" + (" (已解锁)" if i <= self.unlocked_level else f" (需战胜【{DIFFICULTY_NAMES[i-1]}】解锁)"))
+            for i, (name, _) in DIFFICULTY_LEVELS.items():
+                print(f"{i}. 【{name}】" + (" (已解锁)" if i <= self.unlocked_level else f" (需战胜【{DIFFICULTY_LEVELS[i-1][0]}】解锁)"))
             print("\n输入 'q' 返回主菜单。")
             choice = input("请输入你的选择: ").lower()
             if choice == 'q': return False
             try:
                 level = int(choice)
-                if 1 <= level <= 3:
+                if level in DIFFICULTY_LEVELS:
                     if level <= self.unlocked_level:
                         self.difficulty_level = level
-                        ai_name = f"AI ({DIFFICULTY_NAMES[level]})"
+                        name, ai_class = DIFFICULTY_LEVELS[level]
                         human_player = Player("玩家")
-                        ai_player = {1: HardAIPlayer, 2: ExpertAIPlayer, 3: HellAIPlayer}[level](ai_name)
+                        ai_player = ai_class(f"AI ({name})")
                         self.players = [human_player, ai_player]
                         return True
                     else: print_slow("该难度尚未解锁！")
@@ -780,6 +3296,8 @@ class Game:
                 break
 
     def run_game_loop(self):
+        if self.turn_count: self._prepare_next_game()
+        recorder = self.bus.subscribe(HistoryRecorder(self))
         clear_screen()
         self._setup()
         self.game_over = False
@@ -788,21 +3306,78 @@ class Game:
             self._turn()
             self._check_game_over()
             if not self.game_over: self._switch_player()
-        self._end_game()
+        self._log_game_end()
+        for player in self.players:
+            if isinstance(player, BaseAIPlayer): player.stop_pondering()
+        self.bus.unsubscribe(recorder)
+        self._end_game(recorder.rows)
+
+    def _prepare_next_game(self):
+        """同一个 Game 对象连续开局时，为新的一局重置随机源、日志、牌堆和计数"""
+        self.seed = random.getrandbits(63)
+        self.rng.seed(self.seed)
+        if self.log is not None: self.log = GameLog(self.seed, config=self.config)
+        self.spirit_deck.load(())
+        self.extra_turn_player = None
+        self.last_spirit_used_by_player = [None, None]
+        self.turn_count = 0
+        self.damage_taken = [0, 0]
+        self.damage_dealt = [0, 0]
+        self.spirits_used = [Counter(), Counter()]
+        self.fate_cards_drawn = [Counter(), Counter()]
+
+    def _log_game_end(self):
+        winner = 255 if self.winner is None else self.players.index(self.winner)
+        self._log_event(EVENT_GAME_END, (winner, self.turn_count & 0xFF, (self.turn_count >> 8) & 0xFF))
+
+    def run_headless(self, first_player=None, max_turns=HEADLESS_MAX_TURNS):
+        """不经过任何界面完整运行一局AI对战，返回 GameResult"""
+        if not self.headless:
+            raise RuntimeError("run_headless 只能在 headless=True 的 Game 上调用")
+        if not all(isinstance(p, BaseAIPlayer) for p in self.players):
+            raise ValueError("无头模式仅支持AI玩家")
+        self._setup(first_player)
+        self.game_over = False
+        self.winner = None
+        while not self.game_over and self.turn_count < max_turns:
+            self._turn()
+            self._check_game_over()
+            if not self.game_over: self._switch_player()
+        self._log_game_end()
+        return GameResult(self)
+
+    def play_out(self, max_turns=HEADLESS_MAX_TURNS):
+        """从当前玩家回合的行动阶段继续，把对局进行到结束（供搜索和推演使用）"""
+        player = self.players[self.current_player_index]
+        self._play_turn_actions(player, self.players[1 - self.current_player_index])
+        self._check_game_over()
+        if not self.game_over: self._switch_player()
+        while not self.game_over and self.turn_count < max_turns:
+            self._turn()
+            self._check_game_over()
+            if not self.game_over: self._switch_player()
+        return self.winner
 
     def _turn(self):
         player = self.players[self.current_player_index]
         opponent = self.players[1 - self.current_player_index]
-        print_slow(f"\n轮到 {player.name} 的回合了。")
+        self.turn_count += 1
+        self.bus.emit(TurnStarted, player)
         self._update_player_status_start_of_turn(player)
-        if player.status["skip_next_turn"]:
-            player.status["skip_next_turn"] = False
-            print_slow(f"由于【枕头】的效果，{player.name} 跳过本回合。")
-            time.sleep(AI_THINK_DELAY * 2)
+        if player.status.skip_next_turn:
+            player.status.skip_next_turn = False
+            self.bus.emit(TurnSkipped, player)
+            self._pause(AI_THINK_DELAY * 2)
             return
+        self._play_turn_actions(player, opponent)
+
+    def _play_turn_actions(self, player, opponent):
+        """回合的行动阶段：反复选择行动，直到使用命运卡牌或【枕头】结束回合"""
         turn_ended = False
         while not turn_ended:
             action = self._get_player_action(player, opponent)
+            if action == "fate_card": self._log_event(DECISION_ACTION, (0,))
+            elif action.startswith("spirit_index_"): self._log_event(DECISION_ACTION, (int(action.split('_')[-1]) + 1,))
             if action == "fate_card":
                 self.last_spirit_used_by_player[self.current_player_index] = None
                 self._use_fate_card(player, opponent)
@@ -814,53 +3389,53 @@ class Game:
                     self.last_spirit_used_by_player[self.current_player_index] = spirit_name
                     if spirit_name == "PILLOW": turn_ended = True
                     else:
-                        if not isinstance(player, BaseAIPlayer): input("灵物已使用。按回车键继续...")
-                        else: time.sleep(AI_THINK_DELAY)
-                except (ValueError, IndexError): print_slow("内部错误：处理灵物选择时出现问题。")
+                        if not isinstance(player, BaseAIPlayer): self._prompt("灵物已使用。按回车键继续...")
+                        else: self._pause(AI_THINK_DELAY)
+                except (ValueError, IndexError): self.bus.emit(ActionFailed, player)
             elif action == "back": continue
-        print_slow(f"{player.name} 的回合结束。")
-        time.sleep(AI_THINK_DELAY * 2)
+        self.bus.emit(TurnEnded, player)
+        self._pause(AI_THINK_DELAY * 2)
 
     def _update_player_status_start_of_turn(self, player):
-        if isinstance(player, ExpertAIPlayer):
-            player.known_next_fate_card = None
-            player.intended_fate_card_target = 'opponent'
-        if player.status["amulet_turns"] > 0:
-            player.status["amulet_turns"] -= 1
-            if player.status["amulet_turns"] == 0: print_slow(f"{player.name} 的【{MYSTERIOUS_CHARM_NAME}】({SPIRIT_NAMES['AMULET']})效果已结束。")
-        if player.status["pillow_immunity"] > 0:
-            player.status["pillow_immunity"] -= 1
-            if player.status["pillow_immunity"] == 0: print_slow(f"{player.name} 的【枕头】手铐免疫效果已结束。")
+        if isinstance(player, ExpertAIPlayer): player.intended_fate_card_target = 'opponent'
+        if player.status.amulet_turns > 0:
+            player.status.amulet_turns -= 1
+            if player.status.amulet_turns == 0: self.bus.emit(AmuletExpired, player)
+        if player.status.pillow_immunity > 0:
+            player.status.pillow_immunity -= 1
+            if player.status.pillow_immunity == 0: self.bus.emit(PillowImmunityExpired, player)
         
         # 镜子的效果只持续到自己回合开始，所以在这里重置
-        if player.status["is_mirrored"]:
-            player.status["is_mirrored"] = False
-            print_slow(f"{player.name} 周身的【{MYSTERIOUS_CHARM_NAME}】({SPIRIT_NAMES['MIRROR']})效果消失了。")
+        if player.status.is_mirrored:
+            player.status.is_mirrored = False
+            self.bus.emit(MirrorExpired, player)
 
         # 手铐效果在对方回合开始时解除
-        self.players[1 - self.players.index(player)].status["is_handcuffed"] = False
-        player.status["red_potion_bonus"] = 0
+        self.players[1 - self.players.index(player)].status.is_handcuffed = False
+        player.status.red_potion_bonus = 0
 
     def _display_turn_interface(self, player, opponent):
-        clear_screen()
-        print(f"--- 对手 ({opponent.name}) 状态 ---")
-        opponent.display_status()
-        print("\n" + "="*40 + "\n")
-        print(f"--- 你的回合 ({player.name}) ---")
-        player.display_status()
+        if self.headless: return
+        self.bus.flush()
+        SCREEN.draw([f"--- 对手 ({opponent.name}) 状态 ---", *opponent.status_lines(), "", "="*40, "",
+                     f"--- 你的回合 ({player.name}) ---", *player.status_lines()])
+        if self.overlay is not None: self.overlay.show(self, player)
 
     def _get_player_action(self, player, opponent):
         if isinstance(player, BaseAIPlayer):
             self._display_turn_interface(player, opponent)
+            self._pause(player.action_think_delay)
             return player.ai_choose_action(opponent, self)
+        # 人类思考和阅读的时间留给AI在后台预演
+        if isinstance(opponent, BaseAIPlayer): opponent.ponder(self)
         while True:
             self._display_turn_interface(player, opponent)
             print("\n请选择你的行动:")
             print("1. 使用命运卡牌 (结束回合)")
-            can_use_spirit = player.spirits and not player.status["is_handcuffed"]
+            can_use_spirit = player.spirits and not player.status.is_handcuffed
             if can_use_spirit: print("2. 使用灵物")
-            elif player.status["is_handcuffed"]: print_slow("❌ 你被【手铐】束缚，无法使用灵物！")
-            choice = input("输入选项编号: ")
+            elif player.status.is_handcuffed: print_slow("❌ 你被【手铐】束缚，无法使用灵物！")
+            choice = self._prompt("输入选项编号: ")
             if choice == "1": return "fate_card"
             if choice == "2" and can_use_spirit: return self._get_spirit_choice(player, opponent)
             else: print_slow("无效的输入。")
@@ -874,7 +3449,7 @@ class Game:
                 display_name = f"【{MYSTERIOUS_CHARM_NAME}】" if spirit in HIDDEN_SPIRITS else f"【{SPIRIT_NAMES.get(spirit, spirit)}】"
                 print(f"{i+1}. {display_name}")
             try:
-                choice = int(input("输入灵物编号: "))
+                choice = int(self._prompt("输入灵物编号: "))
                 if choice == 0: return "back"
                 if 1 <= choice <= len(player.spirits):
                     selected_spirit = player.spirits[choice - 1]
@@ -887,72 +3462,63 @@ class Game:
             except (ValueError, TypeError): print_slow("请输入数字。")
 
     def _use_fate_card(self, user, opponent):
-        print_slow(f"{user.name} 准备抽取命运卡牌...")
+        self.bus.emit(FateCardPrepared, user)
         target_choice = self._get_target_choice(user, opponent)
+        self._log_event(DECISION_TARGET, (0 if target_choice == 'self' else 1,))
         target = user if target_choice == 'self' else opponent
-        print_slow(f"{user.name} 决定将卡牌对 {target.name} 使用。")
-        if not isinstance(user, BaseAIPlayer): input("按回车键抽取卡牌...")
-        else: time.sleep(AI_THINK_DELAY)
+        self.bus.emit(TargetChosen, user, target)
+        if not isinstance(user, BaseAIPlayer): self._prompt("按回车键抽取卡牌...")
+        else: self._pause(AI_THINK_DELAY)
         card = self._draw_fate_card(user)
-        print_slow(f"抽出的卡牌是... 【{FATE_CARD_NAMES.get(card, card)}】!")
-        time.sleep(AI_THINK_DELAY)
+        self.bus.emit(FateCardDrawn, user, card)
+        self._pause(AI_THINK_DELAY)
         self._apply_fate_card_effect(card, user, target)
 
     def _get_target_choice(self, user, opponent):
-        if isinstance(user, BaseAIPlayer): return user.ai_choose_target(opponent)
+        if isinstance(user, BaseAIPlayer):
+            self._pause(user.target_think_delay)
+            return user.ai_choose_target(opponent)
         while True:
-            choice = input(f"选择目标: 1. 自己 ({user.name})  2. 对方 ({opponent.name}) -> ")
+            choice = self._prompt(f"选择目标: 1. 自己 ({user.name})  2. 对方 ({opponent.name}) -> ")
             if choice in ['1', '2']: return 'self' if choice == '1' else 'opponent'
             print_slow("无效选择。")
 
     def _apply_fate_card_effect(self, card, user, target):
-        print_slow(f"【{FATE_CARD_NAMES.get(card, card)}】的效果对 {target.name} 生效了。")
-        damage_from_mirror = False
-        if target.status["is_mirrored"]:
-            # 触发时揭示身份
-            print_slow(f"🪞 {target.name} 的【{MYSTERIOUS_CHARM_NAME}】({SPIRIT_NAMES['MIRROR']})生效了！效果被反弹！")
-            target.status["is_mirrored"] = False
-            new_target = user if target != user else self.players[1 - self.players.index(user)]
-            print_slow(f"效果反弹给了 {new_target.name}！")
-            target = new_target
-            if card in ["DIVINE_PUNISHMENT", "BACKLASH"]: damage_from_mirror = True
-        
-        if card in ["DIVINE_PUNISHMENT", "BACKLASH"]:
-            damage = 1 + user.status["red_potion_bonus"]
-            actual_damage = target.take_damage(damage, source_is_mirror=damage_from_mirror)
-            if actual_damage > 0: self._handle_hp_loss(target, actual_damage, attacker=user)
-            if card == "BACKLASH" and actual_damage > 0:
-                print_slow(f"【反噬】效果触发！失去生命值的 {target.name} 获得一个额外回合！")
-                self.extra_turn_player = target
-            user.status["red_potion_bonus"] = 0
-        elif card == "DIVINE_BOON": self._draw_spirit_for_player(target)
-        elif card == "THE_VOID":
-            print_slow("虚无... 本回合无事发生。")
-            if target == user:
-                print_slow(f"由于对己使用，{user.name} 获得一个额外回合！")
-                self.extra_turn_player = user
-        elif card == "REINCARNATION":
-            print_slow(f"【轮回】之力发动！{target.name} 将对自己使用下一张命运卡牌！")
-            # REMOVED: 牌堆检查已移至 _draw_fate_card
-            next_card = self._draw_fate_card(target)
-            print_slow(f"下一张牌是... 【{FATE_CARD_NAMES.get(next_card, next_card)}】!")
-            self._apply_fate_card_effect(next_card, target, target)
+        # 轮回不递归：效果把抽到的下一张牌留在帧里，由这里接着对目标自己结算
+        while True:
+            self.bus.emit(FateCardResolved, card, target)
+            frame = FATE_EFFECTS[card](self, user, target, card=card)
+            card = frame[FRAME_NEXT]
+            if card is None: return
+            user = target = frame[FRAME_OTHER]
 
     def _use_spirit(self, spirit_index, user, opponent):
         spirit_name = user.spirits.pop(spirit_index)
-        if not isinstance(user, BaseAIPlayer): self.stats.record_spirit_used(spirit_name)
-        
-        # CHANGED: 对隐藏物品，使用时显示统一的模糊信息
-        if spirit_name in HIDDEN_SPIRITS:
-            print_slow(f"{user.name} 使用了【{MYSTERIOUS_CHARM_NAME}】...")
-        else:
-            print_slow(f"{user.name} 使用了灵物: 【{SPIRIT_NAMES.get(spirit_name, spirit_name)}】")
-        
-        strategy = SPIRIT_STRATEGIES.get(spirit_name)
-        if strategy: strategy.apply(user, opponent, self)
-        else: print_slow(f"警告：未找到灵物【{spirit_name}】的对应策略实现！")
+        self.spirits_used[self.players.index(user)][spirit_name] += 1
+        self.bus.emit(SpiritUsed, user, spirit_name)
+        effect = SPIRIT_EFFECTS.get(spirit_name)
+        if effect is not None: effect(self, user, opponent)
+        else: self.bus.emit(StrategyMissing, spirit_name)
         return spirit_name
 
+    def _get_forced_spirit_choice(self, user, opponent):
+        """无线电：user 选择强制 opponent 使用的灵物，放弃时返回 None"""
+        if isinstance(user, BaseAIPlayer): return user.ai_choose_spirit_to_force_use(opponent.spirits, opponent)
+        return self._get_spirit_choice_from_opponent(user, opponent)
+
+    def _get_telephone_position(self, decision_maker):
+        """电话：决策者选择查看牌堆顶下方的第几张牌（从1开始）"""
+        if isinstance(decision_maker, BaseAIPlayer): return decision_maker.ai_choose_telephone_position(len(self.fate_deck))
+        while True:
+            self._display_turn_interface(self.players[self.current_player_index], self.players[1 - self.current_player_index])
+            try:
+                n_str = self._prompt(f"({decision_maker.name}) 你想看牌堆顶下方的第几张牌？(1-{len(self.fate_deck)}) -> ")
+                if not n_str: continue
+                n = int(n_str)
+                if 1 <= n <= len(self.fate_deck): return n
+                else: print_slow("无效的数字。")
+            except ValueError: print_slow("请输入一个数字。")
+
     def _get_spirit_choice_from_opponent(self, user, opponent):
         while True:
             self._display_turn_interface(user, opponent)
@@ -962,7 +3528,7 @@ class Game:
                 display_name = f"【{MYSTERIOUS_CHARM_NAME}】" if spirit in HIDDEN_SPIRITS else f"【{SPIRIT_NAMES.get(spirit, spirit)}】"
                 print(f"{i+1}. {display_name}")
             try:
-                choice = int(input("输入灵物编号: "))
+                choice = int(self._prompt("输入灵物编号: "))
                 if choice == 0: return None
                 if 1 <= choice <= len(opponent.spirits): return opponent.spirits[choice - 1]
                 else: print_slow("无效的编号。")
@@ -978,7 +3544,7 @@ class Game:
                 display_name = f"【{MYSTERIOUS_CHARM_NAME}】" if spirit in HIDDEN_SPIRITS else f"【{SPIRIT_NAMES.get(spirit, spirit)}】"
                 print(f"{i+1}. {display_name}")
             try:
-                choice = int(input("输入灵物编号: "))
+                choice = int(self._prompt("输入灵物编号: "))
                 if 1 <= choice <= len(stealable_spirits): return stealable_spirits[choice - 1]
                 else: print_slow("无效的编号。")
             except (ValueError, TypeError): print_slow("请输入数字。")
@@ -986,21 +3552,20 @@ class Game:
     def _handle_hp_loss(self, player, damage_dealt, attacker=None):
         if self.game_over or damage_dealt <= 0: return
         # 记录数据
-        if not isinstance(player, BaseAIPlayer): self.stats.record_damage_taken(damage_dealt)
-        if attacker and not isinstance(attacker, BaseAIPlayer): self.stats.record_damage_dealt(damage_dealt)
-        
-        gain_count = HP_LOSS_SPIRIT_GAIN * damage_dealt
-        print_slow(f"作为失去生命的代价，{player.name} 获得了 {gain_count} 个灵物。")
+        self.damage_taken[self.players.index(player)] += damage_dealt
+        if attacker and attacker is not player: self.damage_dealt[self.players.index(attacker)] += damage_dealt
+
+        gain_count = self.config.hp_loss_spirit_gain * damage_dealt
+        self.bus.emit(HpLossCompensated, player, gain_count)
         self._draw_spirit_for_player(player, gain_count)
 
     def _check_game_over(self):
         for player in self.players:
             if player.hp <= 0:
-                if player.status["has_contract"] and not player.status["last_stand"]:
-                    print_slow(f"✝️ {player.name} 的生命值归零，但【契约书】发动了！")
-                    player.status["last_stand"] = True
+                if player.status.has_contract and not player.status.last_stand:
+                    player.status.last_stand = True
                     player.hp = 1
-                    print_slow(f"{player.name} 获得一个最终回合，并抽取3个灵物！")
+                    self.bus.emit(ContractTriggered, player)
                     self._draw_spirit_for_player(player, 3)
                     self.extra_turn_player = player
                     return
@@ -1010,9 +3575,8 @@ class Game:
 
     def _switch_player(self):
         current_player = self.players[self.current_player_index]
-        current_player.red_potion_bonus = 0
-        if current_player.status["last_stand"] and not self.game_over:
-            print_slow(f"⏰ {current_player.name} 的最终回合结束，但未能击败对手。契约失败！")
+        if current_player.status.last_stand and not self.game_over:
+            self.bus.emit(LastStandFailed, current_player)
             self.game_over = True
             self.winner = self.players[1 - self.current_player_index]
             return
@@ -1020,20 +3584,21 @@ class Game:
             self.current_player_index = self.players.index(self.extra_turn_player)
             self.extra_turn_player = None
         else:
-            if current_player.status["remote_control_active"]:
-                current_player.status["remote_control_active"] = False
+            if current_player.status.remote_control_active:
+                current_player.status.remote_control_active = False
                 opponent = self.players[1 - self.current_player_index]
-                print_slow(f"\n📡【遥控器】效果发动！{opponent.name} 将对自己使用牌堆顶的牌！")
-                time.sleep(AI_THINK_DELAY)
+                self.bus.emit(RemoteControlTriggered, opponent)
+                self._pause(AI_THINK_DELAY)
                 # REMOVED: 牌堆检查已移至 _draw_fate_card
                 card = self._draw_fate_card(opponent)
-                print_slow(f"{opponent.name} 抽到了... 【{FATE_CARD_NAMES.get(card, card)}】!")
+                self.bus.emit(RemoteControlDrawn, opponent, card)
                 self._apply_fate_card_effect(card, opponent, opponent)
                 self._check_game_over()
                 if self.game_over: return
             self.current_player_index = 1 - self.current_player_index
 
-    def _end_game(self):
+    def _end_game(self, events=()):
+        self.bus.flush()
         clear_screen()
         print_slow("="*30 + "\n          游戏结束！\n" + "="*30)
         if self.winner:
@@ -1041,23 +3606,459 @@ class Game:
             human_player_won = not isinstance(self.winner, BaseAIPlayer)
             if self.difficulty_level > 0: # 是AI对战模式
                 if human_player_won:
-                    self.stats.record_win()
-                    if self.difficulty_level >= self.unlocked_level and self.unlocked_level <= 3:
+                    if self.difficulty_level >= self.unlocked_level and self.unlocked_level <= len(DIFFICULTY_LEVELS):
                         self.unlocked_level += 1
                         self.save_progress()
-                        DIFFICULTY_NAMES = {2: "专家", 3: "地狱"}
-                        if self.unlocked_level <= 3:
-                            print_slow(f"\n🎉 恭喜！你已解锁【{DIFFICULTY_NAMES[self.unlocked_level]}】难度！🎉")
+                        if self.unlocked_level in DIFFICULTY_LEVELS:
+                            print_slow(f"\n🎉 恭喜！你已解锁【{DIFFICULTY_LEVELS[self.unlocked_level][0]}】难度！🎉")
                         else:
                             print_slow("\n🎉 恭喜！你已征服所有难度！🎉")
-                else:
-                    self.stats.record_loss()
-            self.stats.save() # 无论输赢都保存数据
         else:
             print_slow("游戏以平局结束... 这怎么可能？")
+        self.stats.record_game(GameResult(self), self.difficulty_level, [p.name for p in self.players], events)
+        if self.log is not None:
+            write_game_logs(self.REPLAY_FILE, [self.log])
+            print(f"\n本局日志已保存到 {self.REPLAY_FILE}（种子 {self.seed}），可用 replay.py 复现，"
+                  f"用 review.py 找出本局胜率损失最大的决策。")
         input("\n--- 按回车键返回主菜单 ---")
 
+def simulate_game(first_ai_class, second_ai_class, seed=None, first_player=None, max_turns=HEADLESS_MAX_TURNS, record=False, config=None):
+    """以无头模式运行一局AI对战。first_player 为 None 时与正常游戏一样随机决定先手；record=True 时结果附带对局日志；
+    config 为规则变体，默认为标准规则"""
+    game = Game(headless=True, seed=seed, record=record, config=config)
+    game.players = [first_ai_class(), second_ai_class()]
+    return game.run_headless(first_player, max_turns)
+
+# ==============================================================================
+# --- 对局会话（服务器模式） ---
+# ==============================================================================
+# 服务器模式下，每个需要玩家做决定的地方都变成一个 DecisionRequest。会话只保存种子和已做出的决策，
+# 推进时从种子重新运行整局（规则完全由种子和决策决定），遇到下一个未决的决策就停下。
+DECISION_KINDS = {DECISION_ACTION: "action", DECISION_TARGET: "target", DECISION_STEAL: "steal",
+                  DECISION_FORCE_USE: "force_use", DECISION_TELEPHONE: "telephone"}
+
+class DecisionRequest:
+    """等待某个座位做出的决策。options 是 (显示文字, 决策编码) 列表，回答时给出选项的序号"""
+    __slots__ = ("seat", "decision_type", "prompt", "options")
+
+    def __init__(self, seat, decision_type, prompt, options):
+        self.seat = seat
+        self.decision_type = decision_type
+        self.prompt = prompt
+        self.options = options
+
+    @property
+    def kind(self): return DECISION_KINDS[self.decision_type]
+
+    def resolve(self, choice):
+        """把玩家给出的选项序号换成决策编码，非法输入抛出 ValueError"""
+        if not isinstance(choice, int) or isinstance(choice, bool) or not 0 <= choice < len(self.options):
+            raise ValueError(f"无效的选项: {choice!r}")
+        return self.options[choice][1]
+
+    def to_dict(self):
+        return {"seat": self.seat, "kind": self.kind, "prompt": self.prompt, "options": [label for label, _ in self.options]}
+
+class DecisionNeeded(Exception):
+    """会话运行到尚未做出的决策时抛出，中断这次重新运行"""
+    def __init__(self, request):
+        super().__init__(request.kind)
+        self.request = request
+
+class _SessionSeat:
+    """会话中的座位（与玩家类组合使用）：已做出的决策按顺序取回；遇到新决策时，
+    人类座位抛出 DecisionNeeded，AI 座位在允许时当场计算并记入会话，否则同样抛出交给调用方（如AI调度器）"""
+    session = None
+    seat = 0
+    human = True
+
+    def _decide(self, request, compute):
+        code = self.session._recorded(request)
+        if code is None:
+            if self.human or not self.session._may_compute(): raise DecisionNeeded(request)
+            # 每次 advance 都重新开局并重新播种，取回的旧决策不会推进AI的随机源，
+            # 所以按决策历史为每个新决策播种（compute_pending 的工作池结果和超时兜底也用同一个随机源）
+            self.rng.seed(hash((self.session.seed, request.seat, len(self.session.decisions))))
+            code = compute()
+            self.session._record(request.seat, request.decision_type, code)
+        return code
+
+    def ai_choose_action(self, opponent, game):
+        options = [("使用命运卡牌 (结束回合)", 0)]
+        if not self.status.is_handcuffed:
+            last = game.last_spirit_used_by_player[self.seat]
+            options += [(f"使用灵物 {spirit_label(s)}", i + 1) for i, s in enumerate(self.spirits)
+                        if not (s in ["HANDCUFFS", "REMOTE_CONTROL"] and last == s)]
+        def compute():
+            action = super(_SessionSeat, self).ai_choose_action(opponent, game)
+            return 0 if action == "fate_card" else int(action.split('_')[-1]) + 1
+        code = self._decide(DecisionRequest(self.seat, DECISION_ACTION, "请选择你的行动", options), compute)
+        return "fate_card" if code == 0 else f"spirit_index_{code - 1}"
+
+    def ai_choose_target(self, opponent):
+        options = [(f"自己 ({self.name})", 0), (f"对方 ({opponent.name})", 1)]
+        compute = lambda: 0 if super(_SessionSeat, self).ai_choose_target(opponent) == 'self' else 1
+        return 'self' if self._decide(DecisionRequest(self.seat, DECISION_TARGET, "选择命运卡牌的目标", options), compute) == 0 else 'opponent'
+
+    def ai_choose_spirit_to_steal(self, stealable_spirits):
+        options = [(spirit_label(s), SPIRIT_INDEX[s]) for s in stealable_spirits]
+        compute = lambda: SPIRIT_INDEX[super(_SessionSeat, self).ai_choose_spirit_to_steal(stealable_spirits)]
+        return SPIRIT_KEYS[self._decide(DecisionRequest(self.seat, DECISION_STEAL, "请选择要偷取的灵物", options), compute)]
+
+    def ai_choose_spirit_to_force_use(self, opponent_spirits, opponent_player_object):
+        options = [("放弃", 0)] + [(spirit_label(s), SPIRIT_INDEX[s] + 1) for s in opponent_spirits]
+        def compute():
+            spirit = super(_SessionSeat, self).ai_choose_spirit_to_force_use(opponent_spirits, opponent_player_object)
+            return 0 if spirit is None else SPIRIT_INDEX[spirit] + 1
+        code = self._decide(DecisionRequest(self.seat, DECISION_FORCE_USE, f"请选择要强制 {opponent_player_object.name} 使用的灵物", options), compute)
+        return None if code == 0 else SPIRIT_KEYS[code - 1]
+
+    def ai_choose_telephone_position(self, deck_size):
+        options = [(f"第 {n} 张", n) for n in range(1, deck_size + 1)]
+        compute = lambda: super(_SessionSeat, self).ai_choose_telephone_position(deck_size)
+        return self._decide(DecisionRequest(self.seat, DECISION_TELEPHONE, "你想看牌堆顶下方的第几张牌？", options), compute)
+
+_SESSION_SEAT_CLASSES = {}
+
+def session_seat_class(player_class):
+    """player_class 对应的会话座位类；None 表示远程的人类玩家"""
+    base = player_class or BaseAIPlayer
+    cls = _SESSION_SEAT_CLASSES.get(base)
+    if cls is None:
+        # 下划线开头，不会被循环赛当作参赛AI
+        cls = _SESSION_SEAT_CLASSES[base] = type(f"_Session{base.__name__}", (_SessionSeat, base), {"human": player_class is None})
+    return cls
+
+class _SessionCollector:
+    """收集一次重新运行中、上次已经交付过的事件之后的新事件"""
+    wants_events = True
+    __slots__ = ("skip", "seen", "events")
+
+    def __init__(self, skip):
+        self.skip = skip
+        self.seen = 0
+        self.events = []
+
+    def handle(self, event):
+        self.seen += 1
+        if self.seen > self.skip: self.events.append(event)
+
+    def flush(self): pass
+
+class GameSession:
+    """可以在任意决策点暂停的一局对局，只保存种子、座位配置和已做出的决策（每个决策3个整数）。
+
+    advance() 从种子重新运行到下一个未决的决策（或对局结束），所以等待玩家期间不保留 Game 对象。
+    """
+    __slots__ = ("seed", "seats", "names", "first_player", "max_turns", "inline_ai", "config", "decisions",
+                 "events_seen", "pending", "result", "_cursor", "_ai_budget")
+
+    def __init__(self, seats, names, seed=None, first_player=None, max_turns=HEADLESS_MAX_TURNS, inline_ai=True, config=None):
+        self.seed = seed if seed is not None else random.getrandbits(63)
+        self.config = config if config is not None else DEFAULT_CONFIG
+        self.seats = list(seats) # 每个座位的玩家类，None 为人类
+        self.names = list(names)
+        self.first_player = first_player
+        self.max_turns = max_turns
+        self.inline_ai = inline_ai
+        self.decisions = [] # (座位, 决策类型, 决策编码)
+        self.events_seen = 0
+        self.pending = None
+        self.result = None
+        self._cursor = 0
+        self._ai_budget = None # compute_pending 时只允许计算一个AI决策
+
+    @property
+    def finished(self): return self.result is not None
+
+    def clone(self, seat=None, player_class=None):
+        """复制会话（可以把 seat 号座位换成 player_class），复制品不会再产出已交付过的事件"""
+        seats = list(self.seats)
+        if seat is not None: seats[seat] = player_class
+        copy = GameSession(seats, self.names, self.seed, self.first_player, self.max_turns, self.inline_ai, self.config)
+        copy.decisions = list(self.decisions)
+        copy.events_seen = self.events_seen
+        copy.pending = self.pending
+        return copy
+
+    def compute_pending(self, player_class=None):
+        """在本进程中计算待决的AI决策并返回决策编码，会话本身不变。
+
+        player_class 可以临时换掉该座位的AI（如超时后用廉价的启发式兜底）。AI的随机源按决策历史播种，
+        所以工作进程中的结果可以复现，兜底的AI也从这个决策自己的随机源取数。
+        """
+        seat = self.pending.seat
+        copy = self.clone(seat, player_class or self.seats[seat])
+        copy._ai_budget = 1
+        copy.advance()
+        return copy.decisions[len(self.decisions)][2]
+
+    def advance(self):
+        """重新运行到下一个未决的决策。返回这段时间新发生的事件；之后 pending 为待决请求，对局结束时 result 为结果"""
+        game = Game(headless=True, seed=self.seed, record=False, config=self.config)
+        players = []
+        for seat, (player_class, name) in enumerate(zip(self.seats, self.names)):
+            player = session_seat_class(player_class)(name)
+            player.session = self
+            player.seat = seat
+            players.append(player)
+        game.players = players
+        collector = game.bus.subscribe(_SessionCollector(self.events_seen))
+        self._cursor = 0
+        self.pending = None
+        try:
+            self.result = game.run_headless(self.first_player, self.max_turns)
+        except DecisionNeeded as needed:
+            self.pending = needed.request
+        self.events_seen = collector.seen
+        return collector.events
+
+    def answer(self, choice):
+        """回答当前待决的请求（选项序号），之后需要再次 advance()"""
+        if self.pending is None: raise ValueError("当前没有待决的决策")
+        self._record(self.pending.seat, self.pending.decision_type, self.pending.resolve(choice))
+        self.pending = None
+
+    def answer_code(self, code):
+        """直接记入待决请求的决策编码（compute_pending 的结果），不经过选项校验"""
+        if self.pending is None: raise ValueError("当前没有待决的决策")
+        self._record(self.pending.seat, self.pending.decision_type, code)
+        self.pending = None
+
+    @staticmethod
+    def visible_to(event, seat):
+        """私密事件只交给它所属的座位"""
+        return not event.private or event.player.seat == seat
+
+    def _may_compute(self):
+        if self._ai_budget is None: return self.inline_ai
+        if self._ai_budget <= 0: return False
+        self._ai_budget -= 1
+        return True
+
+    def _recorded(self, request):
+        if self._cursor == len(self.decisions): return None
+        seat, decision_type, code = self.decisions[self._cursor]
+        if seat != request.seat or decision_type != request.decision_type:
+            raise ReplayMismatch(f"会话第 {self._cursor + 1} 个决策应为座位 {seat} 的 {DECISION_KINDS[decision_type]}，"
+                                 f"重新运行时为座位 {request.seat} 的 {request.kind}")
+        self._cursor += 1
+        return code
+
+    def _record(self, seat, decision_type, code):
+        self.decisions.append((seat, decision_type, code))
+        self._cursor = len(self.decisions)
+
+# ==============================================================================
+# --- 性能计量 ---
+# ==============================================================================
+# 计时直方图的桶上界（秒）：1微秒起按2倍递增，约到16秒
+METRIC_BUCKETS = tuple(1e-6 * 2 ** i for i in range(25))
+# 各指标的说明（Prometheus 的 HELP 行）
+METRIC_HELP = {
+    "turn_seconds": "Game._turn 的耗时（整个回合，包括AI思考）",
+    "player_action_seconds": "Game._get_player_action 的耗时",
+    "draw_fate_card_seconds": "Game._draw_fate_card 的耗时",
+    "apply_fate_card_seconds": "Game._apply_fate_card_effect 的耗时（轮回抽到的牌计入同一次）",
+    "spirit_apply_seconds": "各灵物效果的耗时（被无线电强制使用的灵物计入两次：本身和无线电）",
+    "ai_decision_seconds": "AI 各决策方法的耗时（按定义该方法的类统计）",
+    "render_seconds": "渲染器处理事件和输出的耗时",
+    "fate_cards_drawn_total": "抽出的命运卡牌张数",
+    "spirits_used_total": "发动的灵物次数（包括被无线电强制使用）",
+}
+AI_DECISION_METHODS = ("ai_choose_action", "ai_choose_target", "ai_choose_spirit_to_steal",
+                       "ai_choose_spirit_to_force_use", "ai_choose_telephone_position")
+
+class _Histogram:
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(METRIC_BUCKETS) + 1) # 最后一个桶是 +Inf
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max: self.max = seconds
+        self.buckets[bisect.bisect_left(METRIC_BUCKETS, seconds)] += 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        for i, n in enumerate(other.buckets): self.buckets[i] += n
+
+    def percentile(self, q):
+        """由桶计数估计分位数（在桶内线性插值）"""
+        if not self.count: return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            if n and seen + n >= rank:
+                low = METRIC_BUCKETS[i - 1] if i else 0.0
+                high = METRIC_BUCKETS[i] if i < len(METRIC_BUCKETS) else self.max
+                return min(self.max, low + (high - low) * (rank - seen) / n)
+            seen += n
+        return self.max
+
+def _assign(owner, attr, value):
+    if isinstance(owner, dict): owner[attr] = value
+    else: setattr(owner, attr, value)
+
+class Metrics:
+    """热点路径的计时器和计数器，默认关闭。
+
+    enable() 时才把计时包装装到各个热点方法上，disable() 时还原，所以关闭状态下没有任何额外开销。
+    指标以 (名称, 标签元组) 为键；snapshot()/merge() 用于把多个进程的结果汇总。
+    """
+    def __init__(self):
+        self.enabled = False
+        self.histograms = {}
+        self.counters = Counter()
+        self._patched = []
+
+    def histogram(self, name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None: histogram = self.histograms[key] = _Histogram()
+        return histogram
+
+    def _instrument(self, owner, attr, histogram, on_result=None):
+        """包装 owner 的属性 attr（owner 为字典时包装其中的条目，如效果表）"""
+        func = owner[attr] if isinstance(owner, dict) else owner.__dict__[attr]
+        perf = time.perf_counter
+        observe = histogram.observe
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            started = perf()
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                observe(perf() - started)
+            if on_result is not None: on_result(result)
+            return result
+        self._patched.append((owner, attr, func))
+        _assign(owner, attr, timed)
+
+    def _counter(self, name, label, value=None):
+        """返回一个计数回调：固定 value 时每次调用加1，否则以被包装方法的返回值为标签值"""
+        counters = self.counters
+        def count(result):
+            key = (name, ((label, result if value is None else value),))
+            counters[key] += 1
+        return count
+
+    def enable(self):
+        if self.enabled: return
+        self.enabled = True
+        self._instrument(Game, "_turn", self.histogram("turn_seconds"))
+        self._instrument(Game, "_get_player_action", self.histogram("player_action_seconds"))
+        self._instrument(Game, "_draw_fate_card", self.histogram("draw_fate_card_seconds"),
+                         self._counter("fate_cards_drawn_total", "card"))
+        self._instrument(Game, "_apply_fate_card_effect", self.histogram("apply_fate_card_seconds"))
+        for spirit in list(SPIRIT_EFFECTS):
+            self._instrument(SPIRIT_EFFECTS, spirit, self.histogram("spirit_apply_seconds", spirit=spirit),
+                             self._counter("spirits_used_total", "spirit", spirit))
+        pending = [BaseAIPlayer]
+        while pending:
+            cls = pending.pop()
+            pending.extend(cls.__subclasses__())
+            for method in AI_DECISION_METHODS:
+                if method in cls.__dict__:
+                    self._instrument(cls, method, self.histogram("ai_decision_seconds", ai=cls.__name__, method=method))
+        for cls in (TypewriterRenderer, BufferedRenderer, JsonLinesRenderer, HistoryRecorder):
+            for method in ("handle", "flush"):
+                self._instrument(cls, method, self.histogram("render_seconds", renderer=cls.__name__, method=method))
+
+    def disable(self):
+        for owner, attr, func in reversed(self._patched): _assign(owner, attr, func)
+        self._patched.clear()
+        self.enabled = False
+
+    def reset(self):
+        # 计时包装持有各自直方图的引用，所以原地清零而不是替换对象
+        for histogram in self.histograms.values(): histogram.__init__()
+        self.counters.clear()
+
+    def snapshot(self):
+        """可以 pickle 的原始数据，供工作进程回传"""
+        return ({key: (h.count, h.total, h.max, list(h.buckets)) for key, h in self.histograms.items() if h.count},
+                dict(self.counters))
+
+    def merge(self, snapshot):
+        histograms, counters = snapshot
+        for (name, labels), (count, total, maximum, buckets) in histograms.items():
+            other = _Histogram()
+            other.count, other.total, other.max, other.buckets = count, total, maximum, buckets
+            self.histogram(name, **dict(labels)).merge(other)
+        self.counters.update(counters)
+
+    def to_dict(self):
+        timers = []
+        for (name, labels), h in sorted(self.histograms.items()):
+            if not h.count: continue
+            timers.append({"name": name, "labels": dict(labels), "count": h.count, "total_seconds": h.total,
+                           "mean_seconds": h.total / h.count, "p50_seconds": h.percentile(0.5),
+                           "p90_seconds": h.percentile(0.9), "p99_seconds": h.percentile(0.99), "max_seconds": h.max})
+        counters = [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in sorted(self.counters.items())]
+        return {"timers": timers, "counters": counters}
+
+    def to_prometheus(self, prefix="fate_"):
+        """Prometheus 文本格式：计时为 histogram，计数为 counter"""
+        def label_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}" if pairs else ""
+        lines = []
+        by_name = {}
+        for (name, labels), h in sorted(self.histograms.items()):
+            if h.count: by_name.setdefault(name, []).append((labels, h))
+        for name, series in by_name.items():
+            lines.append(f"# HELP {prefix}{name} {METRIC_HELP.get(name, name)}")
+            lines.append(f"# TYPE {prefix}{name} histogram")
+            for labels, h in series:
+                cumulative = 0
+                for bound, n in zip(METRIC_BUCKETS + (float("inf"),), h.buckets):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{prefix}{name}_bucket{label_text(labels, [('le', le)])} {cumulative}")
+                lines.append(f"{prefix}{name}_sum{label_text(labels)} {h.total!r}")
+                lines.append(f"{prefix}{name}_count{label_text(labels)} {h.count}")
+        counter_names = {}
+        for (name, labels), value in sorted(self.counters.items()):
+            counter_names.setdefault(name, []).append((labels, value))
+        for name, series in counter_names.items():
+            lines.append(f"# HELP {prefix}{name} {METRIC_HELP.get(name, name)}")
+            lines.append(f"# TYPE {prefix}{name} counter")
+            for labels, value in series: lines.append(f"{prefix}{name}{label_text(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """写入本地文件：.json 为 JSON，其它扩展名为 Prometheus 文本格式"""
+        with open(path, "w", encoding="utf-8") as f:
+            if path.endswith(".json"): json.dump(self.to_dict(), f, indent=4, ensure_ascii=False)
+            else: f.write(self.to_prometheus())
+
+METRICS = Metrics()
+
 # --- 游戏启动 ---
 if __name__ == "__main__":
-    game = Game()
-    game.main_menu()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="命运轮盘")
+    parser.add_argument("--renderer", choices=sorted(RENDERERS), default="typewriter", help="对局信息的输出方式")
+    parser.add_argument("--metrics", help="开启性能计量，退出时写入该文件（.json 或 Prometheus 文本）")
+    parser.add_argument("--overlay", action="store_true", help="在你的回合显示后台推演的胜率估计（需要 NumPy）")
+    parser.add_argument("--overlay-workers", type=int, help="胜率估计的工作进程数（默认为CPU核数减1，至少1个）")
+    add_ai_file_arguments(parser)
+    args = parser.parse_args()
+    load_ai_files(args)
+    if args.metrics: METRICS.enable()
+    overlay = WinRateOverlay(args.overlay_workers) if args.overlay else None
+    game = Game(renderer=RENDERERS[args.renderer](), overlay=overlay)
+    try:
+        game.main_menu()
+    finally:
+        SCREEN.release()
+        if overlay is not None: overlay.close()
+        if args.metrics: METRICS.dump(args.metrics)
\ No newline at end of file
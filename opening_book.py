@@ -0,0 +1,353 @@
+"""命运轮盘开局库生成器
+
+开局是整局中最容易分析的部分：_setup 之后双方各有 initial_spirits 个随机灵物（后手多一个），
+命运牌堆有 min_fate_cards..max_fate_cards 张，双方都是满状态。专家AI在这里仍然只用启发式打分，
+而同一批开局局面在每一局里都会出现。build 子命令离线把它们推演清楚，写成以内存映射方式加载的开局库
+（见 main.OpeningBook，各命令行入口用 --opening-book 加载），专家AI和地狱AI轮到自己的第一个回合时先查开局库，查不到再用启发式。
+
+开局局面按 main.opening_key 归类：是否后手、手牌的多重集、命运牌堆张数、是否用放大镜看到了牌堆顶（以及是哪张）。
+局面从真实的开局中收集：用一批种子开局，双方按启发式行动，记下每个开局局面（后手的局面包含先手第一回合
+之后的变化，放大镜之后的局面自然出现），直到开局结束；出现得越多的局面得到的推演越多，不可能出现的组合不占空间。
+每个收集到的局面，对每个候选的第一步（命运卡牌对对手/对自己、每种可用的灵物）以及“照常按启发式”各推演若干局：
+看不到的部分（对手的神秘护符、命运牌堆顺序、灵物牌堆）按该玩家的信息随机取样，第一步之后双方都按启发式下完。
+同一次取样的随机源对所有候选相同（配对比较），所以候选之间的差别不受取样运气影响。
+同一局面键的结果跨局面累计，最好的一步比启发式的胜率高出 --margin 且配对差的 z 值达到 --confidence 时才收录。
+
+check 子命令让使用开局库的AI与不使用开局库的同一个AI对局（每个种子交换先后手各一局），报告胜率和置信区间。
+
+用法示例:
+    python opening_book.py build --games 20000 --rollouts 64 --jobs 8
+    python opening_book.py build --player HellAIPlayer --out hell_book.bin
+    python opening_book.py show --limit 30
+    python opening_book.py check --games 4000 --jobs 8
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+import main
+from tournament import game_seed
+
+Z95 = 1.959964
+
+
+class _OpeningOver(Exception):
+    """双方的开局都已结束，停止收集这一局"""
+
+
+class _Collector:
+    """收集开局局面的玩家（与AI类组合使用）：每次决策前记下开局局面，然后照常按启发式行动"""
+    record = False
+
+    def ai_choose_action(self, opponent, game):
+        if game.turn_count > 2: raise _OpeningOver
+        if self.record:
+            key = main.opening_key(game, self)
+            if key is not None:
+                belief = main.DeckBelief()
+                belief.copy_from(self.belief, with_counts=False)
+                self.positions.append((key, game.players.index(self), game.state_key(), belief, main.legal_search_actions(game, self)))
+        return super().ai_choose_action(opponent, game)
+
+
+class _Forced:
+    """推演中走开局的一方（与AI类组合使用）：第一次决策走指定的行动（None 为照常按启发式），之后按启发式"""
+    forced = None
+
+    def ai_choose_action(self, opponent, game):
+        action, self.forced = self.forced, None
+        if action is None: return super().ai_choose_action(opponent, game)
+        kind, value = action
+        if kind == "fate":
+            self.book_target = value
+            return "fate_card"
+        return f"spirit_index_{self.spirits.index(value)}"
+
+
+def _combined(mixin, cls):
+    return type(f"{mixin.__name__}{cls.__name__}", (mixin, cls), {})
+
+
+# --- 收集与推演（工作进程） ---
+
+def collect_positions(cls, opponent_cls, config, seed, first_player):
+    """用一个种子开局，返回 cls 一方遇到的开局局面 [(局面键, 座位, 局面, 信念, 候选行动)]"""
+    game = main.Game(headless=True, seed=seed, config=config)
+    game.players = [_combined(_Collector, cls)(), _combined(_Collector, opponent_cls)()]
+    me = game.players[0]
+    me.record, me.positions = True, []
+    try: game.run_headless(first_player)
+    except _OpeningOver: pass
+    return me.positions
+
+
+class Evaluator:
+    """在一个工作进程里反复使用的推演对局：每个座位一局，走开局的一方由 _Forced 代替"""
+
+    def __init__(self, cls, opponent_cls, config, rollouts):
+        self.cls, self.opponent_cls, self.config, self.rollouts = cls, opponent_cls, config, rollouts
+        self.scratch = {}
+
+    def _scratch_game(self, seat):
+        if seat not in self.scratch:
+            scratch = main.Game(headless=True, seed=0, config=self.config)
+            scratch.players = [self.opponent_cls("model"), self.opponent_cls("model")]
+            scratch.players[seat] = _combined(_Forced, self.cls)("book")
+            for p in scratch.players: p.config = self.config
+            scratch.fate_deck.observers = list(scratch.players)
+            self.scratch[seat] = scratch
+        return self.scratch[seat]
+
+    def _rollout(self, scratch, seat, state, belief, action, seed):
+        """按 seed 对看不到的部分取样，第一步走 action，返回 seat 一方的得分（胜 1，平 0.5，负 0）"""
+        rng = random.Random(seed)
+        me, opponent = scratch.players[seat], scratch.players[1 - seat]
+        scratch.restore_state(state)
+        scratch.rng.seed(rng.getrandbits(64))
+        for p in scratch.players: p.rng.seed(rng.getrandbits(64))
+        opponent.spirits = [rng.choice(["AMULET", "MIRROR"]) if s in main.HIDDEN_SPIRITS else s for s in opponent.spirits]
+        rng.shuffle(scratch.spirit_deck.cards)
+        size = len(scratch.fate_deck)
+        scratch.fate_deck.load(belief.sample(rng) if len(belief.rows) == size else self.config.random_fate_cards(rng, size))
+        scratch.turn_count = 0
+        for p in scratch.players:
+            p.belief.reset(size, prior=self.config.fate_prior)
+            p.intended_fate_card_target, p.book_target = 'opponent', None
+        me.belief.copy_from(belief, with_counts=False)
+        me.forced = action
+        winner = scratch.play_out(main.SEARCH_ROLLOUT_MAX_TURNS)
+        return 0.5 if winner is None else (1.0 if winner is me else 0.0)
+
+    def evaluate(self, position, seed):
+        """一个开局局面：每个候选行动的 (行动编号, 推演局数, 得分和, 与启发式配对差的和, 配对差的平方和)，
+        启发式本身的编号为 -1"""
+        key, seat, state, belief, actions = position
+        scratch = self._scratch_game(seat)
+        seeds = [hash((seed, r)) for r in range(self.rollouts)]
+        baseline = [self._rollout(scratch, seat, state, belief, None, s) for s in seeds]
+        results = [(-1, len(seeds), sum(baseline), 0.0, 0.0)]
+        for action in actions:
+            rewards = [self._rollout(scratch, seat, state, belief, action, s) for s in seeds]
+            diffs = [a - b for a, b in zip(rewards, baseline)]
+            results.append((main.OpeningBook.action_code(action), len(seeds), sum(rewards), sum(diffs), sum(d * d for d in diffs)))
+        return key, results
+
+
+_evaluator = None # 工作进程各自的推演对局
+
+
+def _init_worker(cls, opponent_cls, config, rollouts):
+    global _evaluator
+    main.use_opening_book(None) # 推演和收集都按启发式进行
+    _evaluator = Evaluator(cls, opponent_cls, config, rollouts)
+
+
+def _build_chunk(task):
+    """工作进程：若干个种子的开局，返回 (开局数, 局面数, {局面键: {行动编号: [局数, 得分和, 差的和, 差的平方和]}})"""
+    start, count, base_seed = task
+    ev = _evaluator
+    totals, positions = {}, 0
+    for game_index in range(start, start + count):
+        seed = game_seed(base_seed, 0, game_index)
+        for position in collect_positions(ev.cls, ev.opponent_cls, ev.config, seed, game_index & 1):
+            key, results = ev.evaluate(position, (seed, positions))
+            positions += 1
+            bucket = totals.setdefault(key, {})
+            for code, n, wins, diff, diff_sq in results:
+                stats = bucket.setdefault(code, [0, 0.0, 0.0, 0.0])
+                stats[0] += n
+                stats[1] += wins
+                stats[2] += diff
+                stats[3] += diff_sq
+    return count, positions, totals
+
+
+def _pool_progress(pool_results, total, unit, progress):
+    """逐个产出工作进程的结果，同时在 stderr 上显示进度"""
+    done = 0
+    started = last_report = time.perf_counter()
+    for count, *rest in pool_results:
+        done += count
+        now = time.perf_counter()
+        if progress and (now - last_report > 0.2 or done == total):
+            last_report = now
+            rate = done / (now - started) if now > started else 0
+            eta = (total - done) / rate if rate else 0
+            sys.stderr.write(f"\r进度 {done}/{total} {unit} ({done / total:6.1%})  剩余约 {eta:,.0f} 秒 ")
+            sys.stderr.flush()
+        yield rest
+    if progress: sys.stderr.write("\n")
+
+
+# --- 编译 ---
+
+def select_entries(totals, confidence, margin, min_rollouts):
+    """每个局面键中与启发式相比最好的一步：[(局面键, 行动编号, 胜率)]，没有明显好于启发式的一步时不收录"""
+    entries = []
+    for key, bucket in totals.items():
+        best = None
+        for code, (n, wins, diff, diff_sq) in bucket.items():
+            if code < 0 or n < min_rollouts: continue
+            mean = diff / n
+            se = math.sqrt(max(diff_sq / n - mean * mean, 0.0) / n)
+            if mean < margin or (mean <= confidence * se if se else mean <= 0): continue
+            if best is None or mean > best[0]: best = (mean, code, wins / n)
+        if best is not None: entries.append((key, best[1], best[2]))
+    entries.sort()
+    return entries
+
+
+def build(args):
+    cls, opponent_cls = _player_class(args.player), _player_class(args.opponent or args.player)
+    config = main.GameConfig.from_dict(_load_json(args.config)).validated() if args.config else main.DEFAULT_CONFIG
+    hand_space = (main.SPIRIT_COUNT + 1) ** config.max_spirits
+    if hand_space * (config.max_fate_cards + 1) * (len(main.FATE_CARD_KEYS) + 1) * 2 >= 1 << 64:
+        raise SystemExit("规则变体的开局局面键超出 64 位，无法编译开局库")
+    tasks = [(start, min(args.chunk, args.games - start), args.seed) for start in range(0, args.games, args.chunk)]
+    totals, positions = {}, 0
+    started = time.perf_counter()
+    with multiprocessing.Pool(processes=args.jobs, initializer=_init_worker,
+                              initargs=(cls, opponent_cls, config, args.rollouts)) as pool:
+        for found, chunk in _pool_progress(pool.imap_unordered(_build_chunk, tasks), args.games, "局开局", not args.quiet):
+            positions += found
+            for key, bucket in chunk.items():
+                merged = totals.setdefault(key, {})
+                for code, stats in bucket.items():
+                    into = merged.setdefault(code, [0, 0.0, 0.0, 0.0])
+                    for k, v in enumerate(stats): into[k] += v
+    entries = select_entries(totals, args.confidence, args.margin, args.min_rollouts)
+    meta = {"weights": cls.weights, "config": config.to_dict(), "player": cls.__name__, "opponent": opponent_cls.__name__,
+            "games": args.games, "rollouts": args.rollouts, "seed": args.seed, "confidence": args.confidence,
+            "margin": args.margin, "positions": positions, "situations": len(totals)}
+    data = main.OpeningBook.encode(meta, {"keys": [k for k, _, _ in entries], "actions": [c for _, c, _ in entries],
+                                          "values": [v for _, _, v in entries]})
+    with open(args.out, "wb") as f: f.write(data)
+    print(f"{args.games:,} 局开局中的 {positions:,} 个开局局面（{len(totals):,} 种），收录 {len(entries):,} 种，"
+          f"{len(data):,} 字节，用时 {time.perf_counter() - started:.1f} 秒 -> {args.out}")
+
+
+# --- 查看 ---
+
+def describe_key(key, config):
+    """把 opening_key 拆回（是否后手, 手牌, 牌堆张数, 已知的牌堆顶）"""
+    key, second = divmod(key, 2)
+    key, top = divmod(key, len(main.FATE_CARD_KEYS) + 1)
+    hand, deck_size = divmod(key, config.max_fate_cards + 1)
+    spirits = []
+    while hand:
+        hand, k = divmod(hand, main.SPIRIT_COUNT + 1)
+        spirits.append(main.SPIRIT_KEYS[k - 1])
+    return bool(second), sorted(spirits, key=main.SPIRIT_INDEX.get), deck_size, main.FATE_CARD_KEYS[top - 1] if top else None
+
+
+def show(args):
+    book = main.OpeningBook.open(args.book)
+    meta = book.meta
+    print(f"{args.book}: {meta['player']} 对 {meta['opponent']}，{meta['games']:,} 局开局、{meta['positions']:,} 个局面"
+          f"（{meta['situations']:,} 种），每个候选推演 {meta['rollouts']} 局，收录 {len(book):,} 种")
+    for i in range(min(args.limit, len(book))):
+        second, spirits, deck_size, top = describe_key(book.keys[i], book.config)
+        kind, value = book.decode_action(book.actions[i])
+        action = f"命运卡牌 -> {'对手' if value == 'opponent' else '自己'}" if kind == "fate" else main.SPIRIT_NAMES[value]
+        print(f"{'后手' if second else '先手'}  {' '.join(main.SPIRIT_NAMES[s] for s in spirits) or '-'}  牌堆 {deck_size} 张"
+              f"{'' if top is None else '，牌堆顶 ' + main.FATE_CARD_NAMES[top]}  ->  {action}（胜率 {book.values[i]:.1%}）")
+
+
+# --- 对局检验 ---
+
+_check_book = None
+
+
+def _init_check(path):
+    global _check_book
+    _check_book = main.load_opening_book(path)
+
+
+def _check_chunk(task):
+    """工作进程：使用开局库的一方（座位0）与不使用的一方对局，返回 (局数, [座位0得分和])"""
+    cls, config, start, count, base_seed = task
+    score = 0.0
+    for game_index in range(start, start + count):
+        seed = game_seed(base_seed, 1, game_index)
+        for first_player in (0, 1):
+            game = main.Game(headless=True, seed=seed, config=config)
+            game.players = [cls(), cls()]
+            game.players[1].opening_book = None # 实例属性遮住类属性，只对这一方关闭开局库
+            result = game.run_headless(first_player)
+            score += 0.5 if result.winner is None else float(result.winner == 0)
+    return count * 2, score
+
+
+def check(args):
+    cls = _player_class(args.player)
+    book = main.OpeningBook.open(args.book)
+    if not book.matches(cls):
+        print(f"{args.book} 与 {cls.__name__} 当前的权重或决策方式不符，开局库不会被使用，请重新生成。")
+        return 1
+    seeds = max(1, args.games // 2)
+    tasks = [(cls, book.config, start, min(args.chunk, seeds - start), args.seed) for start in range(0, seeds, args.chunk)]
+    score = 0.0
+    with multiprocessing.Pool(processes=args.jobs, initializer=_init_check, initargs=(args.book,)) as pool:
+        for (chunk_score,) in _pool_progress(pool.imap_unordered(_check_chunk, tasks), seeds * 2, "局", not args.quiet):
+            score += chunk_score
+    games = seeds * 2
+    rate = score / games
+    print(f"{cls.__name__} 使用开局库对不使用开局库：{games:,} 局，胜率 {rate:.1%} ± {Z95 * math.sqrt(rate * (1 - rate) / games):.1%}")
+    return 0
+
+
+def _player_class(name):
+    cls = getattr(main, name, None)
+    if not (isinstance(cls, type) and issubclass(cls, main.ExpertAIPlayer)): raise SystemExit(f"{name} 不是专家AI类")
+    return cls
+
+
+def _load_json(path):
+    with open(path, "r", encoding="utf-8") as f: return json.load(f)
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="专家AI开局库的生成、查看与对局检验")
+    sub = parser.add_subparsers(dest="command", required=True)
+    default_path = os.environ.get("FATE_OPENING_BOOK", main.OPENING_BOOK_FILE)
+    p = sub.add_parser("build", help="推演并生成开局库")
+    p.add_argument("--player", default="ExpertAIPlayer", help="使用开局库的AI类（按它的启发式收集局面和推演）")
+    p.add_argument("--opponent", help="收集局面和推演时的对手AI类，默认与 --player 相同")
+    p.add_argument("--config", help="规则变体的 JSON 文件（只写出与标准规则不同的字段），默认为标准规则")
+    p.add_argument("--games", type=int, default=4000, help="收集开局局面的开局数")
+    p.add_argument("--rollouts", type=int, default=128, help="每个局面每个候选行动的推演局数")
+    p.add_argument("--min-rollouts", type=int, default=128, help="一种局面的一个候选至少累计这么多局推演才可能收录")
+    p.add_argument("--confidence", type=float, default=2.5, help="收录所需的配对差 z 值")
+    p.add_argument("--margin", type=float, default=0.01, help="收录所需的胜率提升")
+    p.add_argument("--jobs", type=int, default=multiprocessing.cpu_count(), help="工作进程数")
+    p.add_argument("--chunk", type=int, default=50, help="每个任务包含的开局数")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--out", default=default_path, help="输出文件")
+    p.add_argument("--quiet", action="store_true", help="不显示进度")
+    p = sub.add_parser("show", help="列出开局库的条目")
+    p.add_argument("book", nargs="?", default=default_path, help="开局库文件")
+    p.add_argument("--limit", type=int, default=50, help="最多列出的条目数")
+    p = sub.add_parser("check", help="使用开局库与不使用开局库的同一AI对局")
+    p.add_argument("book", nargs="?", default=default_path, help="开局库文件")
+    p.add_argument("--player", default="ExpertAIPlayer", help="对局的AI类")
+    p.add_argument("--games", type=int, default=2000, help="局数（先后手各一半）")
+    p.add_argument("--jobs", type=int, default=multiprocessing.cpu_count(), help="工作进程数")
+    p.add_argument("--chunk", type=int, default=250, help="每个任务包含的种子数")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--quiet", action="store_true", help="不显示进度")
+    for p in sub.choices.values():
+        p.add_argument("--ai-weights", default=os.environ.get("FATE_AI_WEIGHTS"), help="按此权重文件（tune.py 写出）生成或检验，默认取 $FATE_AI_WEIGHTS")
+    args = parser.parse_args(argv)
+    if args.ai_weights: main.load_ai_weights(args.ai_weights)
+    if args.command == "build": build(args)
+    elif args.command == "show": show(args)
+    else: sys.exit(check(args))
+
+
+if __name__ == "__main__":
+    main_cli()
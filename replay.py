@@ -0,0 +1,146 @@
+"""命运轮盘对局日志工具
+
+    python replay.py show fate_last_game.frl              # 逐条列出日志中的决策和随机结果
+    python replay.py verify games.frl --jobs 8           # 按当前规则重放所有对局并逐事件校验
+    python replay.py record games.frl --games 100000     # 生成一批AI对局日志，用于规则修改前后的对比
+
+规则修改后对旧日志运行 verify，第一个不一致的事件就是行为发生变化的地方。
+"""
+import argparse
+import multiprocessing
+import sys
+import time
+
+import main
+from tournament import discover_ai_classes
+
+EVENT_NAMES = {
+    main.EVENT_FIRST_PLAYER: "先手",
+    main.EVENT_FATE_DECK: "生成命运牌堆",
+    main.EVENT_SPIRIT_DECK: "灵物牌堆",
+    main.EVENT_FATE_DRAW: "抽取命运卡牌",
+    main.EVENT_ERASE: "橡皮擦移除",
+    main.EVENT_WHITE_POTION: "白药水结果",
+    main.EVENT_SHUFFLER_SWAP: "洗牌器交换位置",
+    main.EVENT_MUSHROOM: "蘑菇变出",
+    main.DECISION_ACTION: "决策:行动",
+    main.DECISION_TARGET: "决策:目标",
+    main.DECISION_STEAL: "决策:偷取",
+    main.DECISION_FORCE_USE: "决策:强制使用",
+    main.DECISION_TELEPHONE: "决策:电话位置",
+    main.EVENT_GAME_END: "对局结束",
+}
+
+
+def describe_payload(event_type, payload):
+    if event_type == main.EVENT_FATE_DECK:
+        return " ".join(main.FATE_CARD_NAMES[main.FATE_CARD_KEYS[c]] for c in payload[1:])
+    if event_type in (main.EVENT_SPIRIT_DECK, main.EVENT_ERASE):
+        return " ".join(main.SPIRIT_NAMES[main.SPIRIT_KEYS[s]] for s in payload[1:])
+    if event_type in (main.EVENT_FATE_DRAW, main.EVENT_MUSHROOM):
+        return main.FATE_CARD_NAMES[main.FATE_CARD_KEYS[payload[0]]]
+    if event_type == main.EVENT_WHITE_POTION:
+        return ["恢复1", "失去1", "恢复2", "失去2"][payload[0]]
+    if event_type == main.DECISION_ACTION:
+        return "使用命运卡牌" if payload[0] == 0 else f"使用第 {payload[0]} 个灵物"
+    if event_type == main.DECISION_TARGET:
+        return "自己" if payload[0] == 0 else "对手"
+    if event_type == main.DECISION_STEAL:
+        return main.SPIRIT_NAMES[main.SPIRIT_KEYS[payload[0]]]
+    if event_type == main.DECISION_FORCE_USE:
+        return "放弃" if payload[0] == 0 else main.SPIRIT_NAMES[main.SPIRIT_KEYS[payload[0] - 1]]
+    if event_type == main.EVENT_GAME_END:
+        winner = "平局" if payload[0] == 255 else f"座位 {payload[0]} 获胜"
+        return f"{winner}，共 {payload[1] | (payload[2] << 8)} 回合"
+    return " ".join(str(v) for v in payload)
+
+
+def show(path):
+    for number, log in enumerate(main.read_game_logs(path)):
+        print(f"=== 第 {number + 1} 局  种子 {log.seed}  玩家 {' / '.join(log.player_names)} ===")
+        for index, (event_type, payload, check) in enumerate(log.records(), 1):
+            name = EVENT_NAMES.get(event_type, f"未知事件 {event_type}")
+            print(f"{index:4d}. {name:<8} {describe_payload(event_type, payload)}  [{check:04x}]")
+
+
+def _verify_chunk(blobs):
+    """工作进程：重放一批日志，返回 (事件数, 失败列表)"""
+    events = 0
+    failures = []
+    for index, blob in blobs:
+        log = main.GameLog.from_bytes(blob)
+        try:
+            main.replay_game(log)
+        except main.ReplayMismatch as e:
+            failures.append((index, log.seed, str(e)))
+        events += log.count()
+    return events, failures
+
+
+def verify(path, jobs, chunk_size):
+    blobs = [(index, log.to_bytes()) for index, log in enumerate(main.read_game_logs(path))]
+    chunks = [blobs[i:i + chunk_size] for i in range(0, len(blobs), chunk_size)]
+    started = time.perf_counter()
+    events = 0
+    failures = []
+    with multiprocessing.Pool(processes=jobs) as pool:
+        for chunk_events, chunk_failures in pool.imap_unordered(_verify_chunk, chunks):
+            events += chunk_events
+            failures.extend(chunk_failures)
+    elapsed = time.perf_counter() - started
+    print(f"重放 {len(blobs):,} 局 / {events:,} 个事件，用时 {elapsed:.1f} 秒（{len(blobs) / max(elapsed, 1e-9):,.0f} 局/秒）")
+    for index, seed, message in sorted(failures)[:20]:
+        print(f"  第 {index + 1} 局（种子 {seed}）: {message}")
+    if failures:
+        print(f"共 {len(failures)} 局与当前规则不一致。")
+        return 1
+    print("全部一致。")
+    return 0
+
+
+def _record_chunk(task):
+    first_cls, second_cls, seeds = task
+    return [main.simulate_game(first_cls, second_cls, seed=seed, record=True).log.to_bytes() for seed in seeds]
+
+
+def record(path, games, players, base_seed, jobs, chunk_size):
+    classes = {cls.__name__: cls for cls in discover_ai_classes()}
+    first_cls, second_cls = classes[players[0]], classes[players[1]]
+    seeds = list(range(base_seed, base_seed + games))
+    tasks = [(first_cls, second_cls, seeds[i:i + chunk_size]) for i in range(0, games, chunk_size)]
+    with multiprocessing.Pool(processes=jobs) as pool, open(path, "wb") as f:
+        for blobs in pool.imap(_record_chunk, tasks):
+            for data in blobs:
+                f.write(len(data).to_bytes(4, "little"))
+                f.write(data)
+    print(f"已写入 {games:,} 局日志到 {path}")
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="命运轮盘对局日志工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_show = sub.add_parser("show", help="列出日志内容")
+    p_show.add_argument("path")
+    p_verify = sub.add_parser("verify", help="按当前规则重放并校验")
+    p_verify.add_argument("path")
+    p_verify.add_argument("--jobs", type=int, default=multiprocessing.cpu_count())
+    p_verify.add_argument("--chunk", type=int, default=500)
+    p_record = sub.add_parser("record", help="生成AI对局日志")
+    p_record.add_argument("path")
+    p_record.add_argument("--games", type=int, default=10000)
+    p_record.add_argument("--players", nargs=2, default=["HellAIPlayer", "ExpertAIPlayer"])
+    p_record.add_argument("--seed", type=int, default=0)
+    p_record.add_argument("--jobs", type=int, default=multiprocessing.cpu_count())
+    p_record.add_argument("--chunk", type=int, default=500)
+    args = parser.parse_args(argv)
+
+    if args.command == "show":
+        show(args.path)
+    elif args.command == "verify":
+        sys.exit(verify(args.path, args.jobs, args.chunk))
+    else:
+        record(args.path, args.games, args.players, args.seed, args.jobs, args.chunk)
+
+
+if __name__ == "__main__":
+    main_cli()
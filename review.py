@@ -0,0 +1,350 @@
+"""命运轮盘复盘：找出一局中胜率损失最大的决策
+
+按对局日志重新运行整局，在每个决策点（行动、命运卡牌的目标、手套偷取、无线电强制使用、电话位置）
+把所有合法的选择各推演若干局：从种子重放到该决策点，按决策者掌握的信息对看不到的部分重新取样
+（命运牌堆按决策者的信念，双方的神秘护符按灵物牌库中的比例，灵物牌堆重新洗牌，规则随机源换新种子），
+换成这个选择，之后双方都由专家AI下完。同一个决策的各个选择使用相同的推演种子（公共随机数），
+比较的主要是配对差异。
+
+推演分发到进程池。同一局面上的同一选择只算一次：行动和目标按决策者视角的局面识别，
+其余决策点（发生在灵物结算中途）按所在对局和决策序号识别；结果存在 SQLite 缓存中，
+再次分析同一局或不同对局出现相同局面时直接复用。
+
+用法示例:
+    python review.py fate_last_game.frl
+    python review.py fate_last_game.frl --rollouts 400 --jobs 8 --top 10 --seat 0
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import random
+import sqlite3
+import sys
+import time
+
+import main
+
+DEFAULT_ROLLOUTS = 200
+CACHE_FILE = "fate_review_cache.db"
+CACHE_VERSION = 1 # 推演方式改变时加1，旧的缓存条目自动失效
+HIDDEN_POOL = [s for s in main.DEFAULT_CONFIG.spirit_deck_template if s in main.HIDDEN_SPIRITS]
+
+DECISION_LABELS = {main.DECISION_ACTION: "行动", main.DECISION_TARGET: "目标", main.DECISION_STEAL: "偷取",
+                   main.DECISION_FORCE_USE: "强制使用", main.DECISION_TELEPHONE: "电话位置"}
+# 这些决策点上局面是完整的（不在灵物结算中途），可以按局面在不同对局之间共享结果
+POSITIONAL_DECISIONS = (main.DECISION_ACTION, main.DECISION_TARGET)
+
+
+# ==============================================================================
+# --- 重新运行 ---
+# ==============================================================================
+
+class _Script:
+    """一次重新运行中双方共享的决策脚本：branch 之前按日志决策，branch 处换成 choice 并重新取样看不到的部分，
+    之后交给专家AI。branch 为 None 时完整重放，并对每个决策点调用 survey"""
+
+    def __init__(self, decisions, branch=None, choice=None, seed=None, survey=None):
+        self.decisions = decisions # [(座位, 决策类型, 决策编码)]，座位为 None 时不校验
+        self.branch = branch
+        self.choice = choice
+        self.seed = seed
+        self.survey = survey
+        self.cursor = 0
+        self.game = None
+
+
+class _ReviewPlayer(main.ExpertAIPlayer):
+    """复盘用的玩家：作为专家AI观察命运牌堆（维护信念），决策按 _Script 取得"""
+
+    def __init__(self, name, script, seat):
+        super().__init__(name)
+        self.script = script
+        self.seat = seat
+
+    def _decide(self, decision_type, options, compute):
+        """options 为 [(显示文字, 决策编码, 局面无关的选择标识)]，compute 计算专家AI的决策编码"""
+        script = self.script
+        index = script.cursor
+        script.cursor += 1
+        if script.branch is None or index < script.branch:
+            seat, recorded_type, code = script.decisions[index]
+            if (seat is not None and seat != self.seat) or recorded_type != decision_type:
+                raise main.ReplayMismatch(f"第 {index + 1} 个决策应为座位 {seat} 的{DECISION_LABELS[recorded_type]}，"
+                                          f"重新运行时为座位 {self.seat} 的{DECISION_LABELS[decision_type]}")
+            if script.survey is not None: script.survey(index, self, decision_type, options, code)
+            return code
+        if index == script.branch:
+            self._determinize(decision_type)
+            return script.choice
+        return compute()
+
+    def _determinize(self, decision_type):
+        """把决策者看不到的部分换成一个符合其已知信息的随机样本，并换掉之后的所有随机源"""
+        game = self.script.game
+        rng = random.Random(self.script.seed)
+        game.rng.seed(rng.getrandbits(63))
+        for player in game.players: player.rng.seed(rng.getrandbits(63))
+        if decision_type in POSITIONAL_DECISIONS or decision_type == main.DECISION_TELEPHONE:
+            # 神秘护符连持有者自己也分不清；偷取和强制使用的选项指名了具体的灵物，这两处不换
+            for player in game.players:
+                player.spirits = [rng.choice(HIDDEN_POOL) if s in main.HIDDEN_SPIRITS else s for s in player.spirits]
+        rng.shuffle(game.spirit_deck.cards)
+        deck = game.fate_deck
+        if len(self.belief.rows) == len(deck): deck.load(self.belief.sample(rng))
+        else: deck.load(game.config.random_fate_cards(rng, len(deck)))
+        for player in game.players:
+            if player is not self: player.belief.copy_from(self.belief)
+
+    def ai_choose_action(self, opponent, game):
+        options = [("使用命运卡牌", 0, "fate_card")]
+        if not self.status.is_handcuffed:
+            last = game.last_spirit_used_by_player[self.seat]
+            seen = set()
+            for i, spirit in enumerate(self.spirits):
+                kind = main.HIDDEN_OPTION if spirit in main.HIDDEN_SPIRITS else spirit
+                if kind in seen or (spirit in ["HANDCUFFS", "REMOTE_CONTROL"] and last == spirit): continue
+                seen.add(kind)
+                options.append((f"使用{main.spirit_label(spirit)}", i + 1, kind))
+        def compute():
+            action = super(_ReviewPlayer, self).ai_choose_action(opponent, game)
+            return 0 if action == "fate_card" else int(action.split('_')[-1]) + 1
+        code = self._decide(main.DECISION_ACTION, options, compute)
+        return "fate_card" if code == 0 else f"spirit_index_{code - 1}"
+
+    def ai_choose_target(self, opponent):
+        options = [("对自己使用", 0, 0), ("对对手使用", 1, 1)]
+        compute = lambda: 0 if super(_ReviewPlayer, self).ai_choose_target(opponent) == 'self' else 1
+        return 'self' if self._decide(main.DECISION_TARGET, options, compute) == 0 else 'opponent'
+
+    def ai_choose_spirit_to_steal(self, stealable_spirits):
+        options = [(f"偷取{main.spirit_label(s)}", main.SPIRIT_INDEX[s], s) for s in dict.fromkeys(stealable_spirits)]
+        compute = lambda: main.SPIRIT_INDEX[super(_ReviewPlayer, self).ai_choose_spirit_to_steal(stealable_spirits)]
+        return main.SPIRIT_KEYS[self._decide(main.DECISION_STEAL, options, compute)]
+
+    def ai_choose_spirit_to_force_use(self, opponent_spirits, opponent_player_object):
+        options = [("放弃", 0, None)] + [(f"强制使用{main.spirit_label(s)}", main.SPIRIT_INDEX[s] + 1, s)
+                                        for s in dict.fromkeys(opponent_spirits)]
+        def compute():
+            spirit = super(_ReviewPlayer, self).ai_choose_spirit_to_force_use(opponent_spirits, opponent_player_object)
+            return 0 if spirit is None else main.SPIRIT_INDEX[spirit] + 1
+        code = self._decide(main.DECISION_FORCE_USE, options, compute)
+        return None if code == 0 else main.SPIRIT_KEYS[code - 1]
+
+    def ai_choose_telephone_position(self, deck_size):
+        options = [(f"查看第 {n} 张", n, n) for n in range(1, deck_size + 1)]
+        compute = lambda: super(_ReviewPlayer, self).ai_choose_telephone_position(deck_size)
+        return self._decide(main.DECISION_TELEPHONE, options, compute)
+
+
+def _run(log, script, record=False):
+    game = main.Game(headless=True, seed=log.seed, record=record, config=log.config)
+    if record: game.log.expect(log)
+    game.players = [_ReviewPlayer(name, script, seat) for seat, name in enumerate(log.player_names)]
+    script.game = game
+    ending = log.game_end()
+    max_turns = (ending[1] if ending else 0) + main.SEARCH_ROLLOUT_MAX_TURNS if script.branch is not None else ending[1]
+    return game, game.run_headless(log.first_player(), max_turns)
+
+
+# ==============================================================================
+# --- 决策点 ---
+# ==============================================================================
+
+class DecisionPoint:
+    """原局中的一个决策点：谁在第几回合做了什么决定，有哪些合法的选择"""
+    __slots__ = ("index", "seat", "decision_type", "turn", "options", "chosen", "keys", "values")
+
+    def __init__(self, index, seat, decision_type, turn, options, chosen, keys):
+        self.index = index
+        self.seat = seat
+        self.decision_type = decision_type
+        self.turn = turn
+        self.options = options # [(显示文字, 决策编码)]
+        self.chosen = chosen   # 实际做出的决策编码
+        self.keys = keys       # 与 options 对应的缓存键
+        self.values = [None] * len(options) # 推演得到的胜率（决策者视角）
+
+    def label(self, code):
+        for text, option in self.options:
+            if option == code: return text
+        return str(code)
+
+    def value(self, code):
+        for (_, option), value in zip(self.options, self.values):
+            if option == code: return value
+        return None
+
+    def loss(self):
+        """最佳选择与实际选择的胜率差（不小于0）"""
+        chosen = self.value(self.chosen)
+        best = max(v for v in self.values if v is not None)
+        return max(best - chosen, 0.0)
+
+    def best(self):
+        return max(zip(self.options, self.values), key=lambda item: item[1])[0][1]
+
+
+def observed_key(game, seat, belief):
+    """决策者视角的局面：双方的神秘护符不分身份，命运牌堆只有决策者的信念"""
+    position = main.observe_position(game, seat, belief)
+    relative = 0 if game.current_player_index == seat else 1
+    return (position, relative, game.config.to_dict(only_changed=True))
+
+
+def survey(log):
+    """完整重放一局（逐事件校验），收集所有决策点"""
+    points = []
+    # 日志中的决策不带座位，由重放时实际做决定的玩家补上
+    decisions = [(None, event_type, payload[0]) for event_type, payload, _ in log.records() if event_type in DECISION_LABELS]
+    weights = json.dumps(main.ExpertAIPlayer.weights, sort_keys=True)
+
+    def collect(index, player, decision_type, options, code):
+        game = player.script.game
+        decisions[index] = (player.seat, decision_type, code)
+        if decision_type in POSITIONAL_DECISIONS: context = observed_key(game, player.seat, player.belief)
+        else: context = (log.seed, tuple(decisions[:index + 1]), observed_key(game, player.seat, player.belief))
+        keys = [_cache_key((CACHE_VERSION, weights, decision_type, context, kind)) for _, _, kind in options]
+        points.append(DecisionPoint(index, player.seat, decision_type, game.turn_count,
+                                    [(text, option) for text, option, _ in options], code, keys))
+
+    game, _ = _run(log, _Script(list(decisions), survey=collect), record=True)
+    if len(game.log.events) != len(log.events):
+        raise main.ReplayMismatch(f"重新运行在第 {game.log.count()} 个事件处提前结束")
+    return points, decisions
+
+
+def _cache_key(value):
+    return hashlib.sha1(repr(value).encode("utf-8")).hexdigest()
+
+
+# ==============================================================================
+# --- 推演 ---
+# ==============================================================================
+
+def _evaluate(task):
+    """工作进程：在第 branch 个决策处依次换成 codes 中的每个选择，各推演 rollouts 局，返回决策者视角的得分和"""
+    blob, decisions, branch, seat, codes, rollouts, seed = task
+    log = main.GameLog.from_bytes(blob)
+    scores = [0.0] * len(codes)
+    for k in range(rollouts):
+        rollout_seed = hash((seed, branch, k))
+        for i, code in enumerate(codes):
+            script = _Script(decisions, branch, code, rollout_seed)
+            _, result = _run(log, script)
+            scores[i] += 0.5 if result.winner is None else float(result.winner == seat)
+    return branch, codes, scores
+
+
+class ReviewCache:
+    """推演结果的 SQLite 缓存：键 -> (得分和, 局数)；path 为 None 时只在内存中"""
+
+    def __init__(self, path=None):
+        self.db = sqlite3.connect(path or ":memory:")
+        self.db.execute("CREATE TABLE IF NOT EXISTS rollouts (key TEXT PRIMARY KEY, score REAL NOT NULL, games INTEGER NOT NULL)")
+
+    def get(self, key, games):
+        """至少推演过 games 局时返回胜率，否则返回 None"""
+        row = self.db.execute("SELECT score, games FROM rollouts WHERE key = ?", (key,)).fetchone()
+        return row[0] / row[1] if row and row[1] >= games else None
+
+    def put(self, key, score, games):
+        self.db.execute("INSERT OR REPLACE INTO rollouts VALUES (?, ?, ?)", (key, score, games))
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+def review(log, rollouts=DEFAULT_ROLLOUTS, jobs=None, cache=None, seats=(0, 1), seed=0, progress=True):
+    """分析一局，返回 (决策点列表, 统计)；每个决策点的 values 为各选择的胜率"""
+    started = time.perf_counter()
+    points, decisions = survey(log)
+    cache = cache or ReviewCache()
+    blob = log.to_bytes()
+    tasks, hits, queued = [], 0, {}
+    for point in points:
+        if point.seat not in seats or len(point.options) < 2: continue
+        missing = []
+        for i, ((_, code), key) in enumerate(zip(point.options, point.keys)):
+            value = cache.get(key, rollouts)
+            if value is not None:
+                point.values[i] = value
+                hits += 1
+            elif key in queued: hits += 1 # 同一次分析中的相同局面，等第一次的结果
+            else:
+                queued[key] = (point, i)
+                missing.append(code)
+        if missing: tasks.append((blob, decisions, point.index, point.seat, missing, rollouts, seed))
+
+    by_index = {point.index: point for point in points}
+    total = sum(len(task[4]) for task in tasks) * rollouts
+    done = 0
+    with multiprocessing.Pool(processes=jobs) as pool:
+        for branch, codes, scores in pool.imap_unordered(_evaluate, tasks):
+            point = by_index[branch]
+            for code, score in zip(codes, scores):
+                i = [option for _, option in point.options].index(code)
+                point.values[i] = score / rollouts
+                cache.put(point.keys[i], score, rollouts)
+            done += len(codes) * rollouts
+            if progress:
+                sys.stderr.write(f"\r推演 {done:,}/{total:,} 局 ({done / max(total, 1):6.1%})")
+                sys.stderr.flush()
+    if progress and tasks: sys.stderr.write("\n")
+    for point in points: # 相同局面的选择取第一次算出的结果
+        for i, key in enumerate(point.keys):
+            if point.values[i] is None and key in queued:
+                source, j = queued[key]
+                point.values[i] = source.values[j]
+    analysed = [point for point in points if point.seat in seats and len(point.options) >= 2]
+    stats = {"decisions": len(points), "analysed": len(analysed), "rollouts": total, "cache_hits": hits,
+             "seconds": time.perf_counter() - started}
+    return analysed, stats
+
+
+def print_report(log, points, stats, top):
+    names = log.player_names
+    print(f"=== 种子 {log.seed}  玩家 {' / '.join(names)} ===")
+    print(f"{stats['decisions']} 个决策，分析了其中 {stats['analysed']} 个有多种选择的决策；推演 {stats['rollouts']:,} 局，"
+          f"缓存命中 {stats['cache_hits']} 个选择，用时 {stats['seconds']:.1f} 秒")
+    worst = sorted(points, key=lambda point: point.loss(), reverse=True)[:top]
+    print(f"\n胜率损失最大的 {len(worst)} 个决策:")
+    for point in worst:
+        chosen, best = point.value(point.chosen), point.value(point.best())
+        print(f"  第 {point.turn:>3} 回合  {names[point.seat]} 的{DECISION_LABELS[point.decision_type]}：{point.label(point.chosen)} "
+              f"{chosen:.0%}，最佳为 {point.label(point.best())} {best:.0%}（{-point.loss():+.1%}）")
+    print("\n逐个决策（胜率为决策者视角，* 为实际选择）:")
+    for point in points:
+        choices = "  ".join(f"{'*' if code == point.chosen else ''}{text} {value:.0%}"
+                            for (text, code), value in zip(point.options, point.values))
+        print(f"  第 {point.turn:>3} 回合  {names[point.seat]} {DECISION_LABELS[point.decision_type]}: {choices}")
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="命运轮盘复盘：找出一局中胜率损失最大的决策")
+    parser.add_argument("path", nargs="?", default="fate_last_game.frl", help="对局日志（游戏结束时保存的 .frl 文件）")
+    parser.add_argument("--game", type=int, default=1, help="日志文件中的第几局（从1开始）")
+    parser.add_argument("--seat", type=int, choices=(0, 1), help="只分析这个座位的决策（默认双方）")
+    parser.add_argument("--rollouts", type=int, default=DEFAULT_ROLLOUTS, help="每个选择推演的局数")
+    parser.add_argument("--jobs", type=int, default=multiprocessing.cpu_count(), help="工作进程数")
+    parser.add_argument("--top", type=int, default=5, help="列出胜率损失最大的决策数")
+    parser.add_argument("--seed", type=int, default=0, help="推演的随机种子")
+    parser.add_argument("--cache", default=CACHE_FILE, help="推演结果缓存（SQLite）；传空字符串则不使用")
+    args = parser.parse_args(argv)
+
+    logs = list(main.read_game_logs(args.path))
+    if not 1 <= args.game <= len(logs): parser.error(f"{args.path} 中只有 {len(logs)} 局")
+    log = logs[args.game - 1]
+    cache = ReviewCache(args.cache or None)
+    try:
+        points, stats = review(log, args.rollouts, args.jobs, cache, (0, 1) if args.seat is None else (args.seat,), args.seed)
+    except main.ReplayMismatch as e:
+        sys.exit(f"日志与当前规则不一致，无法复盘：{e}")
+    finally:
+        cache.close()
+    print_report(log, points, stats, args.top)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,228 @@
+"""命运轮盘规则变体扫描
+
+把一组规则变体（GameConfig）分发到进程池中，每个变体用同一批种子下若干局无头AI对局
+（每个种子交换先后手各一局），输出每个变体的胜率、平均对局长度和先手优势（带95%置信区间）。
+所有变体使用相同的种子，变体之间的差异不受种子运气影响。
+
+变体可以是网格（--vary 的所有组合）、网格中的随机抽样（--sample），或 JSON 文件中的列表（--variants）。
+--vary 的取值写成 "4,5,6" 或闭区间 "3:7"；fate_weights 的一组权重用 "/" 分隔，如 "1/1/1/1/2"。
+
+用法示例:
+    python sweep.py --vary max_hp=4,5,6 --vary spirit_copies=1:3 --games 4000 --jobs 8
+    python sweep.py --vary initial_hp=2:6 --vary max_spirits=3:8 --sample 12 --json sweep.json
+    python sweep.py --variants variants.json --players HardAIPlayer ExpertAIPlayer
+"""
+import argparse
+import itertools
+import json
+import math
+import multiprocessing
+import random
+import sys
+import time
+
+import main
+from tournament import discover_ai_classes, game_seed
+
+Z95 = 1.959964
+
+
+def parse_values(field, spec):
+    """--vary 的取值：逗号分隔的列表或闭区间 lo:hi"""
+    if field not in main.GameConfig._fields: raise ValueError(f"未知的规则参数: {field}")
+    if field == "fate_weights":
+        return [None if part == "none" else tuple(float(w) for w in part.split("/")) for part in spec.split(",")]
+    if ":" in spec:
+        low, high = (int(v) for v in spec.split(":"))
+        return list(range(low, high + 1))
+    return [int(v) for v in spec.split(",")]
+
+
+def grid_configs(axes):
+    """axes 为 [(字段, 取值列表)]，返回所有组合中合法的变体和被跳过的组合数"""
+    names = [name for name, _ in axes]
+    configs, skipped = [], 0
+    for values in itertools.product(*(values for _, values in axes)):
+        try: configs.append(main.GameConfig(**dict(zip(names, values))))
+        except ValueError: skipped += 1
+    return configs, skipped
+
+
+def sample_configs(axes, count, rng):
+    """从网格中不放回地随机抽取 count 个合法变体（网格不大时等价于先枚举再抽样）"""
+    configs, skipped = grid_configs(axes)
+    return rng.sample(configs, min(count, len(configs))), skipped
+
+
+def load_variants(path):
+    """JSON 文件：变体列表，每项是只写出与标准规则不同字段的字典"""
+    with open(path, "r", encoding="utf-8") as f: data = json.load(f)
+    if not isinstance(data, list): raise ValueError("变体文件应为 JSON 列表")
+    return [main.GameConfig.from_dict(item) for item in data]
+
+
+def describe(config):
+    changed = config.to_dict(only_changed=True)
+    if not changed: return "标准规则"
+    return " ".join(f"{k}={'/'.join(f'{w:g}' for w in v) if k == 'fate_weights' else v}" for k, v in changed.items())
+
+
+def _init_worker(search_nodes):
+    # 与循环赛相同：搜索AI按固定推演局数决策，保证同一种子结果可复现
+    main.SearchAIPlayer.node_budget = search_nodes
+
+
+def _play_chunk(task):
+    """工作进程：在一个变体下连续下若干个种子（每个种子两局），只回传聚合计数"""
+    variant_index, config, first_cls, second_cls, start, count, base_seed, max_turns = task
+    # counts: [座位0胜, 座位1胜, 平局, 总回合数, 回合数平方和, 先手方胜]
+    counts = [0, 0, 0, 0, 0, 0]
+    for game_index in range(start, start + count):
+        seed = game_seed(base_seed, 0, game_index)
+        for first_player in (0, 1):
+            result = main.simulate_game(first_cls, second_cls, seed=seed, first_player=first_player,
+                                        max_turns=max_turns, config=config)
+            if result.winner is None: counts[2] += 1
+            else:
+                counts[result.winner] += 1
+                if result.winner == first_player: counts[5] += 1
+            counts[3] += result.turns
+            counts[4] += result.turns * result.turns
+    return variant_index, count * 2, counts
+
+
+def build_tasks(configs, first_cls, second_cls, games, chunk_size, base_seed, max_turns):
+    seeds = max(1, games // 2)
+    return [(index, config, first_cls, second_cls, start, min(chunk_size, seeds - start), base_seed, max_turns)
+            for index, config in enumerate(configs) for start in range(0, seeds, chunk_size)]
+
+
+def _proportion(successes, trials):
+    """比例及其95%置信区间半宽（正态近似）"""
+    if not trials: return None, None
+    p = successes / trials
+    return p, Z95 * math.sqrt(p * (1 - p) / trials)
+
+
+def summarize(config, counts, games):
+    seat0, seat1, draws, turn_sum, turn_squares, first_wins = counts
+    decided = games - draws
+    mean = turn_sum / games
+    variance = max(turn_squares / games - mean * mean, 0.0)
+    win_rate, win_ci = _proportion(seat0 + draws / 2, games)
+    first_rate, first_ci = _proportion(first_wins, decided)
+    return {
+        "config": config.to_dict(only_changed=True),
+        "games": games,
+        "win_rate": win_rate, # 座位0（第一个AI）的胜率，平局记半胜
+        "win_rate_ci95": win_ci,
+        "average_turns": mean,
+        "average_turns_ci95": Z95 * math.sqrt(variance / games),
+        "draw_rate": draws / games,
+        "first_player_win_rate": first_rate, # 分出胜负的对局中先手方的胜率
+        "first_player_advantage": None if first_rate is None else first_rate - 0.5,
+        "first_player_advantage_ci95": first_ci,
+    }
+
+
+def run_sweep(configs, first_cls, second_cls, games, jobs, chunk_size=250, base_seed=0,
+              max_turns=main.HEADLESS_MAX_TURNS, search_nodes=100, progress=True):
+    tasks = build_tasks(configs, first_cls, second_cls, games, chunk_size, base_seed, max_turns)
+    totals = [[0] * 6 for _ in configs]
+    played = [0] * len(configs)
+    total_games = sum(task[5] * 2 for task in tasks)
+    done = 0
+    started = last_report = time.perf_counter()
+    with multiprocessing.Pool(processes=jobs, initializer=_init_worker, initargs=(search_nodes,)) as pool:
+        for variant_index, count, counts in pool.imap_unordered(_play_chunk, tasks):
+            bucket = totals[variant_index]
+            for k, v in enumerate(counts): bucket[k] += v
+            played[variant_index] += count
+            done += count
+            now = time.perf_counter()
+            if progress and (now - last_report > 0.2 or done == total_games):
+                last_report = now
+                elapsed = now - started
+                rate = done / elapsed if elapsed > 0 else 0
+                eta = (total_games - done) / rate if rate else 0
+                sys.stderr.write(f"\r进度 {done}/{total_games} 局 ({done / total_games:6.1%})  {rate:,.0f} 局/秒  剩余约 {eta:,.0f} 秒 ")
+                sys.stderr.flush()
+    if progress: sys.stderr.write("\n")
+    return {
+        "players": [first_cls.__name__, second_cls.__name__],
+        "games": total_games,
+        "seconds": time.perf_counter() - started,
+        "seed": base_seed,
+        "variants": [summarize(config, totals[i], played[i]) for i, config in enumerate(configs)],
+    }
+
+
+def print_report(report, sort_key=None):
+    first, second = report["players"]
+    print(f"\n{first} 对 {second}，{len(report['variants'])} 个变体共 {report['games']:,} 局，"
+          f"用时 {report['seconds']:.1f} 秒（{report['games'] / max(report['seconds'], 1e-9):,.0f} 局/秒）")
+    rows = report["variants"]
+    if sort_key: rows = sorted(rows, key=lambda row: abs(row[sort_key] or 0), reverse=True)
+    labels = [describe(main.GameConfig.from_dict(row["config"])) for row in rows]
+    width = max(main.display_width(label) for label in labels) + 2
+    headers = [("座位0胜率", 16), ("平均回合", 16), ("平局", 8), ("先手优势", 18)]
+    print("\n" + main.pad_display("变体", width) + "".join(main.pad_display(text, n, right=True) for text, n in headers))
+    for label, row in zip(labels, rows):
+        advantage = "-" if row["first_player_advantage"] is None else \
+            f"{row['first_player_advantage']:+.1%} ± {row['first_player_advantage_ci95']:.1%}"
+        print(f"{main.pad_display(label, width)}{row['win_rate']:>9.1%} ± {row['win_rate_ci95']:.1%}"
+              f"{row['average_turns']:>9.2f} ± {row['average_turns_ci95']:.2f}{row['draw_rate']:>8.1%}{advantage:>18}")
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="命运轮盘规则变体扫描")
+    parser.add_argument("--vary", action="append", default=[], metavar="FIELD=VALUES",
+                        help=f"要变化的规则参数，可重复；可选字段: {', '.join(main.GameConfig._fields)}")
+    parser.add_argument("--sample", type=int, help="从 --vary 的网格中随机抽取这么多个变体（默认取全部组合）")
+    parser.add_argument("--variants", help="从 JSON 文件读取变体列表（与 --vary 二选一）")
+    parser.add_argument("--no-baseline", action="store_true", help="不自动加入标准规则作为对照")
+    parser.add_argument("--players", nargs=2, default=["ExpertAIPlayer", "ExpertAIPlayer"], help="对局双方的 AI 类")
+    parser.add_argument("--games", type=int, default=2000, help="每个变体的局数（先后手各一半）")
+    parser.add_argument("--jobs", type=int, default=multiprocessing.cpu_count(), help="工作进程数")
+    parser.add_argument("--chunk", type=int, default=250, help="每个任务包含的种子数")
+    parser.add_argument("--seed", type=int, default=0, help="基础随机种子（同时决定 --sample 的抽样）")
+    parser.add_argument("--max-turns", type=int, default=main.HEADLESS_MAX_TURNS, help="单局回合上限")
+    parser.add_argument("--search-nodes", type=int, default=100, help="搜索AI每次决策的推演局数")
+    parser.add_argument("--sort", choices=["win_rate", "average_turns", "first_player_advantage"], help="按该指标的绝对值从大到小输出")
+    parser.add_argument("--json", help="将完整结果写入 JSON 文件")
+    parser.add_argument("--quiet", action="store_true", help="不显示实时进度")
+    main.add_ai_file_arguments(parser)
+    args = parser.parse_args(argv)
+    main.load_ai_files(args)
+
+    by_name = {cls.__name__: cls for cls in discover_ai_classes()}
+    unknown = [name for name in args.players if name not in by_name]
+    if unknown: parser.error(f"未知的 AI 类: {', '.join(unknown)}")
+    if args.variants and args.vary: parser.error("--variants 与 --vary 不能同时使用")
+
+    try:
+        if args.variants:
+            configs, skipped = load_variants(args.variants), 0
+        else:
+            axes = []
+            for item in args.vary:
+                field, _, spec = item.partition("=")
+                axes.append((field, parse_values(field, spec)))
+            if args.sample: configs, skipped = sample_configs(axes, args.sample, random.Random(args.seed))
+            else: configs, skipped = grid_configs(axes)
+    except (ValueError, OSError) as e:
+        parser.error(str(e))
+    if skipped: print(f"跳过了 {skipped} 个不合法的组合。", file=sys.stderr)
+    if not args.no_baseline and main.DEFAULT_CONFIG not in configs: configs.insert(0, main.DEFAULT_CONFIG)
+    if not configs: parser.error("没有可以运行的变体")
+
+    report = run_sweep(configs, by_name[args.players[0]], by_name[args.players[1]], args.games, args.jobs,
+                       args.chunk, args.seed, args.max_turns, args.search_nodes, progress=not args.quiet)
+    print_report(report, args.sort)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,118 @@
+"""AI 数据文件（权重、决策表、开局库）只由命令行入口显式加载"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import ai_tables
+import main
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def default_weights(monkeypatch):
+    """测试结束后恢复各专家AI类的权重、决策表、开局库和已加载的版本号"""
+    pending = [main.ExpertAIPlayer]
+    while pending:
+        cls = pending.pop()
+        pending.extend(cls.__subclasses__())
+        for name in ("weights", "decision_table", "decision_weights", "opening_book", "book_weights"):
+            if name in vars(cls): monkeypatch.setattr(cls, name, vars(cls)[name])
+    monkeypatch.setattr(main, "AI_WEIGHTS_VERSION", None)
+    monkeypatch.setattr(main, "DECISION_TABLES", None)
+    monkeypatch.setattr(main, "OPENING_BOOK", None)
+
+
+def _write(path, data):
+    path.write_text(json.dumps(data), encoding="utf-8")
+    return str(path)
+
+
+def test_import_does_not_read_files_from_the_working_directory(tmp_path):
+    _write(tmp_path / main.AI_WEIGHTS_FILE, {"version": 9, "classes": {"ExpertAIPlayer": {"radio": 999}}})
+    (tmp_path / main.AI_TABLES_FILE).write_bytes(b"not a table")
+    (tmp_path / main.OPENING_BOOK_FILE).write_bytes(b"not a book")
+    code = "import main; print(main.AI_WEIGHTS_VERSION, main.ExpertAIPlayer.weights['radio'], main.ExpertAIPlayer.decision_table, main.ExpertAIPlayer.opening_book)"
+    env = {**os.environ, "PYTHONPATH": ROOT}
+    out = subprocess.run([sys.executable, "-c", code], cwd=tmp_path, env=env, capture_output=True, text=True, check=True)
+    assert out.stdout.split() == ["None", str(main.EXPERT_WEIGHTS["radio"]), "None", "None"]
+
+
+def test_loads_weights_file(tmp_path, default_weights):
+    path = _write(tmp_path / "w.json", {"version": 3, "classes": {"HellAIPlayer": {"radio": 7}}})
+    assert main.load_ai_weights(path) == 3
+    assert main.AI_WEIGHTS_VERSION == 3
+    assert main.HellAIPlayer.weights == {**main.EXPERT_WEIGHTS, "radio": 7}
+    assert main.ExpertAIPlayer.weights is main.EXPERT_WEIGHTS
+
+
+@pytest.mark.parametrize("data", [
+    {"version": 2, "classes": {"ExpertAIPlayer": {"radio": 7}, "HardAIPlayer": {"radio": 7}}},
+    {"version": 2, "classes": {"ExpertAIPlayer": {"radio": 7, "no_such_weight": 1}}},
+    {"version": 2},
+    [],
+])
+def test_bad_weights_file_warns_and_keeps_defaults(tmp_path, capsys, default_weights, data):
+    path = _write(tmp_path / "w.json", data)
+    assert main.load_ai_weights(path) is None
+    assert "警告" in capsys.readouterr().err
+    assert main.AI_WEIGHTS_VERSION is None
+    assert main.ExpertAIPlayer.weights is main.EXPERT_WEIGHTS
+
+
+def test_missing_weights_file_warns(tmp_path, capsys, default_weights):
+    assert main.load_ai_weights(str(tmp_path / "missing.json")) is None
+    assert "警告" in capsys.readouterr().err
+
+
+def _write_tables(path, cls=main.ExpertAIPlayer):
+    # 小规则下编译很快；对局不用这个规则，这里只检查加载时与权重的匹配
+    config = main.GameConfig.from_dict({"max_hp": 3, "initial_hp": 3, "max_spirits": 3, "initial_spirits": 3})
+    path.write_bytes(main.DecisionTables.encode(*ai_tables.compile_tables(cls, config)))
+    return str(path)
+
+
+def test_loads_tables_compiled_with_current_weights(tmp_path, capsys, default_weights):
+    table = main.load_decision_tables(_write_tables(tmp_path / "t.bin"))
+    assert main.DECISION_TABLES is table is main.ExpertAIPlayer.decision_table
+    assert capsys.readouterr().err == ""
+
+
+def test_tables_compiled_for_other_weights_warn_and_are_not_used(tmp_path, capsys, default_weights):
+    path = _write_tables(tmp_path / "t.bin")
+    main.load_ai_weights(_write(tmp_path / "w.json", {"version": 4, "classes": {"ExpertAIPlayer": {"radio": 7}}}))
+    main.load_decision_tables(path)
+    err = capsys.readouterr().err
+    assert "不符" in err and "当前 4" in err
+    assert main.ExpertAIPlayer.decision_table is None
+
+
+def test_bad_tables_file_warns(tmp_path, capsys, default_weights):
+    (tmp_path / "t.bin").write_bytes(b"not a table")
+    assert main.load_decision_tables(str(tmp_path / "t.bin")) is None
+    assert "警告" in capsys.readouterr().err
+    assert main.ExpertAIPlayer.decision_table is None
+
+
+def test_bad_opening_book_warns(tmp_path, capsys, default_weights):
+    (tmp_path / "b.bin").write_bytes(b"not a book")
+    assert main.load_opening_book(str(tmp_path / "b.bin")) is None
+    assert "警告" in capsys.readouterr().err
+    assert main.ExpertAIPlayer.opening_book is None
+
+
+def test_cli_options_load_only_what_is_asked_for(tmp_path, monkeypatch, capsys, default_weights):
+    for name in ("FATE_AI_WEIGHTS", "FATE_AI_TABLES", "FATE_OPENING_BOOK"): monkeypatch.delenv(name, raising=False)
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / main.OPENING_BOOK_FILE).write_bytes(b"not a book")
+    parser = argparse.ArgumentParser()
+    main.add_ai_file_arguments(parser)
+    main.load_ai_files(parser.parse_args(["--ai-tables", _write_tables(tmp_path / "t.bin")]))
+    assert main.ExpertAIPlayer.decision_table is main.DECISION_TABLES is not None
+    assert main.OPENING_BOOK is None and capsys.readouterr().err == ""
+    main.load_ai_files(parser.parse_args(["--opening-book"]))
+    assert main.OPENING_BOOK_FILE in capsys.readouterr().err
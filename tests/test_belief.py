@@ -0,0 +1,89 @@
+"""命运牌堆信念：构成已知时的比例拟合、揭示和交换"""
+import itertools
+import random
+from collections import Counter
+
+import pytest
+
+import main
+
+KEYS = main.FATE_CARD_KEYS
+
+
+def _columns(belief):
+    return [sum(row[i] for row in belief.rows) for i in range(len(KEYS))]
+
+
+def _exact_marginals(cards, revealed):
+    """牌堆按构成均匀随机排列、并满足已揭示位置时，各位置（从牌堆顶数）的精确分布"""
+    counts = [[0] * len(KEYS) for _ in cards]
+    total = 0
+    for order in set(itertools.permutations(cards)):
+        if any(order[p] != card for p, card in revealed.items()): continue
+        total += 1
+        for position, card in enumerate(order): counts[position][main.FATE_CARD_INDEX[card]] += 1
+    return [[n / total for n in row] for row in counts]
+
+
+def test_unknown_composition_keeps_the_prior():
+    belief = main.DeckBelief()
+    belief.reset(6)
+    belief.drawn("BACKLASH")
+    assert belief.rows == [main.DEFAULT_CONFIG.fate_prior] * 5
+    assert belief.probability(0, main.DAMAGE_CARD_INDICES) == pytest.approx(0.4)
+
+
+def test_known_composition_tracks_draws_exactly():
+    cards = ["BACKLASH", "BACKLASH", "THE_VOID", "DIVINE_BOON", "DIVINE_PUNISHMENT"]
+    belief = main.DeckBelief()
+    belief.reset(len(cards), Counter(cards))
+    belief.drawn("BACKLASH")
+    belief.drawn("DIVINE_PUNISHMENT")
+    assert belief.exchangeable
+    assert belief.probability(0, main.DAMAGE_CARD_INDICES) == pytest.approx(1 / 3)
+    assert _columns(belief) == pytest.approx([Counter(["BACKLASH", "THE_VOID", "DIVINE_BOON"])[k] for k in KEYS])
+
+
+@pytest.mark.parametrize("revealed", [{3: "THE_VOID"}, {0: "BACKLASH", 4: "BACKLASH"}, {1: "DIVINE_BOON", 2: "BACKLASH"}])
+def test_fit_after_reveals_matches_the_exact_posterior(revealed):
+    cards = ["BACKLASH", "BACKLASH", "THE_VOID", "DIVINE_BOON", "REINCARNATION"]
+    belief = main.DeckBelief()
+    belief.reset(len(cards), Counter(cards))
+    for position, card in revealed.items(): belief.revealed(position, card)
+    assert all(belief.certain(position) == card for position, card in revealed.items())
+    exact = _exact_marginals(cards, revealed)
+    for position, row in enumerate(exact):
+        assert belief.rows[-1 - position] == pytest.approx(row, abs=2e-3)
+
+
+def test_random_swap_conserves_probability_mass():
+    rng = random.Random(2)
+    belief = main.DeckBelief()
+    cards = [rng.choice(KEYS) for _ in range(8)]
+    belief.reset(len(cards), Counter(cards))
+    belief.revealed(0, cards[0])
+    before = _columns(belief)
+    belief.swapped_with_random(0)
+    assert _columns(belief) == pytest.approx(before)
+    assert all(sum(row) == pytest.approx(1.0) for row in belief.rows)
+    assert belief.certain(0) is None
+
+
+def test_player_belief_follows_the_real_deck():
+    """对局中的信念与实际牌堆一致：确定的位置就是真实的牌"""
+    for seed in range(10):
+        game = main.Game(headless=True, seed=seed)
+        game.players = [main.HellAIPlayer("甲"), main.ExpertAIPlayer("乙")]
+        game._setup(0)
+        for _ in range(10):
+            game._turn()
+            game._check_game_over()
+            if game.game_over: break
+            game._switch_player()
+            for player in game.players:
+                belief = player.belief
+                assert len(belief.rows) == len(game.fate_deck)
+                for position, card in enumerate(game.fate_deck):
+                    certain = belief.certain(position)
+                    assert certain in (None, card)
+                    assert belief.rows[-1 - position][main.FATE_CARD_INDEX[card]] > 0
@@ -0,0 +1,38 @@
+"""规则参数不能超出局面和对局日志的编码范围"""
+import pytest
+
+import main
+
+
+@pytest.mark.parametrize("values", [
+    {"max_spirits": 20, "spirit_copies": 20},
+    {"max_spirits": 16},
+    {"spirit_copies": 16},
+    {"min_fate_cards": 300, "max_fate_cards": 300},
+    {"max_hp": 256},
+])
+def test_rejects_values_the_encodings_cannot_hold(values):
+    with pytest.raises(ValueError):
+        main.GameConfig.from_dict(values)
+
+
+def test_largest_config_round_trips_through_state_key_and_log():
+    config = main.GameConfig.from_dict({"max_spirits": 15, "initial_spirits": 15, "spirit_copies": 15,
+                                        "min_fate_cards": 254, "max_fate_cards": 254})
+    result = main.simulate_game(main.HardAIPlayer, main.HardAIPlayer, seed=1, record=True, config=config)
+    main.replay_game(main.GameLog.from_bytes(result.log.to_bytes()))
+    player = main.Player("甲")
+    player.spirits = ["MIRROR"] * 15
+    copy = main.Player("乙")
+    copy.load_state_key(player.state_key())
+    assert copy.spirits == player.spirits
+
+
+@pytest.mark.parametrize("make", [
+    lambda: main.GameConfig(max_spirits=20),
+    lambda: main.DEFAULT_CONFIG._replace(spirit_copies=16),
+    lambda: main.GameConfig(initial_hp=6, max_hp=5),
+])
+def test_direct_construction_is_validated(make):
+    with pytest.raises(ValueError):
+        make()
@@ -0,0 +1,68 @@
+"""牌堆：与按牌堆顶在前的普通列表逐步对照"""
+import random
+from collections import Counter
+
+import main
+
+KINDS = main.FATE_CARD_KEYS
+
+
+class Recorder:
+    def __init__(self): self.calls = []
+    def deck_refilled(self, deck): self.calls.append(("refilled", len(deck)))
+    def card_drawn(self, deck, card): self.calls.append(("drawn", card))
+    def card_discarded(self, deck, card): self.calls.append(("discarded", card))
+    def card_pushed(self, deck, card): self.calls.append(("pushed", card))
+    def cards_swapped(self, deck, i, j): self.calls.append(("swapped", i, j))
+
+
+def test_deck_matches_a_plain_list_under_random_operations():
+    rng = random.Random(0)
+    initial = [rng.choice(KINDS) for _ in range(12)]
+    deck, model = main.Deck(KINDS, initial), list(initial) # model[0] 为牌堆顶
+    recorder = Recorder()
+    deck.observers.append(recorder)
+    expected = []
+    for _ in range(2000):
+        op = rng.randrange(5) if model else 2
+        if op == 0:
+            card = model.pop(0)
+            assert deck.draw() == card
+            expected.append(("drawn", card))
+        elif op == 1:
+            card = model.pop(0)
+            assert deck.discard() == card
+            expected.append(("discarded", card))
+        elif op == 2:
+            card = rng.choice(KINDS)
+            model.insert(0, card)
+            deck.push(card)
+            expected.append(("pushed", card))
+        elif op == 3:
+            card, old = rng.choice(KINDS), model[0]
+            model[0] = card
+            assert deck.replace_top(card) == old
+            expected += [("discarded", old), ("pushed", card)]
+        else:
+            i, j = rng.randrange(len(model)), rng.randrange(len(model))
+            model[i], model[j] = model[j], model[i]
+            deck.swap(i, j)
+            expected.append(("swapped", i, j))
+        assert list(deck) == model
+        assert deck.composition() == Counter(model)
+        if model: assert deck.peek(len(model) - 1) == model[-1]
+    assert recorder.calls == expected
+
+
+def test_load_and_load_bottom_up_do_not_notify():
+    deck = main.Deck(KINDS)
+    recorder = Recorder()
+    deck.observers.append(recorder)
+    cards = ["THE_VOID", "BACKLASH", "BACKLASH"]
+    deck.load(cards)
+    assert list(deck) == cards and deck.peek() == "THE_VOID"
+    deck.load_bottom_up(cards)
+    assert list(deck) == cards[::-1] and deck.counts["BACKLASH"] == 2
+    assert recorder.calls == []
+    deck.refill(cards)
+    assert recorder.calls == [("refilled", 3)]
@@ -0,0 +1,195 @@
+"""效果指令表：逐条对照灵物与命运卡牌的规则说明"""
+from collections import Counter
+
+import pytest
+
+import main
+
+
+class Scripted(main.HardAIPlayer):
+    """偷取第一个可偷的灵物，强制使用的灵物由测试指定"""
+    force = None
+    def ai_choose_spirit_to_steal(self, stealable_spirits): return stealable_spirits[0]
+    def ai_choose_spirit_to_force_use(self, opponent_spirits, opponent_player_object): return self.force
+
+
+@pytest.fixture
+def game():
+    game = main.Game(headless=True, seed=3)
+    game.players = [Scripted("甲"), Scripted("乙")]
+    game._setup(0)
+    for player in game.players:
+        player.hp = 3
+        player.spirits[:] = []
+    return game
+
+
+def _spirit(game, name, user=0):
+    return main.SPIRIT_EFFECTS[name](game, game.players[user], game.players[1 - user])
+
+
+def test_every_rule_has_an_effect():
+    assert main.SPIRIT_EFFECTS.keys() == main.SPIRIT_DESCRIPTIONS.keys()
+    assert main.FATE_EFFECTS.keys() == main.FATE_CARD_DESCRIPTIONS.keys()
+
+
+@pytest.mark.parametrize("name, field, value", [
+    ("AMULET", "amulet_turns", 2), ("MIRROR", "is_mirrored", True), ("REMOTE_CONTROL", "remote_control_active", True),
+    ("MUSHROOM", "mushroom_effect", True), ("SHUFFLER", "shuffler_effect", True), ("RED_POTION", "red_potion_bonus", 1)])
+def test_status_spirits(game, name, field, value):
+    _spirit(game, name)
+    assert getattr(game.players[0].status, field) == value
+
+
+def test_amulet_absorbs_one_point_and_shatters_on_more(game):
+    me = game.players[0]
+    _spirit(game, "AMULET")
+    assert me.take_damage(1) == 0
+    assert me.take_damage(2) == 4 and me.status.amulet_turns == 0
+
+
+@pytest.mark.parametrize("held, left", [(["MIRROR", "RADIO", "PILLOW"], 1), (["MIRROR"], 0), ([], 0)])
+def test_eraser_removes_up_to_two(game, held, left):
+    game.players[1].spirits[:] = held
+    _spirit(game, "ERASER")
+    assert len(game.players[1].spirits) == left
+
+
+def test_gloves_cannot_steal_gloves(game):
+    me, other = game.players
+    other.spirits[:] = ["GLOVES", "MIRROR"]
+    _spirit(game, "GLOVES")
+    assert (me.spirits, other.spirits) == (["MIRROR"], ["GLOVES"])
+
+
+def test_potions_and_draws(game):
+    me = game.players[0]
+    _spirit(game, "GREEN_POTION")
+    assert me.hp == 4
+    me.hp = me.max_hp
+    _spirit(game, "GREEN_POTION")
+    assert me.hp == me.max_hp
+    _spirit(game, "CREATION")
+    assert len(me.spirits) == 2
+
+
+def test_white_potion_odds(game):
+    me = game.players[0]
+    outcomes = Counter()
+    for _ in range(4000):
+        me.hp, me.spirits[:] = 3, []
+        _spirit(game, "WHITE_POTION")
+        outcomes[me.hp - 3] += 1
+    assert set(outcomes) <= {1, -1, 2, -2}
+    assert outcomes[1] / 4000 == pytest.approx(0.49, abs=0.03)
+    assert outcomes[-1] / 4000 == pytest.approx(0.49, abs=0.03)
+    assert (outcomes[2] + outcomes[-2]) / 4000 < 0.05
+
+
+def test_magnifying_glass_sees_the_top_card(game):
+    game.fate_deck.load(["BACKLASH", "THE_VOID"])
+    assert _spirit(game, "MAGNIFYING_GLASS")[main.FRAME_VALUE] == "BACKLASH"
+    assert list(game.fate_deck) == ["BACKLASH", "THE_VOID"]
+
+
+def test_handcuffs_compensate_unless_pillow_immune(game):
+    other = game.players[1]
+    _spirit(game, "HANDCUFFS")
+    assert other.status.is_handcuffed and len(other.spirits) == 1
+    other.status.is_handcuffed, other.status.pillow_immunity = False, 3
+    _spirit(game, "HANDCUFFS")
+    assert not other.status.is_handcuffed and len(other.spirits) == 1
+
+
+def test_telephone_reveals_the_chosen_position():
+    game = main.Game(headless=True, seed=5)
+    game.players = [main.ExpertAIPlayer("甲"), main.HardAIPlayer("乙")]
+    game._setup(0)
+    me = game.players[0]
+    frame = main.SPIRIT_EFFECTS["TELEPHONE"](game, me, game.players[1])
+    position = frame[main.FRAME_AUX] - 1
+    assert frame[main.FRAME_VALUE] == game.fate_deck.peek(position)
+    assert me.belief.certain(position) == game.fate_deck.peek(position)
+
+
+def test_pillow(game):
+    me = game.players[0]
+    _spirit(game, "PILLOW")
+    assert len(me.spirits) == 3 and me.status.skip_next_turn and me.status.pillow_immunity == 3
+
+
+def test_contract_costs_two_and_saves_once(game):
+    me = game.players[0]
+    me.hp = 4
+    _spirit(game, "CONTRACT")
+    assert me.hp == 2 and me.status.has_contract
+    me.spirits[:] = []
+    me.hp = 0
+    game._check_game_over()
+    assert not game.game_over and me.hp == 1 and len(me.spirits) == 3 and game.extra_turn_player is me
+    me.hp = 0
+    game._check_game_over()
+    assert game.game_over and game.winner is game.players[1]
+
+
+def test_radio_forces_the_opponent_to_use_the_chosen_spirit(game):
+    me, other = game.players
+    other.spirits[:] = ["GREEN_POTION", "MIRROR"]
+    me.force = "GREEN_POTION"
+    _spirit(game, "RADIO")
+    assert other.spirits == ["MIRROR"] and other.hp == 4
+
+
+def test_divine_punishment_uses_and_clears_the_red_potion_bonus(game):
+    me, other = game.players
+    me.status.red_potion_bonus = 1
+    game._apply_fate_card_effect("DIVINE_PUNISHMENT", me, other)
+    # 每失去1点生命获得2个灵物
+    assert other.hp == 1 and len(other.spirits) == 4 and me.status.red_potion_bonus == 0
+
+
+def test_mirror_reflects_with_one_extra_damage(game):
+    me, other = game.players
+    other.status.is_mirrored = True
+    game._apply_fate_card_effect("DIVINE_PUNISHMENT", me, other)
+    assert other.hp == 3 and not other.status.is_mirrored and me.hp == 1
+
+
+def test_divine_boon(game):
+    game._apply_fate_card_effect("DIVINE_BOON", game.players[0], game.players[1])
+    assert len(game.players[1].spirits) == 1
+
+
+@pytest.mark.parametrize("target, extra", [(0, 0), (1, None)])
+def test_void_gives_an_extra_turn_only_on_self(game, target, extra):
+    game._apply_fate_card_effect("THE_VOID", game.players[0], game.players[target])
+    assert game.extra_turn_player is (None if extra is None else game.players[extra])
+
+
+def test_backlash_extra_turn_only_when_life_is_lost(game):
+    me, other = game.players
+    game._apply_fate_card_effect("BACKLASH", me, other)
+    assert other.hp == 2 and game.extra_turn_player is other
+    game.extra_turn_player = None
+    other.status.amulet_turns = 2
+    game._apply_fate_card_effect("BACKLASH", me, other)
+    assert other.hp == 2 and game.extra_turn_player is None
+
+
+def test_reincarnation_makes_the_target_draw_for_itself(game):
+    me, other = game.players
+    game.fate_deck.load(["BACKLASH", "THE_VOID"])
+    game._apply_fate_card_effect("REINCARNATION", me, other)
+    assert other.hp == 2 and game.extra_turn_player is other
+    assert list(game.fate_deck) == ["THE_VOID"]
+
+
+def test_shuffler_and_mushroom_change_the_next_draw(game):
+    me = game.players[0]
+    game.fate_deck.load(["THE_VOID"] + ["BACKLASH"] * 3)
+    _spirit(game, "SHUFFLER")
+    assert game._draw_fate_card(me) == "BACKLASH" and not me.status.shuffler_effect
+    assert game.fate_deck.composition() == Counter(THE_VOID=1, BACKLASH=2)
+    _spirit(game, "MUSHROOM")
+    game._draw_fate_card(me)
+    assert not me.status.mushroom_effect and len(game.fate_deck) == 2
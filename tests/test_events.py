@@ -0,0 +1,52 @@
+"""事件总线与渲染器"""
+import io
+import json
+from types import SimpleNamespace
+
+import main
+
+
+def _run(seed, renderer=None):
+    game = main.Game(headless=True, seed=seed)
+    game.players = [main.ExpertAIPlayer("甲"), main.HardAIPlayer("乙")]
+    if renderer is not None: game.bus.subscribe(renderer)
+    return game.run_headless(0)
+
+
+def test_null_renderer_never_builds_events():
+    def explode(*values): raise AssertionError("没有需要事件的订阅者时不应创建事件")
+    bus = main.EventBus()
+    bus.subscribe(main.NullRenderer())
+    bus.emit(explode, 1, 2)
+    bus.flush()
+
+
+def test_jsonl_renderer_writes_one_object_per_event_without_changing_the_game():
+    stream = io.StringIO()
+    result, plain = _run(7, main.JsonLinesRenderer(stream)), _run(7)
+    assert (result.winner, result.turns, result.damage_taken) == (plain.winner, plain.turns, plain.damage_taken)
+    lines = stream.getvalue().splitlines()
+    assert lines and all("event" in json.loads(line) for line in lines)
+
+
+def test_buffered_renderer_writes_once_per_frame_and_hides_ai_private_events():
+    class CountingStream(io.StringIO):
+        writes = 0
+        def write(self, text):
+            self.writes += 1
+            return super().write(text)
+
+    stream = CountingStream()
+    bus = main.EventBus()
+    bus.subscribe(main.BufferedRenderer(stream))
+    human, ai = main.Player("人"), main.HardAIPlayer("机")
+    event = lambda player, private, text: SimpleNamespace(player=player, private=private, text=lambda: text)
+    bus.emit(event, human, False, "公开")
+    bus.emit(event, ai, True, "AI 的秘密")
+    bus.emit(event, human, True, "给人看的秘密")
+    assert stream.getvalue() == ""
+    bus.flush()
+    assert stream.getvalue() == "公开\n给人看的秘密\n"
+    assert stream.writes == 1
+    bus.flush() # 空帧不输出
+    assert stream.writes == 1
@@ -0,0 +1,100 @@
+"""命运卡牌期望求解：与逐一枚举牌堆顺序、用对局规则实际结算的结果对照，以及缓存的一致性"""
+import itertools
+
+import pytest
+
+import main
+
+CARDS = ["BACKLASH", "DIVINE_PUNISHMENT", "THE_VOID", "REINCARNATION", "DIVINE_BOON"]
+
+
+def _game(seats):
+    game = main.Game(headless=True, seed=0)
+    game.players = [main.HardAIPlayer("甲"), main.HardAIPlayer("乙")]
+    game._setup(0)
+    for player, (hp, spirits, status) in zip(game.players, seats):
+        player.hp = hp
+        player.spirits[:] = ["CREATION"] * spirits
+        for field, value in status.items(): setattr(player.status, field, value)
+    return game
+
+
+def _play(seats, order, drawer, target):
+    """按给定的牌堆顺序（牌堆顶在前）让 drawer 抽一张牌对 target 使用，返回与 fate_expectation 相同格式的结果"""
+    game = _game(seats)
+    game.fate_deck.load(order)
+    before = [(p.hp, len(p.spirits), p.status.is_mirrored) for p in game.players]
+    user = game.players[drawer]
+    user.status.shuffler_effect = False # 洗牌器的交换已经体现在 order 里
+    game._apply_fate_card_effect(game._draw_fate_card(user), user, game.players[target])
+    after = [(p.hp, len(p.spirits), p.status.is_mirrored) for p in game.players]
+    return tuple(float(v) for v in (
+        *(b[0] - a[0] for b, a in zip(before, after)), *(a[1] - b[1] for b, a in zip(before, after)),
+        *(game.extra_turn_player is p for p in game.players), *(b[2] and not a[2] for b, a in zip(before, after)),
+        *(a[0] <= 0 for a in after)))
+
+
+def _brute_force(cards, top, seats, drawer, target):
+    orders = [order for order in set(itertools.permutations(cards)) if top is None or order[0] == top]
+    if seats[drawer][2].get("shuffler_effect"): # 牌堆顶与其余任意一张等概率交换
+        swapped = []
+        for order in orders:
+            for j in range(1, len(order)):
+                swapped.append((order[j],) + order[1:j] + (order[0],) + order[j + 1:])
+        orders = swapped
+    results = [_play(seats, list(order), drawer, target) for order in orders]
+    return [sum(values) / len(results) for values in zip(*results)]
+
+
+def _solve(cards, top, seats, drawer, target):
+    game = _game(seats)
+    config = game.config
+    counts = tuple(cards.count(k) for k in main.FATE_CARD_KEYS)
+    sides = tuple(main.fate_side(p, config) for p in game.players)
+    top = -1 if top is None else main.FATE_CARD_INDEX[top]
+    return main.fate_expectation(counts, top, drawer, target, sides, config.fate_prior, config.hp_loss_spirit_gain)
+
+
+PLAIN = (3, 2, {})
+CASES = {
+    "plain": (CARDS, None, (PLAIN, (3, 4, {}))),
+    "mirror_and_red_potion": (CARDS, None, ((3, 1, {"red_potion_bonus": 1}), (2, 0, {"is_mirrored": True}))),
+    "amulet_and_lethal": (CARDS[:3] + ["REINCARNATION"], None, ((1, 0, {}), (1, 3, {"amulet_turns": 2}))),
+    "known_top": (CARDS, "REINCARNATION", (PLAIN, (2, 0, {"is_mirrored": True}))),
+    "shuffler_known_top": (CARDS, "BACKLASH", ((2, 0, {"shuffler_effect": True}), PLAIN)),
+    "shuffler_unknown_top": (CARDS[:4], None, ((1, 0, {"shuffler_effect": True, "red_potion_bonus": 1}), PLAIN)),
+}
+
+
+@pytest.mark.parametrize("target", [0, 1])
+@pytest.mark.parametrize("case", CASES)
+def test_matches_brute_force_over_deck_orders(case, target):
+    cards, top, seats = CASES[case]
+    assert _solve(cards, top, seats, 0, target) == pytest.approx(_brute_force(cards, top, seats, 0, target))
+
+
+def test_fresh_deck_self_reincarnation_sums_the_geometric_series():
+    """新生成的牌堆上对自己轮回会回到同一个状态：期望是除轮回外各牌结果按先验归一化"""
+    config = main.DEFAULT_CONFIG
+    prior, gain = config.fate_prior, config.hp_loss_spirit_gain
+    sides = ((0, 0, 0, 0, 0, 3, 3), (0, 0, 0, 0, 0, 3, 3))
+    expected = [0.0] * 10
+    for card, p in enumerate(prior):
+        if card == main.FATE_CARD_INDEX["REINCARNATION"]: continue
+        outcome = main._fate_card_outcome(card, 0, 0, sides, gain)
+        expected = [e + p * v / (1 - prior[main.FATE_CARD_INDEX["REINCARNATION"]]) for e, v in zip(expected, outcome)]
+    assert main.fate_expectation(None, -1, 0, 0, sides, prior, gain) == pytest.approx(expected)
+    assert main.fate_expectation((0,) * len(prior), -1, 0, 0, sides, prior, gain) == pytest.approx(expected)
+
+
+def test_cached_results_do_not_depend_on_evaluation_order():
+    cards, top, seats = CASES["mirror_and_red_potion"]
+    main.fate_expectation.cache_clear()
+    first = [_solve(cards, top, seats, 0, target) for target in (0, 1)]
+    hits = main.fate_expectation.cache_info().hits
+    assert [_solve(cards, top, seats, 0, target) for target in (0, 1)] == first
+    assert main.fate_expectation.cache_info().hits == hits + 2
+    # 先算出轮回之后的较小牌堆、再倒过来算整体，结果不变
+    main.fate_expectation.cache_clear()
+    for drawer in (0, 1): _solve([c for c in cards if c != "REINCARNATION"], None, seats, drawer, drawer)
+    assert [_solve(cards, top, seats, 0, target) for target in (1, 0)] == first[::-1]
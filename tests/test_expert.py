@@ -0,0 +1,28 @@
+"""专家AI的灵物打分"""
+import main
+
+
+def _scores(spirit, p_damage, tendency="Stable"):
+    me, opponent = main.ExpertAIPlayer(), main.ExpertAIPlayer()
+    me.spirits = [spirit]
+    return me._score_spirit(spirit, opponent, tendency, p_damage, None)
+
+
+def test_threat_bonus_applies_only_when_next_card_is_certainly_damage():
+    w = main.EXPERT_WEIGHTS
+    for spirit, bonus in (("RED_POTION", w["red_potion_threat"]), ("MIRROR", w["mirror_threat"])):
+        calm = _scores(spirit, 0.0)
+        assert _scores(spirit, 0.9) == calm # 只是很可能时不加分，与按已知牌堆顶判断的规则相同
+        assert _scores(spirit, 1.0) == calm + bonus # 加分是固定值，不随概率缩放
+
+
+def test_known_damage_top_gives_the_bonus_through_the_belief():
+    me, opponent = main.ExpertAIPlayer(), main.ExpertAIPlayer()
+    game = main.Game(headless=True, seed=3)
+    game.players = [me, opponent]
+    game._setup(0)
+    me.spirits = ["RED_POTION"]
+    _, calm = me._evaluate_spirit_use(opponent, game, "Stable")
+    me.belief.revealed(0, "DIVINE_PUNISHMENT")
+    _, threatened = me._evaluate_spirit_use(opponent, game, "Stable")
+    assert threatened == calm + main.EXPERT_WEIGHTS["red_potion_threat"]
@@ -0,0 +1,54 @@
+"""服务器不在事件循环中运行对局代码：会话推进和超时兜底都交给工作池"""
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import game_server
+import main
+
+
+def _session():
+    session = main.GameSession([None, main.HardAIPlayer], ["人", "AI"], seed=5, inline_ai=False)
+    session.advance()
+    while session.pending.seat == 0:
+        session.answer(0)
+        session.advance()
+    return session
+
+
+def test_advance_in_worker_matches_session_advance():
+    expected = main.GameSession([None, main.HardAIPlayer], ["人", "AI"], seed=5, inline_ai=False)
+    events = expected.advance()
+    session, messages = game_server._advance(main.GameSession([None, main.HardAIPlayer], ["人", "AI"], seed=5, inline_ai=False))
+    assert [message["text"] for message, _ in messages] == [event.text() for event in events]
+    assert all(seats == [seat for seat in (0, 1) if expected.visible_to(event, seat)]
+               for (_, seats), event in zip(messages, events))
+    assert session.pending.to_dict() == expected.pending.to_dict()
+
+
+class _StuckExecutor:
+    """永远算不完的AI工作池，让截止时间一定到期"""
+    def submit(self, fn, *args):
+        return Future()
+
+
+def test_deadline_fallback_runs_off_the_event_loop(monkeypatch):
+    session = _session()
+    threads = []
+    compute = main.GameSession.compute_pending
+    def recording(self, player_class=None):
+        threads.append(threading.get_ident())
+        return compute(self, player_class)
+    monkeypatch.setattr(main.GameSession, "compute_pending", recording)
+
+    async def decide():
+        with ThreadPoolExecutor(1) as fallback_executor:
+            scheduler = game_server.AIScheduler(_StuckExecutor(), 1, deadline=0.01, fallback=main.HardAIPlayer,
+                                                fallback_executor=fallback_executor)
+            code = await scheduler.decide("match", session)
+            return code, scheduler.stats, threading.get_ident()
+
+    code, stats, loop_thread = asyncio.run(decide())
+    assert stats["fallback"] == 1
+    assert threads and loop_thread not in threads
+    assert code == compute(session.clone(), main.HardAIPlayer)
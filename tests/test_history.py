@@ -0,0 +1,60 @@
+"""SQLite 对局历史：旧版 JSON 统计的导入、事务写入和战绩汇总"""
+import json
+from collections import Counter
+from types import SimpleNamespace
+
+import pytest
+
+import main
+
+LEGACY = {"wins": 3, "losses": 2, "total_damage_dealt": 10, "total_damage_taken": 7,
+          "spirits_used": {"MIRROR": 4}, "fate_cards_drawn": {"BACKLASH": 5}}
+
+
+def _human_result(winner, seed=1):
+    """人类玩家坐在座位0的一局"""
+    return SimpleNamespace(seed=seed, player_types=["Player", "HardAIPlayer"], first_player=0, winner=winner, turns=9,
+                           damage_taken=[2, 5], damage_dealt=[5, 2], spirits_used=[Counter(MIRROR=1), Counter()],
+                           fate_cards_drawn=[Counter(BACKLASH=2), Counter(VOID=1)])
+
+
+@pytest.fixture
+def paths(tmp_path):
+    legacy = tmp_path / "fate_game_stats.json"
+    legacy.write_text(json.dumps(LEGACY), encoding="utf-8")
+    return str(tmp_path / "history.db"), str(legacy)
+
+
+def test_legacy_stats_are_imported_once(paths):
+    db, legacy = paths
+    main.GameStats(db, legacy)
+    stats = main.GameStats(db, legacy).summary() # 再次打开不会重复导入
+    assert (stats["wins"], stats["losses"]) == (3, 2)
+    assert (stats["total_damage_dealt"], stats["total_damage_taken"]) == (10, 7)
+    assert stats["spirits_used"] == Counter(MIRROR=4)
+    assert stats["fate_cards_drawn"] == Counter(BACKLASH=5)
+
+
+def test_summary_adds_recorded_games_to_legacy_totals(paths):
+    db, legacy = paths
+    history = main.GameStats(db, legacy)
+    history.record_games([(_human_result(0), 2, ["你", "AI"], [(1, 0, "FateDrawn", None)]),
+                          (_human_result(1), 2, ["你", "AI"], ())])
+    # 另一个连接（如另一个进程）同时写入同一个库
+    main.GameStats(db, None).record_game(_human_result(0), 1)
+    stats = history.summary()
+    assert stats["by_difficulty"] == {1: (1, 0), 2: (1, 1)}
+    assert (stats["wins"], stats["losses"]) == (3 + 2, 2 + 1)
+    assert stats["total_damage_dealt"] == 10 + 3 * 5
+    assert stats["spirits_used"] == Counter(MIRROR=4 + 3)
+    assert stats["fate_cards_drawn"] == Counter(BACKLASH=5 + 6) # 只统计人类玩家
+    assert history.conn.execute("SELECT COUNT(*) FROM game_events").fetchone() == (1,)
+
+
+def test_failed_batch_is_rolled_back(paths):
+    db, legacy = paths
+    history = main.GameStats(db, legacy)
+    broken = SimpleNamespace(**{**vars(_human_result(0)), "damage_taken": None})
+    with pytest.raises(TypeError):
+        history.record_games([(_human_result(0), 2, None, ()), (broken, 2, None, ())])
+    assert history.conn.execute("SELECT COUNT(*) FROM games").fetchone() == (0,)
@@ -0,0 +1,66 @@
+"""热点路径计量：开关、计数与对局结果一致、多进程汇总和导出格式"""
+import json
+from collections import Counter
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def metrics():
+    metrics = main.Metrics()
+    originals = (main.Game.__dict__["_turn"], dict(main.SPIRIT_EFFECTS))
+    metrics.enable()
+    try: yield metrics
+    finally: metrics.disable()
+    assert main.Game.__dict__["_turn"] is originals[0]
+    assert main.SPIRIT_EFFECTS == originals[1]
+
+
+def _play(games):
+    return [main.simulate_game(main.ExpertAIPlayer, main.HardAIPlayer, seed=seed) for seed in range(games)]
+
+
+def _counter(metrics, name):
+    return Counter({labels[0][1]: value for (counter, labels), value in metrics.counters.items() if counter == name})
+
+
+def test_counters_match_game_results(metrics):
+    results = _play(20)
+    cards, spirits = Counter(), Counter()
+    for result in results:
+        for seat in (0, 1):
+            cards.update(result.fate_cards_drawn[seat])
+            spirits.update(result.spirits_used[seat])
+    assert _counter(metrics, "fate_cards_drawn_total") == cards
+    # 计量也包括被无线电强制使用的灵物，每次无线电至多多出一次
+    used = _counter(metrics, "spirits_used_total")
+    assert all(used[spirit] >= n for spirit, n in spirits.items())
+    assert sum(used.values()) - sum(spirits.values()) <= spirits["RADIO"]
+    assert metrics.histogram("turn_seconds").count >= sum(result.turns for result in results)
+
+
+def test_snapshots_merge_and_export(metrics):
+    _play(5)
+    snapshot = metrics.snapshot()
+    total = main.Metrics()
+    total.merge(snapshot)
+    total.merge(snapshot)
+    assert total.counters == Counter({key: 2 * value for key, value in metrics.counters.items()})
+    turns = metrics.histogram("turn_seconds")
+    assert total.histogram("turn_seconds").count == 2 * turns.count
+    data = json.loads(json.dumps(total.to_dict()))
+    assert {timer["name"] for timer in data["timers"]} >= {"turn_seconds", "draw_fate_card_seconds"}
+    text = total.to_prometheus()
+    assert "# TYPE fate_turn_seconds histogram" in text
+    assert f'fate_turn_seconds_bucket{{le="+Inf"}} {2 * turns.count}' in text
+    assert f"fate_turn_seconds_count {2 * turns.count}" in text
+
+
+def test_reset_keeps_instrumentation_working(metrics):
+    _play(2)
+    metrics.reset()
+    assert not metrics.counters and metrics.histogram("turn_seconds").count == 0
+    _play(2)
+    assert metrics.histogram("turn_seconds").count > 0
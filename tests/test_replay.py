@@ -0,0 +1,33 @@
+"""replay.py verify：回放对局日志并逐局检查"""
+import main
+import replay
+
+
+def _record(path, games):
+    logs = [main.simulate_game(main.ExpertAIPlayer, main.HardAIPlayer, seed=seed, record=True).log for seed in range(games)]
+    main.write_game_logs(path, logs)
+    return logs
+
+
+def test_replay_verify_accepts_recorded_games(tmp_path, capsys):
+    path = tmp_path / "games.frl"
+    _record(path, 20)
+    assert replay.verify(path, jobs=1, chunk_size=8) == 0
+    assert "全部一致" in capsys.readouterr().out
+
+
+def test_replay_verify_reports_tampered_games(tmp_path, capsys):
+    path = tmp_path / "games.frl"
+    logs = _record(path, 5)
+    # 把第一个命运牌抽取事件换成另一种牌，回放时应当不一致
+    log = logs[2]
+    pos = 0
+    while pos < len(log.events):
+        event_type, payload, end = main.GameLog._parse(log.events, pos)
+        if event_type == main.EVENT_FATE_DRAW:
+            log.events[pos + 1] = (payload[0] + 1) % len(main.FATE_CARD_KEYS)
+            break
+        pos = end
+    main.write_game_logs(path, logs)
+    assert replay.verify(path, jobs=1, chunk_size=8) == 1
+    assert "第 3 局" in capsys.readouterr().out
@@ -0,0 +1,36 @@
+"""搜索AI的后台预演不与前台决策共享随机源和搜索树"""
+import time
+
+import main
+
+
+def _game(searcher):
+    game = main.Game(headless=True, seed=5)
+    game.players = [searcher, main.HardAIPlayer()]
+    game._setup(0)
+    return game
+
+
+def test_ponder_uses_its_own_rng_and_merges_its_tree_when_stopped():
+    searcher = main.SearchAIPlayer(node_budget=20)
+    game = _game(searcher)
+    searcher.ponder(game)
+    state = searcher.rng.getstate() # 预演线程开始之后，前台的随机源不应再被它推进
+    time.sleep(0.2)
+    assert searcher.rng.getstate() == state
+    assert searcher.table == {}
+    searcher.ai_choose_telephone_position(10) # 任何决策入口都先停止预演
+    assert searcher._ponder_thread is None
+    report = searcher.search_report()
+    assert report["ponder_iterations"] > 0
+    assert report["table_size"] > 0
+    assert report["table_hits"] + report["table_misses"] > 0
+
+
+def test_search_after_ponder_builds_on_the_merged_tree():
+    searcher = main.SearchAIPlayer(node_budget=20)
+    game = _game(searcher)
+    searcher.ponder(game)
+    time.sleep(0.2)
+    searcher.ai_choose_action(game.players[1], game)
+    assert searcher.search_report()["ponder_hits"] == 1
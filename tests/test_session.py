@@ -0,0 +1,79 @@
+"""GameSession 按决策重新运行时，AI 的决策分布应与一次跑完的对局（simulate_game）相同"""
+import random
+
+import main
+
+GAMES = 40
+
+
+class _RecordingHard(main.HardAIPlayer):
+    """记下每个回合的第一个行动是否使用灵物。会话只在新决策时调用AI，重新运行取回的旧决策不会重复记录"""
+    turns = None
+
+    def ai_choose_action(self, opponent, game):
+        action = super().ai_choose_action(opponent, game)
+        if game.turn_count not in self.turns: self.turns[game.turn_count] = action != "fate_card"
+        return action
+
+
+def _play_session(seed, seats, answer_ai=None):
+    """人类座位随机回答；answer_ai 给出时AI座位不在会话内计算，而由 answer_ai(session) 给出决策编码"""
+    session = main.GameSession(seats, ["人", "AI"], seed=seed, inline_ai=answer_ai is None)
+    rng = random.Random(seed)
+    session.advance()
+    while not session.finished:
+        if session.pending.seat == 0: session.answer(rng.randrange(len(session.pending.options)))
+        else: session.answer_code(answer_ai(session))
+        session.advance()
+
+
+def _switch_rate(games):
+    """相邻两个回合的第一个行动（使用灵物/命运卡牌）不同的比例"""
+    pairs = switches = 0
+    for turns in games:
+        first_actions = [turns[turn] for turn in sorted(turns)]
+        pairs += max(len(first_actions) - 1, 0)
+        switches += sum(a != b for a, b in zip(first_actions, first_actions[1:]))
+    return switches / pairs
+
+
+def _simulated_games():
+    games = []
+    for seed in range(GAMES):
+        _RecordingHard.turns = {}
+        main.simulate_game(main.HardAIPlayer, _RecordingHard, seed=seed)
+        games.append(_RecordingHard.turns)
+    return games
+
+
+def test_session_ai_randomness_matches_simulated_games():
+    games = []
+    for seed in range(GAMES):
+        _RecordingHard.turns = {}
+        _play_session(seed, [None, _RecordingHard])
+        games.append(_RecordingHard.turns)
+    # 每个决策各自取随机数时，约有一半的相邻回合第一个行动不同；随机源被冻结时几乎总是相同
+    assert abs(_switch_rate(games) - _switch_rate(_simulated_games())) < 0.12
+
+
+def test_compute_pending_fallback_draws_per_decision():
+    """服务器的工作池结果和超时兜底（compute_pending 换成别的AI）同样按决策历史取随机源"""
+    games = []
+    for seed in range(GAMES):
+        _RecordingHard.turns = {}
+        _play_session(seed, [None, main.ExpertAIPlayer], lambda session: session.compute_pending(_RecordingHard))
+        games.append(_RecordingHard.turns)
+    assert abs(_switch_rate(games) - _switch_rate(_simulated_games())) < 0.12
+
+
+def test_compute_pending_is_repeatable():
+    session = main.GameSession([None, main.HardAIPlayer], ["人", "AI"], seed=6, inline_ai=False)
+    rng = random.Random(6)
+    session.advance()
+    while not session.finished:
+        if session.pending.seat == 0: session.answer(rng.randrange(len(session.pending.options)))
+        else:
+            code = session.compute_pending()
+            assert session.compute_pending() == code
+            session.answer_code(code)
+        session.advance()
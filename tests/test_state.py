@@ -0,0 +1,48 @@
+"""状态位压缩和局面键的往返"""
+import random
+
+import main
+
+
+def test_status_pack_round_trip():
+    rng = random.Random(0)
+    for _ in range(500):
+        status = main.PlayerStatus()
+        status.amulet_turns = rng.randrange(4)
+        status.pillow_immunity = rng.randrange(4)
+        status.red_potion_bonus = rng.randrange(16)
+        for field in main.PlayerStatus.FLAG_FIELDS: setattr(status, field, rng.random() < 0.5)
+        copy = main.PlayerStatus().unpack(status.pack())
+        assert all(getattr(copy, name) == getattr(status, name) for name in main.PlayerStatus.__slots__)
+        assert 0 <= status.pack() < 1 << 16
+
+
+def _game(seed):
+    game = main.Game(headless=True, seed=seed)
+    game.players = [main.ExpertAIPlayer("甲"), main.HardAIPlayer("乙")]
+    game._setup(0)
+    return game
+
+
+def test_game_state_key_round_trips_mid_game():
+    for seed in range(20):
+        game = _game(seed)
+        for _ in range(6):
+            game._turn()
+            game._check_game_over()
+            if game.game_over: break
+            game._switch_player()
+        key = game.state_key()
+        hash(key)
+        copy = _game(seed + 1000)
+        copy.restore_state(key)
+        assert copy.state_key() == key
+        assert list(copy.fate_deck) == list(game.fate_deck)
+        assert sorted(copy.players[0].spirits) == sorted(game.players[0].spirits)
+
+
+def test_state_key_ignores_hand_order():
+    game = _game(1)
+    key = game.state_key()
+    game.players[0].spirits.reverse()
+    assert game.state_key() == key
@@ -0,0 +1,15 @@
+"""sweep.py 的结果表格在中英文混排时按显示宽度对齐"""
+import main
+import sweep
+
+
+def test_report_columns_align_with_mixed_labels(capsys):
+    row = {"win_rate": 0.435, "win_rate_ci95": 0.069, "average_turns": 11.02, "average_turns_ci95": 0.66,
+           "draw_rate": 0.0, "first_player_advantage": 0.065, "first_player_advantage_ci95": 0.069}
+    report = {"players": ["甲", "乙"], "games": 400, "seconds": 1.0,
+              "variants": [dict(row, config={"max_hp": 4}), dict(row, config={})]}
+    sweep.print_report(report)
+    lines = capsys.readouterr().out.splitlines()[-3:]
+    assert len({main.display_width(line) for line in lines}) == 1
+    prefixes = [line[:line.index("43.5%")] for line in lines[1:]]
+    assert main.display_width(prefixes[0]) == main.display_width(prefixes[1])
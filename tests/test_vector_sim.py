@@ -0,0 +1,15 @@
+"""vector_sim.py：向量化模拟器与对象引擎的结果分布一致"""
+import pytest
+
+import main
+import vector_sim
+
+ALPHA = 0.001
+
+
+@pytest.mark.parametrize("first, second", [(main.HardAIPlayer, main.HardAIPlayer), (main.ExpertAIPlayer, main.HardAIPlayer)])
+def test_vector_sim_parity(first, second):
+    checks = vector_sim.parity_checks(vector_sim.simulate_batch(first, second, 400, seed=1),
+                                      vector_sim.object_results(first, second, 400, 1, jobs=1))
+    threshold = ALPHA / len(checks)
+    assert [name for name, _, _, p in checks if p < threshold] == []
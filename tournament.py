@@ -0,0 +1,271 @@
+"""命运轮盘 AI 循环赛
+
+在进程池中并行运行所有 AI 之间的无头对局（双方先后手各一半，每局种子固定），
+输出胜率矩阵、平均对局长度以及带置信区间的 Elo / Bradley-Terry 评分。
+
+用法示例:
+    python tournament.py --games 100000 --jobs 8 --json results.json
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import sys
+import time
+
+import main
+
+ELO_SCALE = 400 / math.log(10)
+ELO_BASE = 1500
+
+
+def discover_ai_classes():
+    """收集 main 中 BaseAIPlayer 的所有子类（包含以后新增的难度）"""
+    found = []
+    pending = list(main.BaseAIPlayer.__subclasses__())
+    while pending:
+        cls = pending.pop(0)
+        # 下划线开头的是内部辅助类（如搜索推演用的玩家），不参赛
+        if cls not in found and not cls.__name__.startswith("_"): found.append(cls)
+        pending.extend(cls.__subclasses__())
+    return found
+
+
+def game_seed(base_seed, pair_index, game_index):
+    """每局的确定性种子：同一参数下重跑结果完全一致"""
+    return (base_seed * 1_000_003 + pair_index) * 10_000_019 + game_index
+
+
+_history = None # 工作进程各自持有的历史库连接（--history）
+
+
+def _init_worker(search_nodes, history_path, metrics=False):
+    global _history
+    # 循环赛中搜索AI按固定推演局数决策，既保证速度也保证同一种子结果可复现
+    main.SearchAIPlayer.node_budget = search_nodes
+    if history_path: _history = main.GameStats(history_path, legacy_filename=None)
+    if metrics: main.METRICS.enable()
+
+
+def _play_chunk(task):
+    """工作进程：连续下若干局并只回传聚合计数，减少进程间通信"""
+    pair_index, first_cls, second_cls, start, count, base_seed, max_turns = task
+    # counts: [先座位胜, 后座位胜, 平局, 总回合数, 先手方胜]
+    counts = [0, 0, 0, 0, 0]
+    results = []
+    for game_index in range(start, start + count):
+        # 同一种子下交换先后手各下一局，抵消先手优势带来的方差
+        seed = game_seed(base_seed, pair_index, game_index)
+        for first_player in (0, 1):
+            result = main.simulate_game(first_cls, second_cls, seed=seed, first_player=first_player, max_turns=max_turns)
+            if result.winner is None: counts[2] += 1
+            else:
+                counts[result.winner] += 1
+                if result.winner == first_player: counts[4] += 1
+            counts[3] += result.turns
+            if _history is not None: results.append((result, None, None, ()))
+    # 每个任务一次性批量写入，WAL 模式下各进程的短事务互不阻塞读取
+    if results: _history.record_games(results)
+    # 开启计量时把本任务的计时数据带回主进程汇总
+    snapshot = None
+    if main.METRICS.enabled:
+        snapshot = main.METRICS.snapshot()
+        main.METRICS.reset()
+    return pair_index, count * 2, counts, snapshot
+
+
+def build_tasks(classes, games_per_pair, chunk_size, base_seed, max_turns):
+    pairs = [(i, j) for i in range(len(classes)) for j in range(i + 1, len(classes))]
+    tasks = []
+    # 每个种子会下两局（交换先后手），因此种子数为对局数的一半
+    seeds_per_pair = max(1, games_per_pair // 2)
+    for pair_index, (i, j) in enumerate(pairs):
+        for start in range(0, seeds_per_pair, chunk_size):
+            count = min(chunk_size, seeds_per_pair - start)
+            tasks.append((pair_index, classes[i], classes[j], start, count, base_seed, max_turns))
+    return pairs, tasks
+
+
+def _solve_linear(matrix, vector):
+    """高斯-约当消元（参赛者数量很少，无需引入 numpy）"""
+    n = len(vector)
+    aug = [row[:] + [vector[r]] for r, row in enumerate(matrix)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(aug[r][col]))
+        aug[col], aug[pivot] = aug[pivot], aug[col]
+        div = aug[col][col]
+        if div == 0: raise ZeroDivisionError("singular matrix")
+        aug[col] = [v / div for v in aug[col]]
+        for r in range(n):
+            if r != col and aug[r][col]:
+                factor = aug[r][col]
+                aug[r] = [v - factor * p for v, p in zip(aug[r], aug[col])]
+    return [row[n] for row in aug]
+
+
+def bradley_terry(wins, iterations=1000, tolerance=1e-10):
+    """用 MM 算法拟合 Bradley-Terry 强度；wins[i][j] 为 i 胜 j 的局数（平局各记 0.5）
+
+    返回 (Elo 评分列表, Elo 标准误列表)。标准误来自 Fisher 信息矩阵的伪逆，
+    评分以平均值 ELO_BASE 为基准。
+    """
+    n = len(wins)
+    games = [[wins[i][j] + wins[j][i] for j in range(n)] for i in range(n)]
+    strength = [1.0] * n
+    for _ in range(iterations):
+        updated = []
+        for i in range(n):
+            total_wins = sum(wins[i])
+            denom = sum(games[i][j] / (strength[i] + strength[j]) for j in range(n) if j != i and games[i][j])
+            # 全胜或全负时 MLE 不存在，加一个极小的先验避免发散
+            updated.append(max(total_wins, 0.5) / denom if denom else strength[i])
+        log_mean = sum(math.log(s) for s in updated) / n
+        updated = [s / math.exp(log_mean) for s in updated]
+        converged = max(abs(a - b) for a, b in zip(updated, strength)) < tolerance
+        strength = updated
+        if converged: break
+    theta = [math.log(s) for s in strength]
+
+    # Fisher 信息矩阵是图拉普拉斯形式，伪逆 = (I + J/n)^-1 - J/n
+    info = [[0.0] * n for _ in range(n)]
+    for i in range(n):
+        for j in range(n):
+            if i == j or not games[i][j]: continue
+            p = strength[i] / (strength[i] + strength[j])
+            w = games[i][j] * p * (1 - p)
+            info[i][j] -= w
+            info[i][i] += w
+    shifted = [[info[i][j] + 1 / n for j in range(n)] for i in range(n)]
+    errors = []
+    for i in range(n):
+        try:
+            column = _solve_linear(shifted, [1.0 if r == i else 0.0 for r in range(n)])
+            variance = column[i] - 1 / n
+            errors.append(ELO_SCALE * math.sqrt(variance) if variance > 0 else 0.0)
+        except ZeroDivisionError:
+            errors.append(float("inf"))
+    return [ELO_BASE + ELO_SCALE * t for t in theta], errors
+
+
+def run_tournament(classes, games_per_pair, jobs, chunk_size=250, base_seed=0, max_turns=main.HEADLESS_MAX_TURNS, progress=True, search_nodes=100, history_path=None, metrics_path=None):
+    pairs, tasks = build_tasks(classes, games_per_pair, chunk_size, base_seed, max_turns)
+    totals = {pair_index: [0, 0, 0, 0, 0, 0] for pair_index in range(len(pairs))} # 最后一项为局数
+    total_games = sum(task[4] * 2 for task in tasks)
+    done = 0
+    started = last_report = time.perf_counter()
+    with multiprocessing.Pool(processes=jobs, initializer=_init_worker, initargs=(search_nodes, history_path, bool(metrics_path))) as pool:
+        for pair_index, played, counts, snapshot in pool.imap_unordered(_play_chunk, tasks):
+            if snapshot is not None: main.METRICS.merge(snapshot)
+            bucket = totals[pair_index]
+            for k, v in enumerate(counts): bucket[k] += v
+            bucket[5] += played
+            done += played
+            now = time.perf_counter()
+            if progress and (now - last_report > 0.2 or done == total_games):
+                last_report = now
+                elapsed = now - started
+                rate = done / elapsed if elapsed > 0 else 0
+                eta = (total_games - done) / rate if rate else 0
+                sys.stderr.write(f"\r进度 {done}/{total_games} 局 ({done / total_games:6.1%})  {rate:,.0f} 局/秒  剩余约 {eta:,.0f} 秒 ")
+                sys.stderr.flush()
+    if progress: sys.stderr.write("\n")
+    elapsed = time.perf_counter() - started
+    if metrics_path: main.METRICS.dump(metrics_path)
+
+    n = len(classes)
+    wins = [[0.0] * n for _ in range(n)]
+    played = [[0] * n for _ in range(n)]
+    turns = [[0] * n for _ in range(n)]
+    first_mover_wins = decided = 0
+    for pair_index, (i, j) in enumerate(pairs):
+        w_i, w_j, draws, turn_sum, first_wins, games = totals[pair_index]
+        wins[i][j] += w_i + draws / 2
+        wins[j][i] += w_j + draws / 2
+        played[i][j] = played[j][i] = games
+        turns[i][j] = turns[j][i] = turn_sum
+        first_mover_wins += first_wins
+        decided += games - draws
+    ratings, errors = bradley_terry(wins)
+    return {
+        "players": [cls.__name__ for cls in classes],
+        "games": total_games,
+        "seconds": elapsed,
+        "wins": wins,
+        "played": played,
+        "average_turns": [[turns[i][j] / played[i][j] if played[i][j] else None for j in range(n)] for i in range(n)],
+        "first_mover_win_rate": first_mover_wins / decided if decided else None,
+        "elo": ratings,
+        "elo_ci95": [1.96 * e for e in errors],
+    }
+
+
+def print_report(report):
+    names = report["players"]
+    n = len(names)
+    width = max(len(name) for name in names) + 2
+    print(f"\n共 {report['games']:,} 局，用时 {report['seconds']:.1f} 秒（{report['games'] / max(report['seconds'], 1e-9):,.0f} 局/秒）")
+
+    print("\n--- 胜率矩阵（行对列） ---")
+    print(" " * width + "".join(name.rjust(width) for name in names))
+    for i in range(n):
+        cells = []
+        for j in range(n):
+            games = report["played"][i][j]
+            cells.append(("-" if not games else f"{report['wins'][i][j] / games:.1%}").rjust(width))
+        print(names[i].ljust(width) + "".join(cells))
+
+    print("\n--- 平均对局长度（回合） ---")
+    print(" " * width + "".join(name.rjust(width) for name in names))
+    for i in range(n):
+        cells = [("-" if v is None else f"{v:.2f}").rjust(width) for v in report["average_turns"][i]]
+        print(names[i].ljust(width) + "".join(cells))
+
+    if report["first_mover_win_rate"] is not None:
+        print(f"\n先手胜率: {report['first_mover_win_rate']:.2%}")
+
+    print("\n--- Elo / Bradley-Terry 评分（95% 置信区间） ---")
+    order = sorted(range(n), key=lambda k: report["elo"][k], reverse=True)
+    for rank, k in enumerate(order, 1):
+        print(f"{rank}. {names[k].ljust(width)} {report['elo'][k]:7.1f} ± {report['elo_ci95'][k]:.1f}")
+
+    # 检查菜单中的难度阶梯是否与实测强度一致
+    ladder = [cls.__name__ for level, (_, cls) in sorted(main.DIFFICULTY_LEVELS.items()) if cls.__name__ in names]
+    elo_by_name = dict(zip(names, report["elo"]))
+    ordered = all(elo_by_name[a] < elo_by_name[b] for a, b in zip(ladder, ladder[1:]))
+    print("\n难度阶梯 " + " → ".join(ladder) + (" 与实测强度一致。" if ordered else " 与实测强度不一致！"))
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="命运轮盘 AI 循环赛")
+    parser.add_argument("--games", type=int, default=10000, help="每组对阵的总局数（先后手各一半）")
+    parser.add_argument("--jobs", type=int, default=multiprocessing.cpu_count(), help="工作进程数")
+    parser.add_argument("--chunk", type=int, default=250, help="每个任务包含的种子数")
+    parser.add_argument("--seed", type=int, default=0, help="基础随机种子")
+    parser.add_argument("--max-turns", type=int, default=main.HEADLESS_MAX_TURNS, help="单局回合上限")
+    parser.add_argument("--players", nargs="*", help="只让指定的 AI 类参赛（默认全部）")
+    parser.add_argument("--search-nodes", type=int, default=100, help="搜索AI每次决策的推演局数")
+    parser.add_argument("--json", help="将完整结果写入 JSON 文件")
+    parser.add_argument("--history", help="把每一局写入 SQLite 对局历史库（如 fate_history.db）")
+    parser.add_argument("--metrics", help="开启热点路径计量，结束时写入该文件（.json 为 JSON，其它为 Prometheus 文本）")
+    parser.add_argument("--quiet", action="store_true", help="不显示实时进度")
+    main.add_ai_file_arguments(parser)
+    args = parser.parse_args(argv)
+    main.load_ai_files(args)
+
+    classes = discover_ai_classes()
+    if args.players:
+        by_name = {cls.__name__: cls for cls in classes}
+        unknown = [name for name in args.players if name not in by_name]
+        if unknown: parser.error(f"未知的 AI 类: {', '.join(unknown)}")
+        classes = [by_name[name] for name in args.players]
+    if len(classes) < 2: parser.error("至少需要两个 AI 参赛")
+
+    report = run_tournament(classes, args.games, args.jobs, args.chunk, args.seed, args.max_turns, progress=not args.quiet, search_nodes=args.search_nodes, history_path=args.history, metrics_path=args.metrics)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main_cli()
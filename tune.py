@@ -0,0 +1,342 @@
+"""命运轮盘专家AI权重调优
+
+把 main.EXPERT_WEIGHTS 中的评分权重展开成参数向量，用进化策略（对角协方差的
+CMA-ES 简化版）在进程池中自我对弈优化：每代的候选权重都与当前权重在同一批
+固定种子上交换先后手对弈，明显落后的候选按置信区间提前淘汰；新的均值通过
+验证对局显著胜出才会被接受，连续若干代没有进步就停止。
+
+结果写成带版本号的权重文件；安装为 fate_ai_weights.json 后，各命令行入口用 --ai-weights 加载。
+
+用法示例:
+    python tune.py --generations 30 --jobs 8                 # 调优并写出 weights/fate_ai_weights_vN.json
+    python tune.py --generations 30 --install                # 同时安装为当前权重
+    python tune.py --ai-weights --generations 30             # 从已安装的权重继续调优
+    python tune.py --evaluate weights/fate_ai_weights_v3.json  # 只评估某个权重文件对默认权重的胜率
+"""
+import argparse
+import datetime
+import glob
+import json
+import math
+import multiprocessing
+import os
+import random
+import re
+import shutil
+import sys
+import time
+
+import main
+
+Z_SCORE = 1.96 # 淘汰候选与接受新权重所用的置信水平（95%）
+PROBABILITY_KEYS = ("threat_probability", "self_target_confidence") # 取值限制在 [0, 1]
+MULTIPLIER_KEYS = ("aggressive_multiplier", "defensive_multiplier") # 必须为正
+
+
+class _Candidate(main.ExpertAIPlayer):
+    """调优中的候选权重（工作进程内按任务替换类属性）"""
+
+
+class _Incumbent(main.ExpertAIPlayer):
+    """当前被挑战的权重"""
+
+
+# --- 参数向量 ---
+
+def parameter_keys():
+    return sorted(main.EXPERT_WEIGHTS)
+
+
+def parameter_scales(keys):
+    """归一化空间中 1 个单位对应的原始数值：概率为 0.1，倍率为 0.25，其余为默认值的量级"""
+    scales = []
+    for key in keys:
+        if key in PROBABILITY_KEYS: scales.append(0.1)
+        elif key in MULTIPLIER_KEYS: scales.append(0.25)
+        else: scales.append(max(abs(main.EXPERT_WEIGHTS[key]), 10))
+    return scales
+
+
+def to_weights(keys, scales, origin, x):
+    """归一化向量 → 权重字典（以 origin 为原点，并做取值范围的裁剪）"""
+    weights = {}
+    for key, scale, x_k in zip(keys, scales, x):
+        value = origin[key] + x_k * scale
+        if key in PROBABILITY_KEYS: value = min(max(value, 0.0), 1.0)
+        elif key in MULTIPLIER_KEYS: value = max(value, 0.1)
+        weights[key] = round(value, 4)
+    return weights
+
+
+# --- 对局评估（工作进程） ---
+
+def _play_pairs(task):
+    """工作进程：候选与当前权重在每个种子上交换先后手各下一局，返回每个种子的得分（0~2，平局记半分）"""
+    index, candidate, incumbent, seeds, max_turns = task
+    _Candidate.weights = candidate
+    _Incumbent.weights = incumbent
+    scores = []
+    for seed in seeds:
+        score = 0.0
+        for first_player in (0, 1):
+            result = main.simulate_game(_Candidate, _Incumbent, seed=seed, first_player=first_player, max_turns=max_turns)
+            if result.winner is None: score += 0.5
+            elif result.winner == 0: score += 1
+        scores.append(score)
+    return index, scores
+
+
+class Tally:
+    """按种子对累积得分，给出胜率及其正态近似置信区间"""
+    __slots__ = ("n", "total", "total_sq")
+
+    def __init__(self):
+        self.n = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def add(self, scores):
+        for s in scores:
+            self.n += 1
+            self.total += s
+            self.total_sq += s * s
+
+    @property
+    def win_rate(self):
+        return self.total / (2 * self.n) if self.n else 0.5
+
+    @property
+    def error(self):
+        if self.n < 2: return 0.5
+        mean = self.total / self.n
+        variance = max(self.total_sq / self.n - mean * mean, 0.0) * self.n / (self.n - 1)
+        return math.sqrt(variance / self.n) / 2
+
+    def bounds(self, z=Z_SCORE):
+        return self.win_rate - z * self.error, self.win_rate + z * self.error
+
+
+def race(pool, jobs, candidates, incumbent, seeds, batch, keep, max_turns):
+    """竞速评估：按批次给仍存活的候选加对局，上界已无法进入前 keep 名的候选提前淘汰。
+
+    所有候选使用同一批种子（公共随机数），比较的是同一组牌局下的表现差异。
+    返回每个候选的 Tally 以及实际对局数。
+    """
+    tallies = [Tally() for _ in candidates]
+    alive = set(range(len(candidates)))
+    games = 0
+    for start in range(0, len(seeds), batch):
+        chunk = seeds[start:start + batch]
+        # 每个候选的一批种子再切给多个进程
+        step = max(1, len(chunk) // jobs)
+        tasks = [(i, candidates[i], incumbent, chunk[k:k + step], max_turns) for i in sorted(alive) for k in range(0, len(chunk), step)]
+        for i, scores in pool.imap_unordered(_play_pairs, tasks):
+            tallies[i].add(scores)
+            games += 2 * len(scores)
+        if len(alive) <= keep: continue
+        cutoff = sorted((tallies[i].bounds()[0] for i in alive), reverse=True)[keep - 1]
+        alive = {i for i in alive if tallies[i].bounds()[1] >= cutoff}
+    return tallies, alive, games
+
+
+def evaluate(pool, jobs, candidate, incumbent, seeds, max_turns):
+    tallies, _, games = race(pool, jobs, [candidate], incumbent, seeds, len(seeds), 1, max_turns)
+    return tallies[0], games
+
+
+# --- 进化策略 ---
+
+class DiagonalES:
+    """(μ/μ_w, λ) 进化策略，步长按累积路径长度自适应，协方差只保留对角线（sep-CMA-ES）"""
+
+    def __init__(self, dimension, sigma, population, rng):
+        self.n = dimension
+        self.sigma = sigma
+        self.rng = rng
+        self.population = population
+        self.mu = population // 2
+        raw = [math.log(self.mu + 0.5) - math.log(i + 1) for i in range(self.mu)]
+        self.recombination = [r / sum(raw) for r in raw]
+        self.mu_eff = 1 / sum(w * w for w in self.recombination)
+        n = dimension
+        self.c_sigma = (self.mu_eff + 2) / (n + self.mu_eff + 5)
+        self.d_sigma = 1 + 2 * max(0.0, math.sqrt((self.mu_eff - 1) / (n + 1)) - 1) + self.c_sigma
+        self.c_c = (4 + self.mu_eff / n) / (n + 4 + 2 * self.mu_eff / n)
+        # 只学习对角线时学习率可以放大 (n + 2) / 3 倍
+        self.c_1 = 2 / ((n + 1.3) ** 2 + self.mu_eff) * (n + 2) / 3
+        self.c_mu = min(1 - self.c_1, 2 * (self.mu_eff - 2 + 1 / self.mu_eff) / ((n + 2) ** 2 + self.mu_eff) * (n + 2) / 3)
+        self.expected_norm = math.sqrt(n) * (1 - 1 / (4 * n) + 1 / (21 * n * n))
+        self.mean = [0.0] * n
+        self.variance = [1.0] * n
+        self.path_sigma = [0.0] * n
+        self.path_c = [0.0] * n
+        self.generation = 0
+
+    def ask(self):
+        """采样一代候选，返回 (z, x) 列表：z 为标准正态噪声，x 为归一化空间中的点"""
+        offspring = []
+        for _ in range(self.population):
+            z = [self.rng.gauss(0, 1) for _ in range(self.n)]
+            x = [m + self.sigma * math.sqrt(v) * z_k for m, v, z_k in zip(self.mean, self.variance, z)]
+            offspring.append((z, x))
+        return offspring
+
+    def tell(self, ranked):
+        """ranked: 按成绩从好到坏排列的 (z, x)；至少需要 μ 个"""
+        self.generation += 1
+        elite = ranked[:self.mu]
+        weights = self.recombination[:len(elite)]
+        total = sum(weights)
+        weights = [w / total for w in weights]
+        z_mean = [sum(w * z[k] for w, (z, _) in zip(weights, elite)) for k in range(self.n)]
+        y_mean = [math.sqrt(v) * z_k for v, z_k in zip(self.variance, z_mean)]
+        self.mean = [m + self.sigma * y for m, y in zip(self.mean, y_mean)]
+        norm = math.sqrt(self.c_sigma * (2 - self.c_sigma) * self.mu_eff)
+        self.path_sigma = [(1 - self.c_sigma) * p + norm * z_k for p, z_k in zip(self.path_sigma, z_mean)]
+        path_norm = math.sqrt(sum(p * p for p in self.path_sigma))
+        h_sigma = path_norm / math.sqrt(1 - (1 - self.c_sigma) ** (2 * self.generation)) / self.expected_norm < 1.4 + 2 / (self.n + 1)
+        norm = math.sqrt(self.c_c * (2 - self.c_c) * self.mu_eff)
+        self.path_c = [(1 - self.c_c) * p + (norm * y if h_sigma else 0.0) for p, y in zip(self.path_c, y_mean)]
+        for k in range(self.n):
+            rank_mu = sum(w * self.variance[k] * z[k] * z[k] for w, (z, _) in zip(weights, elite))
+            self.variance[k] = (1 - self.c_1 - self.c_mu) * self.variance[k] + self.c_1 * self.path_c[k] ** 2 + self.c_mu * rank_mu
+        self.sigma *= math.exp(self.c_sigma / self.d_sigma * (path_norm / self.expected_norm - 1))
+
+
+# --- 权重文件 ---
+
+def next_version(out_dir):
+    versions = [int(m.group(1)) for path in glob.glob(os.path.join(out_dir, "fate_ai_weights_v*.json"))
+                if (m := re.search(r"_v(\d+)\.json$", path))]
+    return max(versions, default=0) + 1
+
+
+def write_weights_file(out_dir, class_name, weights, parent, evaluation, settings):
+    os.makedirs(out_dir, exist_ok=True)
+    version = next_version(out_dir)
+    # 只写出与默认值不同的键，文件一目了然，以后新增的权重也会沿用默认值
+    changed = {k: v for k, v in weights.items() if v != main.EXPERT_WEIGHTS[k]}
+    data = {
+        "version": version,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "parent": parent,
+        "classes": {class_name: changed},
+        "evaluation": evaluation,
+        "settings": settings,
+    }
+    path = os.path.join(out_dir, f"fate_ai_weights_v{version}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4, ensure_ascii=False)
+    return path
+
+
+def tune(args):
+    keys = parameter_keys()
+    scales = parameter_scales(keys)
+    target = getattr(main, args.target)
+    origin = dict(target.weights) # 从已加载的权重（或默认值）出发
+    incumbent = dict(origin)
+    rng = random.Random(args.seed)
+    es = DiagonalES(len(keys), args.sigma, args.population, rng)
+    seed_counter = args.seed * 1_000_003
+    validation_seeds = [10_000_019 * (args.seed + 1) + k for k in range(args.validation)]
+    patience = args.patience
+    total_games = 0
+    started = time.perf_counter()
+    history = []
+    with multiprocessing.Pool(processes=args.jobs) as pool:
+        for generation in range(1, args.generations + 1):
+            offspring = es.ask()
+            candidates = [to_weights(keys, scales, origin, x) for _, x in offspring]
+            # 每代换一批新种子，避免过拟合到固定牌局
+            seeds = list(range(seed_counter, seed_counter + args.games))
+            seed_counter += args.games
+            tallies, alive, games = race(pool, args.jobs, candidates, incumbent, seeds, args.batch, es.mu, args.max_turns)
+            total_games += games
+            order = sorted(range(len(offspring)), key=lambda i: (i in alive, tallies[i].win_rate), reverse=True)
+            es.tell([offspring[i] for i in order])
+
+            # 新的均值必须在验证种子上显著胜过当前权重才接受
+            proposal = to_weights(keys, scales, origin, es.mean)
+            tally, games = evaluate(pool, args.jobs, proposal, incumbent, validation_seeds, args.max_turns)
+            total_games += games
+            low, high = tally.bounds()
+            accepted = low > 0.5
+            if accepted:
+                incumbent = proposal
+                patience = args.patience
+            else:
+                patience -= 1
+            best = tallies[order[0]]
+            history.append({"generation": generation, "best_win_rate": best.win_rate, "mean_win_rate": tally.win_rate, "accepted": accepted, "sigma": es.sigma})
+            sys.stderr.write(f"第 {generation} 代  最佳候选 {best.win_rate:.1%}（存活 {len(alive)}/{len(offspring)}）  "
+                             f"均值 {tally.win_rate:.1%} [{low:.1%}, {high:.1%}] {'接受' if accepted else '保留'}  "
+                             f"σ={es.sigma:.3f}  累计 {total_games:,} 局  {time.perf_counter() - started:,.0f} 秒\n")
+            if patience <= 0:
+                sys.stderr.write(f"连续 {args.patience} 代没有显著进步，停止。\n")
+                break
+
+        # 最终权重与调优起点在独立的种子上比较，写入文件备查
+        final_seeds = [20_000_003 * (args.seed + 1) + k for k in range(args.validation)]
+        tally, games = evaluate(pool, args.jobs, incumbent, origin, final_seeds, args.max_turns)
+    low, high = tally.bounds()
+    evaluation = {
+        "opponent": "parent",
+        "win_rate": tally.win_rate,
+        "ci95": [low, high],
+        "games": games,
+        "tuning_games": total_games,
+        "generations": history,
+    }
+    settings = {k: getattr(args, k) for k in ("population", "games", "batch", "validation", "sigma", "seed", "max_turns")}
+    print(f"调优结果对起点权重的胜率: {tally.win_rate:.2%} [{low:.2%}, {high:.2%}]，共 {games:,} 局")
+    if incumbent == origin:
+        print("没有找到显著更好的权重，不写出文件。")
+        return None
+    path = write_weights_file(args.out_dir, args.target, incumbent, main.AI_WEIGHTS_VERSION, evaluation, settings)
+    print(f"已写入 {path}")
+    if args.install:
+        shutil.copyfile(path, main.AI_WEIGHTS_FILE)
+        print(f"已安装为 {main.AI_WEIGHTS_FILE}")
+    return path
+
+
+def evaluate_file(args):
+    with open(args.evaluate, encoding="utf-8") as f: data = json.load(f)
+    weights = {**main.EXPERT_WEIGHTS, **data["classes"].get(args.target, {})}
+    seeds = [20_000_003 * (args.seed + 1) + k for k in range(args.validation)]
+    with multiprocessing.Pool(processes=args.jobs) as pool:
+        tally, games = evaluate(pool, args.jobs, weights, dict(main.EXPERT_WEIGHTS), seeds, args.max_turns)
+    low, high = tally.bounds()
+    print(f"版本 {data.get('version')} 对默认权重的胜率: {tally.win_rate:.2%} [{low:.2%}, {high:.2%}]，共 {games:,} 局")
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="专家AI权重自我对弈调优")
+    parser.add_argument("--generations", type=int, default=30, help="最多进化代数")
+    parser.add_argument("--population", type=int, default=12, help="每代候选数 λ")
+    parser.add_argument("--games", type=int, default=400, help="每个候选最多对弈的种子数（每个种子交换先后手下两局）")
+    parser.add_argument("--batch", type=int, default=100, help="竞速淘汰的批次大小（种子数）")
+    parser.add_argument("--validation", type=int, default=2000, help="验证新权重所用的种子数")
+    parser.add_argument("--patience", type=int, default=5, help="连续多少代没有显著进步就停止")
+    parser.add_argument("--sigma", type=float, default=0.3, help="初始步长（归一化空间）")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--max-turns", type=int, default=main.HEADLESS_MAX_TURNS, help="单局回合上限")
+    parser.add_argument("--jobs", type=int, default=multiprocessing.cpu_count(), help="工作进程数")
+    parser.add_argument("--target", default="ExpertAIPlayer", help="写入权重文件的AI类（其子类随之继承）")
+    parser.add_argument("--out-dir", default="weights", help="版本化权重文件的输出目录")
+    parser.add_argument("--install", action="store_true", help=f"把结果复制为 {main.AI_WEIGHTS_FILE}（之后用 --ai-weights 加载）")
+    parser.add_argument("--evaluate", help="只评估指定权重文件对默认权重的胜率")
+    main.add_ai_file_arguments(parser)
+    args = parser.parse_args(argv)
+    main.load_ai_files(args)
+    target = getattr(main, args.target, None)
+    if not (isinstance(target, type) and issubclass(target, main.ExpertAIPlayer)):
+        parser.error(f"{args.target} 不是专家AI类")
+    if args.population < 4: parser.error("--population 至少为 4")
+    if args.evaluate: evaluate_file(args)
+    else: tune(args)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,1023 @@
+"""命运轮盘向量化批量模拟器
+
+把 K 局对局放进一组 NumPy 数组（生命值、灵物计数向量、状态位字段、命运牌堆、灵物牌堆），
+所有对局同步推进：每一步里，处于回合开始、行动和回合结束阶段的对局各自按掩码批量结算。
+某局结束后它占用的通道立即装入新的一局，直到下满指定局数。
+
+规则与 main.Game 一一对应（包括回合中生命值归零不立即判负、契约书的最终回合、遥控器、
+被强制使用的灵物由无线电使用者做决定等细节）。支持困难AI的随机策略和专家AI的表驱动策略；
+专家AI的牌堆信念按位置保存为概率矩阵，与 DeckBelief 的更新规则相同。
+手牌只记录计数，与顺序有关的平局（专家AI在得分相同的灵物中取先拿到的那个）按张数比例随机打破。
+
+两个引擎使用不同的随机源，因此比较的是分布而不是逐局结果：parity 子命令分别用两个引擎
+下同样多的局，对胜率、回合数分布、伤害、灵物和命运卡牌的使用频率做统计检验。
+
+用法示例:
+    python vector_sim.py run --players HardAIPlayer ExpertAIPlayer --games 200000
+    python vector_sim.py parity --players HardAIPlayer HardAIPlayer --games 20000 --jobs 8
+"""
+import argparse
+import math
+import multiprocessing
+import sys
+import time
+
+import numpy as np
+
+import main
+
+RULES = main.DEFAULT_CONFIG # 只实现标准规则；规则变体请用对象引擎（sweep.py）
+SPIRIT_COUNT = len(main.SPIRIT_KEYS)
+FATE_COUNT = len(main.FATE_CARD_KEYS)
+SPIRIT_DECK_SIZE = len(RULES.spirit_deck_template)
+FATE_CAPACITY = 16 # 命运牌堆最多 max_fate_cards 张，蘑菇在牌堆刚好抽空时会多放回一张
+DEFAULT_LANES = 16384
+
+S = main.SPIRIT_INDEX
+F = main.FATE_CARD_INDEX
+DAMAGE_CARDS = np.array(main.DAMAGE_CARD_INDICES)
+SELF_CARDS = np.array(main.SELF_CARD_INDICES)
+SPIRIT_TEMPLATE = np.array([S[s] for s in RULES.spirit_deck_template], dtype=np.int8)
+
+# 状态位字段与 PlayerStatus.pack() 的布局相同：护身符2位 | 枕头免疫2位 | 红药水加成4位 | 8个标志位
+AMULET_MASK = 0b11
+PILLOW_SHIFT, PILLOW_MASK = 2, 0b1100
+RED_SHIFT, RED_MASK = 4, 0xF0
+FLAG = {field: 1 << (8 + i) for i, field in enumerate(main.PlayerStatus.FLAG_FIELDS)}
+
+# 对局通道所处的阶段
+PHASE_START, PHASE_ACTION, PHASE_END, PHASE_IDLE = 0, 1, 2, 3
+
+
+# ==============================================================================
+# --- 策略 ---
+# ==============================================================================
+# 每个座位一个策略对象，方法接收该座位需要做决定的对局通道下标数组，返回同样长度的结果数组。
+
+def weighted_kind(rng, counts):
+    """按每行的张数比例随机取一种（每行张数之和必须大于0），等价于从列表中均匀取一张"""
+    cumulative = counts.cumsum(axis=1)
+    r = (rng.random(len(counts)) * cumulative[:, -1]).astype(np.int64)
+    return (cumulative <= r[:, None]).sum(axis=1)
+
+
+class HardPolicy:
+    """HardAIPlayer：40% 概率随机用一张灵物，90% 对对手使用命运卡牌，其余选择均匀随机"""
+
+    def __init__(self, sim, seat):
+        self.sim = sim
+        self.seat = seat
+
+    def choose_action(self, lanes):
+        sim, seat = self.sim, self.seat
+        kinds = np.full(len(lanes), -1, dtype=np.int64)
+        able = (sim.size[lanes, seat] > 0) & ((sim.status[lanes, seat] & FLAG["is_handcuffed"]) == 0)
+        able[able] = sim.rng.random(int(able.sum())) < 0.4
+        if able.any(): kinds[able] = weighted_kind(sim.rng, sim.hand[lanes[able], seat])
+        return kinds
+
+    def choose_self_target(self, lanes):
+        return self.sim.rng.random(len(lanes)) >= 0.9
+
+    def choose_steal(self, lanes, stealable):
+        return weighted_kind(self.sim.rng, stealable)
+
+    def choose_force(self, lanes, victim):
+        return weighted_kind(self.sim.rng, self.sim.hand[lanes, victim])
+
+    def choose_telephone(self, lanes, deck_sizes):
+        return 1 + (self.sim.rng.random(len(lanes)) * deck_sizes).astype(np.int64)
+
+
+class ExpertPolicy(HardPolicy):
+    """ExpertAIPlayer 的表驱动实现：各灵物得分由 weights 预先展开成按灵物编号排列的表"""
+    STEAL_PRIORITY = main.ExpertAIPlayer.steal_priority
+
+    def __init__(self, sim, seat, weights):
+        super().__init__(sim, seat)
+        self.w = w = weights
+        self.action_threshold = max(w["action_threshold"], 0) # 得分必须同时高于0（初始最高分）和门槛
+        # 倾向的倍率表：列 0 = 稳健，1 = 进攻，2 = 防守
+        self.multipliers = np.ones((SPIRIT_COUNT, 3))
+        self.multipliers[[S[s] for s in ("RED_POTION", "ERASER", "HANDCUFFS", "REMOTE_CONTROL", "RADIO")], 1] = w["aggressive_multiplier"]
+        self.multipliers[[S[s] for s in ("AMULET", "MIRROR", "GREEN_POTION")], 2] = w["defensive_multiplier"]
+        # 偷取：按优先级取第一种，不在列表中的（电话）排在最后
+        self.steal_rank = np.full(SPIRIT_COUNT, len(self.STEAL_PRIORITY))
+        for rank, spirit in enumerate(self.STEAL_PRIORITY): self.steal_rank[S[spirit]] = rank
+        # 强制使用：与局面无关的固定得分
+        force = np.full(SPIRIT_COUNT, float(w["force_default"]))
+        force[S["CONTRACT"]] = w["force_contract"]
+        force[S["PILLOW"]] = w["force_pillow"]
+        for spirit in main.HIDDEN_SPIRITS: force[S[spirit]] = w["force_hidden"]
+        for spirit in ("ERASER", "HANDCUFFS", "REMOTE_CONTROL", "RADIO"): force[S[spirit]] = w["force_harmful"]
+        self.force_base = force
+
+    def choose_action(self, lanes):
+        sim, seat, w = self.sim, self.seat, self.w
+        kinds = np.full(len(lanes), -1, dtype=np.int64)
+        free = ((sim.status[lanes, seat] & FLAG["is_handcuffed"]) == 0) & (sim.size[lanes, seat] > 0)
+        lanes = lanes[free]
+        if not len(lanes): return kinds
+        opp = 1 - seat
+        hp, opp_hp = sim.hp[lanes, seat].astype(float), sim.hp[lanes, opp]
+        size, opp_size = sim.size[lanes, seat], sim.size[lanes, opp]
+        counts = np.ascontiguousarray(sim.hand[lanes, seat].T)
+        defensive = hp <= 2
+        aggressive = ~defensive & (opp_hp <= 2)
+        top = sim.top_belief(lanes, seat)
+        p_damage = top[DAMAGE_CARDS].sum(axis=0)
+        known = (top.max(axis=0) > 0.999999) & (sim.fate_len[lanes] > 0)
+        has_contract = (sim.status[lanes, seat] & FLAG["has_contract"]) != 0
+
+        # 得分按 (灵物, 通道) 排列，逐种灵物整行赋值
+        default = float(w["default_spirit"])
+        scores = np.full((SPIRIT_COUNT, len(lanes)), default)
+        scores[S["GREEN_POTION"]] = (RULES.max_hp - hp) * w["green_potion_per_missing_hp"]
+        scores[S["ERASER"]] = opp_size * w["eraser_per_enemy_spirit"]
+        stealable = opp_size - sim.hand[lanes, opp, S["GLOVES"]]
+        scores[S["GLOVES"]] = np.where((stealable > 0) & (size < RULES.max_spirits), w["gloves_base"] + stealable * w["gloves_per_stealable"], 0)
+        scores[S["CREATION"]] = (RULES.max_spirits - size) * w["creation_per_free_slot"]
+        scores[S["MAGNIFYING_GLASS"]] = np.where(known, default, w["magnifier_unknown_top"])
+        contract = np.where(hp <= 2, w["contract_hp_le_2"], np.where(hp == 3, w["contract_hp_3"], 0))
+        scores[S["CONTRACT"]] = np.where(has_contract, default, contract)
+        scores[S["WHITE_POTION"]] = np.where(hp > 1, w["white_potion"], w["white_potion_last_hp"])
+        scores[S["PILLOW"]] = np.where(size <= 2, w["pillow_base"] - opp_hp * w["pillow_per_enemy_hp"], default)
+        scores[S["RADIO"]] = np.where(opp_size > 0, w["radio"], default)
+        hidden = np.where(defensive, w["hidden_defensive"], w["hidden_other"])
+        for spirit in main.HIDDEN_SPIRITS: scores[S[spirit]] = hidden
+        threat = p_damage >= w["threat_probability"]
+        scores[S["RED_POTION"]] += np.where(threat, w["red_potion_threat"], 0.0)
+        scores[S["MIRROR"]] += np.where(threat, w["mirror_threat"], 0.0)
+        scores *= self.multipliers[:, aggressive + 2 * defensive]
+        last = sim.last_used[lanes, seat]
+        for spirit in ("HANDCUFFS", "REMOTE_CONTROL"):
+            scores[S[spirit], last == S[spirit]] = -1000
+
+        present = counts > 0
+        scores = np.where(present, scores, -np.inf)
+        best = scores.max(axis=0)
+        act = best > self.action_threshold
+        if act.any():
+            # 得分相同的几种灵物中取手牌里靠前的那张：手牌顺序近似随机，按张数比例选取
+            tied = np.where(present[:, act] & (scores[:, act] == best[act]), counts[:, act], 0)
+            chosen = np.full(len(lanes), -1, dtype=np.int64)
+            chosen[act] = weighted_kind(sim.rng, tied.T)
+            kinds[free] = chosen
+        return kinds
+
+    def choose_self_target(self, lanes):
+        top = self.sim.top_belief(lanes, self.seat)
+        return top[SELF_CARDS].sum(axis=0) >= self.w["self_target_confidence"]
+
+    def choose_steal(self, lanes, stealable):
+        return np.where(stealable > 0, self.steal_rank, SPIRIT_COUNT + 1).argmin(axis=1)
+
+    def choose_force(self, lanes, victim):
+        sim, w = self.sim, self.w
+        counts = sim.hand[lanes, victim]
+        victim_hp, victim_size = sim.hp[lanes, victim], sim.size[lanes, victim]
+        own = sim.hand[lanes, self.seat]
+        own_stealable = sim.size[lanes, self.seat] - own[:, S["GLOVES"]]
+        scores = np.tile(self.force_base, (len(lanes), 1))
+        scores[:, S["WHITE_POTION"]] = np.where(victim_hp <= 2, w["force_white_potion_low_hp"], w["force_white_potion"])
+        scores[:, S["GREEN_POTION"]] = np.where(victim_hp >= RULES.max_hp, w["force_green_potion_full_hp"], w["force_default"])
+        scores[:, S["CREATION"]] = np.where(victim_size >= RULES.max_spirits, w["force_creation_full_hand"], w["force_default"])
+        scores[:, S["GLOVES"]] = np.where(own_stealable == 0, w["force_gloves_empty_hand"], w["force_gloves_per_spirit"] * own_stealable)
+        present = counts > 0
+        scores[~present] = -np.inf
+        best = scores.max(axis=1)
+        kinds = np.full(len(lanes), -1, dtype=np.int64)
+        use = best >= w["force_threshold"]
+        if use.any():
+            # 同分时取对方手牌中最先出现的那种，同样按张数比例近似
+            tied = np.where(present[use] & (scores[use] == best[use, None]), counts[use], 0)
+            kinds[use] = weighted_kind(sim.rng, tied)
+        return kinds
+
+
+# 与 main 中的哪些方法相同才能用对应的向量化策略（子类只改权重时仍然适用，例如调优时的候选）
+_EXPERT_METHODS = ("ai_choose_action", "ai_choose_target", "ai_choose_spirit_to_steal", "ai_choose_spirit_to_force_use",
+                   "ai_choose_telephone_position", "_evaluate_spirit_use", "_score_spirit", "_score_forced_spirit",
+                   "_determine_strategic_tendency", "deck_refilled", "steal_priority")
+
+
+def make_policy(cls, sim, seat):
+    if cls is main.HardAIPlayer: return HardPolicy(sim, seat)
+    if issubclass(cls, main.ExpertAIPlayer) and all(getattr(cls, m) is getattr(main.ExpertAIPlayer, m) for m in _EXPERT_METHODS):
+        if cls.opening_book is not None:
+            raise ValueError(f"向量化模拟器不支持开局库，{cls.__name__} 正在使用开局库（可用 main.use_opening_book(None) 关闭）")
+        return ExpertPolicy(sim, seat, cls.weights)
+    raise ValueError(f"向量化模拟器不支持 {cls.__name__}（支持 HardAIPlayer 和只修改权重的 ExpertAIPlayer）")
+
+
+# ==============================================================================
+# --- 同步推进的对局批 ---
+# ==============================================================================
+
+class BatchResults:
+    """批量模拟的结果：每项都是按对局编号排列的数组，可以转换成与对象引擎相同的 GameResult"""
+
+    def __init__(self, games, player_types, seed):
+        self.player_types = player_types
+        self.seed = seed
+        self.winner = np.full(games, -1, dtype=np.int8) # -1 = 达到回合上限的平局
+        self.first_player = np.zeros(games, dtype=np.int8)
+        self.turns = np.zeros(games, dtype=np.int32)
+        self.damage_taken = np.zeros((games, 2), dtype=np.int16)
+        self.damage_dealt = np.zeros((games, 2), dtype=np.int16)
+        self.spirits_used = np.zeros((games, 2, SPIRIT_COUNT), dtype=np.int16)
+        self.fate_cards_drawn = np.zeros((games, 2, FATE_COUNT), dtype=np.int16)
+        self.seconds = 0.0
+
+    def __len__(self): return len(self.winner)
+
+    def game_seed(self, index):
+        """批量对局没有各自的规则随机源，用批次种子和对局编号组成一个唯一标识写入 GameResult.seed"""
+        return self.seed * 1_000_003 + index
+
+    def result(self, index):
+        spirits = self.spirits_used[index]
+        cards = self.fate_cards_drawn[index]
+        winner = int(self.winner[index])
+        return main.GameResult.from_values(
+            seed=self.game_seed(index),
+            player_types=list(self.player_types),
+            first_player=int(self.first_player[index]),
+            winner=None if winner < 0 else winner,
+            turns=int(self.turns[index]),
+            damage_taken=self.damage_taken[index].tolist(),
+            damage_dealt=self.damage_dealt[index].tolist(),
+            spirits_used=[{main.SPIRIT_KEYS[k]: int(n) for k, n in enumerate(row) if n} for row in spirits],
+            fate_cards_drawn=[{main.FATE_CARD_KEYS[k]: int(n) for k, n in enumerate(row) if n} for row in cards],
+        )
+
+    def results(self):
+        for index in range(len(self)): yield self.result(index)
+
+    def counts(self):
+        """与 tournament 相同的聚合计数：[座位0胜, 座位1胜, 平局, 总回合数, 先手方胜]"""
+        winner = self.winner
+        return [int((winner == 0).sum()), int((winner == 1).sum()), int((winner < 0).sum()), int(self.turns.sum()),
+                int((winner == self.first_player).sum())]
+
+
+class LockstepSimulator:
+    """K 个对局通道同步推进的模拟器。座位0和座位1在所有通道中分别由同一个AI类担任"""
+
+    def __init__(self, first_cls, second_cls, lanes=DEFAULT_LANES, seed=None, first_player=None, max_turns=main.HEADLESS_MAX_TURNS):
+        self.seed = seed if seed is not None else int(np.random.SeedSequence().entropy % (1 << 63))
+        self.rng = np.random.default_rng(self.seed)
+        self.classes = (first_cls, second_cls)
+        self.policies = (make_policy(first_cls, self, 0), make_policy(second_cls, self, 1))
+        # 只有专家AI观察命运牌堆，没有专家时完全不维护信念
+        self.observers = tuple(seat for seat, policy in enumerate(self.policies) if isinstance(policy, ExpertPolicy))
+        self.first_player = first_player
+        self.max_turns = max_turns
+        self.lanes = k = lanes
+        self.hp = np.zeros((k, 2), dtype=np.int16)
+        self.status = np.zeros((k, 2), dtype=np.uint16)
+        self.hand = np.zeros((k, 2, SPIRIT_COUNT), dtype=np.int8)
+        self._hand_flat = self.hand.reshape(-1)
+        self.size = np.zeros((k, 2), dtype=np.int8)
+        self.last_used = np.full((k, 2), -1, dtype=np.int8)
+        self.fate = np.zeros((k, FATE_CAPACITY), dtype=np.int8) # 牌堆底在前，牌堆顶在 fate_len - 1
+        self.fate_len = np.zeros(k, dtype=np.int64)
+        self.spirit_deck = np.zeros((k, SPIRIT_DECK_SIZE), dtype=np.int8)
+        self.spirit_drawn = np.zeros(k, dtype=np.int64)
+        # 信念按 (牌, 通道×座位×位置) 存放：取某个位置的分布得到的是每种牌一行的连续数组
+        self.belief = np.zeros((FATE_COUNT, k * 2 * FATE_CAPACITY)) if self.observers else None
+        self.current = np.zeros(k, dtype=np.int64)
+        self.extra = np.full(k, -1, dtype=np.int64)
+        self.turn = np.zeros(k, dtype=np.int64)
+        self.phase = np.full(k, PHASE_IDLE, dtype=np.int8)
+        self.over = np.zeros(k, dtype=bool)
+        self.winner = np.full(k, -1, dtype=np.int8)
+        self.first = np.zeros(k, dtype=np.int8)
+        self.game_index = np.full(k, -1, dtype=np.int64)
+        self.damage_taken = np.zeros((k, 2), dtype=np.int16)
+        self.damage_dealt = np.zeros((k, 2), dtype=np.int16)
+        self.spirits_used = np.zeros((k, 2, SPIRIT_COUNT), dtype=np.int16)
+        self.fate_drawn = np.zeros((k, 2, FATE_COUNT), dtype=np.int16)
+
+    # --- 运行 ---
+
+    def run(self, games, stop=None):
+        """下 games 局；stop 为可选的无参函数，每步之前调用，返回真时放弃这一批并返回 None"""
+        results = BatchResults(games, [cls.__name__ for cls in self.classes], self.seed)
+        started = time.perf_counter()
+        self._next_game = 0
+        self._results = results
+        self._start_games(np.arange(min(games, self.lanes)))
+        while (self.phase != PHASE_IDLE).any():
+            if stop is not None and stop(): return None
+            self.step()
+        results.seconds = time.perf_counter() - started
+        return results
+
+    def step(self):
+        """所有通道各推进一步：回合开始 → 一次行动 → 回合结束（判定胜负并切换玩家）"""
+        phase = self.phase
+        lanes = np.flatnonzero(phase == PHASE_START)
+        if len(lanes): self._turn_start(lanes)
+        lanes = np.flatnonzero(phase == PHASE_ACTION)
+        if len(lanes): self._action(lanes)
+        lanes = np.flatnonzero(phase == PHASE_END)
+        if len(lanes): self._turn_end(lanes)
+
+    def _start_games(self, lanes):
+        """对应 Game._setup：洗灵物牌堆、生成命运牌堆、每人2个灵物、决定先手、后手多拿1个"""
+        count = len(lanes)
+        self.game_index[lanes] = np.arange(self._next_game, self._next_game + count)
+        self._next_game += count
+        self.hp[lanes] = RULES.initial_hp
+        self.status[lanes] = 0
+        self.hand[lanes] = 0
+        self.size[lanes] = 0
+        self.last_used[lanes] = -1
+        self._refill_spirit_deck(lanes)
+        self._create_fate_deck(lanes)
+        for seat in (0, 1): self._draw_spirits(lanes, np.full(count, seat), RULES.initial_spirits)
+        first = self.rng.integers(0, 2, count) if self.first_player is None else np.full(count, self.first_player)
+        self.current[lanes] = first
+        self.first[lanes] = first
+        self._draw_spirits(lanes, 1 - first, 1)
+        self.extra[lanes] = -1
+        self.turn[lanes] = 0
+        self.over[lanes] = False
+        self.winner[lanes] = -1
+        self.damage_taken[lanes] = 0
+        self.damage_dealt[lanes] = 0
+        self.spirits_used[lanes] = 0
+        self.fate_drawn[lanes] = 0
+        self.phase[lanes] = PHASE_START
+
+    def _finish_games(self, lanes):
+        results, index = self._results, self.game_index[lanes]
+        results.winner[index] = np.where(self.over[lanes], self.winner[lanes], -1)
+        results.first_player[index] = self.first[lanes]
+        results.turns[index] = self.turn[lanes]
+        results.damage_taken[index] = self.damage_taken[lanes]
+        results.damage_dealt[index] = self.damage_dealt[lanes]
+        results.spirits_used[index] = self.spirits_used[lanes]
+        results.fate_cards_drawn[index] = self.fate_drawn[lanes]
+        remaining = len(results) - self._next_game
+        if remaining > 0: self._start_games(lanes[:remaining])
+        self.phase[lanes[max(remaining, 0):]] = PHASE_IDLE
+
+    # --- 回合流程 ---
+
+    def _turn_start(self, lanes):
+        """对应 Game._turn 开头与 _update_player_status_start_of_turn"""
+        seat = self.current[lanes]
+        self.turn[lanes] += 1
+        status = self.status[lanes, seat]
+        status = np.where((status & AMULET_MASK) > 0, status - 1, status)
+        status = np.where((status & PILLOW_MASK) > 0, status - (1 << PILLOW_SHIFT), status)
+        status &= ~np.uint16(FLAG["is_mirrored"] | RED_MASK)
+        skip = (status & FLAG["skip_next_turn"]) != 0
+        status &= ~np.uint16(FLAG["skip_next_turn"])
+        self.status[lanes, seat] = status
+        self.status[lanes, 1 - seat] &= ~np.uint16(FLAG["is_handcuffed"])
+        self.phase[lanes] = np.where(skip, PHASE_END, PHASE_ACTION)
+
+    def _action(self, lanes):
+        """对应 Game._play_turn_actions 的一次循环：用一个灵物，或使用命运卡牌结束回合"""
+        seat = self.current[lanes]
+        kinds = np.empty(len(lanes), dtype=np.int64)
+        for s in (0, 1):
+            mine = seat == s
+            if mine.any(): kinds[mine] = self.policies[s].choose_action(lanes[mine])
+        spirit = kinds >= 0
+        if spirit.any():
+            used, user, kind = lanes[spirit], seat[spirit], kinds[spirit]
+            self.hand[used, user, kind] -= 1
+            self.size[used, user] -= 1
+            self.spirits_used[used, user, kind] += 1
+            self.last_used[used, user] = kind
+            self._apply_spirits(used, user, kind, user)
+            self.phase[used[kind == S["PILLOW"]]] = PHASE_END
+        fate = ~spirit
+        if fate.any():
+            lanes, user = lanes[fate], seat[fate]
+            self.last_used[lanes, user] = -1
+            to_self = np.empty(len(lanes), dtype=bool)
+            for s in (0, 1):
+                mine = user == s
+                if mine.any(): to_self[mine] = self.policies[s].choose_self_target(lanes[mine])
+            target = np.where(to_self, user, 1 - user)
+            card = self._draw_fate_card(lanes, user)
+            self._resolve_fate_card(lanes, user, target, card)
+            self.phase[lanes] = PHASE_END
+
+    def _turn_end(self, lanes):
+        """对应 run_headless 循环中的 _check_game_over 与 _switch_player"""
+        self._check_game_over(lanes)
+        alive = lanes[~self.over[lanes]]
+        if len(alive): self._switch_player(alive)
+        done = self.over[lanes] | (self.turn[lanes] >= self.max_turns)
+        self.phase[lanes[~done]] = PHASE_START
+        if done.any(): self._finish_games(lanes[done])
+
+    def _check_game_over(self, lanes):
+        pending = np.ones(len(lanes), dtype=bool)
+        for seat in (0, 1):
+            dead = pending & (self.hp[lanes, seat] <= 0)
+            if not dead.any(): continue
+            pending &= ~dead
+            dead = lanes[dead]
+            status = self.status[dead, seat]
+            saved = ((status & FLAG["has_contract"]) != 0) & ((status & FLAG["last_stand"]) == 0)
+            if saved.any():
+                # 契约书：以1点生命值存活，获得3个灵物和一个最终回合；另一方这次不再检查
+                rescued = dead[saved]
+                self.status[rescued, seat] |= np.uint16(FLAG["last_stand"])
+                self.hp[rescued, seat] = 1
+                self._draw_spirits(rescued, np.full(len(rescued), seat), 3)
+                self.extra[rescued] = seat
+            lost = dead[~saved]
+            self.over[lost] = True
+            self.winner[lost] = 1 - seat
+
+    def _switch_player(self, lanes):
+        seat = self.current[lanes]
+        last_stand = (self.status[lanes, seat] & FLAG["last_stand"]) != 0
+        failed = lanes[last_stand]
+        self.over[failed] = True
+        self.winner[failed] = 1 - seat[last_stand]
+        lanes, seat = lanes[~last_stand], seat[~last_stand]
+        extra = self.extra[lanes] >= 0
+        bonus = lanes[extra]
+        self.current[bonus] = self.extra[bonus]
+        self.extra[bonus] = -1
+        lanes, seat = lanes[~extra], seat[~extra]
+        remote = (self.status[lanes, seat] & FLAG["remote_control_active"]) != 0
+        if remote.any():
+            controlled, user = lanes[remote], seat[remote]
+            self.status[controlled, user] &= ~np.uint16(FLAG["remote_control_active"])
+            victim = 1 - user
+            card = self._draw_fate_card(controlled, victim)
+            self._resolve_fate_card(controlled, victim, victim, card)
+            self._check_game_over(controlled)
+        keep = ~self.over[lanes]
+        self.current[lanes[keep]] = 1 - seat[keep]
+
+    # --- 牌堆 ---
+
+    def _refill_spirit_deck(self, lanes):
+        self.spirit_deck[lanes] = self.rng.permuted(np.broadcast_to(SPIRIT_TEMPLATE, (len(lanes), SPIRIT_DECK_SIZE)), axis=1)
+        self.spirit_drawn[lanes] = 0
+
+    def _draw_spirits(self, lanes, seat, count):
+        """对应 Game._draw_spirit_for_player：牌堆抽空时重新洗牌，手牌已满时抽到的灵物被丢弃。
+
+        每一轮把各通道要抽的牌（不超过牌堆剩余张数）一次取出，只有牌堆中途抽空的通道需要下一轮。
+        """
+        count = np.broadcast_to(count, lanes.shape)
+        while len(lanes):
+            left = SPIRIT_DECK_SIZE - self.spirit_drawn[lanes]
+            empty = left == 0
+            if empty.any():
+                self._refill_spirit_deck(lanes[empty])
+                left[empty] = SPIRIT_DECK_SIZE
+            take = np.minimum(count, left)
+            drawn = self.spirit_drawn[lanes]
+            offsets = np.arange(int(take.max()))
+            position = np.minimum(drawn[:, None] + offsets, SPIRIT_DECK_SIZE - 1)
+            cards = self.spirit_deck[lanes[:, None], position]
+            room = RULES.max_spirits - self.size[lanes, seat]
+            kept = offsets < np.minimum(take, room)[:, None]
+            rows = (lanes * 2 + seat) * SPIRIT_COUNT
+            np.add.at(self._hand_flat, (rows[:, None] + cards)[kept], 1)
+            self.size[lanes, seat] += kept.sum(axis=1, dtype=np.int8)
+            self.spirit_drawn[lanes] = drawn + take
+            more = count > take
+            lanes, seat, count = lanes[more], seat[more], (count - take)[more]
+
+    def _create_fate_deck(self, lanes):
+        count = len(lanes)
+        self.fate_len[lanes] = self.rng.integers(RULES.min_fate_cards, RULES.max_fate_cards + 1, count)
+        self.fate[lanes] = self.rng.integers(0, FATE_COUNT, (count, FATE_CAPACITY))
+        if self.observers:
+            positions = (lanes[:, None] * (2 * FATE_CAPACITY) + np.arange(2 * FATE_CAPACITY)).ravel()
+            self.belief[:, positions] = 1 / FATE_COUNT
+
+    def _draw_fate_card(self, lanes, drawer):
+        """对应 Game._draw_fate_card：空牌堆重建、洗牌器、蘑菇，然后抽出牌堆顶"""
+        empty = self.fate_len[lanes] == 0
+        if empty.any(): self._create_fate_deck(lanes[empty])
+        status = self.status[lanes, drawer]
+
+        shuffler = (status & FLAG["shuffler_effect"]) != 0
+        if shuffler.any():
+            shuffled = lanes[shuffler]
+            self.status[shuffled, drawer[shuffler]] &= ~np.uint16(FLAG["shuffler_effect"])
+            shuffled = shuffled[self.fate_len[shuffled] > 1]
+            if len(shuffled):
+                size = self.fate_len[shuffled]
+                top = size - 1
+                other = top - 1 - (self.rng.random(len(shuffled)) * (size - 1)).astype(np.int64) # 从牌堆顶数第 1..size-1 张
+                cards = self.fate[shuffled]
+                rows = np.arange(len(shuffled))
+                cards[rows, top], cards[rows, other] = cards[rows, other], cards[rows, top].copy()
+                self.fate[shuffled] = cards
+                for seat in self.observers: self._belief_swapped_with_top(shuffled, seat)
+
+        mushroom = (status & FLAG["mushroom_effect"]) != 0
+        if mushroom.any():
+            changed = lanes[mushroom]
+            self.status[changed, drawer[mushroom]] &= ~np.uint16(FLAG["mushroom_effect"])
+            self.fate_len[changed] -= 1
+            empty = changed[self.fate_len[changed] == 0]
+            if len(empty): self._create_fate_deck(empty)
+            position = self.fate_len[changed]
+            self.fate[changed, position] = self.rng.integers(0, FATE_COUNT, len(changed))
+            self.fate_len[changed] += 1
+            for seat in self.observers: self.belief[:, self._belief_index(changed, seat, position)] = 1 / FATE_COUNT
+
+        self.fate_len[lanes] -= 1
+        card = self.fate[lanes, self.fate_len[lanes]].astype(np.int64)
+        self.fate_drawn[lanes, drawer, card] += 1
+        return card
+
+    # --- 专家AI的牌堆信念（与 DeckBelief 相同的更新规则） ---
+
+    def _belief_index(self, lanes, seat, position):
+        """某座位对牌堆第 position 张（从牌堆底数起）的信念所在的列"""
+        return (lanes * 2 + seat) * FATE_CAPACITY + position
+
+    def top_belief(self, lanes, seat):
+        """牌堆顶的概率分布，形状为 (牌, 通道)；牌堆为空时为均匀分布"""
+        size = self.fate_len[lanes]
+        rows = self.belief[:, self._belief_index(lanes, seat, np.maximum(size - 1, 0))]
+        rows[:, size == 0] = 1 / FATE_COUNT
+        return rows
+
+    def _belief_reveal(self, lanes, seat, position, card):
+        index = self._belief_index(lanes, seat, self.fate_len[lanes] - 1 - position)
+        self.belief[:, index] = 0.0
+        self.belief[card, index] = 1.0
+
+    def _belief_swapped_with_top(self, lanes, seat):
+        """DeckBelief.swapped_with_random(0)：牌堆顶与其余某个看不到的随机位置交换"""
+        size = self.fate_len[lanes]
+        top = size - 1
+        columns = self._belief_index(lanes, seat, 0)[:, None] + np.arange(FATE_CAPACITY)
+        rows = self.belief[:, columns]
+        index = np.arange(len(lanes))
+        moved = rows[:, index, top]
+        share = 1 / (size - 1)
+        others = np.arange(FATE_CAPACITY)[None, :] < top[:, None]
+        mean = (rows * others).sum(axis=2) * share
+        rows = np.where(others, rows * (1 - share)[:, None] + moved[:, :, None] * share[:, None], rows)
+        rows[:, index, top] = mean
+        self.belief[:, columns] = rows
+
+    # --- 伤害 ---
+
+    def _take_damage(self, lanes, seat, amount, from_mirror):
+        """对应 Player.take_damage，返回实际失去的生命值"""
+        status = self.status[lanes, seat]
+        amulet = (status & AMULET_MASK) > 0
+        shatter = amulet & (amount > 1)
+        final = np.where(shatter, amount * 2, np.where(amulet, 0, amount)) + from_mirror
+        if shatter.any(): self.status[lanes[shatter], seat[shatter]] &= ~np.uint16(AMULET_MASK)
+        self.hp[lanes, seat] -= final
+        return final
+
+    def _handle_hp_loss(self, lanes, seat, damage, attacker):
+        """对应 Game._handle_hp_loss：记录伤害，每失去1点生命获得 hp_loss_spirit_gain 个灵物"""
+        hit = damage > 0
+        lanes, seat, damage, attacker = lanes[hit], seat[hit], damage[hit], attacker[hit]
+        if not len(lanes): return
+        self.damage_taken[lanes, seat] += damage
+        other = attacker != seat
+        self.damage_dealt[lanes[other], attacker[other]] += damage[other]
+        self._draw_spirits(lanes, seat, RULES.hp_loss_spirit_gain * damage)
+
+    def _self_damage(self, lanes, seat, amount):
+        damage = self._take_damage(lanes, seat, np.full(len(lanes), amount), 0)
+        self._handle_hp_loss(lanes, seat, damage, seat)
+
+    # --- 命运卡牌 ---
+
+    def _resolve_fate_card(self, lanes, user, target, card):
+        """对应 Game._apply_fate_card_effect；轮回在这里循环结算，直到没有通道再抽到轮回"""
+        while len(lanes):
+            mirrored = (self.status[lanes, target] & FLAG["is_mirrored"]) != 0
+            if mirrored.any():
+                self.status[lanes[mirrored], target[mirrored]] &= ~np.uint16(FLAG["is_mirrored"])
+                target = np.where(mirrored, 1 - target, target)
+            damage_card = (card == F["DIVINE_PUNISHMENT"]) | (card == F["BACKLASH"])
+
+            if damage_card.any():
+                hit, by, to = lanes[damage_card], user[damage_card], target[damage_card]
+                amount = 1 + ((self.status[hit, by] & RED_MASK) >> RED_SHIFT).astype(np.int64)
+                actual = self._take_damage(hit, to, amount, mirrored[damage_card].astype(np.int64))
+                self._handle_hp_loss(hit, to, actual, by)
+                backlash = (card[damage_card] == F["BACKLASH"]) & (actual > 0)
+                self.extra[hit[backlash]] = to[backlash]
+                self.status[hit, by] &= ~np.uint16(RED_MASK)
+
+            boon = card == F["DIVINE_BOON"]
+            if boon.any(): self._draw_spirits(lanes[boon], target[boon], 1)
+
+            void = (card == F["THE_VOID"]) & (target == user)
+            self.extra[lanes[void]] = user[void]
+
+            again = card == F["REINCARNATION"]
+            lanes, target = lanes[again], target[again]
+            user = target
+            if len(lanes): card = self._draw_fate_card(lanes, target)
+
+    # --- 灵物 ---
+
+    def _apply_spirits(self, lanes, user, kind, decider):
+        """按灵物种类分组结算；decider 为做后续选择的座位（被无线电强制使用时是无线电的使用者）"""
+        for k in np.unique(kind):
+            mine = kind == k
+            self.SPIRIT_HANDLERS[k](self, lanes[mine], user[mine], decider[mine])
+
+    def _amulet(self, lanes, user, decider):
+        self.status[lanes, user] = (self.status[lanes, user] & ~np.uint16(AMULET_MASK)) | 2
+
+    def _mirror(self, lanes, user, decider):
+        self.status[lanes, user] |= np.uint16(FLAG["is_mirrored"])
+
+    def _remote_control(self, lanes, user, decider):
+        self.status[lanes, user] |= np.uint16(FLAG["remote_control_active"])
+
+    def _eraser(self, lanes, user, decider):
+        victim = 1 - user
+        for _ in range(2):
+            has = self.size[lanes, victim] > 0
+            lanes, victim = lanes[has], victim[has]
+            if not len(lanes): return
+            kind = weighted_kind(self.rng, self.hand[lanes, victim])
+            self.hand[lanes, victim, kind] -= 1
+            self.size[lanes, victim] -= 1
+
+    def _gloves(self, lanes, user, decider):
+        victim = 1 - user
+        stealable = self.hand[lanes, victim].astype(np.int64)
+        stealable[:, S["GLOVES"]] = 0
+        ok = (stealable.sum(axis=1) > 0) & (self.size[lanes, user] < RULES.max_spirits)
+        lanes, user, decider, victim, stealable = lanes[ok], user[ok], decider[ok], victim[ok], stealable[ok]
+        kind = np.empty(len(lanes), dtype=np.int64)
+        for s in (0, 1):
+            mine = decider == s
+            if mine.any(): kind[mine] = self.policies[s].choose_steal(lanes[mine], stealable[mine])
+        self.hand[lanes, victim, kind] -= 1
+        self.size[lanes, victim] -= 1
+        self.hand[lanes, user, kind] += 1
+        self.size[lanes, user] += 1
+
+    def _green_potion(self, lanes, user, decider):
+        self.hp[lanes, user] = np.minimum(self.hp[lanes, user] + 1, RULES.max_hp)
+
+    def _creation(self, lanes, user, decider):
+        self._draw_spirits(lanes, user, 2)
+
+    def _mushroom(self, lanes, user, decider):
+        self.status[lanes, user] |= np.uint16(FLAG["mushroom_effect"])
+
+    def _white_potion(self, lanes, user, decider):
+        # 49% 恢复1，49% 失去1，1% 恢复2，1% 失去2
+        r = self.rng.random(len(lanes))
+        heal = np.where(r < 0.49, 1, np.where((r >= 0.98) & (r < 0.99), 2, 0))
+        self.hp[lanes, user] = np.minimum(self.hp[lanes, user] + heal, RULES.max_hp)
+        for amount, hit in ((1, (r >= 0.49) & (r < 0.98)), (2, r >= 0.99)):
+            if hit.any(): self._self_damage(lanes[hit], user[hit], amount)
+
+    def _shuffler(self, lanes, user, decider):
+        self.status[lanes, user] |= np.uint16(FLAG["shuffler_effect"])
+
+    def _magnifying_glass(self, lanes, user, decider):
+        seen = self.fate_len[lanes] > 0
+        lanes, user = lanes[seen], user[seen]
+        card = self.fate[lanes, self.fate_len[lanes] - 1]
+        for seat in self.observers:
+            mine = user == seat
+            if mine.any(): self._belief_reveal(lanes[mine], seat, 0, card[mine])
+
+    def _red_potion(self, lanes, user, decider):
+        status = self.status[lanes, user]
+        self.status[lanes, user] = np.where((status & RED_MASK) != RED_MASK, status + (1 << RED_SHIFT), status)
+
+    def _handcuffs(self, lanes, user, decider):
+        victim = 1 - user
+        open_ = (self.status[lanes, victim] & PILLOW_MASK) == 0
+        lanes, victim = lanes[open_], victim[open_]
+        self.status[lanes, victim] |= np.uint16(FLAG["is_handcuffed"])
+        self._draw_spirits(lanes, victim, 1)
+
+    def _telephone(self, lanes, user, decider):
+        live = self.fate_len[lanes] > 0
+        lanes, decider = lanes[live], decider[live]
+        size = self.fate_len[lanes]
+        for s in (0, 1):
+            mine = decider == s
+            if not mine.any(): continue
+            position = self.policies[s].choose_telephone(lanes[mine], size[mine]) - 1
+            if s in self.observers:
+                heard = lanes[mine]
+                self._belief_reveal(heard, s, position, self.fate[heard, self.fate_len[heard] - 1 - position])
+
+    def _pillow(self, lanes, user, decider):
+        self._draw_spirits(lanes, user, 3)
+        status = self.status[lanes, user] & ~np.uint16(PILLOW_MASK)
+        self.status[lanes, user] = status | np.uint16(FLAG["skip_next_turn"] | (3 << PILLOW_SHIFT))
+
+    def _contract(self, lanes, user, decider):
+        self._self_damage(lanes, user, 2)
+        self.status[lanes, user] |= np.uint16(FLAG["has_contract"])
+
+    def _radio(self, lanes, user, decider):
+        """无线电：使用者选择对手的一个灵物，对手立即使用它，其后续选择由使用者决定"""
+        victim = 1 - user
+        has = self.size[lanes, victim] > 0
+        lanes, user, victim = lanes[has], user[has], victim[has]
+        kind = np.empty(len(lanes), dtype=np.int64)
+        for s in (0, 1):
+            mine = user == s
+            if mine.any(): kind[mine] = self.policies[s].choose_force(lanes[mine], victim[mine])
+        forced = kind >= 0
+        lanes, user, victim, kind = lanes[forced], user[forced], victim[forced], kind[forced]
+        if not len(lanes): return
+        self.hand[lanes, victim, kind] -= 1
+        self.size[lanes, victim] -= 1
+        self._apply_spirits(lanes, victim, kind, user)
+
+    SPIRIT_HANDLERS = {
+        S["AMULET"]: _amulet, S["MIRROR"]: _mirror, S["REMOTE_CONTROL"]: _remote_control, S["ERASER"]: _eraser,
+        S["GLOVES"]: _gloves, S["GREEN_POTION"]: _green_potion, S["CREATION"]: _creation, S["MUSHROOM"]: _mushroom,
+        S["WHITE_POTION"]: _white_potion, S["SHUFFLER"]: _shuffler, S["MAGNIFYING_GLASS"]: _magnifying_glass,
+        S["RED_POTION"]: _red_potion, S["HANDCUFFS"]: _handcuffs, S["TELEPHONE"]: _telephone, S["PILLOW"]: _pillow,
+        S["CONTRACT"]: _contract, S["RADIO"]: _radio,
+    }
+
+
+def simulate_batch(first_cls, second_cls, games, seed=None, first_player=None, max_turns=main.HEADLESS_MAX_TURNS, lanes=DEFAULT_LANES):
+    """向量化地下 games 局，返回 BatchResults"""
+    sim = LockstepSimulator(first_cls, second_cls, lanes=min(lanes, max(games, 1)), seed=seed, first_player=first_player, max_turns=max_turns)
+    return sim.run(games)
+
+
+# ==============================================================================
+# --- 从观察到的局面出发的推演（胜率估计） ---
+# ==============================================================================
+
+ROLLOUT_LANES = 4096 # 局面推演同时推进的对局数：推演比整局短，较少的通道让一批更快结束
+HIDDEN = -2          # 候选行动中“使用一个神秘护符”的编号，开局取样后换成该局手牌中的护身符或镜子
+
+
+class _ForcedFirst:
+    """包装座位0的策略：每局的第一次行动按 sim.forced 指定（-1 为交给策略），之后照常由策略决定"""
+
+    def __init__(self, policy):
+        self.policy = policy
+        self.sim = policy.sim
+
+    def __getattr__(self, name): return getattr(self.policy, name)
+
+    def choose_action(self, lanes):
+        sim = self.sim
+        kinds = sim.forced[lanes].copy()
+        free = kinds < 0
+        if free.any(): kinds[free] = self.policy.choose_action(lanes[free])
+        sim.forced[lanes] = -1
+        return kinds
+
+
+class PositionSimulator(LockstepSimulator):
+    """每局都从同一个观察到的局面（main.ObservedPosition）开始的模拟器：观察者在座位0，正处于自己回合的行动阶段。
+
+    看不到的部分在每局开始时取样：神秘护符的真实身份按灵物牌库中护身符与镜子的比例，命运牌堆按观察者的信念
+    逐位置独立取样，灵物牌堆按模板重新洗牌后只保留剩余的张数。双方都由 cls 的策略担任，两个座位的牌堆信念
+    都从观察者的信念开始。options 为座位0第一次行动的候选（None 为交给策略，main.HIDDEN_OPTION 为使用一个神秘护符，
+    其余为灵物名），按对局编号轮流分配。
+    """
+
+    def __init__(self, position, options, cls=main.ExpertAIPlayer, lanes=ROLLOUT_LANES, seed=None, max_turns=main.SEARCH_ROLLOUT_MAX_TURNS):
+        super().__init__(cls, cls, lanes=lanes, seed=seed, first_player=0, max_turns=max_turns)
+        self.position = position
+        self.options = np.array([-1 if o is None else HIDDEN if o == main.HIDDEN_OPTION else S[o] for o in options], dtype=np.int64)
+        self.forced = np.full(self.lanes, -1, dtype=np.int64)
+        self.policies = (_ForcedFirst(self.policies[0]), self.policies[1])
+        rows = np.array(position.fate_rows, dtype=float).reshape(-1, FATE_COUNT)
+        self.fate_cumulative = rows.cumsum(axis=1)
+        self.belief_rows = np.full((FATE_COUNT, FATE_CAPACITY), 1 / FATE_COUNT)
+        self.belief_rows[:, :len(rows)] = rows.T
+        template = RULES.spirit_deck_template
+        self.amulet_share = template.count("AMULET") / (template.count("AMULET") + template.count("MIRROR"))
+
+    def _start_games(self, lanes):
+        count = len(lanes)
+        position = self.position
+        index = np.arange(self._next_game, self._next_game + count)
+        self.game_index[lanes] = index
+        self._next_game += count
+        self.hp[lanes] = position.hp
+        self.status[lanes] = position.status
+        hands = np.array(position.hands, dtype=np.int8)[None].repeat(count, axis=0)
+        for seat, hidden in enumerate(position.hidden):
+            if not hidden: continue
+            amulets = self.rng.binomial(hidden, self.amulet_share, count).astype(np.int8)
+            hands[:, seat, S["AMULET"]] += amulets
+            hands[:, seat, S["MIRROR"]] += hidden - amulets
+        self.hand[lanes] = hands
+        self.size[lanes] = hands.sum(axis=2)
+        self.last_used[lanes] = position.last_used
+        self._refill_spirit_deck(lanes)
+        self.spirit_drawn[lanes] = SPIRIT_DECK_SIZE - position.spirit_deck_size
+        size = len(self.fate_cumulative)
+        self.fate_len[lanes] = size
+        if size:
+            # 每个位置按该位置的分布独立取样（与 DeckBelief.sample 相同）
+            r = self.rng.random((count, size, 1))
+            self.fate[lanes, :size] = np.minimum((self.fate_cumulative < r).sum(axis=2), FATE_COUNT - 1)
+        for seat in self.observers:
+            columns = (self._belief_index(lanes, seat, 0)[:, None] + np.arange(FATE_CAPACITY)).ravel()
+            self.belief[:, columns] = np.tile(self.belief_rows, count)
+        self.current[lanes] = 0
+        self.first[lanes] = 0
+        self.extra[lanes] = position.extra
+        self.turn[lanes] = 0
+        self.over[lanes] = False
+        self.winner[lanes] = -1
+        self.damage_taken[lanes] = 0
+        self.damage_dealt[lanes] = 0
+        self.spirits_used[lanes] = 0
+        self.fate_drawn[lanes] = 0
+        forced = self.options[index % len(self.options)]
+        hidden = forced == HIDDEN
+        if hidden.any():
+            charms = self.hand[lanes[hidden], 0]
+            amulets, mirrors = charms[:, S["AMULET"]], charms[:, S["MIRROR"]]
+            forced[hidden] = np.where(self.rng.random(len(charms)) * (amulets + mirrors) < amulets, S["AMULET"], S["MIRROR"])
+        self.forced[lanes] = forced
+        self.phase[lanes] = PHASE_ACTION
+
+
+def rollout_position(position, options, games, seed=None, lanes=ROLLOUT_LANES, stop=None):
+    """从 position 推演 games 局，返回 (各候选的得分和, 各候选的局数)，座位0胜计1、平局计0.5；被 stop 取消时返回 None"""
+    sim = PositionSimulator(position, options, lanes=min(lanes, max(games, 1)), seed=seed)
+    results = sim.run(games, stop)
+    if results is None: return None
+    option = np.arange(games) % len(options)
+    score = (results.winner == 0) + 0.5 * (results.winner < 0)
+    return np.bincount(option, score, len(options)).tolist(), np.bincount(option, minlength=len(options)).tolist()
+
+
+# ==============================================================================
+# --- 与对象引擎的分布一致性检验 ---
+# ==============================================================================
+
+def _object_chunk(task):
+    """工作进程：用对象引擎下一批对局，返回与 BatchResults 相同布局的数组"""
+    first_cls, second_cls, seeds, max_turns = task
+    rows = []
+    for seed in seeds:
+        result = main.simulate_game(first_cls, second_cls, seed=seed, max_turns=max_turns)
+        rows.append(result)
+    return rows
+
+
+def object_results(first_cls, second_cls, games, seed, jobs, max_turns=main.HEADLESS_MAX_TURNS, chunk_size=500):
+    """用对象引擎（main.simulate_game）下 games 局，结果整理成 BatchResults 以便比较"""
+    results = BatchResults(games, [first_cls.__name__, second_cls.__name__], seed)
+    seeds = [seed * 1_000_003 + i for i in range(games)]
+    tasks = [(first_cls, second_cls, seeds[i:i + chunk_size], max_turns) for i in range(0, games, chunk_size)]
+    started = time.perf_counter()
+    index = 0
+    with multiprocessing.Pool(processes=jobs) as pool:
+        for chunk in pool.imap(_object_chunk, tasks):
+            for result in chunk:
+                results.winner[index] = -1 if result.winner is None else result.winner
+                results.first_player[index] = result.first_player
+                results.turns[index] = result.turns
+                results.damage_taken[index] = result.damage_taken
+                results.damage_dealt[index] = result.damage_dealt
+                for seat in (0, 1):
+                    for name, n in result.spirits_used[seat].items(): results.spirits_used[index, seat, S[name]] = n
+                    for name, n in result.fate_cards_drawn[seat].items(): results.fate_cards_drawn[index, seat, F[name]] = n
+                index += 1
+    results.seconds = time.perf_counter() - started
+    return results
+
+
+def _p_value(z):
+    """双侧正态检验的 p 值"""
+    return math.erfc(abs(z) / math.sqrt(2))
+
+
+def _compare_means(a, b):
+    """两组独立样本均值之差的 z 检验，返回 (均值a, 均值b, p)"""
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+    error = math.sqrt(a.var(ddof=1) / len(a) + b.var(ddof=1) / len(b))
+    diff = a.mean() - b.mean()
+    if error == 0: return a.mean(), b.mean(), 1.0 if diff == 0 else 0.0
+    return a.mean(), b.mean(), _p_value(diff / error)
+
+
+def _compare_distributions(a, b, bins):
+    """两个样本在 bins 区间上的卡方齐性检验（Wilson-Hilferty 近似），返回 p"""
+    ca, _ = np.histogram(a, bins)
+    cb, _ = np.histogram(b, bins)
+    keep = (ca + cb) > 0
+    ca, cb = ca[keep].astype(float), cb[keep].astype(float)
+    na, nb = ca.sum(), cb.sum()
+    expected_a = (ca + cb) * na / (na + nb)
+    expected_b = (ca + cb) * nb / (na + nb)
+    chi2 = ((ca - expected_a) ** 2 / expected_a).sum() + ((cb - expected_b) ** 2 / expected_b).sum()
+    dof = max(len(ca) - 1, 1)
+    z = ((chi2 / dof) ** (1 / 3) - (1 - 2 / (9 * dof))) / math.sqrt(2 / (9 * dof))
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def parity_checks(vector, reference):
+    """逐项比较两组结果，返回 [(指标, 向量化, 对象引擎, p)]"""
+    checks = []
+    def means(name, a, b):
+        checks.append((name,) + _compare_means(a, b))
+    means("座位0胜率", vector.winner == 0, reference.winner == 0)
+    means("先手胜率", vector.winner == vector.first_player, reference.winner == reference.first_player)
+    means("平局率", vector.winner < 0, reference.winner < 0)
+    means("平均回合数", vector.turns, reference.turns)
+    bins = np.append(np.arange(1, 41), np.iinfo(np.int32).max)
+    checks.append(("回合数分布", float(np.median(vector.turns)), float(np.median(reference.turns)),
+                   _compare_distributions(vector.turns, reference.turns, bins)))
+    for seat in (0, 1):
+        means(f"座位{seat}受到伤害", vector.damage_taken[:, seat], reference.damage_taken[:, seat])
+        means(f"座位{seat}造成伤害", vector.damage_dealt[:, seat], reference.damage_dealt[:, seat])
+    for k, name in enumerate(main.SPIRIT_KEYS):
+        means(f"使用{main.SPIRIT_NAMES[name]}", vector.spirits_used[:, :, k].sum(axis=1), reference.spirits_used[:, :, k].sum(axis=1))
+    for k, name in enumerate(main.FATE_CARD_KEYS):
+        means(f"抽到{main.FATE_CARD_NAMES[name]}", vector.fate_cards_drawn[:, :, k].sum(axis=1), reference.fate_cards_drawn[:, :, k].sum(axis=1))
+    return checks
+
+
+def parity(first_cls, second_cls, games, seed, jobs, lanes, alpha):
+    vector = simulate_batch(first_cls, second_cls, games, seed=seed, lanes=lanes)
+    reference = object_results(first_cls, second_cls, games, seed, jobs)
+    checks = parity_checks(vector, reference)
+    # 多重比较：Bonferroni 校正
+    threshold = alpha / len(checks)
+    print(f"{first_cls.__name__} vs {second_cls.__name__}，各 {games:,} 局")
+    print(f"{'指标':<12}{'向量化':>10}{'对象引擎':>10}{'p':>10}")
+    failed = 0
+    for name, a, b, p in checks:
+        flag = "" if p >= threshold else "  ← 不一致"
+        failed += bool(flag)
+        print(f"{name:<12}{a:>10.4f}{b:>10.4f}{p:>10.4f}{flag}")
+    vector_rate = games / vector.seconds
+    reference_rate = games / reference.seconds
+    print(f"\n向量化 {vector_rate:,.0f} 局/秒，对象引擎 {reference_rate:,.0f} 局/秒（{jobs} 个进程），"
+          f"单进程加速 {vector_rate / (reference_rate / jobs):.1f} 倍")
+    if failed:
+        print(f"{failed} 项指标在显著性水平 {alpha}（校正后 {threshold:.2g}）下不一致。")
+        return 1
+    print(f"全部 {len(checks)} 项指标一致（显著性水平 {alpha}，Bonferroni 校正）。")
+    return 0
+
+
+def main_cli(argv=None):
+    from tournament import discover_ai_classes
+    parser = argparse.ArgumentParser(description="命运轮盘向量化批量模拟器")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("run", "向量化地下一批对局并输出汇总"), ("parity", "与对象引擎比较结果分布")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--players", nargs=2, default=["HardAIPlayer", "ExpertAIPlayer"], help="座位0和座位1的AI类")
+        p.add_argument("--games", type=int, default=100000 if name == "run" else 20000)
+        p.add_argument("--seed", type=int, default=0)
+        p.add_argument("--lanes", type=int, default=DEFAULT_LANES, help="同时推进的对局数")
+        if name == "parity":
+            p.add_argument("--jobs", type=int, default=multiprocessing.cpu_count(), help="对象引擎的工作进程数")
+            p.add_argument("--alpha", type=float, default=0.01, help="整体显著性水平")
+        else:
+            p.add_argument("--first-player", type=int, choices=(0, 1), help="固定先手座位（默认随机）")
+            p.add_argument("--max-turns", type=int, default=main.HEADLESS_MAX_TURNS, help="单局回合上限")
+    args = parser.parse_args(argv)
+
+    classes = {cls.__name__: cls for cls in discover_ai_classes()}
+    unknown = [name for name in args.players if name not in classes]
+    if unknown: parser.error(f"未知的 AI 类: {', '.join(unknown)}")
+    first_cls, second_cls = (classes[name] for name in args.players)
+    try:
+        make_policy(first_cls, None, 0), make_policy(second_cls, None, 1)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.command == "parity":
+        sys.exit(parity(first_cls, second_cls, args.games, args.seed, args.jobs, args.lanes, args.alpha))
+    results = simulate_batch(first_cls, second_cls, args.games, seed=args.seed, first_player=args.first_player,
+                             max_turns=args.max_turns, lanes=args.lanes)
+    seat0, seat1, draws, turns, first_wins = results.counts()
+    decided = seat0 + seat1
+    print(f"{first_cls.__name__} vs {second_cls.__name__}：{len(results):,} 局，用时 {results.seconds:.2f} 秒"
+          f"（{len(results) / max(results.seconds, 1e-9):,.0f} 局/秒）")
+    print(f"座位0胜率 {seat0 / len(results):.2%}，座位1胜率 {seat1 / len(results):.2%}，平局 {draws}")
+    print(f"平均回合数 {turns / len(results):.2f}，先手胜率 {first_wins / decided if decided else 0:.2%}")
+
+
+if __name__ == "__main__":
+    main_cli()